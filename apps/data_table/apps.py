@@ -8,6 +8,13 @@ class DataTableConfig(AppConfig):
     def ready(self):
         """Register proxy models for admin after all apps are loaded."""
         from django.contrib import admin
+        from django.db.models.signals import post_delete, post_save
+        from .utils import invalidate_filter_options
+
+        # Danh sách chọn của bộ lọc được cache theo model → xóa khi dữ liệu đổi
+        post_save.connect(invalidate_filter_options, dispatch_uid='data_table_filter_options_save')
+        post_delete.connect(invalidate_filter_options, dispatch_uid='data_table_filter_options_delete')
+
         from .models import (
             KhoaProxy, BoMonProxy, GiangVienProxy, MonHocProxy, GVDayMonProxy,
             PhongHocProxy, LopMonHocProxy, KhungTGProxy, TimeSlotProxy,
@@ -1,3 +1,124 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import Client, TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from apps.data_table.models import HideShowFilter, PageItems
+from apps.data_table.utils import KeysetPage, decode_cursor, encode_cursor, filter_options, keyset_fields
+from apps.scheduling.models import BoMon, Khoa
+
+
+class KeysetPageTest(TestCase):
+    """Phân trang keyset theo (ten_khoa, ma_khoa): tên trùng nhau vẫn không mất / lặp dòng"""
+
+    @classmethod
+    def setUpTestData(cls):
+        names = ['A', 'B', 'B', 'B', 'C', 'D', 'E']
+        for index, name in enumerate(names, 1):
+            Khoa.objects.create(ma_khoa=f'KHOA-{index:03d}', ten_khoa=name)
+        cls.expected = list(Khoa.objects.order_by('ten_khoa', 'ma_khoa').values_list('ma_khoa', flat=True))
+        cls.key_fields = keyset_fields(Khoa, 'ten_khoa')
+
+    def page(self, after=None, before=None):
+        decode = lambda cursor: decode_cursor(cursor, self.key_fields) if cursor else None
+        return KeysetPage(Khoa.objects.all(), self.key_fields, 3, after=decode(after), before=decode(before))
+
+    @staticmethod
+    def codes(page):
+        return [row.ma_khoa for row in page]
+
+    def test_forward_and_backward(self):
+        pages = [self.page()]
+        while pages[-1].has_next:
+            pages.append(self.page(after=pages[-1].next_cursor))
+        self.assertEqual([code for page in pages for code in self.codes(page)], self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertFalse(pages[0].has_previous)
+        self.assertTrue(pages[-1].has_previous)
+
+        back = self.page(before=pages[2].prev_cursor)
+        self.assertEqual(self.codes(back), self.codes(pages[1]))
+        self.assertTrue(back.has_next and back.has_previous)
+        first = self.page(before=back.prev_cursor)
+        self.assertEqual(self.codes(first), self.codes(pages[0]))
+        self.assertFalse(first.has_previous)
+
+    def test_keyset_fields(self):
+        self.assertEqual([field.name for field in self.key_fields], ['ten_khoa', 'ma_khoa'])
+        self.assertEqual([field.name for field in keyset_fields(Khoa, 'ma_khoa')], ['ma_khoa'])
+
+    def test_tampered_cursor(self):
+        self.assertIsNone(decode_cursor('not-base64!', self.key_fields))
+        self.assertIsNone(decode_cursor(encode_cursor(['B']), self.key_fields))  # thiếu cột
+        self.assertIsNone(decode_cursor(encode_cursor({'a': 1}), self.key_fields))
+
+
+class FilterOptionsCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        khoa = Khoa.objects.create(ma_khoa='KHOA-001', ten_khoa='CNTT')
+        BoMon.objects.create(ma_bo_mon='BM-001', ma_khoa=khoa, ten_bo_mon='KHMT')
+
+    def setUp(self):
+        caches['data_table'].clear()
+
+    def test_cache_hit(self):
+        options = filter_options(BoMon)
+        self.assertEqual(options['ma_khoa'], [('KHOA-001', str(Khoa.objects.get()))])
+        with self.assertNumQueries(0):
+            self.assertEqual(filter_options(BoMon), options)
+
+    def test_save_invalidates_model_and_dependents(self):
+        filter_options(Khoa)
+        filter_options(BoMon)
+        khoa = Khoa.objects.create(ma_khoa='KHOA-002', ten_khoa='Điện tử')
+
+        self.assertIn(('Điện tử', 'Điện tử'), filter_options(Khoa)['ten_khoa'])
+        self.assertIn(('KHOA-002', str(khoa)), filter_options(BoMon)['ma_khoa'])
+
+        khoa.delete()
+        self.assertNotIn('KHOA-002', [value for value, _ in filter_options(BoMon)['ma_khoa']])
+
+
+class DataTableViewTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        for index in range(1, 8):
+            Khoa.objects.create(ma_khoa=f'KHOA-{index:03d}', ten_khoa=f'Khoa, số "{index}"')
+        PageItems.objects.create(parent='khoa', items_per_page=3)
+
+    def setUp(self):
+        self.client = Client(HTTP_HOST='localhost')
+        self.client.force_login(self.user)
+
+    def test_tampered_cursor_falls_back_to_first_page(self):
+        url = reverse('model_dt', args=['Khoa'])
+        first = self.client.get(url)
+        tampered = self.client.get(url, {'after': 'garbage'})
+        self.assertEqual(tampered.status_code, 200)
+        self.assertEqual(
+            [row.ma_khoa for row in tampered.context['items']],
+            [row.ma_khoa for row in first.context['items']]
+        )
+
+        second = self.client.get(url + '?' + first.context['items'].next_query)
+        self.assertEqual([row.ma_khoa for row in second.context['items']], ['KHOA-004', 'KHOA-005', 'KHOA-006'])
+
+    def test_export_csv_streams_all_rows(self):
+        for key in ('ma_khoa', 'ten_khoa'):
+            HideShowFilter.objects.create(parent='khoa', key=key, value=False)
+        response = self.client.get(reverse('export_csv', args=['Khoa']))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="khoa.csv"')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'ma_khoa,ten_khoa')
+        self.assertEqual(len(lines), 8)
+        self.assertEqual(lines[1], 'KHOA-001,"Khoa, số ""1"""')
+
+    def test_typeahead_fields_rendered_as_json_script(self):
+        response = self.client.get(reverse('model_dt', args=['Khoa']))
+        self.assertContains(response, '<script id="typeahead-fields" type="application/json">')
+        self.assertNotContains(response, 'const typeaheadFields = [')
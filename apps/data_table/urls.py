@@ -12,6 +12,8 @@ urlpatterns = [
     path('delete/<str:aPath>/<str:id>/', views.delete, name="delete"),
     path('update/<str:aPath>/<str:id>/', views.update, name="update"),
 
+    path('field-options/<str:aPath>/<str:field>/', views.field_options, name='field_options'),
+
     path('export-csv/<str:aPath>/', views.ExportCSVView.as_view(), name='export_csv'),
 
     path('data_table/<str:aPath>/', views.model_dt, name="model_dt"),
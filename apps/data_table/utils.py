@@ -1,4 +1,22 @@
+import base64
+import json
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
 from django.db.models import Q
+from django.utils.module_loading import import_string
+
+# Cột có <= FILTER_OPTIONS_LIMIT giá trị khác nhau thì dựng sẵn danh sách chọn,
+# nhiều hơn thì dùng typeahead (field_options endpoint)
+FILTER_OPTIONS_LIMIT = 100
+TYPEAHEAD_LIMIT = 20
+# Signal không bắt được bulk_create / queryset.update() → cache vẫn tự hết hạn.
+# Cache alias 'data_table' (settings.CACHES): với LocMemCache, worker khác có thể thấy bản cũ tới khi hết hạn
+FILTER_OPTIONS_TIMEOUT = 600
 
 def user_filter(request, queryset, fields, fk_fields=[]):
     value = request.GET.get('search')
@@ -10,4 +28,169 @@ def user_filter(request, queryset, fields, fk_fields=[]):
                 dynamic_q |= Q(**{f'{field}__icontains': value})
         return queryset.filter(dynamic_q)
 
-    return queryset
\ No newline at end of file
+    return queryset
+
+def encode_cursor(values):
+    """Cursor keyset: giá trị cột sắp xếp của dòng biên → chuỗi base64 an toàn cho URL"""
+    return base64.urlsafe_b64encode(json.dumps(values, cls=DjangoJSONEncoder).encode()).decode()
+
+
+def decode_cursor(cursor, key_fields):
+    """Ngược lại encode_cursor; None nếu cursor hỏng"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        if len(values) != len(key_fields):
+            return None
+        return [field.to_python(value) for field, value in zip(key_fields, values)]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def keyset_fields(model, order_by):
+    """Các field dùng làm khóa keyset: (order_by, pk) hoặc (pk,).
+    None nếu order_by không dùng được (quan hệ / cho phép NULL) → phân trang OFFSET."""
+    pk = model._meta.pk
+    if order_by == pk.name:
+        return [pk]
+    field = model._meta.get_field(order_by)
+    if field.is_relation or field.null:
+        return None
+    return [field, pk]
+
+
+class KeysetPage:
+    """Trang phân trang keyset (seek) - WHERE (cột, pk) > cursor thay vì OFFSET,
+    nên trang sâu tốn như trang đầu. Giao diện giống Page: lặp được, has_next, has_previous..."""
+
+    is_keyset = True
+
+    def __init__(self, queryset, key_fields, per_page, after=None, before=None):
+        names = [field.name for field in key_fields]
+        self.per_page = per_page
+        backwards = before is not None and after is None
+        cursor = before if backwards else after
+
+        qs = queryset
+        if cursor is not None:
+            qs = qs.filter(self._seek(names, cursor, 'lt' if backwards else 'gt'))
+        qs = qs.order_by(*(f'-{name}' for name in names) if backwards else names)
+        rows = list(qs[:per_page + 1])
+        more = len(rows) > per_page
+        rows = rows[:per_page]
+        if backwards:
+            rows.reverse()
+
+        self.object_list = rows
+        self.has_next = (not backwards and more) or (backwards and bool(rows))
+        self.has_previous = (backwards and more) or (not backwards and cursor is not None and bool(rows))
+        self.next_cursor = encode_cursor([getattr(rows[-1], f.attname) for f in key_fields]) if rows else None
+        self.prev_cursor = encode_cursor([getattr(rows[0], f.attname) for f in key_fields]) if rows else None
+
+    @staticmethod
+    def _seek(names, values, op):
+        """(a, b) > (x, y)  ⇔  a > x OR (a = x AND b > y)"""
+        condition = Q()
+        for index, name in enumerate(names):
+            term = Q(**{f'{name}__{op}': values[index]})
+            for prev_name, prev_value in zip(names[:index], values[:index]):
+                term &= Q(**{prev_name: prev_value})
+            condition |= term
+        return condition
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _options_cache_key(model):
+    return f'data_table:filter_options:{model._meta.concrete_model._meta.label_lower}'
+
+
+def _option_fields(model):
+    """Các field có thể có danh sách chọn: FK và cột thường (bỏ pk, ngày giờ, text dài)"""
+    return [
+        field for field in model._meta.fields
+        if not field.primary_key
+        and not isinstance(field, (models.DateField, models.TimeField, models.TextField))
+        and (not field.is_relation or field.many_to_one)
+    ]
+
+
+def _build_filter_options(model):
+    options = {}
+    for field in _option_fields(model):
+        if field.choices:
+            options[field.name] = [(value, label) for value, label in field.flatchoices]
+        elif isinstance(field, models.BooleanField):
+            options[field.name] = [(True, 'True'), (False, 'False')]
+        elif field.is_relation:
+            rows = list(field.related_model._default_manager.all()[:FILTER_OPTIONS_LIMIT + 1])
+            if len(rows) <= FILTER_OPTIONS_LIMIT:
+                options[field.name] = [(row.pk, str(row)) for row in rows]
+        else:
+            values = list(
+                model._default_manager.exclude(**{f'{field.name}__isnull': True})
+                .order_by(field.name).values_list(field.name, flat=True).distinct()[:FILTER_OPTIONS_LIMIT + 1]
+            )
+            if len(values) <= FILTER_OPTIONS_LIMIT:
+                options[field.name] = [(value, str(value)) for value in values]
+    return options
+
+
+def filter_options(model):
+    """{field: [(value, label), ...]} cho các field ít giá trị, cache theo model.
+    Field không có trong dict (nhiều giá trị) → typeahead qua field_options."""
+    cache = caches['data_table']
+    key = _options_cache_key(model)
+    options = cache.get(key)
+    if options is None:
+        options = _build_filter_options(model)
+        cache.set(key, options, FILTER_OPTIONS_TIMEOUT)
+    return options
+
+
+def typeahead_fields(model, options):
+    return [field.name for field in _option_fields(model) if field.name not in options]
+
+
+def typeahead_options(model, field_name, term, limit=TYPEAHEAD_LIMIT):
+    """Gợi ý cho một field nhiều giá trị: [(value, label), ...] chứa term"""
+    field = model._meta.get_field(field_name)
+    if field.is_relation:
+        related = field.related_model
+        condition = Q(pk__icontains=term)
+        for related_field in related._meta.fields:
+            if isinstance(related_field, models.CharField):
+                condition |= Q(**{f'{related_field.name}__icontains': term})
+        rows = related._default_manager.filter(condition).order_by('pk')[:limit]
+        return [(row.pk, str(row)) for row in rows]
+    values = (
+        model._default_manager.filter(**{f'{field_name}__icontains': term})
+        .order_by(field_name).values_list(field_name, flat=True).distinct()[:limit]
+    )
+    return [(value, str(value)) for value in values]
+
+
+@lru_cache(maxsize=None)
+def _watched_models():
+    """Model trong DYNAMIC_DATATB và các model chúng trỏ FK tới"""
+    watched = set()
+    for path in settings.DYNAMIC_DATATB.values():
+        model = import_string(path)._meta.concrete_model
+        watched.add(model)
+        watched.update(field.related_model for field in model._meta.fields if field.many_to_one)
+    return frozenset(watched)
+
+
+def invalidate_filter_options(sender, **kwargs):
+    """post_save / post_delete: xóa cache của model và các model có FK trỏ tới nó"""
+    concrete = sender._meta.concrete_model
+    if concrete not in _watched_models():
+        return
+    dependents = {rel.related_model for rel in concrete._meta.related_objects}
+    caches['data_table'].delete_many([_options_cache_key(model) for model in {concrete, *dependents}])
@@ -2,7 +2,7 @@ import requests, base64, json, csv
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils.safestring import mark_safe
 from django.conf import settings
 from django.urls import reverse
@@ -13,7 +13,9 @@ from django.db import models
 from pprint import pp 
 
 from apps.data_table.models import ModelFilter, PageItems, HideShowFilter
-from apps.data_table.utils import user_filter
+from apps.data_table.utils import (
+    KeysetPage, decode_cursor, filter_options, keyset_fields, typeahead_fields, typeahead_options, user_filter
+)
 
 from cli import *
 
@@ -103,7 +105,9 @@ def model_dt(request, aPath):
     
     #db_fields = [field.name for field in aModelClass._meta.get_fields() if not field.is_relation]
     db_fields = [field.name for field in aModelClass._meta.fields]
-    fk_fields = get_model_fk_values(aModelClass)
+    # Danh sách chọn lấy từ cache; FK nhiều giá trị (None) dùng typeahead
+    options = filter_options(aModelClass)
+    fk_fields = {name: options.get(name) for name in get_model_fk(aModelClass)}
     db_filters = []
     for f in db_fields:
         if f not in fk_fields.keys():
@@ -119,11 +123,6 @@ def model_dt(request, aPath):
         if fields.key in db_fields:
             field_names.append(fields)
     
-    model_series = {}
-    for f in db_fields:
-        f_values = list ( aModelClass.objects.values_list( f, flat=True) )
-        model_series[ f ] = ', '.join( str(i) for i in f_values)
-
     # model filter
     filter_string = {}
     filter_instance = ModelFilter.objects.filter(parent=aPath.lower())
@@ -146,7 +145,7 @@ def model_dt(request, aPath):
     if isinstance(aModelClass._meta.pk, models.CharField):
         queryset = queryset.exclude(**{f'{pk_field}': ''})
     
-    queryset = queryset.order_by(order_by)
+    queryset = queryset.select_related(*fk_fields).order_by(order_by)
     item_list = user_filter(request, queryset, db_fields, fk_fields.keys())
 
     # pagination
@@ -155,15 +154,36 @@ def model_dt(request, aPath):
     if page_items:
         p_items = page_items.items_per_page
 
-    page = request.GET.get('page', 1)
-    paginator = Paginator(item_list, p_items)
-
-    try:
-        items = paginator.page(page)
-    except PageNotAnInteger:
-        return redirect(reverse('model_dt', args=[aPath]))
-    except EmptyPage:
-        return redirect(reverse('model_dt', args=[aPath]))
+    # Keyset (seek) theo (order_by, pk) khi được - trang sâu tốn như trang đầu;
+    # cột quan hệ / cho phép NULL thì dùng Paginator (OFFSET) như cũ
+    key_fields = keyset_fields(aModelClass, order_by)
+    if key_fields:
+        after = request.GET.get('after')
+        before = request.GET.get('before')
+        after = decode_cursor(after, key_fields) if after else None
+        before = decode_cursor(before, key_fields) if before else None
+        items = KeysetPage(item_list, key_fields, p_items, after=after, before=before)
+        query = request.GET.copy()
+        for param in ('page', 'after', 'before'):
+            query.pop(param, None)
+        items.first_query = query.urlencode()
+        if items.has_next:
+            query['after'] = items.next_cursor
+            items.next_query = query.urlencode()
+            query.pop('after')
+        if items.has_previous:
+            query['before'] = items.prev_cursor
+            items.previous_query = query.urlencode()
+    else:
+        page = request.GET.get('page', 1)
+        paginator = Paginator(item_list, p_items)
+
+        try:
+            items = paginator.page(page)
+        except PageNotAnInteger:
+            return redirect(reverse('model_dt', args=[aPath]))
+        except EmptyPage:
+            return redirect(reverse('model_dt', args=[aPath]))
     
     read_only_fields = (pk_field, )
 
@@ -197,6 +217,8 @@ def model_dt(request, aPath):
         'fk_fields_keys': list( fk_fields.keys() ),
         'fk_fields': fk_fields ,
         'choices_dict': choices_dict,
+        'filter_options': options,
+        'typeahead_fields': typeahead_fields(aModelClass, options),
         'segment': 'data_table',
         
         # Permissions
@@ -207,6 +229,28 @@ def model_dt(request, aPath):
     return render(request, 'data_table/model.html', context)
 
 
+@login_required(login_url='/accounts/login/')
+def field_options(request, aPath, field):
+    """Typeahead cho field nhiều giá trị: ?q=... → [{value, label}]"""
+    aModelClass = None
+
+    if aPath in settings.DYNAMIC_DATATB.keys():
+        aModelName  = settings.DYNAMIC_DATATB[aPath]
+        aModelClass = name_to_class(aModelName)
+
+    if not aModelClass:
+        return JsonResponse({'status': 'error', 'message': f'Unknown model: {aPath}'}, status=404)
+    if field not in typeahead_fields(aModelClass, filter_options(aModelClass)):
+        return JsonResponse({'status': 'error', 'message': f'No typeahead for field: {field}'}, status=400)
+
+    term = request.GET.get('q', '').strip()
+    results = typeahead_options(aModelClass, field, term) if term else []
+    return JsonResponse({
+        'status': 'success',
+        'results': [{'value': value, 'label': label} for value, label in results],
+    })
+
+
 @login_required(login_url='/accounts/login/')
 def create(request, aPath):
     aModelClass = None
@@ -311,6 +355,15 @@ def update(request, aPath, id):
 
 
 # Export as CSV
+CSV_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """Buffer giả cho csv.writer: writerow() trả thẳng dòng đã format để stream"""
+    def write(self, value):
+        return value
+
+
 class ExportCSVView(View):
     def get(self, request, aPath):
         aModelName  = None
@@ -333,12 +386,6 @@ class ExportCSVView(View):
             else:
                 print(f"Field {field.key} does not exist in {aModelClass} model.")
 
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{aPath.lower()}.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow(fields)  # Write the header
-
         filter_string = {}
         filter_instance = ModelFilter.objects.filter(parent=aPath.lower())
         for filter_data in filter_instance:
@@ -361,14 +408,29 @@ class ExportCSVView(View):
         queryset = queryset.order_by(order_by)
 
         items = user_filter(request, queryset, db_field_names)
-
-        for item in items:
-            row_data = []
-            for field in fields:
-                try:
-                    row_data.append(getattr(item, field))
-                except AttributeError:
-                    row_data.append('') 
-            writer.writerow(row_data)
-
-        return response
\ No newline at end of file
+        # FK xuất theo __str__ của object liên kết → select_related để không query từng dòng
+        fk_names = [
+            field for field in fields
+            if aModelClass._meta.get_field(field).many_to_one or aModelClass._meta.get_field(field).one_to_one
+        ]
+        if fk_names:
+            items = items.select_related(*fk_names)
+
+        def rows():
+            yield fields  # Write the header
+            for item in items.iterator(chunk_size=CSV_CHUNK_SIZE):
+                row_data = []
+                for field in fields:
+                    try:
+                        row_data.append(getattr(item, field))
+                    except AttributeError:
+                        row_data.append('') 
+                yield row_data
+
+        # Ghi từng dòng ra response theo chunk thay vì dựng cả file trong bộ nhớ
+        writer = csv.writer(Echo())
+        response = StreamingHttpResponse(
+            (writer.writerow(row) for row in rows()), content_type='text/csv'
+        )
+        response['Content-Disposition'] = f'attachment; filename="{aPath.lower()}.csv"'
+        return response
@@ -30,6 +30,20 @@ class Utils:
 
         return Serializer
 
+    @staticmethod
+    def get_fields(config, name: str, requested=None) -> list:
+        """Tên field cho .values(): mặc định mọi field của model (FK → giá trị khóa,
+        giống ModelSerializer); ?fields=a,b chỉ lấy các field đó. ValueError nếu field lạ."""
+        model = Utils.get_class(config, name)
+        available = [field.name for field in model._meta.concrete_fields]
+        if not requested:
+            return available
+        fields = [field.strip() for field in requested.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in available]
+        if unknown:
+            raise ValueError('Unknown field(s): ' + ', '.join(unknown))
+        return fields
+
     @staticmethod
     def model_name_to_class(name: str):
 
@@ -3,6 +3,85 @@
 Copyright (c) 2019 - present AppSeed.us
 """
 
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from apps.dyn_api import views
+from apps.scheduling.models import BoMon, Khoa
+
+
+@mock.patch.dict(views.DYNAMIC_API, {'bomon': 'apps.scheduling.models.BoMon'})
+class DynamicAPIListTest(TestCase):
+    """GET api/<model>/: toàn bộ, hoặc trang keyset theo pk khi có ?limit / ?cursor; ?fields / ?stream=ndjson"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        khoa = Khoa.objects.create(ma_khoa='KHOA-001', ten_khoa='CNTT')
+        for index in range(1, 8):
+            BoMon.objects.create(ma_bo_mon=f'BM-{index:03d}', ma_khoa=khoa, ten_bo_mon=f'Bộ môn {index}')
+        cls.url = reverse('model_api', args=['bomon'])
+
+    def setUp(self):
+        self.client = Client(HTTP_HOST='localhost')
+        self.client.force_login(self.user)
+
+    def get(self, **params):
+        return self.client.get(self.url, params)
+
+    def test_cursor_round_trip(self):
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 3, 'fields': 'ma_bo_mon'}
+            if cursor:
+                params['cursor'] = cursor
+            body = self.get(**params).json()
+            self.assertTrue(body['success'])
+            self.assertLessEqual(len(body['data']), 3)
+            seen += [row['ma_bo_mon'] for row in body['data']]
+            cursor = body['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, [f'BM-{index:03d}' for index in range(1, 8)])
+
+    def test_unpaginated_by_default(self):
+        body = self.get(fields='ma_bo_mon').json()
+        self.assertEqual(body['data'], [{'ma_bo_mon': f'BM-{index:03d}'} for index in range(1, 8)])
+        self.assertNotIn('next_cursor', body)
+
+        with mock.patch.object(views, 'DEFAULT_PAGE_SIZE', 2):
+            self.assertEqual(len(self.get().json()['data']), 7)
+            self.assertEqual(len(self.get(cursor=self.get(limit=1).json()['next_cursor']).json()['data']), 2)
+
+    def test_limit_capped(self):
+        with mock.patch.object(views, 'MAX_PAGE_SIZE', 2):
+            body = self.get(limit=5000).json()
+        self.assertEqual(len(body['data']), 2)
+        self.assertIsNotNone(body['next_cursor'])
+        self.assertEqual(self.get(limit=0).status_code, 400)
+        self.assertEqual(self.get(limit='abc').status_code, 400)
+
+    def test_fields(self):
+        body = self.get(fields='ten_bo_mon,ma_khoa', limit=1).json()
+        self.assertEqual(body['data'], [{'ten_bo_mon': 'Bộ môn 1', 'ma_khoa': 'KHOA-001'}])
+
+        response = self.get(fields='ten_bo_mon,mat_khau')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('mat_khau', response.json()['message'])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.get(cursor='garbage').status_code, 400)
+
+    def test_stream_ndjson(self):
+        first = self.get(limit=2).json()
+        response = self.get(stream='ndjson', fields='ma_bo_mon', cursor=first['next_cursor'])
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [{'ma_bo_mon': f'BM-{index:03d}'} for index in range(3, 8)]
+        )
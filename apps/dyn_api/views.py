@@ -12,10 +12,15 @@ from django.shortcuts import render, redirect, get_object_or_404
 from rest_framework.generics import get_object_or_404
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.settings import api_settings
+import json
 
 from django.conf import settings
 
+from apps.data_table.utils import decode_cursor, encode_cursor
+
 DYNAMIC_API = {}
 
 try:
@@ -25,6 +30,10 @@ except:
 
 from .helpers import Utils 
 
+DEFAULT_PAGE_SIZE = api_settings.PAGE_SIZE or 100
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 2000
+
 def index(request):
     
     context = {
@@ -60,11 +69,7 @@ class DynamicAPI(APIView):
                 model_serializer = Utils.get_serializer(DYNAMIC_API, kwargs.get('model_name'))(instance=thing)
                 output = model_serializer.data
             else:
-                all_things = Utils.get_manager(DYNAMIC_API, kwargs.get('model_name')).all()
-                thing_serializer = Utils.get_serializer(DYNAMIC_API, kwargs.get('model_name'))
-                output = []
-                for thing in all_things:
-                    output.append(thing_serializer(instance=thing).data)
+                return self.list(request, kwargs.get('model_name'))
         except KeyError:
             return Response(data={
                 'message': 'this model is not activated or not exist.',
@@ -80,6 +85,59 @@ class DynamicAPI(APIView):
             'success': True
             }, status=200)
 
+    def list(self, request, model_name):
+        """Danh sách bản ghi (?fields= chọn field).
+        Phân trang keyset trên pk chỉ khi có ?limit= hoặc ?cursor= (trả thêm next_cursor);
+        không có thì trả toàn bộ như trước. ?stream=ndjson trả toàn bộ (từ cursor) dạng
+        NDJSON, đọc DB theo chunk."""
+        model = Utils.get_class(DYNAMIC_API, model_name)
+        pk_field = model._meta.pk
+        try:
+            fields = Utils.get_fields(DYNAMIC_API, model_name, request.query_params.get('fields'))
+            paginate = 'limit' in request.query_params or 'cursor' in request.query_params
+            limit = int(request.query_params.get('limit', DEFAULT_PAGE_SIZE))
+            if limit < 1:
+                raise ValueError('Expect positive limit')
+        except ValueError as e:
+            return Response(data={
+                'message': 'Input Error = ' + str(e),
+                'success': False
+            }, status=400)
+        limit = min(limit, MAX_PAGE_SIZE)
+
+        queryset = model.objects.order_by(pk_field.name)
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            after = decode_cursor(cursor, [pk_field])
+            if after is None:
+                return Response(data={
+                    'message': 'Input Error = invalid cursor',
+                    'success': False
+                }, status=400)
+            queryset = queryset.filter(pk__gt=after[0])
+
+        # pk luôn được đọc để tạo cursor, chỉ trả về nếu được chọn
+        values = queryset.values(*dict.fromkeys(fields + [pk_field.attname]))
+
+        if request.query_params.get('stream') == 'ndjson':
+            rows = values.iterator(chunk_size=STREAM_CHUNK_SIZE)
+            lines = (json.dumps({key: row[key] for key in fields}, cls=DjangoJSONEncoder) + '\n' for row in rows)
+            return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+        if not paginate:
+            return Response(data={
+                'data': [{key: row[key] for key in fields} for row in values.iterator(chunk_size=STREAM_CHUNK_SIZE)],
+                'success': True
+            }, status=200)
+
+        rows = list(values[:limit + 1])
+        next_cursor = encode_cursor([rows[limit - 1][pk_field.attname]]) if len(rows) > limit else None
+        return Response(data={
+            'data': [{key: row[key] for key in fields} for row in rows[:limit]],
+            'next_cursor': next_cursor,
+            'success': True
+        }, status=200)
+
     # CREATE : POST api/model/
     #@check_permission
     def post(self, request, **kwargs):
@@ -0,0 +1,258 @@
+"""
+Chỉ mục dùng chung của một đợt xếp lịch, cache theo phiên bản TKB của đợt
+(DotXep.schedule_version(ma_dot), CACHES['schedule']):
+- class_teacher_index: ma_lop → giảng viên / môn học
+- ScheduleOccupancy: phòng×slot, GV×slot, lớp×slot kèm bitmask tuần học, số ca của GV
+  và dữ liệu tham chiếu để kiểm tra ràng buộc khi sửa TKB bằng tra dict thay vì query
+"""
+
+from collections import Counter, defaultdict
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Q
+
+from apps.scheduling.models import (
+    DotXep, GiangVien, GVDayMon, LopMonHoc, NguyenVong, PhanCong, PhongHoc, ThoiKhoaBieu, TimeSlot
+)
+from apps.scheduling.utils.weeks import ALL_WEEKS, week_mask
+
+
+def class_teacher_index(dot_xep, version=None):
+    """
+    Chỉ mục ma_lop → {'ma_gv', 'ten_gv', 'ma_mon', 'ten_mon'} của cả đợt, dựng bằng
+    1 query PhanCong và cache (CACHES['schedule']) theo phiên bản TKB của đợt
+    (``version``, mặc định đọc từ DB). Dùng thay cho tra PhanCong từng dòng TKB.
+    Lớp chưa phân công không có trong index.
+    """
+    cache = caches['schedule']
+    version = version or DotXep.schedule_version(dot_xep.ma_dot)
+    key = f'class_teacher_index:{dot_xep.ma_dot}:{version}'
+    index = cache.get(key)
+    if index is None:
+        index = {
+            ma_lop: {'ma_gv': ma_gv, 'ten_gv': ten_gv, 'ma_mon': ma_mon, 'ten_mon': ten_mon}
+            for ma_lop, ma_gv, ten_gv, ma_mon, ten_mon in PhanCong.objects.filter(ma_dot=dot_xep).values_list(
+                'ma_lop_id', 'ma_gv_id', 'ma_gv__ten_gv', 'ma_lop__ma_mon_hoc_id', 'ma_lop__ma_mon_hoc__ten_mon_hoc'
+            )
+        }
+        cache.set(key, index)
+    return index
+
+
+class ScheduleOccupancy:
+    """
+    Trạng thái chiếm dụng của các dòng TKB chưa xóa trong 1 đợt.
+
+    Dựng 1 lần cho mỗi phiên bản TKB (vài query), sau đó endpoint sửa TKB:
+        with transaction.atomic():
+            occupancy = ScheduleOccupancy.for_update(ma_dot)  # khóa đợt
+            ... kiểm tra bằng occupancy, ghi DB ...
+            occupancy.place(...) / occupancy.remove(...)
+            occupancy.save_after_write()  # lưu cache theo phiên bản mới khi commit
+    """
+
+    def __init__(self, dot_xep, version):
+        self.ma_dot = dot_xep.ma_dot
+        self.version = version
+        self.rows = {}  # ma_tkb → (ma_lop, ma_phong, time_slot_id, mask)
+        self.room_slot = defaultdict(set)  # (ma_phong, time_slot_id) → {ma_tkb}
+        self.teacher_slot = defaultdict(set)  # (ma_gv, time_slot_id) → {ma_tkb}
+        self.class_slot = defaultdict(set)  # (ma_lop, time_slot_id) → {ma_tkb}
+        self.teacher_load = Counter()  # ma_gv → số dòng TKB
+        self.lop_teacher = {}  # ma_lop → ma_gv
+        # Dữ liệu tham chiếu (thiếu thì nạp từ DB khi cần)
+        self.lops = {}
+        self.rooms = {}
+        self.slots = {}
+        self.teachers = {}
+        self.preferences = set()  # (ma_gv, time_slot_id) có nguyện vọng
+        self.can_teach = set()  # (ma_gv, ma_mon)
+        self.can_teach_loaded = set()  # ma_gv đã nạp GVDayMon
+
+    # ---------- Dựng / cache ----------
+
+    @staticmethod
+    def _key(ma_dot, version):
+        return f'schedule_occupancy:{ma_dot}:{version}'
+
+    @classmethod
+    def load(cls, dot_xep):
+        """Lấy từ cache theo phiên bản TKB hiện tại của đợt, không có thì dựng"""
+        cache = caches['schedule']
+        version = DotXep.schedule_version(dot_xep.ma_dot)
+        key = cls._key(dot_xep.ma_dot, version)
+        occupancy = cache.get(key)
+        if occupancy is None:
+            occupancy = cls(dot_xep, version)
+            occupancy._build(dot_xep)
+            cache.set(key, occupancy)
+        return occupancy
+
+    @classmethod
+    def for_update(cls, ma_dot):
+        """Khóa dòng đợt (gọi trong transaction) để các lần sửa TKB cùng đợt
+        kiểm tra và ghi lần lượt, rồi lấy trạng thái theo phiên bản hiện tại"""
+        return cls.load(DotXep.objects.select_for_update().get(ma_dot=ma_dot))
+
+    def save_after_write(self):
+        """Sau khi ghi (signal đã tăng phiên bản): lưu trạng thái đã cập nhật
+        dưới phiên bản mới khi transaction commit"""
+        self.version = DotXep.schedule_version(self.ma_dot)
+        key = self._key(self.ma_dot, self.version)
+        transaction.on_commit(lambda: caches['schedule'].set(key, self))
+
+    def _build(self, dot_xep):
+        for ma_lop, info in class_teacher_index(dot_xep, self.version).items():
+            self.lop_teacher[ma_lop] = info['ma_gv']
+            if info['ma_gv']:
+                self.teachers[info['ma_gv']] = info['ten_gv']
+
+        for ma_tkb, ma_lop, ma_phong, time_slot_id, tuan_hoc in ThoiKhoaBieu.objects.filter(
+            ma_dot=dot_xep, is_deleted=False
+        ).values_list('ma_tkb', 'ma_lop_id', 'ma_phong_id', 'time_slot_id_id', 'tuan_hoc'):
+            self.place(ma_tkb, ma_lop, ma_phong, time_slot_id, tuan_hoc)
+
+        lop_filter = Q(phan_cong_list__ma_dot=dot_xep) | Q(tkb_list__ma_dot=dot_xep)
+        for row in LopMonHoc.objects.filter(lop_filter).distinct().values(
+            'ma_lop', 'so_luong_sv', 'ma_mon_hoc_id', 'ma_mon_hoc__ten_mon_hoc',
+            'ma_mon_hoc__so_tiet_lt', 'ma_mon_hoc__so_tiet_th'
+        ):
+            self.lops[row['ma_lop']] = self._lop_info(row)
+        for ma_phong, loai_phong, suc_chua in PhongHoc.objects.values_list('ma_phong', 'loai_phong', 'suc_chua'):
+            self.rooms[ma_phong] = {'loai_phong': loai_phong, 'suc_chua': suc_chua}
+        for slot in TimeSlot.objects.select_related('ca'):
+            self.slots[slot.time_slot_id] = str(slot)
+
+        self.preferences = set(
+            NguyenVong.objects.filter(ma_dot=dot_xep).values_list('ma_gv_id', 'time_slot_id_id')
+        )
+        teacher_ids = set(self.teachers)
+        self.can_teach = set(
+            GVDayMon.objects.filter(ma_gv_id__in=teacher_ids).values_list('ma_gv_id', 'ma_mon_hoc_id')
+        )
+        self.can_teach_loaded = teacher_ids
+
+    # ---------- Dữ liệu tham chiếu ----------
+
+    @staticmethod
+    def _lop_info(row):
+        return {
+            'so_luong_sv': row['so_luong_sv'],
+            'ma_mon': row['ma_mon_hoc_id'],
+            'ten_mon': row['ma_mon_hoc__ten_mon_hoc'],
+            'so_tiet_lt': row['ma_mon_hoc__so_tiet_lt'],
+            'so_tiet_th': row['ma_mon_hoc__so_tiet_th'],
+        }
+
+    def lop(self, ma_lop):
+        """Thông tin lớp; lớp ngoài đợt (VD: vừa tạo) nạp từ DB, không có → LopMonHoc.DoesNotExist"""
+        if ma_lop not in self.lops:
+            row = LopMonHoc.objects.filter(ma_lop=ma_lop).values(
+                'ma_lop', 'so_luong_sv', 'ma_mon_hoc_id', 'ma_mon_hoc__ten_mon_hoc',
+                'ma_mon_hoc__so_tiet_lt', 'ma_mon_hoc__so_tiet_th'
+            ).first()
+            if row is None:
+                raise LopMonHoc.DoesNotExist(f'LopMonHoc {ma_lop} không tồn tại')
+            self.lops[ma_lop] = self._lop_info(row)
+        return self.lops[ma_lop]
+
+    def room(self, ma_phong):
+        if ma_phong not in self.rooms:
+            phong = PhongHoc.objects.get(ma_phong=ma_phong)
+            self.rooms[ma_phong] = {'loai_phong': phong.loai_phong, 'suc_chua': phong.suc_chua}
+        return self.rooms[ma_phong]
+
+    def slot_label(self, time_slot_id):
+        if time_slot_id not in self.slots:
+            self.slots[time_slot_id] = str(TimeSlot.objects.select_related('ca').get(time_slot_id=time_slot_id))
+        return self.slots[time_slot_id]
+
+    def teacher_name(self, ma_gv):
+        if ma_gv not in self.teachers:
+            ten_gv = GiangVien.objects.filter(ma_gv=ma_gv).values_list('ten_gv', flat=True).first()
+            if ten_gv is None:
+                raise GiangVien.DoesNotExist(f'GiangVien {ma_gv} không tồn tại')
+            self.teachers[ma_gv] = ten_gv
+        return self.teachers[ma_gv]
+
+    def teacher_of(self, ma_lop):
+        return self.lop_teacher.get(ma_lop)
+
+    def teaches(self, ma_gv, ma_mon):
+        if ma_gv not in self.can_teach_loaded:
+            self.can_teach.update(
+                GVDayMon.objects.filter(ma_gv_id=ma_gv).values_list('ma_gv_id', 'ma_mon_hoc_id')
+            )
+            self.can_teach_loaded.add(ma_gv)
+        return (ma_gv, ma_mon) in self.can_teach
+
+    # ---------- Chiếm dụng ----------
+
+    def place(self, ma_tkb, ma_lop, ma_phong, time_slot_id, tuan_hoc=None):
+        """Thêm / cập nhật 1 dòng TKB chưa xóa"""
+        self.remove(ma_tkb)
+        self._add(ma_tkb, (ma_lop, ma_phong, time_slot_id, week_mask(tuan_hoc)))
+
+    def _add(self, ma_tkb, row):
+        ma_lop, ma_phong, time_slot_id, _ = row
+        self.rows[ma_tkb] = row
+        if ma_phong:
+            self.room_slot[(ma_phong, time_slot_id)].add(ma_tkb)
+        self.class_slot[(ma_lop, time_slot_id)].add(ma_tkb)
+        ma_gv = self.lop_teacher.get(ma_lop)
+        if ma_gv:
+            self.teacher_slot[(ma_gv, time_slot_id)].add(ma_tkb)
+            self.teacher_load[ma_gv] += 1
+
+    def remove(self, ma_tkb):
+        """Bỏ 1 dòng (xóa mềm hoặc trước khi đặt lại)"""
+        row = self.rows.pop(ma_tkb, None)
+        if row is None:
+            return
+        ma_lop, ma_phong, time_slot_id, _ = row
+        self.room_slot[(ma_phong, time_slot_id)].discard(ma_tkb)
+        self.class_slot[(ma_lop, time_slot_id)].discard(ma_tkb)
+        ma_gv = self.lop_teacher.get(ma_lop)
+        if ma_gv:
+            self.teacher_slot[(ma_gv, time_slot_id)].discard(ma_tkb)
+            self.teacher_load[ma_gv] -= 1
+
+    def set_teacher(self, ma_lop, ma_gv, ten_gv=None):
+        """Đổi phân công của lớp: chuyển các dòng của lớp sang GV mới"""
+        if self.lop_teacher.get(ma_lop) == ma_gv:
+            return
+        rows = [(ma_tkb, row) for ma_tkb, row in self.rows.items() if row[0] == ma_lop]
+        for ma_tkb, _ in rows:
+            self.remove(ma_tkb)
+        self.lop_teacher[ma_lop] = ma_gv
+        if ma_gv and ten_gv:
+            self.teachers[ma_gv] = ten_gv
+        for ma_tkb, row in rows:
+            self._add(ma_tkb, row)
+
+    def conflict(self, index, key, mask=ALL_WEEKS, exclude=()):
+        """Dòng đầu tiên trong index[key] trùng tuần học với mask (bỏ qua exclude), hoặc None"""
+        for ma_tkb in sorted(index.get(key, ())):
+            if ma_tkb not in exclude and self.rows[ma_tkb][3] & mask:
+                return ma_tkb
+        return None
+
+    def room_conflict(self, ma_phong, time_slot_id, mask=ALL_WEEKS, exclude=()):
+        return self.conflict(self.room_slot, (ma_phong, time_slot_id), mask, exclude)
+
+    def teacher_conflict(self, ma_gv, time_slot_id, mask=ALL_WEEKS, exclude=()):
+        return self.conflict(self.teacher_slot, (ma_gv, time_slot_id), mask, exclude)
+
+    def class_conflict(self, ma_lop, time_slot_id, mask=ALL_WEEKS, exclude=()):
+        return self.conflict(self.class_slot, (ma_lop, time_slot_id), mask, exclude)
+
+    def occupied_rooms(self, time_slot_id):
+        """Các phòng đang có lớp ở time slot"""
+        return sorted({
+            ma_phong for (ma_phong, slot), rows in self.room_slot.items()
+            if slot == time_slot_id and ma_phong and rows
+        })
+
+    def row_lop(self, ma_tkb):
+        return self.rows[ma_tkb][0]
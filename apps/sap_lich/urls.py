@@ -11,6 +11,10 @@ urlpatterns = [
     path('llm-scheduler/', views.llm_scheduler_view, name='llm_scheduler'),
     path('algo-scheduler/', views.algo_scheduler_view, name='algo_scheduler'),
     path('api/algo-scheduler/run/', views.algo_scheduler_run_api, name='algo_scheduler_run_api'),
+    path('api/algo-scheduler/job/', views.algo_scheduler_job_status_api, name='algo_scheduler_job_status_api'),
+    path('api/algo-scheduler/job/progress/', views.algo_scheduler_job_progress_api, name='algo_scheduler_job_progress_api'),
+    path('api/algo-scheduler/job/cancel/', views.algo_scheduler_job_cancel_api, name='algo_scheduler_job_cancel_api'),
+    path('api/algo-scheduler/run-multi/', views.algo_scheduler_run_multi_api, name='algo_scheduler_run_multi_api'),
     path('api/algo-scheduler/stats/', views.algo_scheduler_get_stats_api, name='algo_scheduler_get_stats_api'),
     path('api/algo-scheduler/view-result/', views.algo_scheduler_view_result_api, name='algo_scheduler_view_result_api'),
     path('api/algo-scheduler/weights/', views.algo_scheduler_get_weights_api, name='algo_scheduler_get_weights_api'),
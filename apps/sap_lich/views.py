@@ -10,16 +10,20 @@ import time
 from datetime import datetime, timedelta
 from functools import wraps
 from django.contrib import admin
+from django.core.cache import caches
 from django.shortcuts import render, redirect
 from django.http import JsonResponse, HttpResponseForbidden
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.db.models import Q, Prefetch
+from django.db import transaction
 from apps.scheduling.models import (
     DotXep, ThoiKhoaBieu, GiangVien, PhongHoc, 
     TimeSlot, KhungTG, PhanCong, LopMonHoc, MonHoc,
-    NguyenVong, GVDayMon, TKBLog
+    NguyenVong, GVDayMon, TKBLog, SolverJob, IdSequence
 )
+from apps.sap_lich.occupancy import ScheduleOccupancy, class_teacher_index
+from apps.scheduling.utils.weeks import week_mask
 
 logger = logging.getLogger(__name__)
 
@@ -130,6 +134,9 @@ def algo_scheduler_get_stats_api(request):
     
     Query params:
         ma_dot: Mã đợt xếp lịch
+        strategy: "TS" hoặc "SA" (cho gợi ý time limit, mặc định TS)
+        target_ratio: optional, cost mục tiêu / cost ban đầu (mặc định: mức
+            thường đạt được trong lịch sử)
     
     Returns:
         {
@@ -142,6 +149,15 @@ def algo_scheduler_get_stats_api(request):
                 "mon_hoc": 60,
                 "time_slots": 50,
                 "tkb_existing": 0
+            },
+            "prediction": {
+                "available": true,
+                "features": {"lectures": 216, "room_scarcity": 0.21, ...},
+                "target_ratio": 0.45,
+                "predicted_seconds": 142.3,
+                "suggested_time_limit": 180,
+                "expected_ratio": {"60": 0.61, "180": 0.44, "400": 0.38},
+                "n_runs": 12
             }
         }
     """
@@ -154,6 +170,20 @@ def algo_scheduler_get_stats_api(request):
                 'message': 'Vui lòng cung cấp ma_dot'
             }, status=400)
         
+        target_ratio = request.GET.get('target_ratio')
+        if target_ratio:
+            try:
+                target_ratio = float(target_ratio)
+            except ValueError:
+                target_ratio = None
+            if target_ratio is None or not 0 < target_ratio <= 1:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'target_ratio phải là số trong khoảng (0, 1]'
+                }, status=400)
+        else:
+            target_ratio = None
+        
         # Get the scheduling period
         try:
             dot_xep = DotXep.objects.get(ma_dot=ma_dot)
@@ -206,7 +236,12 @@ def algo_scheduler_get_stats_api(request):
                 'mon_hoc': mon_hoc_count,
                 'time_slots': time_slots_count,
                 'nguyen_vong': nguyen_vong_count
-            }
+            },
+            'prediction': _solve_time_prediction(
+                dot_xep,
+                request.GET.get('strategy', 'TS'),
+                target_ratio
+            )
         })
         
     except Exception as e:
@@ -217,6 +252,32 @@ def algo_scheduler_get_stats_api(request):
         }, status=500)
 
 
+def _solve_time_prediction(dot_xep, strategy='TS', target_ratio=None):
+    """Gợi ý time limit cho đợt từ đặc trưng instance + lịch sử các lần chạy.
+    Đặc trưng cache (CACHES['schedule']) theo phiên bản TKB của đợt - phân công, lớp,
+    phòng... đổi đều tăng phiên bản; model cache theo lần chạy mới nhất (solve_time_model)"""
+    from apps.scheduling.algorithms.algorithms_data_adapter import build_instance_from_db
+    from apps.scheduling.algorithms.algorithms_runner import AlgorithmRunner
+    from apps.scheduling.algorithms.solve_time_model import instance_features
+    
+    cache = caches['schedule']
+    key = f'solve_time_features:{dot_xep.ma_dot}:{DotXep.schedule_version(dot_xep.ma_dot)}'
+    features = cache.get(key)
+    if features is None:
+        try:
+            features = instance_features(build_instance_from_db(dot_xep))
+        except Exception as e:
+            return {'available': False, 'reason': f'Không dựng được instance: {e}'}
+        cache.set(key, features)
+    prediction = AlgorithmRunner.solve_time_model().suggest(
+        features,
+        strategy=strategy,
+        target_ratio=target_ratio
+    )
+    prediction['features'] = features
+    return prediction
+
+
 def llm_scheduler_view(request, ma_gv=None):
     """
     LLM Chatbot Assistant - Tất cả user đăng nhập đều có thể truy cập
@@ -338,11 +399,28 @@ def algo_scheduler_run_api(request):
         "ma_dot": "2025-2026_HK1",
         "strategy": "TS",  // "TS" (Tabu Search) hoặc "SA" (Simulated Annealing)
         "init_method": "greedy-cprop",  // "greedy-cprop" hoặc "random-repair"
-        "time_limit": 180,  // seconds (default 180s = 3 phút)
+        "time_limit": 180,  // seconds (default 180s = 3 phút), "auto" = theo gợi ý từ lịch sử chạy
         "seed": 42,  // optional, random seed
-        "save_to_db": true  // optional, lưu vào ThoiKhoaBieu hay không
+        "max_iterations": 20000,  // optional, giới hạn số iteration SA/TS
+        "max_evaluations": null,  // optional, giới hạn số lần evaluate move
+        "decompose": false,  // optional, tách thành các thành phần độc lập và giải song song
+        "batch_eval": false,  // optional, TS lọc move bằng NumPy batch evaluator (thử nghiệm)
+        "force": false,  // optional, bỏ qua kết quả đã cache và chạy lại
+        "save_to_db": true,  // optional, lưu vào ThoiKhoaBieu hay không
+        "background": true  // mặc định: đưa vào hàng đợi (manage.py solver_worker) và trả job_id ngay;
+                            // false = chạy trực tiếp trong request (chỉ để debug, vẫn tính vào
+                            // SOLVER_MAX_CONCURRENT_JOBS - hết chỗ thì vẫn vào hàng đợi)
     }
     
+    Nếu có max_iterations/max_evaluations mà không gửi time_limit, tìm kiếm chạy
+    theo budget đếm (deterministic): cùng seed + budget cho cùng kết quả.
+    
+    Mỗi đợt chỉ có 1 lần chạy tại một thời điểm (409 nếu đợt đang có job).
+    Job vào hàng đợi → 202 {"status": "queued", "job_id": ...}; theo dõi / huỷ qua
+    algo_scheduler_job_progress_api (SSE), algo_scheduler_job_status_api và
+    algo_scheduler_job_cancel_api. Response bên dưới là kết quả job (khi chạy trực tiếp
+    hoặc trong "result" của job status).
+    
     Returns:
     {
         "status": "success",
@@ -362,19 +440,36 @@ def algo_scheduler_run_api(request):
         },
         "sol_file": "/path/to/solution.sol",
         "saved_to_db": true,
+        "save_stats": {"created": 12, "updated": 30, "restored": 0, "deleted": 2,
+                       "unchanged": 39, "skipped": 0, "elapsed": 0.08},
         "message": "Xếp lịch thành công!"
     }
     """
     try:
-        from apps.scheduling.algorithms.algorithms_runner import AlgorithmRunner
+        from apps.scheduling.algorithms.solver_jobs import DotBusyError, enqueue, run_job
         
         data = json.loads(request.body)
         ma_dot = data.get('ma_dot')
         strategy = data.get('strategy', 'TS').upper()
         init_method = data.get('init_method', 'greedy-cprop')
-        time_limit = float(data.get('time_limit', 180))
+        max_iterations = data.get('max_iterations')
+        max_evaluations = data.get('max_evaluations')
+        max_iterations = int(max_iterations) if max_iterations is not None else None
+        max_evaluations = int(max_evaluations) if max_evaluations is not None else None
+        count_budget = max_iterations is not None or max_evaluations is not None
+        time_limit_auto = data.get('time_limit') == 'auto'
+        if data.get('time_limit') is None and count_budget:
+            time_limit = None  # Deterministic: chỉ dừng theo budget đếm
+        elif time_limit_auto:
+            time_limit = None  # Lấy theo gợi ý của model dự đoán (sau khi tìm được DotXep)
+        else:
+            time_limit = float(data.get('time_limit', 180))
         seed = data.get('seed', 42)
         save_to_db = data.get('save_to_db', True)
+        decompose = bool(data.get('decompose', False))
+        batch_eval = bool(data.get('batch_eval', False))
+        force = bool(data.get('force', False))
+        background = bool(data.get('background', True))
 
         # Validation
         if not ma_dot:
@@ -395,99 +490,350 @@ def algo_scheduler_run_api(request):
                 'message': 'Init method không hợp lệ. Phải là "greedy-cprop" hoặc "random-repair"'
             }, status=400)
 
+        dot_xep = DotXep.objects.filter(ma_dot=ma_dot).first()
+        if dot_xep is None:
+            return JsonResponse({
+                'status': 'error',
+                'message': f'Không tìm thấy đợt xếp {ma_dot}'
+            }, status=404)
+
         logger.info(f"🚀 Bắt đầu xếp lịch cho {ma_dot}")
-        logger.info(f"   Strategy: {strategy}, Init: {init_method}, Time: {time_limit}s, Seed: {seed}")
+        logger.info(f"   Strategy: {strategy}, Init: {init_method}, Time: {time_limit}s, Seed: {seed}, "
+                    f"Max iterations: {max_iterations}, Max evaluations: {max_evaluations}, Background: {background}")
+
+        params = {
+            'strategy': strategy,
+            'init_method': init_method,
+            'time_limit': time_limit,
+            'time_limit_auto': time_limit_auto,
+            'seed': seed,
+            'max_iterations': max_iterations,
+            'max_evaluations': max_evaluations,
+            'decompose': decompose,
+            'batch_eval': batch_eval,
+            'force': force,
+            'save_to_db': save_to_db,
+        }
+        # Mỗi lần chạy là 1 SolverJob: giữ loại trừ theo đợt và cho phép huỷ cả khi chạy trực tiếp
+        try:
+            job = enqueue(dot_xep, params, user=request.user.username, run_inline=not background)
+        except DotBusyError as e:
+            return JsonResponse({
+                'status': 'error',
+                'message': f'Đợt {ma_dot} đang được xếp lịch (job #{e.job.id if e.job else "?"}), vui lòng đợi hoặc huỷ job đó',
+                'job_id': e.job.id if e.job else None
+            }, status=409)
+
+        if job.status == 'QUEUED':
+            return JsonResponse({
+                'status': 'queued',
+                'job_id': job.id,
+                'message': f'Đã đưa vào hàng đợi (job #{job.id})'
+            }, status=202)
+
+        status_code, job = run_job(job)
+        return JsonResponse({**job.result, 'job_id': job.id}, status=status_code)
+
+    except json.JSONDecodeError:
+        logger.error("JSON không hợp lệ")
+        return JsonResponse({
+            'status': 'error',
+            'message': 'JSON không hợp lệ'
+        }, status=400)
+    except Exception as e:
+        logger.exception(f"Lỗi API: {e}")
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Lỗi: {str(e)}'
+        }, status=500)
 
-        # Step 1: Initialize runner
-        runner = AlgorithmRunner(ma_dot=ma_dot, seed=seed)
 
-        # Step 2: Prepare data (export DB to CTT)
-        logger.info("📊 Step 1: Chuẩn bị dữ liệu (export DB sang CTT)")
+def _job_payload(job):
+    """Trạng thái job cho API polling"""
+    return {
+        'job_id': job.id,
+        'ma_dot': job.ma_dot_id,
+        'job_status': job.status,
+        'params': job.params,
+        'created_by': job.created_by,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'cancel_requested': job.cancel_requested,
+        'finish_early': job.finish_early,
+        'progress': job.progress,
+        'queue_position': (
+            SolverJob.objects.filter(status='QUEUED', created_at__lt=job.created_at).count() + 1
+            if job.status == 'QUEUED' else None
+        ),
+        'result': job.result,
+        'error': job.error,
+    }
+
+
+@require_role('admin')
+@require_http_methods(["GET"])
+def algo_scheduler_job_status_api(request):
+    """
+    Trạng thái job xếp lịch chạy nền - CHỈ ADMIN
+    
+    Query params:
+        job_id: Mã job (trả về bởi algo_scheduler_run_api với background=true)
+        ma_dot: hoặc lấy job mới nhất của đợt
+    
+    Returns:
+    {
+        "status": "success",
+        "job": {"job_id": 12, "job_status": "RUNNING", "queue_position": null, "result": null, ...}
+    }
+    """
+    job_id = request.GET.get('job_id')
+    ma_dot = request.GET.get('ma_dot')
+    jobs = SolverJob.objects.all()
+    if job_id:
+        job = jobs.filter(id=job_id).first() if job_id.isdigit() else None
+    elif ma_dot:
+        job = jobs.filter(ma_dot_id=ma_dot).order_by('-created_at', '-id').first()
+    else:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Vui lòng cung cấp job_id hoặc ma_dot'
+        }, status=400)
+    if job is None:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Không tìm thấy job'
+        }, status=404)
+    return JsonResponse({'status': 'success', 'job': _job_payload(job)})
+
+
+@require_role('admin')
+@csrf_exempt
+@require_http_methods(["POST"])
+def algo_scheduler_job_cancel_api(request):
+    """
+    Huỷ / dừng sớm job xếp lịch - CHỈ ADMIN
+    
+    Expected POST data:
+    {
+        "job_id": 12,
+        "finish_early": false  // optional, true = dừng tìm kiếm nhưng vẫn lưu lời giải tốt nhất
+    }
+    
+    Job đang chờ bị huỷ ngay; job đang chạy dừng ở lần kiểm tra kế tiếp của
+    vòng SA/TS (khoảng 1 giây) và không lưu kết quả vào database (trừ khi finish_early).
+    """
+    from apps.scheduling.algorithms.solver_jobs import request_cancel
+    
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'JSON không hợp lệ'
+        }, status=400)
+    job = SolverJob.objects.filter(id=data.get('job_id')).first() if str(data.get('job_id', '')).isdigit() else None
+    if job is None:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Không tìm thấy job'
+        }, status=404)
+    if job.status not in SolverJob.ACTIVE_STATUSES:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Job #{job.id} đã kết thúc ({job.status})',
+            'job': _job_payload(job)
+        }, status=409)
+    finish_early = bool(data.get('finish_early', False))
+    job = request_cancel(job, finish_early=finish_early)
+    logger.info(f"Job #{job.id} {'finish early' if finish_early else 'cancel'} requested by {request.user.username}")
+    if job.status == 'CANCELLED':
+        message = f'Đã huỷ job #{job.id}'
+    elif finish_early:
+        message = f'Đang dừng sớm job #{job.id} (giữ lời giải tốt nhất)...'
+    else:
+        message = f'Đang dừng job #{job.id}...'
+    return JsonResponse({
+        'status': 'success',
+        'message': message,
+        'job': _job_payload(job)
+    })
+
+
+# Thời gian tối đa của 1 kết nối SSE - client (EventSource) tự kết nối lại sau đó
+# Mỗi stream giữ 1 worker WSGI: đóng sau ít giây, EventSource tự kết nối lại
+# (sau "retry") kèm Last-Event-ID nên client không mất sự kiện nào
+JOB_PROGRESS_STREAM_MAX_SECONDS = 45
+JOB_PROGRESS_KEEPALIVE_SECONDS = 15
+
+
+def _job_progress_events(job_id, last_seq=0):
+    """Sinh các sự kiện SSE từ SolverJob.progress đến khi job kết thúc"""
+    from django.conf import settings
+    from django.db import close_old_connections
+    
+    interval = max(0.2, getattr(settings, 'SOLVER_PROGRESS_INTERVAL', 1.0))
+    started = last_sent = time.monotonic()
+    yield f"retry: {int(interval * 2000)}\n\n"
+    while time.monotonic() - started < JOB_PROGRESS_STREAM_MAX_SECONDS:
+        row = SolverJob.objects.filter(id=job_id).values('status', 'progress').first()
+        if row is None:
+            break
+        progress = row['progress'] or {}
+        if progress.get('seq', 0) != last_seq:
+            last_seq = progress.get('seq', 0)
+            last_sent = time.monotonic()
+            payload = json.dumps({**progress, 'job_status': row['status']}, ensure_ascii=False)
+            yield f"id: {last_seq}\nevent: progress\ndata: {payload}\n\n"
+        if row['status'] not in SolverJob.ACTIVE_STATUSES:
+            job = SolverJob.objects.get(id=job_id)
+            yield f"event: done\ndata: {json.dumps(_job_payload(job), ensure_ascii=False)}\n\n"
+            return
+        if time.monotonic() - last_sent >= JOB_PROGRESS_KEEPALIVE_SECONDS:
+            last_sent = time.monotonic()
+            yield ": keep-alive\n\n"
+        close_old_connections()
+        time.sleep(interval)
+
+
+@require_role('admin')
+@require_http_methods(["GET"])
+def algo_scheduler_job_progress_api(request):
+    """
+    Stream tiến trình job xếp lịch (Server-Sent Events) - CHỈ ADMIN
+    
+    Query params:
+        job_id: Mã job
+    
+    Events (tối đa 1 lần / settings.SOLVER_PROGRESS_INTERVAL giây, chỉ khi có dữ liệu mới):
+        progress: {"seq", "phase": "prepare|init|search|save|done", "elapsed", "best_cost",
+                   "current_cost", "accept_rate", "temperature" (SA) | "tenure" (TS),
+                   "breakdown", "progress" (0..1 theo budget), "curve": [[giây, best_cost], ...],
+                   "job_status"}
+        done: trạng thái job cuối cùng (như algo_scheduler_job_status_api)
+    
+    Mỗi response chỉ mở tối đa JOB_PROGRESS_STREAM_MAX_SECONDS giây (không giữ worker
+    WSGI suốt lần chạy); EventSource kết nối lại sau "retry" với header Last-Event-ID
+    và stream tiếp từ sự kiện kế tiếp.
+    """
+    from django.http import StreamingHttpResponse
+    
+    job_id = request.GET.get('job_id', '')
+    if not job_id.isdigit() or not SolverJob.objects.filter(id=job_id).exists():
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Không tìm thấy job'
+        }, status=404)
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    response = StreamingHttpResponse(
+        _job_progress_events(int(job_id), int(last_event_id) if last_event_id.isdigit() else 0),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: không buffer stream
+    return response
+
+
+@require_role('admin')
+@csrf_exempt
+@require_http_methods(["POST"])
+def algo_scheduler_run_multi_api(request):
+    """
+    API endpoint để xếp lịch nhiều đợt cùng lúc, dùng chung phòng học - CHỈ ADMIN
+    
+    Mỗi đợt chạy trong 1 worker process; phòng/tiết của các đợt khác cùng học kỳ
+    đã có TKB được coi là ô cố định. Sau khi giải, bước sửa phòng tuần tự xử lý
+    xung đột giữa các đợt (đợt đứng trước trong ma_dots được giữ phòng).
+    
+    Expected POST data:
+    {
+        "ma_dots": ["DOT1_2025-2026_HK1", "DOT2_2025-2026_HK1"],
+        "strategy": "TS",
+        "init_method": "greedy-cprop",
+        "time_limit": 180,
+        "seed": 42,
+        "max_iterations": null,
+        "max_evaluations": null,
+        "workers": null,  // optional, số process tối đa
+        "batch_eval": false,  // optional, TS lọc move bằng NumPy batch evaluator (thử nghiệm)
+        "save_to_db": true
+    }
+    """
+    try:
+        from apps.scheduling.algorithms.algorithms_runner import MultiDotRunner
+        
+        data = json.loads(request.body)
+        ma_dots = data.get('ma_dots') or []
+        strategy = data.get('strategy', 'TS').upper()
+        init_method = data.get('init_method', 'greedy-cprop')
+        max_iterations = data.get('max_iterations')
+        max_evaluations = data.get('max_evaluations')
+        max_iterations = int(max_iterations) if max_iterations is not None else None
+        max_evaluations = int(max_evaluations) if max_evaluations is not None else None
+        if data.get('time_limit') is None and (max_iterations is not None or max_evaluations is not None):
+            time_limit = None  # Deterministic: chỉ dừng theo budget đếm
+        else:
+            time_limit = float(data.get('time_limit', 180))
+        seed = int(data.get('seed', 42))
+        workers = data.get('workers')
+        batch_eval = bool(data.get('batch_eval', False))
+        save_to_db = data.get('save_to_db', True)
+        
+        if not isinstance(ma_dots, list) or len(ma_dots) < 2:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Vui lòng cung cấp ít nhất 2 đợt trong ma_dots'
+            }, status=400)
+        
+        if strategy not in ['TS', 'SA']:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Strategy không hợp lệ. Phải là "TS" hoặc "SA"'
+            }, status=400)
+        
+        if init_method not in ['greedy-cprop', 'random-repair']:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Init method không hợp lệ. Phải là "greedy-cprop" hoặc "random-repair"'
+            }, status=400)
+        
+        logger.info(f"🚀 Bắt đầu xếp lịch nhiều đợt: {ma_dots}")
+        runner = MultiDotRunner(ma_dots=ma_dots, seed=seed, max_workers=int(workers) if workers else None)
         if not runner.prepare_data():
             return JsonResponse({
                 'status': 'error',
-                'message': 'Không thể chuẩn bị dữ liệu. Kiểm tra xem DotXep có tồn tại và có dữ liệu hợp lệ không.'
+                'message': 'Không thể chuẩn bị dữ liệu. Kiểm tra xem các DotXep có tồn tại và có dữ liệu hợp lệ không.'
             }, status=400)
-
-        # Step 3: Run optimization
-        logger.info("🔧 Step 2: Chạy thuật toán optimization")
-        result = runner.run_optimization(
+        
+        result = runner.run(
             strategy=strategy,
             init_method=init_method,
-            time_limit=time_limit
+            time_limit=time_limit,
+            max_iterations=max_iterations,
+            max_evaluations=max_evaluations,
+            batch_eval=batch_eval,
+            save_to_db=save_to_db
         )
-
-        if not result or not result.get('success'):
-            error_msg = result.get('error', 'Thuật toán thất bại') if result else 'Lỗi không xác định'
-            logger.error(f"❌ Optimization failed: {error_msg}")
+        if 'error' in result:
             return JsonResponse({
                 'status': 'error',
-                'message': error_msg
+                'message': result['error']
             }, status=500)
-
-        # Step 4: Save to database (nếu requested)
-        if save_to_db:
-            logger.info("💾 Step 3: Lưu kết quả vào database")
-            
-            # Reconstruct assignments from formatted result
-            assignments = {}
-            for lecture_id_str, assignment_data in result.get('assignments', {}).items():
-                lecture_id = int(lecture_id_str)
-                period = assignment_data['period_absolute']
-                
-                # Find room_idx from room_id
-                room_id = assignment_data['room_id']
-                room_idx = None
-                for idx, room in enumerate(runner.instance.rooms):
-                    if room.id == room_id:
-                        room_idx = idx
-                        break
-                
-                if room_idx is not None:
-                    assignments[lecture_id] = (period, room_idx)
-            
-            saved = runner.save_to_database(assignments)
-            result['saved_to_db'] = saved
-            
-            if not saved:
-                logger.warning("⚠️  Lưu vào database thất bại, nhưng optimization thành công")
-                result['warning'] = 'Lưu vào database thất bại'
-        else:
-            result['saved_to_db'] = False
-
-        # Format response
-        logger.info(f"✅ Xếp lịch hoàn tất!")
-        logger.info(f"   Initial cost: {result['initial_cost']}")
-        logger.info(f"   Final cost: {result['final_cost']}")
-        logger.info(f"   Improvement: {result['improvement']} ({result['improvement_percent']:.1f}%)")
-        logger.info(f"   Teacher preferences: {result['breakdown']['teacher_preferences']} violations")
-
-        # Convert to JsonResponse format
+        
+        unresolved = sum(len(dot['room_repair']['unresolved']) for dot in result['dots'])
         response = {
-            'status': 'success',
-            'ma_dot': result['ma_dot'],
-            'initial_cost': result['initial_cost'],
-            'final_cost': result['final_cost'],
-            'improvement': result['improvement'],
-            'improvement_percent': round(result['improvement_percent'], 2),
+            'status': 'success' if result['success'] else 'warning',
+            'dots': result['dots'],
+            'committed_cells': result['committed_cells'],
             'time_elapsed': round(result['time_elapsed'], 2),
-            'breakdown': result['breakdown'],
-            'sol_file': result['sol_file'],
-            'saved_to_db': result['saved_to_db'],
-            'message': f'Xếp lịch thành công! Cost giảm từ {result["initial_cost"]} xuống {result["final_cost"]} ({result["improvement_percent"]:.1f}%)',
-            'details': {
-                'strategy': strategy,
-                'init_method': init_method,
-                'seed': seed,
-                'lectures_scheduled': len(result.get('assignments', {}))
-            }
+            'message': (
+                f'Xếp lịch {len(result["dots"])} đợt thành công!'
+                if result['success'] else
+                f'Còn {unresolved} lecture không tìm được phòng/tiết trống - các đợt này chưa được lưu'
+            ),
         }
-
-        if 'warning' in result:
-            response['warning'] = result['warning']
-
         return JsonResponse(response)
-
+    
     except json.JSONDecodeError:
         logger.error("JSON không hợp lệ")
         return JsonResponse({
@@ -562,16 +908,14 @@ def algo_scheduler_view_result_api(request):
             'time_slot_id__ca'
         ).order_by('time_slot_id__thu', 'time_slot_id__ca__ma_khung_gio')
         
-        # Lấy mapping từ ma_lop sang giảng viên qua PhanCong
-        lop_to_gv = {}
-        for pc in PhanCong.objects.filter(ma_dot=dot_xep).select_related('ma_lop', 'ma_gv'):
-            lop_to_gv[pc.ma_lop.ma_lop] = pc.ma_gv
+        # Mapping từ ma_lop sang giảng viên (chỉ mục dùng chung của đợt)
+        lop_to_gv = class_teacher_index(dot_xep)
         
         # Format kết quả
         schedules = []
         for tkb in tkb_list:
             # Lấy thông tin giảng viên từ mapping
-            gv = lop_to_gv.get(tkb.ma_lop.ma_lop)
+            gv = lop_to_gv.get(tkb.ma_lop.ma_lop, {})
             
             schedules.append({
                 'id': tkb.ma_tkb,
@@ -579,8 +923,8 @@ def algo_scheduler_view_result_api(request):
                 'ten_lop': f"{tkb.ma_lop.ma_mon_hoc.ten_mon_hoc} (Nhóm {tkb.ma_lop.nhom_mh})",
                 'ma_mon': tkb.ma_lop.ma_mon_hoc.ma_mon_hoc,
                 'ten_mon': tkb.ma_lop.ma_mon_hoc.ten_mon_hoc,
-                'ma_gv': gv.ma_gv if gv else 'N/A',
-                'ten_gv': gv.ten_gv if gv else 'Chưa phân công',
+                'ma_gv': gv.get('ma_gv') or 'N/A',
+                'ten_gv': gv.get('ten_gv') or 'Chưa phân công',
                 'ma_phong': tkb.ma_phong.ma_phong if tkb.ma_phong else 'N/A',
                 'suc_chua': tkb.ma_phong.suc_chua if tkb.ma_phong and tkb.ma_phong.suc_chua else 0,
                 'loai_phong': tkb.ma_phong.loai_phong if tkb.ma_phong else 'N/A',
@@ -749,12 +1093,13 @@ def algo_scheduler_export_excel_api(request):
     Expected GET parameters:
     - ma_dot: Mã đợt xếp lịch
     
+    Dữ liệu đọc bằng values_list().iterator() và ghi ra workbook write-only
+    (ExcelExporter.stream_workbook) nên bộ nhớ không tăng theo số dòng.
+    
     Returns:
         Excel file download
     """
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-    from openpyxl.utils import get_column_letter
+    from apps.scheduling.utils.excel_export import ExcelExporter
     
     try:
         ma_dot = request.GET.get('ma_dot')
@@ -774,108 +1119,60 @@ def algo_scheduler_export_excel_api(request):
                 'message': f'Không tìm thấy đợt xếp {ma_dot}'
             }, status=404)
         
-        # Lấy tất cả thời khóa biểu của đợt
-        tkb_list = ThoiKhoaBieu.objects.filter(
-            ma_dot=dot_xep
-        ).select_related(
-            'ma_lop',
-            'ma_lop__ma_mon_hoc',
-            'ma_phong',
-            'time_slot_id__ca'
-        ).order_by('time_slot_id__thu', 'time_slot_id__ca__ma_khung_gio')
-        
-        # Lấy mapping từ ma_lop sang giảng viên qua PhanCong
-        lop_to_gv = {}
-        for pc in PhanCong.objects.filter(ma_dot=dot_xep).select_related('ma_lop', 'ma_gv'):
-            lop_to_gv[pc.ma_lop.ma_lop] = pc.ma_gv
-        
-        # Create workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = f"TKB_{ma_dot}"
-        
-        # Styling
-        header_fill = PatternFill(start_color="0066CC", end_color="0066CC", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF", size=11)
-        border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
+        # Lấy tất cả thời khóa biểu của đợt (bỏ bản ghi đã xóa mềm)
+        tkb_rows = ThoiKhoaBieu.objects.filter(
+            ma_dot=dot_xep, is_deleted=False
+        ).order_by(
+            'time_slot_id__thu', 'time_slot_id__ca__ma_khung_gio'
+        ).values_list(
+            'ma_lop__ma_lop', 'ma_lop__ma_mon_hoc__ten_mon_hoc', 'ma_lop__nhom_mh',
+            'ma_phong__ma_phong', 'ma_phong__loai_phong', 'ma_phong__suc_chua',
+            'time_slot_id__thu', 'time_slot_id__ca__ma_khung_gio',
+            'time_slot_id__ca__gio_bat_dau', 'time_slot_id__ca__gio_ket_thuc', 'tuan_hoc'
         )
         
+        # Mapping từ ma_lop sang giảng viên (chỉ mục dùng chung của đợt)
+        lop_to_gv = {
+            ma_lop: (info['ma_gv'], info['ten_gv'])
+            for ma_lop, info in class_teacher_index(dot_xep).items()
+        }
+        
         # Headers
         headers = ['STT', 'Mã Lớp', 'Tên Môn Học', 'Nhóm', 'Mã GV', 'Tên GV', 
                    'Mã Phòng', 'Loại Phòng', 'Sức Chứa', 'Thứ', 'Ca', 'Giờ BĐ', 'Giờ KT', 'Tuần Học']
         
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            cell.border = border
-        
         # Mapping thứ
         day_map = {
             2: 'Thứ 2', 3: 'Thứ 3', 4: 'Thứ 4', 5: 'Thứ 5',
             6: 'Thứ 6', 7: 'Thứ 7', 8: 'Chủ Nhật'
         }
         
-        # Write data
-        for row_num, tkb in enumerate(tkb_list, 2):
-            gv = lop_to_gv.get(tkb.ma_lop.ma_lop)
-            
-            row_data = [
-                row_num - 1,  # STT
-                tkb.ma_lop.ma_lop,
-                tkb.ma_lop.ma_mon_hoc.ten_mon_hoc,
-                tkb.ma_lop.nhom_mh,
-                gv.ma_gv if gv else 'N/A',
-                gv.ten_gv if gv else 'Chưa phân công',
-                tkb.ma_phong.ma_phong if tkb.ma_phong else 'N/A',
-                tkb.ma_phong.loai_phong if tkb.ma_phong else 'N/A',
-                tkb.ma_phong.suc_chua if tkb.ma_phong else 0,
-                day_map.get(tkb.time_slot_id.thu, tkb.time_slot_id.thu),
-                f"Ca {tkb.time_slot_id.ca.ma_khung_gio}",
-                str(tkb.time_slot_id.ca.gio_bat_dau),
-                str(tkb.time_slot_id.ca.gio_ket_thuc),
-                tkb.tuan_hoc if tkb.tuan_hoc else '1-15'
-            ]
-            
-            for col_num, value in enumerate(row_data, 1):
-                cell = ws.cell(row=row_num, column=col_num)
-                cell.value = str(value) if value is not None else ''
-                cell.border = border
-                cell.alignment = Alignment(vertical='center')
-        
-        # Auto-adjust column widths
-        for col_num in range(1, len(headers) + 1):
-            column_letter = get_column_letter(col_num)
-            max_length = len(headers[col_num - 1])
-            
-            for row_num in range(2, min(102, ws.max_row + 1)):
-                cell_value = ws[f'{column_letter}{row_num}'].value
-                if cell_value:
-                    max_length = max(max_length, len(str(cell_value)))
-            
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-        
-        # Freeze header row
-        ws.freeze_panes = 'A2'
-        
-        # Create response
-        from django.http import HttpResponse
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        filename = f'TKB_{ma_dot}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        wb.save(response)
-        logger.info(f"Exported {tkb_list.count()} schedules for {ma_dot} to Excel")
-        return response
+        def rows():
+            count = 0
+            for stt, (ma_lop, ten_mon_hoc, nhom_mh, ma_phong, loai_phong, suc_chua,
+                      thu, ca, gio_bat_dau, gio_ket_thuc, tuan_hoc) in enumerate(tkb_rows.iterator(chunk_size=2000), 1):
+                ma_gv, ten_gv = lop_to_gv.get(ma_lop, (None, None))
+                count = stt
+                yield [
+                    stt,
+                    ma_lop,
+                    ten_mon_hoc,
+                    nhom_mh,
+                    ma_gv or 'N/A',
+                    ten_gv or 'Chưa phân công',
+                    ma_phong or 'N/A',
+                    loai_phong if ma_phong else 'N/A',
+                    suc_chua if ma_phong else 0,
+                    day_map.get(thu, thu),
+                    f"Ca {ca}",
+                    str(gio_bat_dau),
+                    str(gio_ket_thuc),
+                    tuan_hoc if tuan_hoc else '1-15'
+                ]
+            logger.info(f"Exported {count} schedules for {ma_dot} to Excel")
+        
+        filename = f'TKB_{ma_dot}_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
+        return ExcelExporter.stream_workbook(headers, rows(), filename, title=f"TKB_{ma_dot}", header_size=11)
         
     except Exception as e:
         logger.exception(f"Lỗi khi xuất Excel: {e}")
@@ -1088,8 +1385,8 @@ def thoikhoabieu_view(request, ma_gv=None):
                         'time_slot_id', 'time_slot_id__ca'
                     ).order_by('time_slot_id__thu', 'time_slot_id__ca')
                     
-                    schedule_data = build_schedule_data(
-                        tkb_list, display_mode, week_number, dot_xep
+                    schedule_data = cached_schedule_data(
+                        tkb_list, display_mode, week_number, dot_xep, ('teacher', gv.ma_gv)
                     )
                     context['schedule_data'] = schedule_data
                     
@@ -1143,8 +1440,8 @@ def thoikhoabieu_view(request, ma_gv=None):
                         'time_slot_id', 'time_slot_id__ca'
                     ).order_by('time_slot_id__thu', 'time_slot_id__ca')
                     
-                    schedule_data = build_schedule_data(
-                        tkb_list, display_mode, week_number, dot_xep
+                    schedule_data = cached_schedule_data(
+                        tkb_list, display_mode, week_number, dot_xep, ('room', phong.ma_phong)
                     )
                     context['schedule_data'] = schedule_data
                     
@@ -1202,17 +1499,14 @@ def build_schedule_data(tkb_list, display_mode, week_number, dot_xep):
                 'classes': []
             }
     
-    # Tạo cache cho PhanCong để tránh query nhiều lần
-    phan_cong_cache = {}
-    phan_cong_data = PhanCong.objects.filter(
-        ma_dot=dot_xep
-    ).select_related('ma_gv', 'ma_lop')
-    
-    for pc in phan_cong_data:
-        phan_cong_cache[pc.ma_lop.ma_lop] = {
-            'gv_name': pc.ma_gv.ten_gv if pc.ma_gv else 'Chưa phân',
-            'gv_code': pc.ma_gv.ma_gv if pc.ma_gv else '',
+    # Chỉ mục lớp → giảng viên dùng chung của đợt (tránh query nhiều lần)
+    phan_cong_cache = {
+        ma_lop: {
+            'gv_name': info['ten_gv'] if info['ma_gv'] else 'Chưa phân',
+            'gv_code': info['ma_gv'] or '',
         }
+        for ma_lop, info in class_teacher_index(dot_xep).items()
+    }
     
     # Điền dữ liệu từ TKB
     for tkb in tkb_list:
@@ -1259,6 +1553,24 @@ def build_schedule_data(tkb_list, display_mode, week_number, dot_xep):
     }
 
 
+def cached_schedule_data(tkb_list, display_mode, week_number, dot_xep, filter_key):
+    """
+    build_schedule_data có cache (CACHES['schedule']) theo đợt, bộ lọc
+    (VD: ('teacher', ma_gv)), chế độ hiển thị và phiên bản TKB của đợt.
+    Sửa TKB / phân công tăng phiên bản → khóa cũ không còn được dùng.
+    tkb_list là QuerySet lazy nên cache hit không chạm DB.
+    """
+    cache = caches['schedule']
+    key = ':'.join(str(part) for part in (
+        'schedule_grid', dot_xep.ma_dot, DotXep.schedule_version(dot_xep.ma_dot), *filter_key, display_mode, week_number
+    ))
+    schedule_data = cache.get(key)
+    if schedule_data is None:
+        schedule_data = build_schedule_data(tkb_list, display_mode, week_number, dot_xep)
+        cache.set(key, schedule_data)
+    return schedule_data
+
+
 def parse_tuan_hoc(tuan_hoc_pattern, week_number, display_mode):
     """
     Parse chuỗi pattern tuần học (VD: "1111111000000000") thành list các tuần
@@ -1355,9 +1667,12 @@ def get_week_dates(dot_xep, week_number):
 
 # ==================== VALIDATION FUNCTIONS ====================
 
-def validate_tkb_constraints(ma_dot, ma_lop, ma_phong, time_slot_id, ma_gv=None, exclude_ma_tkb=None):
+def validate_tkb_constraints(ma_dot, ma_lop, ma_phong, time_slot_id, ma_gv=None, exclude_ma_tkb=None,
+                             tuan_hoc=None, occupancy=None):
     """
     Kiểm tra các ràng buộc khi thêm/sửa TKB
+    Tra trên ScheduleOccupancy của đợt (truyền vào khi đang giữ khóa đợt trong endpoint ghi),
+    trùng phòng/GV chỉ tính khi tuần học giao nhau (tuan_hoc trống = mọi tuần)
     Returns: {
         'valid': True/False,
         'errors': [],  # Ràng buộc cứng bị vi phạm
@@ -1368,144 +1683,96 @@ def validate_tkb_constraints(ma_dot, ma_lop, ma_phong, time_slot_id, ma_gv=None,
     warnings = []
     
     try:
-        dot_xep = DotXep.objects.get(ma_dot=ma_dot)
-        lop_mon_hoc = LopMonHoc.objects.get(ma_lop=ma_lop)
-        phong_hoc = PhongHoc.objects.get(ma_phong=ma_phong) if ma_phong else None
-        time_slot = TimeSlot.objects.get(time_slot_id=time_slot_id)
+        if occupancy is None:
+            occupancy = ScheduleOccupancy.load(DotXep.objects.get(ma_dot=ma_dot))
+        lop_mon_hoc = occupancy.lop(ma_lop)
+        phong_hoc = occupancy.room(ma_phong) if ma_phong else None
+        time_slot = occupancy.slot_label(time_slot_id)
+        mask = week_mask(tuan_hoc)
+        exclude = {exclude_ma_tkb} if exclude_ma_tkb else set()
         
         # Lấy GV từ phân công nếu không truyền vào
         if not ma_gv:
-            phan_cong = PhanCong.objects.filter(
-                ma_dot=dot_xep, ma_lop=lop_mon_hoc
-            ).first()
-            if phan_cong and phan_cong.ma_gv:
-                ma_gv = phan_cong.ma_gv.ma_gv
+            ma_gv = occupancy.teacher_of(ma_lop)
+        
+        ten_gv = occupancy.teacher_name(ma_gv) if ma_gv else None
         
-        giang_vien = GiangVien.objects.get(ma_gv=ma_gv) if ma_gv else None
+        def describe(ma_tkb):
+            conflict_lop = occupancy.row_lop(ma_tkb)
+            return f"{conflict_lop} ({occupancy.lop(conflict_lop)['ten_mon']})"
         
         # 1. RÀNG BUỘC CỨNG: Kiểm tra trùng phòng cùng thời gian
         if phong_hoc:
-            conflicting_room = ThoiKhoaBieu.objects.filter(
-                ma_dot=dot_xep,
-                ma_phong=phong_hoc,
-                time_slot_id=time_slot,
-                is_deleted=False
-            )
-            if exclude_ma_tkb:
-                conflicting_room = conflicting_room.exclude(ma_tkb=exclude_ma_tkb)
-            
-            if conflicting_room.exists():
-                conflict = conflicting_room.first()
+            conflict = occupancy.room_conflict(ma_phong, time_slot_id, mask, exclude)
+            if conflict:
                 errors.append(
-                    f"❌ Phòng {phong_hoc.ma_phong} đã bị trùng với lớp "
-                    f"{conflict.ma_lop.ma_lop} ({conflict.ma_lop.ma_mon_hoc.ten_mon_hoc}) "
-                    f"vào {time_slot}"
+                    f"❌ Phòng {ma_phong} đã bị trùng với lớp {describe(conflict)} vào {time_slot}"
                 )
         
         # 2. RÀNG BUỘC CỨNG: Kiểm tra trùng giáo viên cùng thời gian
-        if giang_vien:
-            # Lấy tất cả các lớp GV dạy trong đợt này
-            lop_cua_gv = PhanCong.objects.filter(
-                ma_dot=dot_xep, ma_gv=giang_vien
-            ).values_list('ma_lop__ma_lop', flat=True)
-            
-            conflicting_teacher = ThoiKhoaBieu.objects.filter(
-                ma_dot=dot_xep,
-                ma_lop__ma_lop__in=lop_cua_gv,
-                time_slot_id=time_slot,
-                is_deleted=False
-            )
-            if exclude_ma_tkb:
-                conflicting_teacher = conflicting_teacher.exclude(ma_tkb=exclude_ma_tkb)
-            
-            if conflicting_teacher.exists():
-                conflict = conflicting_teacher.first()
+        if ma_gv:
+            conflict = occupancy.teacher_conflict(ma_gv, time_slot_id, mask, exclude)
+            if conflict:
                 errors.append(
-                    f"❌ GV {giang_vien.ten_gv} đã có lịch dạy lớp "
-                    f"{conflict.ma_lop.ma_lop} ({conflict.ma_lop.ma_mon_hoc.ten_mon_hoc}) "
-                    f"vào {time_slot}"
+                    f"❌ GV {ten_gv} đã có lịch dạy lớp {describe(conflict)} vào {time_slot}"
                 )
         
         # 3. RÀNG BUỘC CỨNG: Kiểm tra phòng phù hợp với loại môn (LT/TH)
-        if phong_hoc and lop_mon_hoc:
-            mon_hoc = lop_mon_hoc.ma_mon_hoc
+        if phong_hoc:
+            loai_phong = phong_hoc['loai_phong']
+            so_tiet_th = lop_mon_hoc['so_tiet_th']
             # Kiểm tra nếu môn có thực hành nhưng phòng không phải phòng TH
-            if mon_hoc.so_tiet_th and mon_hoc.so_tiet_th > 0:
-                if phong_hoc.loai_phong and 'TH' not in phong_hoc.loai_phong.upper() and 'MÁY' not in phong_hoc.loai_phong.upper():
+            if so_tiet_th and so_tiet_th > 0:
+                if loai_phong and 'TH' not in loai_phong.upper() and 'MÁY' not in loai_phong.upper():
                     warnings.append(
-                        f"⚠️ Môn {mon_hoc.ten_mon_hoc} có {mon_hoc.so_tiet_th} tiết TH "
-                        f"nhưng phòng {phong_hoc.ma_phong} là {phong_hoc.loai_phong or 'không xác định'}"
+                        f"⚠️ Môn {lop_mon_hoc['ten_mon']} có {so_tiet_th} tiết TH "
+                        f"nhưng phòng {ma_phong} là {loai_phong or 'không xác định'}"
                     )
             
             # Kiểm tra nếu chỉ có lý thuyết nhưng lại dùng phòng máy
-            if (not mon_hoc.so_tiet_th or mon_hoc.so_tiet_th == 0) and mon_hoc.so_tiet_lt:
-                if phong_hoc.loai_phong and ('TH' in phong_hoc.loai_phong.upper() or 'MÁY' in phong_hoc.loai_phong.upper()):
+            if (not so_tiet_th or so_tiet_th == 0) and lop_mon_hoc['so_tiet_lt']:
+                if loai_phong and ('TH' in loai_phong.upper() or 'MÁY' in loai_phong.upper()):
                     warnings.append(
-                        f"⚠️ Môn {mon_hoc.ten_mon_hoc} chỉ có lý thuyết "
-                        f"nhưng đang xếp vào phòng {phong_hoc.ma_phong} ({phong_hoc.loai_phong})"
+                        f"⚠️ Môn {lop_mon_hoc['ten_mon']} chỉ có lý thuyết "
+                        f"nhưng đang xếp vào phòng {ma_phong} ({loai_phong})"
                     )
         
         # 4. RÀNG BUỘC CỨNG: Kiểm tra sức chứa phòng
-        if phong_hoc and phong_hoc.suc_chua and lop_mon_hoc.so_luong_sv:
-            if lop_mon_hoc.so_luong_sv > phong_hoc.suc_chua:
+        if phong_hoc and phong_hoc['suc_chua'] and lop_mon_hoc['so_luong_sv']:
+            if lop_mon_hoc['so_luong_sv'] > phong_hoc['suc_chua']:
                 errors.append(
-                    f"❌ Lớp có {lop_mon_hoc.so_luong_sv} SV nhưng phòng "
-                    f"{phong_hoc.ma_phong} chỉ chứa được {phong_hoc.suc_chua} người"
+                    f"❌ Lớp có {lop_mon_hoc['so_luong_sv']} SV nhưng phòng "
+                    f"{ma_phong} chỉ chứa được {phong_hoc['suc_chua']} người"
                 )
         
         # 5. RÀNG BUỘC MỀM: Kiểm tra giờ làm việc của GV (số tiết/tuần)
-        if giang_vien:
-            # Đếm số tiết GV đã dạy trong tuần
-            total_slots = ThoiKhoaBieu.objects.filter(
-                ma_dot=dot_xep,
-                ma_lop__ma_lop__in=lop_cua_gv,
-                is_deleted=False
-            ).count()
-            
-            if exclude_ma_tkb:
-                # Nếu đang sửa, không tính slot hiện tại
-                pass
-            else:
-                # Nếu đang thêm mới
+        if ma_gv:
+            # Số ca GV đã dạy trong đợt (nếu đang sửa, không tính thêm slot hiện tại)
+            total_slots = occupancy.teacher_load[ma_gv]
+            if not exclude_ma_tkb:
                 total_slots += 1
             
             # Giả sử mỗi slot = 1 ca = 3 tiết, tối đa 10 ca/tuần = 30 tiết
             MAX_SLOTS_PER_WEEK = 10
             if total_slots > MAX_SLOTS_PER_WEEK:
                 warnings.append(
-                    f"⚠️ GV {giang_vien.ten_gv} đã có {total_slots - 1} ca dạy, "
+                    f"⚠️ GV {ten_gv} đã có {total_slots - 1} ca dạy, "
                     f"nếu thêm ca này sẽ là {total_slots} ca (khuyến nghị tối đa {MAX_SLOTS_PER_WEEK} ca/tuần)"
                 )
         
         # 6. RÀNG BUỘC MỀM: Kiểm tra nguyện vọng của GV
-        if giang_vien:
-            nguyen_vong = NguyenVong.objects.filter(
-                ma_dot=dot_xep,
-                ma_gv=giang_vien,
-                time_slot_id=time_slot
-            ).exists()
-            
-            if nguyen_vong:
-                # GV đã đăng ký nguyện vọng muốn dạy slot này
-                pass
-            else:
-                # GV chưa đăng ký nguyện vọng cho slot này
-                warnings.append(
-                    f"ℹ️ GV {giang_vien.ten_gv} chưa đăng ký nguyện vọng cho {time_slot}"
-                )
+        if ma_gv and (ma_gv, time_slot_id) not in occupancy.preferences:
+            # GV chưa đăng ký nguyện vọng cho slot này
+            warnings.append(
+                f"ℹ️ GV {ten_gv} chưa đăng ký nguyện vọng cho {time_slot}"
+            )
         
         # 7. Kiểm tra xem GV có đủ điều kiện dạy môn không
-        if giang_vien and lop_mon_hoc:
-            can_teach = GVDayMon.objects.filter(
-                ma_gv=giang_vien,
-                ma_mon_hoc=lop_mon_hoc.ma_mon_hoc
-            ).exists()
-            
-            if not can_teach:
-                warnings.append(
-                    f"⚠️ GV {giang_vien.ten_gv} chưa được đăng ký là người có thể dạy "
-                    f"môn {lop_mon_hoc.ma_mon_hoc.ten_mon_hoc}"
-                )
+        if ma_gv and not occupancy.teaches(ma_gv, lop_mon_hoc['ma_mon']):
+            warnings.append(
+                f"⚠️ GV {ten_gv} chưa được đăng ký là người có thể dạy "
+                f"môn {lop_mon_hoc['ten_mon']}"
+            )
         
     except (DotXep.DoesNotExist, LopMonHoc.DoesNotExist, PhongHoc.DoesNotExist, 
             TimeSlot.DoesNotExist, GiangVien.DoesNotExist) as e:
@@ -1522,6 +1789,7 @@ def validate_tkb_constraints(ma_dot, ma_lop, ma_phong, time_slot_id, ma_gv=None,
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@transaction.atomic
 def tkb_create_api(request):
     """API tạo mới một bản ghi TKB - tự động tạo lớp môn học mới"""
     try:
@@ -1542,8 +1810,9 @@ def tkb_create_api(request):
                 'message': 'Thiếu thông tin bắt buộc'
             }, status=400)
         
-        # Lấy objects
-        dot_xep = DotXep.objects.get(ma_dot=ma_dot)
+        # Lấy objects - khóa đợt để các lần sửa TKB cùng đợt kiểm tra/ghi lần lượt
+        dot_xep = DotXep.objects.select_for_update().get(ma_dot=ma_dot)
+        occupancy = ScheduleOccupancy.load(dot_xep)
         mon_hoc = MonHoc.objects.get(ma_mon_hoc=ma_mon_hoc)
         giang_vien = GiangVien.objects.get(ma_gv=ma_gv)
         ts = TimeSlot.objects.get(time_slot_id=time_slot_id)
@@ -1570,6 +1839,7 @@ def tkb_create_api(request):
             # Lớp đã tồn tại, cập nhật thông tin
             lop.so_luong_sv = so_luong_sv
             lop.save()
+            occupancy.lops.pop(ma_lop, None)
         
         # Tạo hoặc cập nhật phân công
         phan_cong, pc_created = PhanCong.objects.get_or_create(
@@ -1583,10 +1853,11 @@ def tkb_create_api(request):
         if not pc_created and phan_cong.ma_gv != giang_vien:
             phan_cong.ma_gv = giang_vien
             phan_cong.save()
+        occupancy.set_teacher(lop.ma_lop, giang_vien.ma_gv, giang_vien.ten_gv)
         
         # Validate ràng buộc
         validation = validate_tkb_constraints(
-            ma_dot, lop.ma_lop, ma_phong, time_slot_id
+            ma_dot, lop.ma_lop, ma_phong, time_slot_id, tuan_hoc=tuan_hoc, occupancy=occupancy
         )
         
         if not validation['valid']:
@@ -1597,39 +1868,16 @@ def tkb_create_api(request):
                 'warnings': validation['warnings']
             }, status=400)
         
-        # Tạo mã TKB siêu ngắn (max 15 ký tự)
-        # Vì cột MaTKB chỉ có max_length=15 trong database
-        # Format: {thu}{ca}{hash6}
-        # VD: 21A3F5B8 = Thứ 2, Ca 1, Hash 6 ký tự
-        
-        import hashlib
-        import re
-        
-        # Lấy thứ và ca từ timeslot (VD: Thu2-Ca1 → 2, 1)
-        ts_match = re.match(r'Thu(\d+)-Ca(\d+)', time_slot_id)
-        if ts_match:
-            thu = ts_match.group(1)
-            ca = ts_match.group(2)
-        else:
-            # Fallback nếu format khác (CN-Ca1 → 8, 1)
-            thu = '8' if 'CN' in time_slot_id else '0'
-            ca_match = re.search(r'Ca(\d+)', time_slot_id)
-            ca = ca_match.group(1) if ca_match else '0'
-        
-        # Hash từ đợt + lớp để đảm bảo unique
-        hash_input = f"{ma_dot}_{ma_lop}_{time_slot_id}".encode()
-        hash_hex = hashlib.md5(hash_input).hexdigest()[:6].upper()
-        
-        # Mã TKB: {thu}{ca}{hash} (VD: 21A3F5B8 = 8 ký tự)
-        ma_tkb = f"{thu}{ca}{hash_hex}"
-        
-        # Kiểm tra TKB đã tồn tại chưa
-        if ThoiKhoaBieu.objects.filter(ma_tkb=ma_tkb, is_deleted=False).exists():
+        # Kiểm tra TKB đã tồn tại chưa (cùng đợt, lớp, time slot)
+        if occupancy.class_conflict(lop.ma_lop, time_slot_id):
             return JsonResponse({
                 'status': 'error',
                 'message': f'Lịch này đã tồn tại: {ma_lop} - {time_slot_id}'
             }, status=400)
         
+        # Mã TKB cấp từ bộ đếm (TKB-00000001, max 15 ký tự) - không trùng khi tạo đồng thời
+        ma_tkb = IdSequence.next_codes(ThoiKhoaBieu)[0]
+        
         # Lấy ngày bắt đầu/kết thúc từ đợt
         ngay_bd = dot_xep.ma_du_kien_dt.ngay_bd if dot_xep.ma_du_kien_dt else None
         ngay_kt = dot_xep.ma_du_kien_dt.ngay_kt if dot_xep.ma_du_kien_dt else None
@@ -1646,6 +1894,8 @@ def tkb_create_api(request):
             ngay_kt=ngay_kt,
             is_deleted=False
         )
+        occupancy.place(tkb.ma_tkb, lop.ma_lop, ma_phong, time_slot_id, tuan_hoc)
+        occupancy.save_after_write()
         
         # Log
         new_data = {
@@ -1692,6 +1942,7 @@ def tkb_create_api(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@transaction.atomic
 def tkb_update_api(request):
     """API cập nhật TKB - cho phép thay đổi môn học, phòng, timeslot"""
     try:
@@ -1706,6 +1957,7 @@ def tkb_update_api(request):
         tuan_hoc = data.get('tuan_hoc', '')
         
         tkb = ThoiKhoaBieu.objects.get(ma_tkb=ma_tkb, is_deleted=False)
+        occupancy = ScheduleOccupancy.for_update(tkb.ma_dot_id)
         old_ma_lop = tkb.ma_lop.ma_lop
         
         # Nếu thay đổi môn học → tạo mã lớp mới
@@ -1735,14 +1987,17 @@ def tkb_update_api(request):
         if so_luong_sv and tkb.ma_lop:
             tkb.ma_lop.so_luong_sv = int(so_luong_sv)
             tkb.ma_lop.save()
+            occupancy.lops.pop(tkb.ma_lop.ma_lop, None)
         
         # Validate với exclude current
         validation = validate_tkb_constraints(
-            tkb.ma_dot.ma_dot,
+            tkb.ma_dot_id,
             tkb.ma_lop.ma_lop,
-            ma_phong if ma_phong else (tkb.ma_phong.ma_phong if tkb.ma_phong else None),
-            time_slot_id if time_slot_id else tkb.time_slot_id.time_slot_id,
-            exclude_ma_tkb=ma_tkb
+            ma_phong if ma_phong else tkb.ma_phong_id,
+            time_slot_id if time_slot_id else tkb.time_slot_id_id,
+            exclude_ma_tkb=ma_tkb,
+            tuan_hoc=tuan_hoc if tuan_hoc is not None else tkb.tuan_hoc,
+            occupancy=occupancy
         )
         
         if not validation['valid']:
@@ -1770,6 +2025,8 @@ def tkb_update_api(request):
             tkb.tuan_hoc = tuan_hoc
         
         tkb.save()
+        occupancy.place(ma_tkb, tkb.ma_lop_id, tkb.ma_phong_id, tkb.time_slot_id_id, tkb.tuan_hoc)
+        occupancy.save_after_write()
         
         # Log
         new_data = {
@@ -1826,6 +2083,7 @@ def tkb_update_api(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@transaction.atomic
 def tkb_update_timeslot_api(request):
     """API cập nhật nhanh timeslot cho drag & drop - chỉ thay đổi thứ và ca"""
     try:
@@ -1842,6 +2100,7 @@ def tkb_update_timeslot_api(request):
         
         # Lấy TKB hiện tại
         tkb = ThoiKhoaBieu.objects.get(ma_tkb=ma_tkb, is_deleted=False)
+        occupancy = ScheduleOccupancy.for_update(tkb.ma_dot_id)
         
         # Tạo time_slot_id mới
         new_time_slot_id = f"Thu{new_thu}-Ca{new_ca}"
@@ -1856,23 +2115,17 @@ def tkb_update_timeslot_api(request):
             }, status=404)
         
         # Lưu old data
-        old_time_slot_id = tkb.time_slot_id.time_slot_id
+        old_time_slot_id = tkb.time_slot_id_id
         
-        # Lấy thông tin GV để validate
-        phan_cong = PhanCong.objects.filter(
-            ma_dot=tkb.ma_dot,
-            ma_lop=tkb.ma_lop
-        ).select_related('ma_gv').first()
-        ma_gv = phan_cong.ma_gv.ma_gv if phan_cong and phan_cong.ma_gv else None
-        
-        # Validate với exclude current
+        # Validate với exclude current (GV lấy từ phân công trong occupancy)
         validation = validate_tkb_constraints(
-            tkb.ma_dot.ma_dot,
-            tkb.ma_lop.ma_lop,
-            tkb.ma_phong.ma_phong if tkb.ma_phong else None,
+            tkb.ma_dot_id,
+            tkb.ma_lop_id,
+            tkb.ma_phong_id,
             new_time_slot_id,
-            ma_gv=ma_gv,
-            exclude_ma_tkb=ma_tkb
+            exclude_ma_tkb=ma_tkb,
+            tuan_hoc=tkb.tuan_hoc,
+            occupancy=occupancy
         )
         
         logger.info(f"Validation result for drag&drop: {validation}")  # Debug
@@ -1889,6 +2142,8 @@ def tkb_update_timeslot_api(request):
         # Cập nhật time slot
         tkb.time_slot_id = new_time_slot
         tkb.save()
+        occupancy.place(ma_tkb, tkb.ma_lop_id, tkb.ma_phong_id, new_time_slot_id, tkb.tuan_hoc)
+        occupancy.save_after_write()
         
         # Log
         TKBLog.objects.create(
@@ -1921,6 +2176,7 @@ def tkb_update_timeslot_api(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@transaction.atomic
 def tkb_delete_api(request):
     """API xóa TKB (soft delete)"""
     try:
@@ -1929,6 +2185,7 @@ def tkb_delete_api(request):
         reason = data.get('reason', '')
         
         tkb = ThoiKhoaBieu.objects.get(ma_tkb=ma_tkb)
+        occupancy = ScheduleOccupancy.for_update(tkb.ma_dot_id)
         
         # Lưu dữ liệu cũ trước khi xóa
         old_data = {
@@ -1942,6 +2199,8 @@ def tkb_delete_api(request):
         # Soft delete
         tkb.is_deleted = True
         tkb.save()
+        occupancy.remove(ma_tkb)
+        occupancy.save_after_write()
         
         # Log
         TKBLog.objects.create(
@@ -1973,6 +2232,7 @@ def tkb_delete_api(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@transaction.atomic
 def tkb_restore_api(request):
     """API phục hồi TKB đã xóa"""
     try:
@@ -1987,21 +2247,17 @@ def tkb_restore_api(request):
                 'message': 'Lịch này chưa bị xóa'
             }, status=400)
         
-        # Lấy GV từ phân công
-        phan_cong = PhanCong.objects.filter(
-            ma_dot=tkb.ma_dot,
-            ma_lop=tkb.ma_lop
-        ).first()
-        ma_gv = phan_cong.ma_gv.ma_gv if phan_cong and phan_cong.ma_gv else None
+        occupancy = ScheduleOccupancy.for_update(tkb.ma_dot_id)
         
-        # Validate xem slot có bị trùng không (cả phòng và GV)
+        # Validate xem slot có bị trùng không (cả phòng và GV, GV lấy từ phân công trong occupancy)
         validation = validate_tkb_constraints(
-            tkb.ma_dot.ma_dot,
-            tkb.ma_lop.ma_lop,
-            tkb.ma_phong.ma_phong if tkb.ma_phong else None,
-            tkb.time_slot_id.time_slot_id,
-            ma_gv=ma_gv,
-            exclude_ma_tkb=ma_tkb
+            tkb.ma_dot_id,
+            tkb.ma_lop_id,
+            tkb.ma_phong_id,
+            tkb.time_slot_id_id,
+            exclude_ma_tkb=ma_tkb,
+            tuan_hoc=tkb.tuan_hoc,
+            occupancy=occupancy
         )
         
         if not validation['valid']:
@@ -2014,6 +2270,8 @@ def tkb_restore_api(request):
         # Phục hồi
         tkb.is_deleted = False
         tkb.save()
+        occupancy.place(ma_tkb, tkb.ma_lop_id, tkb.ma_phong_id, tkb.time_slot_id_id, tkb.tuan_hoc)
+        occupancy.save_after_write()
         
         # Log
         TKBLog.objects.create(
@@ -2046,6 +2304,7 @@ def tkb_restore_api(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@transaction.atomic
 def tkb_swap_api(request):
     """API hoán đổi 2 TKB với tùy chọn swap phòng"""
     try:
@@ -2056,156 +2315,80 @@ def tkb_swap_api(request):
         
         tkb1 = ThoiKhoaBieu.objects.get(ma_tkb=ma_tkb_1, is_deleted=False)
         tkb2 = ThoiKhoaBieu.objects.get(ma_tkb=ma_tkb_2, is_deleted=False)
+        occupancy = ScheduleOccupancy.for_update(tkb1.ma_dot_id)
+        if tkb2.ma_dot_id != tkb1.ma_dot_id:
+            occupancy2 = ScheduleOccupancy.for_update(tkb2.ma_dot_id)
+        else:
+            occupancy2 = occupancy
         
         # Kiểm tra xem 2 TKB có cùng GV không
-        gv1 = PhanCong.objects.filter(ma_dot=tkb1.ma_dot, ma_lop=tkb1.ma_lop).first()
-        gv2 = PhanCong.objects.filter(ma_dot=tkb2.ma_dot, ma_lop=tkb2.ma_lop).first()
+        gv1 = occupancy.teacher_of(tkb1.ma_lop_id)
+        gv2 = occupancy2.teacher_of(tkb2.ma_lop_id)
         
-        same_teacher = gv1 and gv2 and gv1.ma_gv == gv2.ma_gv
+        same_teacher = gv1 and gv2 and gv1 == gv2
         
         # Lưu data cũ
         old_data_1 = {
-            'ma_phong': tkb1.ma_phong.ma_phong if tkb1.ma_phong else None,
-            'time_slot_id': tkb1.time_slot_id.time_slot_id,
-            'ma_lop': tkb1.ma_lop.ma_lop,
-            'gv': gv1.ma_gv.ma_gv if gv1 and gv1.ma_gv else None
+            'ma_phong': tkb1.ma_phong_id,
+            'time_slot_id': tkb1.time_slot_id_id,
+            'ma_lop': tkb1.ma_lop_id,
+            'gv': gv1
         }
         old_data_2 = {
-            'ma_phong': tkb2.ma_phong.ma_phong if tkb2.ma_phong else None,
-            'time_slot_id': tkb2.time_slot_id.time_slot_id,
-            'ma_lop': tkb2.ma_lop.ma_lop,
-            'gv': gv2.ma_gv.ma_gv if gv2 and gv2.ma_gv else None
+            'ma_phong': tkb2.ma_phong_id,
+            'time_slot_id': tkb2.time_slot_id_id,
+            'ma_lop': tkb2.ma_lop_id,
+            'gv': gv2
         }
         
         warnings = []
         errors = []
+        # 2 dòng đang hoán đổi không tính là trùng với nhau
+        exclude = {ma_tkb_1, ma_tkb_2}
         
         # Hoán đổi timeslot (luôn luôn)
-        temp_slot = tkb1.time_slot_id
-        tkb1.time_slot_id = tkb2.time_slot_id
-        tkb2.time_slot_id = temp_slot
+        tkb1.time_slot_id_id, tkb2.time_slot_id_id = tkb2.time_slot_id_id, tkb1.time_slot_id_id
+        slot1 = occupancy.slot_label(tkb1.time_slot_id_id)
+        slot2 = occupancy2.slot_label(tkb2.time_slot_id_id)
         
         # Hoán đổi phòng (tùy chọn)
         if swap_phong:
-            temp_phong = tkb1.ma_phong
-            tkb1.ma_phong = tkb2.ma_phong
-            tkb2.ma_phong = temp_phong
-            
-            # Validate phòng mới
+            tkb1.ma_phong_id, tkb2.ma_phong_id = tkb2.ma_phong_id, tkb1.ma_phong_id
+            new_slot_text = ''
+        else:
+            # Nếu không swap phòng, giữ nguyên phòng và validate phòng cũ với timeslot mới
+            new_slot_text = 'timeslot mới '
+        
+        for tkb, occ, slot_text in ((tkb1, occupancy, slot1), (tkb2, occupancy2, slot2)):
+            if not tkb.ma_phong_id:
+                continue
             # 1. Kiểm tra phòng trùng timeslot
-            if tkb1.ma_phong:
-                conflict1 = ThoiKhoaBieu.objects.filter(
-                    ma_dot=tkb1.ma_dot,
-                    ma_phong=tkb1.ma_phong,
-                    time_slot_id=tkb1.time_slot_id,
-                    is_deleted=False
-                ).exclude(ma_tkb=ma_tkb_1)
-                
-                if conflict1.exists():
-                    errors.append(f"❌ Phòng {tkb1.ma_phong.ma_phong} đã bị trùng tại {tkb1.time_slot_id}")
-            
-            if tkb2.ma_phong:
-                conflict2 = ThoiKhoaBieu.objects.filter(
-                    ma_dot=tkb2.ma_dot,
-                    ma_phong=tkb2.ma_phong,
-                    time_slot_id=tkb2.time_slot_id,
-                    is_deleted=False
-                ).exclude(ma_tkb=ma_tkb_2)
-                
-                if conflict2.exists():
-                    errors.append(f"❌ Phòng {tkb2.ma_phong.ma_phong} đã bị trùng tại {tkb2.time_slot_id}")
+            if occ.room_conflict(tkb.ma_phong_id, tkb.time_slot_id_id, week_mask(tkb.tuan_hoc), exclude):
+                errors.append(f"❌ Phòng {tkb.ma_phong_id} đã bị trùng tại {new_slot_text}{slot_text}")
+            if not swap_phong:
+                continue
             
+            lop = occ.lop(tkb.ma_lop_id)
+            phong = occ.room(tkb.ma_phong_id)
             # 2. Kiểm tra loại phòng phù hợp (chỉ warning)
-            if tkb1.ma_phong:
-                mon1 = tkb1.ma_lop.ma_mon_hoc
-                loai_phong1 = tkb1.ma_phong.loai_phong or ''
-                
-                if mon1.so_tiet_th and mon1.so_tiet_th > 0:
-                    # Môn TH nên dùng phòng TH
-                    if 'TH' not in loai_phong1.upper() and 'MÁY' not in loai_phong1.upper() and 'LAB' not in loai_phong1.upper():
-                        warnings.append(f"⚠️ Lớp {tkb1.ma_lop.ma_lop} (TH) đang dùng phòng {tkb1.ma_phong.ma_phong} ({loai_phong1 or 'không xác định'})")
-                else:
-                    # Môn LT nên dùng phòng LT
-                    if 'TH' in loai_phong1.upper() or 'MÁY' in loai_phong1.upper() or 'LAB' in loai_phong1.upper():
-                        warnings.append(f"⚠️ Lớp {tkb1.ma_lop.ma_lop} (LT) đang dùng phòng {tkb1.ma_phong.ma_phong} ({loai_phong1})")
-            
-            if tkb2.ma_phong:
-                mon2 = tkb2.ma_lop.ma_mon_hoc
-                loai_phong2 = tkb2.ma_phong.loai_phong or ''
-                
-                if mon2.so_tiet_th and mon2.so_tiet_th > 0:
-                    if 'TH' not in loai_phong2.upper() and 'MÁY' not in loai_phong2.upper() and 'LAB' not in loai_phong2.upper():
-                        warnings.append(f"⚠️ Lớp {tkb2.ma_lop.ma_lop} (TH) đang dùng phòng {tkb2.ma_phong.ma_phong} ({loai_phong2 or 'không xác định'})")
-                else:
-                    if 'TH' in loai_phong2.upper() or 'MÁY' in loai_phong2.upper() or 'LAB' in loai_phong2.upper():
-                        warnings.append(f"⚠️ Lớp {tkb2.ma_lop.ma_lop} (LT) đang dùng phòng {tkb2.ma_phong.ma_phong} ({loai_phong2})")
+            loai_phong = phong['loai_phong'] or ''
+            if lop['so_tiet_th'] and lop['so_tiet_th'] > 0:
+                # Môn TH nên dùng phòng TH
+                if 'TH' not in loai_phong.upper() and 'MÁY' not in loai_phong.upper() and 'LAB' not in loai_phong.upper():
+                    warnings.append(f"⚠️ Lớp {tkb.ma_lop_id} (TH) đang dùng phòng {tkb.ma_phong_id} ({loai_phong or 'không xác định'})")
+            else:
+                # Môn LT nên dùng phòng LT
+                if 'TH' in loai_phong.upper() or 'MÁY' in loai_phong.upper() or 'LAB' in loai_phong.upper():
+                    warnings.append(f"⚠️ Lớp {tkb.ma_lop_id} (LT) đang dùng phòng {tkb.ma_phong_id} ({loai_phong})")
             
             # 3. Kiểm tra sức chứa phòng
-            if tkb1.ma_phong and tkb1.ma_phong.suc_chua and tkb1.ma_lop.so_luong_sv:
-                if tkb1.ma_lop.so_luong_sv > tkb1.ma_phong.suc_chua:
-                    errors.append(f"❌ Lớp {tkb1.ma_lop.ma_lop} có {tkb1.ma_lop.so_luong_sv} SV nhưng phòng {tkb1.ma_phong.ma_phong} chỉ chứa {tkb1.ma_phong.suc_chua}")
-            
-            if tkb2.ma_phong and tkb2.ma_phong.suc_chua and tkb2.ma_lop.so_luong_sv:
-                if tkb2.ma_lop.so_luong_sv > tkb2.ma_phong.suc_chua:
-                    errors.append(f"❌ Lớp {tkb2.ma_lop.ma_lop} có {tkb2.ma_lop.so_luong_sv} SV nhưng phòng {tkb2.ma_phong.ma_phong} chỉ chứa {tkb2.ma_phong.suc_chua}")
-        
-        # Nếu không swap phòng, giữ nguyên phòng và validate
-        else:
-            # Kiểm tra phòng cũ có phù hợp với timeslot mới không
-            if tkb1.ma_phong:
-                conflict1 = ThoiKhoaBieu.objects.filter(
-                    ma_dot=tkb1.ma_dot,
-                    ma_phong=tkb1.ma_phong,
-                    time_slot_id=tkb1.time_slot_id,
-                    is_deleted=False
-                ).exclude(ma_tkb=ma_tkb_1)
-                
-                if conflict1.exists():
-                    errors.append(f"❌ Phòng {tkb1.ma_phong.ma_phong} đã bị trùng tại timeslot mới {tkb1.time_slot_id}")
-            
-            if tkb2.ma_phong:
-                conflict2 = ThoiKhoaBieu.objects.filter(
-                    ma_dot=tkb2.ma_dot,
-                    ma_phong=tkb2.ma_phong,
-                    time_slot_id=tkb2.time_slot_id,
-                    is_deleted=False
-                ).exclude(ma_tkb=ma_tkb_2)
-                
-                if conflict2.exists():
-                    errors.append(f"❌ Phòng {tkb2.ma_phong.ma_phong} đã bị trùng tại timeslot mới {tkb2.time_slot_id}")
+            if phong['suc_chua'] and lop['so_luong_sv'] and lop['so_luong_sv'] > phong['suc_chua']:
+                errors.append(f"❌ Lớp {tkb.ma_lop_id} có {lop['so_luong_sv']} SV nhưng phòng {tkb.ma_phong_id} chỉ chứa {phong['suc_chua']}")
         
         # Validate ràng buộc GV (không được trùng timeslot)
-        if gv1 and gv1.ma_gv:
-            other_classes = PhanCong.objects.filter(
-                ma_dot=tkb1.ma_dot,
-                ma_gv=gv1.ma_gv
-            ).exclude(ma_lop=tkb1.ma_lop).values_list('ma_lop__ma_lop', flat=True)
-            
-            conflict_gv1 = ThoiKhoaBieu.objects.filter(
-                ma_dot=tkb1.ma_dot,
-                ma_lop__ma_lop__in=other_classes,
-                time_slot_id=tkb1.time_slot_id,
-                is_deleted=False
-            )
-            
-            if conflict_gv1.exists():
-                errors.append(f"❌ GV {gv1.ma_gv.ten_gv} đã có lịch dạy tại {tkb1.time_slot_id}")
-        
-        if gv2 and gv2.ma_gv:
-            other_classes = PhanCong.objects.filter(
-                ma_dot=tkb2.ma_dot,
-                ma_gv=gv2.ma_gv
-            ).exclude(ma_lop=tkb2.ma_lop).values_list('ma_lop__ma_lop', flat=True)
-            
-            conflict_gv2 = ThoiKhoaBieu.objects.filter(
-                ma_dot=tkb2.ma_dot,
-                ma_lop__ma_lop__in=other_classes,
-                time_slot_id=tkb2.time_slot_id,
-                is_deleted=False
-            )
-            
-            if conflict_gv2.exists():
-                errors.append(f"❌ GV {gv2.ma_gv.ten_gv} đã có lịch dạy tại {tkb2.time_slot_id}")
+        for tkb, occ, ma_gv, slot_text in ((tkb1, occupancy, gv1, slot1), (tkb2, occupancy2, gv2, slot2)):
+            if ma_gv and occ.teacher_conflict(ma_gv, tkb.time_slot_id_id, week_mask(tkb.tuan_hoc), exclude):
+                errors.append(f"❌ GV {occ.teacher_name(ma_gv)} đã có lịch dạy tại {slot_text}")
         
         # Nếu có lỗi, trả về lỗi
         if errors:
@@ -2219,6 +2402,11 @@ def tkb_swap_api(request):
         # Lưu
         tkb1.save()
         tkb2.save()
+        for tkb, occ in ((tkb1, occupancy), (tkb2, occupancy2)):
+            occ.place(tkb.ma_tkb, tkb.ma_lop_id, tkb.ma_phong_id, tkb.time_slot_id_id, tkb.tuan_hoc)
+        occupancy.save_after_write()
+        if occupancy2 is not occupancy:
+            occupancy2.save_after_write()
         
         # Log
         user = request.user.username if request.user.is_authenticated else 'anonymous'
@@ -2231,8 +2419,8 @@ def tkb_swap_api(request):
             user=user,
             old_data=old_data_1,
             new_data={
-                'ma_phong': tkb1.ma_phong.ma_phong if tkb1.ma_phong else None,
-                'time_slot_id': tkb1.time_slot_id.time_slot_id,
+                'ma_phong': tkb1.ma_phong_id,
+                'time_slot_id': tkb1.time_slot_id_id,
                 'swap_type': swap_type,
                 'swap_phong': swap_phong
             },
@@ -2245,8 +2433,8 @@ def tkb_swap_api(request):
             user=user,
             old_data=old_data_2,
             new_data={
-                'ma_phong': tkb2.ma_phong.ma_phong if tkb2.ma_phong else None,
-                'time_slot_id': tkb2.time_slot_id.time_slot_id,
+                'ma_phong': tkb2.ma_phong_id,
+                'time_slot_id': tkb2.time_slot_id_id,
                 'swap_type': swap_type,
                 'swap_phong': swap_phong
             },
@@ -2265,14 +2453,14 @@ def tkb_swap_api(request):
                 'same_teacher': same_teacher,
                 'swap_phong': swap_phong,
                 'tkb1': {
-                    'lop': tkb1.ma_lop.ma_lop,
-                    'phong': tkb1.ma_phong.ma_phong if tkb1.ma_phong else None,
-                    'timeslot': str(tkb1.time_slot_id)
+                    'lop': tkb1.ma_lop_id,
+                    'phong': tkb1.ma_phong_id,
+                    'timeslot': slot1
                 },
                 'tkb2': {
-                    'lop': tkb2.ma_lop.ma_lop,
-                    'phong': tkb2.ma_phong.ma_phong if tkb2.ma_phong else None,
-                    'timeslot': str(tkb2.time_slot_id)
+                    'lop': tkb2.ma_lop_id,
+                    'phong': tkb2.ma_phong_id,
+                    'timeslot': slot2
                 }
             }
         })
@@ -2520,12 +2708,13 @@ def tkb_mini_schedule_api(request):
             'time_slot_id', 'time_slot_id__ca'
         )
         
+        # Lớp → giảng viên của cả đợt (1 query, cache theo phiên bản TKB)
+        lop_index = class_teacher_index(dot_xep)
+        
         # Chỉ hiển thị khi đã chọn GV hoặc phòng cụ thể
         if view_type == 'teacher' and selected_id:
             # Lấy các lớp mà GV dạy
-            lop_gv = PhanCong.objects.filter(
-                ma_dot=dot_xep, ma_gv__ma_gv=selected_id
-            ).values_list('ma_lop__ma_lop', flat=True)
+            lop_gv = [ma_lop for ma_lop, info in lop_index.items() if info['ma_gv'] == selected_id]
             tkb_query = tkb_query.filter(ma_lop__ma_lop__in=lop_gv)
         elif view_type == 'room' and selected_id:
             # Lấy TKB của phòng
@@ -2538,14 +2727,10 @@ def tkb_mini_schedule_api(request):
         
         schedule = []
         for tkb in tkb_list:
-            # Lấy tên GV từ PhanCong
-            phan_cong = PhanCong.objects.filter(
-                ma_dot=dot_xep,
-                ma_lop=tkb.ma_lop
-            ).select_related('ma_gv').first()
-            
-            ten_gv = phan_cong.ma_gv.ten_gv if phan_cong and phan_cong.ma_gv else 'N/A'
-            ma_gv = phan_cong.ma_gv.ma_gv if phan_cong and phan_cong.ma_gv else None
+            # Lấy tên GV từ chỉ mục phân công
+            info = lop_index.get(tkb.ma_lop_id, {})
+            ten_gv = info.get('ten_gv') if info.get('ma_gv') else 'N/A'
+            ma_gv = info.get('ma_gv')
             
             schedule.append({
                 'ma_tkb': tkb.ma_tkb,
@@ -2568,7 +2753,7 @@ def tkb_mini_schedule_api(request):
             ma_dot=dot_xep,
             is_deleted=True
         ).select_related(
-            'ma_lop', 'ma_phong', 'time_slot_id'
+            'ma_lop', 'ma_lop__ma_mon_hoc', 'ma_phong', 'time_slot_id', 'time_slot_id__ca'
         )
         
         if ma_khoa:
@@ -2580,10 +2765,10 @@ def tkb_mini_schedule_api(request):
         
         deleted = []
         for tkb in deleted_list:
-            # Lấy giáo viên từ phân công
-            phan_cong = tkb.ma_lop.phan_cong_list.first()
-            ma_gv = phan_cong.ma_gv.ma_gv if phan_cong and phan_cong.ma_gv else 'N/A'
-            ten_gv = phan_cong.ma_gv.ten_gv if phan_cong and phan_cong.ma_gv else 'N/A'
+            # Lấy giáo viên từ chỉ mục phân công của đợt
+            info = lop_index.get(tkb.ma_lop_id, {})
+            ma_gv = info.get('ma_gv') or 'N/A'
+            ten_gv = info.get('ten_gv') if info.get('ma_gv') else 'N/A'
             
             deleted.append({
                 'ma_tkb': tkb.ma_tkb,
@@ -2648,13 +2833,9 @@ def tkb_occupied_rooms_api(request):
                 'message': 'Thiếu tham số ma_dot hoặc time_slot_id'
             }, status=400)
         
-        # Lấy tất cả phòng đang được sử dụng trong timeslot này (không xóa)
-        occupied_rooms = ThoiKhoaBieu.objects.filter(
-            ma_dot__ma_dot=ma_dot,
-            time_slot_id__time_slot_id=time_slot_id,
-            is_deleted=False,
-            ma_phong__isnull=False
-        ).values_list('ma_phong__ma_phong', flat=True).distinct()
+        # Lấy tất cả phòng đang được sử dụng trong timeslot này (không xóa) từ occupancy của đợt
+        dot_xep = DotXep.objects.filter(ma_dot=ma_dot).first()
+        occupied_rooms = ScheduleOccupancy.load(dot_xep).occupied_rooms(time_slot_id) if dot_xep else []
         
         return JsonResponse({
             'status': 'success',
@@ -2871,11 +3052,8 @@ def tkb_gv_schedule_api(request):
         
         dot_xep = DotXep.objects.get(ma_dot=ma_dot)
         
-        # Lấy các lớp mà GV dạy
-        lop_gv = PhanCong.objects.filter(
-            ma_dot=dot_xep,
-            ma_gv__ma_gv=ma_gv
-        ).values_list('ma_lop__ma_lop', flat=True)
+        # Lấy các lớp mà GV dạy (chỉ mục phân công của đợt)
+        lop_gv = [ma_lop for ma_lop, info in class_teacher_index(dot_xep).items() if info['ma_gv'] == ma_gv]
         
         # Lấy TKB của các lớp đó
         tkb_list = ThoiKhoaBieu.objects.filter(
@@ -18,7 +18,7 @@ from .models import (
     Khoa, BoMon, GiangVien, MonHoc, PhongHoc,
     LopMonHoc, DotXep, PhanCong, TimeSlot, ThoiKhoaBieu,
     DuKienDT, GVDayMon, KhungTG, RangBuocMem, RangBuocTrongDot, NguyenVong,
-    NgayNghiCoDinh, NgayNghiDot
+    NgayNghiCoDinh, NgayNghiDot, SolverRun, SolverJob, IdSequence
 )
 from .utils.excel_export import ExcelExporter
 from .utils.excel_import import ExcelImporter
@@ -95,6 +95,7 @@ class BaseAdmin(admin.ModelAdmin):
         custom_urls = [
             path('download-template/', self.admin_site.admin_view(self.download_template), name=f'{self.model._meta.app_label}_{self.model._meta.model_name}_download_template'),
             path('import-excel/', self.admin_site.admin_view(self.import_excel_view), name=f'{self.model._meta.app_label}_{self.model._meta.model_name}_import_excel'),
+            path('import-report/', self.admin_site.admin_view(self.import_report_view), name=f'{self.model._meta.app_label}_{self.model._meta.model_name}_import_report'),
         ]
         return custom_urls + urls
 
@@ -113,13 +114,18 @@ class BaseAdmin(admin.ModelAdmin):
             if request.FILES.get('excel_file'):
                 file = request.FILES['excel_file']
                 print(f"File received: {file.name}")
-                ExcelImporter.validate_and_import(file, self.model, request)
+                dry_run = request.POST.get('dry_run') in ('1', 'on', 'true')
+                ExcelImporter.validate_and_import(file, self.model, request, dry_run=dry_run)
             else:
                 messages.error(request, "Không tìm thấy file Excel trong request")
         else:
             messages.warning(request, "Phương thức không hợp lệ (cần POST)")
         return redirect('..')
 
+    def import_report_view(self, request):
+        """Download per-row error report of the last Excel import"""
+        return ExcelImporter.report_response(request, self.model)
+
     @staticmethod
     def _safe_filename(name: str) -> str:
         """Sanitize filename: remove Vietnamese accents, keep letters."""
@@ -240,19 +246,8 @@ class KhoaAdmin(BaseAdmin):
 
     def save_model(self, request, obj, form, change):
         if not change:
-            # Tự động sinh mã khoa khi thêm mới
-            existing = type(obj).objects.filter(ma_khoa__startswith='KHOA-')
-            used_nums = set()
-            for item in existing:
-                try:
-                    num = int(item.ma_khoa.split('-')[1])
-                    used_nums.add(num)
-                except Exception:
-                    continue
-            next_num = 1
-            while next_num in used_nums:
-                next_num += 1
-            obj.ma_khoa = f"KHOA-{next_num:03d}"
+            # Tự động sinh mã khoa khi thêm mới (bộ đếm IdSequence, không quét toàn bảng)
+            obj.ma_khoa = IdSequence.next_codes(Khoa)[0]
         super().save_model(request, obj, form, change)
 
 
@@ -514,6 +509,106 @@ class NgayNghiDotAdmin(BaseAdmin):
     tuan_info.short_description = 'Tuần (tham khảo)'
 
 
+@admin.register(SolverRun)
+class SolverRunAdmin(admin.ModelAdmin):
+    """Lịch sử chạy solver (chỉ xem) - so sánh cost / thời gian giữa các đợt và các release"""
+    list_display = ['id', 'ma_dot', 'created_at', 'algorithm', 'seed', 'initial_cost', 'final_cost_colored',
+                    'hard_violations', 'time_elapsed_display', 'status', 'release', 'saved_to_db']
+    list_filter = ['ma_dot', 'algorithm', 'status', 'release', 'decompose', 'saved_to_db']
+    search_fields = ['ma_dot__ma_dot', 'instance_hash']
+    date_hierarchy = 'created_at'
+    list_per_page = 100
+    list_select_related = ['ma_dot']
+    fieldsets = (
+        ('Lần chạy', {
+            'fields': ('ma_dot', 'created_at', 'status', 'release', 'instance_hash', 'saved_to_db', 'error')
+        }),
+        ('Tham số', {
+            'fields': ('algorithm', 'init_method', 'seed', 'time_limit', 'budget', 'decompose')
+        }),
+        ('Kết quả', {
+            'fields': ('initial_cost', 'final_cost', 'hard_violations', 'breakdown', 'cost_curve_chart')
+        }),
+        ('Thời gian', {
+            'fields': ('time_elapsed', 'phase_timings')
+        }),
+        ('Chi tiết', {
+            'fields': ('features', 'cost_curve', 'details'),
+            'classes': ('collapse',)
+        }),
+    )
+    
+    readonly_fields = ['cost_curve_chart']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        # Lịch sử chỉ ghi bởi solver - trang chi tiết ở chế độ chỉ xem
+        return False
+    
+    def final_cost_colored(self, obj):
+        if obj.hard_violations:
+            return format_html('<span style="color: #dc3545; font-weight: bold;">{} ({} vi phạm cứng)</span>',
+                               obj.final_cost, obj.hard_violations)
+        return obj.final_cost
+    final_cost_colored.short_description = 'Cost cuối'
+    final_cost_colored.admin_order_field = 'final_cost'
+    
+    def time_elapsed_display(self, obj):
+        return f"{obj.time_elapsed:.1f}s" if obj.time_elapsed is not None else '-'
+    time_elapsed_display.short_description = 'Thời gian'
+    time_elapsed_display.admin_order_field = 'time_elapsed'
+    
+    def cost_curve_chart(self, obj):
+        """Đường best cost theo thời gian (SVG)"""
+        curve = obj.cost_curve or []
+        if len(curve) < 2:
+            return '-'
+        width, height = 480, 160
+        max_time = max(point[0] for point in curve) or 1.0
+        costs = [point[1] for point in curve]
+        low, high = min(costs), max(costs)
+        span = (high - low) or 1.0
+        points = ' '.join(
+            f"{elapsed / max_time * width:.1f},{height - (cost - low) / span * height:.1f}"
+            for elapsed, cost in curve
+        )
+        return format_html(
+            '<svg width="{}" height="{}" style="border: 1px solid #dee2e6;">'
+            '<polyline fill="none" stroke="#0066cc" stroke-width="2" points="{}"/></svg>'
+            '<div>{} → {} trong {}s</div>',
+            width, height, points, high, low, round(max_time, 1)
+        )
+    cost_curve_chart.short_description = 'Đường cost'
+
+
+@admin.register(SolverJob)
+class SolverJobAdmin(admin.ModelAdmin):
+    """Hàng đợi job xếp lịch chạy nền (chỉ xem + huỷ)"""
+    list_display = ['id', 'ma_dot', 'status', 'created_by', 'created_at', 'started_at', 'finished_at',
+                    'worker', 'cancel_requested', 'solver_run']
+    list_filter = ['status', 'ma_dot']
+    search_fields = ['ma_dot__ma_dot', 'created_by']
+    list_per_page = 100
+    list_select_related = ['ma_dot']
+    actions = ['cancel_jobs']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def cancel_jobs(self, request, queryset):
+        from .algorithms.solver_jobs import request_cancel
+        jobs = list(queryset.filter(status__in=SolverJob.ACTIVE_STATUSES))
+        for job in jobs:
+            request_cancel(job)
+        self.message_user(request, f"Đã gửi yêu cầu huỷ {len(jobs)} job", messages.SUCCESS)
+    cancel_jobs.short_description = "Huỷ job đã chọn"
+
+
 # Import custom permission admin at the end
 # This will override default User and Group admin with custom ones
 from . import permission_admin
@@ -2,21 +2,28 @@
 Scheduling algorithms (GA, Greedy, Heuristics)
 """
 
-from .algorithms_core import (
-    CBCTTInstance, TimetableState, Room, Course, Curriculum, Lecture,
-    ScoreBreakdown, build_initial_solution, rebuild_state
-)
-from .algorithms_runner import AlgorithmRunner
+import importlib
 
-__all__ = [
-    'CBCTTInstance',
-    'TimetableState',
-    'Room',
-    'Course',
-    'Curriculum',
-    'Lecture',
-    'ScoreBreakdown',
-    'build_initial_solution',
-    'rebuild_state',
-    'AlgorithmRunner',
-]
+# Import lazy: algorithms_runner kéo theo Django models, và nạp sẵn algorithms_core
+# làm ``python -m apps.scheduling.algorithms.algorithms_core`` chạy module 2 lần
+_EXPORTS = {
+    'CBCTTInstance': 'algorithms_core',
+    'TimetableState': 'algorithms_core',
+    'Room': 'algorithms_core',
+    'Course': 'algorithms_core',
+    'Curriculum': 'algorithms_core',
+    'Lecture': 'algorithms_core',
+    'ScoreBreakdown': 'algorithms_core',
+    'build_initial_solution': 'algorithms_core',
+    'rebuild_state': 'algorithms_core',
+    'AlgorithmRunner': 'algorithms_runner',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        module = importlib.import_module(f'.{_EXPORTS[name]}', __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
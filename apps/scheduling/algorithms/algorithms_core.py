@@ -2,14 +2,32 @@ from __future__ import annotations
 
 import argparse
 import csv
+import hashlib
+import heapq
 import math
+import os
+import pickle
 import random
 import sys
 import time
+from array import array
+from bisect import bisect_right
 from collections import defaultdict, deque
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+try:
+    import numpy as np  # Batch evaluator (optional)
+except ImportError:  # pragma: no cover - numpy is listed in requirements
+    np = None
+
+# Optional JIT penalty kernels (Numba) - pure-Python fallback khi tắt/thiếu Numba
+try:
+    from . import penalty_kernels
+except ImportError:
+    # Standalone mode (chạy trực tiếp algorithms_core.py)
+    import penalty_kernels
 
 # Import dynamic weight loader
 try:
@@ -132,10 +150,124 @@ class CBCTTInstance:
     teacher_by_id: Dict[str, int]
     teachers: List[str]
     teacher_preferred_periods: Dict[str, Set[int]] = field(default_factory=dict)  # NEW: teacher_id → preferred periods
+    # Trọng số cố định cho instance (sub-instance chạy trong worker process không truy cập DB)
+    weights: Optional[Dict[str, float]] = field(default=None, repr=False)
+    # period → room indices đã bị đợt khác chiếm (ô cố định, không được xếp vào)
+    blocked_cells: Dict[int, Set[int]] = field(default_factory=dict, repr=False)
     total_periods: int = field(init=False)
+    # Chỉ số tương thích tĩnh (sức chứa, loại phòng, thiết bị) - dùng cho neighborhood
+    course_room_sets: List[Set[int]] = field(init=False, repr=False)
+    course_compatible_rooms: List[List[int]] = field(init=False, repr=False)
+    # Swap partners per course: course indices + cumulative lecture counts (sampled lazily)
+    course_swap_partners: List[List[int]] = field(init=False, repr=False)
+    course_swap_offsets: List[List[int]] = field(init=False, repr=False)
+    # Chỉ số tĩnh cho TimetableState / count_hard_conflicts (lưu cùng bản compiled)
+    course_type_codes: List[int] = field(init=False, repr=False)
+    teacher_course_lecture_ids: Dict[str, Dict[int, List[int]]] = field(init=False, repr=False)
+    lecture_teacher_array: Optional["np.ndarray"] = field(init=False, repr=False)
+    lecture_curr_ptr: Optional["np.ndarray"] = field(init=False, repr=False)
+    lecture_curr_idx: Optional["np.ndarray"] = field(init=False, repr=False)
 
     def __post_init__(self) -> None:
         self.total_periods = self.days * self.periods_per_day
+        self._build_compatibility_index()
+        self._build_state_index()
+
+    def _build_compatibility_index(self) -> None:
+        """Precompute static room compatibility and swap partners per course.
+
+        A room is statically compatible with a course when it passes the
+        capacity, room type and equipment checks of ``TimetableState._can_place``.
+        Two courses are swap partners when they share at least one compatible
+        room, so exchanging their lectures can possibly be feasible. Only the
+        partner course indices are stored (O(courses²) rather than
+        O(courses × lectures)); ``swap_partner_lecture`` expands them lazily.
+        """
+
+        self.course_room_sets = []
+        self.course_compatible_rooms = []
+        room_equipment = [
+            set(eq.strip() for eq in (room.equipment or "").split(',') if eq.strip())
+            for room in self.rooms
+        ]
+        for course in self.courses:
+            required = set(eq.strip() for eq in course.equipment.split(',') if eq.strip()) if course.equipment else set()
+            allowed = {
+                room.index
+                for room in self.rooms
+                if room.capacity >= course.students
+                and room.room_type == course.course_type
+                and required.issubset(room_equipment[room.index])
+            }
+            self.course_room_sets.append(allowed)
+            ordered = [r for r in self.course_room_preference[course.index] if r in allowed]
+            if not ordered:
+                # enforce_room_per_course có thể chỉ giữ 1 phòng không hợp lệ → dùng toàn bộ phòng hợp lệ
+                ordered = sorted(allowed, key=lambda r: (self.rooms[r].capacity, r))
+            self.course_compatible_rooms.append(ordered)
+
+        self.course_swap_partners = []
+        self.course_swap_offsets = []
+        for course in self.courses:
+            rooms_a = self.course_room_sets[course.index]
+            partners: List[int] = []
+            offsets: List[int] = []
+            total = 0
+            if rooms_a:
+                for other in self.courses:
+                    if other.index == course.index or not self.course_lecture_ids[other.index]:
+                        continue
+                    if rooms_a.isdisjoint(self.course_room_sets[other.index]):
+                        continue
+                    total += len(self.course_lecture_ids[other.index])
+                    partners.append(other.index)
+                    offsets.append(total)
+            self.course_swap_partners.append(partners)
+            self.course_swap_offsets.append(offsets)
+
+    def swap_partner_lecture(self, course_idx: int, rng: random.Random) -> Optional[int]:
+        """Uniformly random lecture among the swap partners of ``course_idx`` (None if none)."""
+
+        offsets = self.course_swap_offsets[course_idx]
+        if not offsets:
+            return None
+        pick = rng.randrange(offsets[-1])
+        pos = bisect_right(offsets, pick)
+        start = offsets[pos - 1] if pos else 0
+        return self.course_lecture_ids[self.course_swap_partners[course_idx][pos]][pick - start]
+
+    def _build_state_index(self) -> None:
+        """Precompute the static skeletons that ``TimetableState`` needs.
+
+        Teacher → course → lecture ids (in lecture id order), integer room
+        type codes per course, and the flat teacher / curriculum arrays used
+        by ``count_hard_conflicts``.
+        """
+
+        self.teacher_course_lecture_ids = {}
+        for lecture in self.lectures:
+            teacher = self.course_teachers[lecture.course]
+            self.teacher_course_lecture_ids.setdefault(teacher, {}).setdefault(lecture.course, []).append(lecture.id)
+
+        type_codes: Dict[str, int] = {}
+        self.course_type_codes = [
+            type_codes.setdefault(course.course_type, len(type_codes) + 1) if course.course_type else 0
+            for course in self.courses
+        ]
+
+        if np is None:
+            self.lecture_teacher_array = self.lecture_curr_ptr = self.lecture_curr_idx = None
+            return
+        self.lecture_teacher_array = np.array(
+            [self.courses[lec.course].teacher_index for lec in self.lectures], dtype=np.int64
+        )
+        curr_ptr = np.zeros(len(self.lectures) + 1, dtype=np.int64)
+        curr_idx: List[int] = []
+        for lec in self.lectures:
+            curr_idx.extend(self.course_curriculums[lec.course])
+            curr_ptr[lec.id + 1] = len(curr_idx)
+        self.lecture_curr_ptr = curr_ptr
+        self.lecture_curr_idx = np.asarray(curr_idx, dtype=np.int64)
 
     def period_to_slot(self, period: int) -> Tuple[int, int]:
         """Return (day, slot) for a flat period index."""
@@ -169,25 +301,71 @@ class ScoreBreakdown:
 
 
 class ProgressLogger:
-    """CSV + console progress logger."""
+    """CSV + console progress logger.
+
+    ``listener`` (optional) receives every log point as a dict - used to
+    publish live progress (e.g. for a background job) without touching the
+    search loops.
+    """
 
-    def __init__(self, path: Optional[Path]) -> None:
+    def __init__(self, path: Optional[Path], listener: Optional[Callable[[Dict], None]] = None) -> None:
         self.path = path
+        self.listener = listener
         self._file = None
         self._writer: Optional[csv.writer] = None
+        # operator name -> [generated, feasible] (ghi lại sau mỗi lần chạy metaheuristic)
+        self.candidate_stats: Dict[str, List[int]] = {}
+        # (elapsed, best_cost) mỗi lần log - đường cost theo thời gian của lần chạy
+        self.curve: List[Tuple[float, int]] = []
         if path is not None:
             path.parent.mkdir(parents=True, exist_ok=True)
             self._file = path.open("w", newline="", encoding="utf-8")
             self._writer = csv.writer(self._file)
-            self._writer.writerow(["elapsed", "best_cost", "current_cost", "hard_ok", "accept_rate", "operator"])
+            self._writer.writerow(["elapsed", "best_cost", "current_cost", "hard_ok", "accept_rate", "operator", "feasible_ratio"])
             self._file.flush()
 
-    def log(self, elapsed: float, best_cost: int, current_cost: int, hard_ok: bool, accept_rate: float, operator: str) -> None:
+    def log(self, elapsed: float, best_cost: int, current_cost: int, hard_ok: bool, accept_rate: float, operator: str, feasible_ratio: Optional[float] = None, temperature: Optional[float] = None, tenure: Optional[int] = None, breakdown: Optional[ScoreBreakdown] = None, progress: Optional[float] = None) -> None:
         line = f"[{elapsed:7.2f}s] best={best_cost} current={current_cost} hard_ok={hard_ok} accept_rate={accept_rate*100:5.1f}% op={operator}"
+        if feasible_ratio is not None:
+            line += f" feasible={feasible_ratio*100:5.1f}%"
         print(line, flush=True)
+        self.curve.append((round(elapsed, 3), best_cost))
         if self._writer is not None:
-            self._writer.writerow([f"{elapsed:.3f}", best_cost, current_cost, int(hard_ok), f"{accept_rate:.4f}", operator])
+            ratio = f"{feasible_ratio:.4f}" if feasible_ratio is not None else ""
+            self._writer.writerow([f"{elapsed:.3f}", best_cost, current_cost, int(hard_ok), f"{accept_rate:.4f}", operator, ratio])
             self._file.flush()
+        if self.listener is not None:
+            self.listener({
+                "elapsed": round(elapsed, 3),
+                "best_cost": best_cost,
+                "current_cost": current_cost,
+                "hard_ok": hard_ok,
+                "accept_rate": round(accept_rate, 4),
+                "operator": operator,
+                "feasible_ratio": round(feasible_ratio, 4) if feasible_ratio is not None else None,
+                "temperature": round(temperature, 4) if temperature is not None else None,
+                "tenure": tenure,
+                "breakdown": asdict(breakdown) if breakdown is not None else None,
+                "progress": round(progress, 4) if progress is not None else None,
+            })
+
+    def log_candidate_stats(self, stats: Dict[str, List[int]]) -> None:
+        """Record per-operator generated/feasible candidate counts."""
+
+        self.candidate_stats = {name: list(counts) for name, counts in stats.items()}
+        generated = sum(counts[0] for counts in stats.values())
+        feasible = sum(counts[1] for counts in stats.values())
+        ratio = feasible / generated if generated else 0.0
+        print(f"Feasible candidates: {feasible}/{generated} ({ratio*100:.1f}%)", flush=True)
+        for name, (gen, ok) in sorted(stats.items()):
+            if gen:
+                print(f"  {name}: {ok}/{gen} ({ok / gen * 100:.1f}%)", flush=True)
+
+    @property
+    def feasible_ratio(self) -> float:
+        generated = sum(counts[0] for counts in self.candidate_stats.values())
+        feasible = sum(counts[1] for counts in self.candidate_stats.values())
+        return feasible / generated if generated else 0.0
 
     def close(self) -> None:
         if self._file is not None:
@@ -494,6 +672,83 @@ def parse_instance(path: Optional[str], enforce_room_per_course: bool = False) -
     if idx >= len(lines) or lines[idx].upper() != "END.":
         raise ValueError("Missing END. terminator")
 
+    # Load mapping to find preferred room for each course (if enforce_room_per_course is enabled)
+    course_preferred_room: Dict[int, Optional[int]] = {}
+    if enforce_room_per_course and path is not None:
+        mapping_path = Path(str(path).replace('.ctt', '.ctt.mapping.json'))
+        if mapping_path.exists():
+            import json
+            try:
+                with open(mapping_path, 'r', encoding='utf-8') as f:
+                    mapping_data = json.load(f)
+                # Get course_details section (nested structure)
+                course_details_map = mapping_data.get('course_details', mapping_data)
+                
+                # Build course_id -> class_name mapping
+                for course_id_str, details in course_details_map.items():
+                    if course_id_str.startswith('C') and isinstance(details, dict):
+                        class_name = details.get('class')
+                        if class_name:
+                            # Find course index
+                            for course in courses:
+                                if course.id == course_id_str:
+                                    # Find room index with matching name
+                                    for room_idx, room in enumerate(rooms):
+                                        if room.id == class_name:
+                                            course_preferred_room[course.index] = room_idx
+                                            break
+                                    break
+            except Exception as e:
+                pass  # Silently fail if mapping file not found
+
+    return build_instance(
+        name,
+        days,
+        periods_per_day,
+        courses,
+        rooms,
+        curriculums,
+        unavailability,
+        preferences,
+        course_preferred_room=course_preferred_room,
+    )
+
+
+def build_instance(
+    name: str,
+    days: int,
+    periods_per_day: int,
+    courses: List[Course],
+    rooms: List[Room],
+    curriculums: List[Curriculum],
+    unavailability: List[Set[int]],
+    preferences: List[Set[int]],
+    course_preferred_room: Optional[Dict[int, int]] = None,
+) -> CBCTTInstance:
+    """Dựng ``CBCTTInstance`` (kèm các index dẫn xuất) từ dữ liệu đã chuẩn hoá.
+
+    Dùng chung cho ``parse_instance`` (file .ctt) và builder đọc thẳng từ DB.
+    ``courses`` / ``rooms`` / ``curriculums`` phải có ``index`` khớp vị trí;
+    ``course_preferred_room`` (course idx → room idx) chỉ có khi
+    enforce_room_per_course: course đó chỉ được xếp vào đúng phòng này.
+    """
+
+    course_preferred_room = course_preferred_room or {}
+    total_periods = days * periods_per_day
+    course_by_id: Dict[str, int] = {course.id: course.index for course in courses}
+    room_by_id: Dict[str, int] = {room.id: room.index for room in rooms}
+    curriculum_by_id: Dict[str, int] = {curriculum.name: curriculum.index for curriculum in curriculums}
+    teacher_by_id: Dict[str, int] = {}
+    teachers: List[str] = []
+    for course in courses:
+        if course.teacher not in teacher_by_id:
+            teacher_by_id[course.teacher] = course.teacher_index
+            teachers.append(course.teacher)
+    course_curriculums: List[List[int]] = [[] for _ in courses]
+    for curriculum in curriculums:
+        for course_idx in curriculum.courses:
+            course_curriculums[course_idx].append(curriculum.index)
+
     # Convert course preferences to teacher preferences (for hard constraint check in _can_place)
     teacher_preferred_periods: Dict[str, Set[int]] = {}
     for course_idx, course in enumerate(courses):
@@ -528,41 +783,12 @@ def parse_instance(path: Optional[str], enforce_room_per_course: bool = False) -
             raise ValueError(f"Course '{course.id}' has no feasible periods after applying unavailability")
         feasible_periods.append(allowed)
 
-    # Load mapping to find preferred room for each course (if enforce_room_per_course is enabled)
-    course_preferred_room: Dict[int, Optional[int]] = {}
-    if enforce_room_per_course and path is not None:
-        mapping_path = Path(str(path).replace('.ctt', '.ctt.mapping.json'))
-        if mapping_path.exists():
-            import json
-            try:
-                with open(mapping_path, 'r', encoding='utf-8') as f:
-                    mapping_data = json.load(f)
-                # Get course_details section (nested structure)
-                course_details_map = mapping_data.get('course_details', mapping_data)
-                
-                # Build course_id -> class_name mapping
-                for course_id_str, details in course_details_map.items():
-                    if course_id_str.startswith('C') and isinstance(details, dict):
-                        class_name = details.get('class')
-                        if class_name:
-                            # Find course index
-                            for course in courses:
-                                if course.id == course_id_str:
-                                    # Find room index with matching name
-                                    for room_idx, room in enumerate(rooms):
-                                        if room.id == class_name:
-                                            course_preferred_room[course.index] = room_idx
-                                            break
-                                    break
-            except Exception as e:
-                pass  # Silently fail if mapping file not found
-    
     course_room_preference: List[List[int]] = []
     for course in courses:
         students = course.students
-        preferred_room_idx = course_preferred_room.get(course.index) if enforce_room_per_course else None
+        preferred_room_idx = course_preferred_room.get(course.index)
         
-        if enforce_room_per_course and preferred_room_idx is not None:
+        if preferred_room_idx is not None:
             # STRICT MODE: Only allow the preferred room!
             order = [preferred_room_idx]
         else:
@@ -623,15 +849,112 @@ def parse_instance(path: Optional[str], enforce_room_per_course: bool = False) -
     )
 
 
+# Bản compiled của instance: pickle của CBCTTInstance (kèm mọi index dẫn xuất)
+# trong thư mục cache (không ghi cạnh file .ctt), hợp lệ khi version + hash nội dung nguồn khớp.
+COMPILED_INSTANCE_VERSION = 2
+
+
+def compiled_cache_dir() -> Path:
+    """Thư mục cache bản compiled: $SOLVER_INSTANCE_CACHE_DIR, mặc định
+    $XDG_CACHE_HOME (hoặc ~/.cache)/scheduling_web/compiled_instances."""
+
+    configured = os.environ.get("SOLVER_INSTANCE_CACHE_DIR")
+    if configured:
+        return Path(configured)
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "scheduling_web" / "compiled_instances"
+
+
+def _instance_source_hash(path: Path, enforce_room_per_course: bool) -> str:
+    """SHA-256 của nội dung .ctt (và mapping.json khi enforce_room_per_course)."""
+
+    digest = hashlib.sha256()
+    digest.update(f"v{COMPILED_INSTANCE_VERSION}:{int(enforce_room_per_course)}:".encode("ascii"))
+    digest.update(path.read_bytes())
+    if enforce_room_per_course:
+        mapping_path = Path(str(path).replace('.ctt', '.ctt.mapping.json'))
+        if mapping_path.exists():
+            digest.update(mapping_path.read_bytes())
+    return digest.hexdigest()
+
+
+def compiled_instance_path(path: Path, enforce_room_per_course: bool = False, cache_dir: Optional[Path] = None) -> Path:
+    """Đường dẫn bản compiled của file .ctt trong ``cache_dir`` (mặc định ``compiled_cache_dir()``).
+
+    Tên file gồm tên .ctt + hash đường dẫn tuyệt đối (2 file cùng tên ở 2 thư mục
+    không đè nhau), tách riêng theo enforce_room_per_course.
+    """
+
+    path_key = hashlib.sha256(str(Path(path).resolve()).encode("utf-8")).hexdigest()[:16]
+    suffix = ".enforced.compiled.pkl" if enforce_room_per_course else ".compiled.pkl"
+    return Path(cache_dir or compiled_cache_dir()) / f"{Path(path).name}.{path_key}{suffix}"
+
+
+def load_instance(
+    path: Optional[str],
+    enforce_room_per_course: bool = False,
+    use_compiled: bool = True,
+    cache_dir: Optional[Path] = None,
+) -> CBCTTInstance:
+    """Như ``parse_instance`` nhưng dùng lại bản compiled nếu nội dung nguồn không đổi.
+
+    Lần đầu parse file .ctt rồi ghi pickle (atomic) vào thư mục cache
+    (``compiled_instance_path``); các lần sau chỉ hash nội dung nguồn và
+    unpickle - không parse lại, không dựng lại index. Bản compiled hỏng /
+    khác version / khác hash (file .ctt đã sửa) sẽ bị ghi đè. Không ghi được
+    thư mục cache thì vẫn parse bình thường.
+    """
+
+    if path is None or not use_compiled:
+        return parse_instance(path, enforce_room_per_course=enforce_room_per_course)
+    source = Path(path)
+    if not source.exists():
+        raise FileNotFoundError(f"Không tìm thấy file instance: {path}")
+
+    source_hash = _instance_source_hash(source, enforce_room_per_course)
+    compiled_path = compiled_instance_path(source, enforce_room_per_course, cache_dir)
+    try:
+        with compiled_path.open("rb") as handle:
+            payload = pickle.load(handle)
+        if payload.get("version") == COMPILED_INSTANCE_VERSION and payload.get("hash") == source_hash:
+            return payload["instance"]
+    except FileNotFoundError:
+        pass
+    except Exception as exc:  # pickle hỏng hoặc class khác module (__main__ vs package)
+        print(f"[Instance] Bỏ qua bản compiled {compiled_path.name}: {exc}", file=sys.stderr)
+
+    instance = parse_instance(path, enforce_room_per_course=enforce_room_per_course)
+    tmp_path = compiled_path.with_name(compiled_path.name + ".tmp")
+    try:
+        compiled_path.parent.mkdir(parents=True, exist_ok=True)
+        with tmp_path.open("wb") as handle:
+            pickle.dump(
+                {"version": COMPILED_INSTANCE_VERSION, "hash": source_hash, "instance": instance},
+                handle,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp_path, compiled_path)
+    except OSError as exc:
+        print(f"[Instance] Không ghi được bản compiled {compiled_path.name}: {exc}", file=sys.stderr)
+    return instance
+
+
 class TimetableState:
     """Mutable timetable with incremental scoring."""
 
+    # Penalty units (before weights): per missing working day / per extra room of a course
+    MWD_PENALTY_PER_DAY = 5
+    ROOM_STABILITY_PENALTY_PER_ROOM = 20
+
     def __init__(self, instance: CBCTTInstance, ma_dot: Optional[str] = None) -> None:
         self.instance = instance
         self.assignments: Dict[int, Tuple[int, int]] = {}
         
         # Load soft constraint weights dynamically from database (with fallback)
-        self.weights = WeightLoader.load_weights(ma_dot)
+        if instance.weights is not None:
+            self.weights = dict(instance.weights)
+        else:
+            self.weights = WeightLoader.load_weights(ma_dot)
         self.ma_dot = ma_dot  # Store for reference
         total_periods = instance.total_periods
         self.period_rooms: List[Dict[int, int]] = [dict() for _ in range(total_periods)]
@@ -642,6 +965,8 @@ class TimetableState:
         course_count = len(instance.courses)
         self.course_day_counts: List[List[int]] = [[0] * instance.days for _ in range(course_count)]
         self.course_active_days: List[int] = [0] * course_count
+        # NumPy mirror of course_day_counts for BatchMoveEvaluator (see day_count_array)
+        self._course_day_array: Optional["np.ndarray"] = None
         self.course_room_counts: List[Dict[int, int]] = [defaultdict(int) for _ in range(course_count)]
         self.course_mwd_penalty: List[int] = [0] * course_count
         self.course_room_penalty: List[int] = [0] * course_count
@@ -668,19 +993,33 @@ class TimetableState:
         self.course_assigned_periods: List[List[int]] = [[] for _ in range(course_count)]
         # NEW: Track teacher lectures consolidation
         # teacher_name (str) -> dict of {course_idx -> {lecture_id -> (period, room_idx) or None}}
-        self.teacher_course_lectures: Dict[str, Dict[int, Dict[int, Optional[Tuple[int, int]]]]] = {}
-        for lecture_id in range(lecture_count):
-            course_idx = instance.lectures[lecture_id].course
-            teacher = instance.course_teachers[course_idx]  # This is teacher NAME (string)
-            if teacher not in self.teacher_course_lectures:
-                self.teacher_course_lectures[teacher] = {}
-            if course_idx not in self.teacher_course_lectures[teacher]:
-                self.teacher_course_lectures[teacher][course_idx] = {}
-            self.teacher_course_lectures[teacher][course_idx][lecture_id] = None
+        # Khung teacher → course → lecture ids đã dựng sẵn trong instance
+        self.teacher_course_lectures: Dict[str, Dict[int, Dict[int, Optional[Tuple[int, int]]]]] = {
+            teacher: {course_idx: dict.fromkeys(lecture_ids) for course_idx, lecture_ids in by_course.items()}
+            for teacher, by_course in instance.teacher_course_lecture_ids.items()
+        }
+        # JIT kernels (feature flag đọc lúc tạo state)
+        self._use_jit = penalty_kernels.jit_enabled()
+        self._course_type_code: List[int] = instance.course_type_codes
 
     def clone_assignments(self) -> Dict[int, Tuple[int, int]]:
         return dict(self.assignments)
 
+    def _kernel_input(self, values: Sequence[int]):
+        """Đầu vào penalty kernel: mảng NumPy khi chạy bản Numba, list khi chạy Python thuần."""
+        if self._use_jit and np is not None:
+            return np.asarray(values, dtype=np.int64)
+        return list(values)
+
+    def day_count_array(self) -> "np.ndarray":
+        """``course_day_counts`` as a (courses, days) array, built once then kept in sync incrementally."""
+
+        if self._course_day_array is None:
+            self._course_day_array = np.array(self.course_day_counts, dtype=np.int64).reshape(
+                len(self.course_day_counts), self.instance.days
+            )
+        return self._course_day_array
+
     def _compute_teacher_preference_cost(self, lecture_id: int) -> int:
         """
         Tính cost cho teacher preferences.
@@ -713,13 +1052,13 @@ class TimetableState:
         
         course = self.instance.courses[course_idx]
         missing = max(0, course.min_working_days - self.course_active_days[course_idx])
-        return missing * 5
+        return missing * self.MWD_PENALTY_PER_DAY
 
     def _compute_course_room_penalty(self, course_idx: int) -> int:
         rooms_used = sum(1 for count in self.course_room_counts[course_idx].values() if count > 0)
         # EXTREMELY strong penalty to absolutely avoid using multiple rooms
         # RoomStability MUST be 0!
-        return max(0, rooms_used - 1) * 20
+        return max(0, rooms_used - 1) * self.ROOM_STABILITY_PENALTY_PER_ROOM
 
     @staticmethod
     def _compute_curriculum_day_penalty(slots: Set[int]) -> int:
@@ -739,100 +1078,10 @@ class TimetableState:
         
         Tránh tình trạng quá tải: Không được xếp tất cả tiết cùng môn vào cùng 1 ngày!
         """
-        course = self.instance.courses[course_idx]
-        periods = self.course_assigned_periods[course_idx]
-        num_lectures = len(periods)
-        
-        if num_lectures <= 1:
+        periods = self.course_assigned_periods[course_idx]  # đã sắp xếp tăng dần
+        if len(periods) <= 1:
             return 0
-        
-        # Nhóm các tiết học theo ngày
-        lectures_by_day = {}
-        for period in periods:
-            day, slot = self.instance.period_to_slot(period)
-            if day not in lectures_by_day:
-                lectures_by_day[day] = []
-            lectures_by_day[day].append(slot)
-        
-        # Sắp xếp slots trong mỗi ngày
-        for day in lectures_by_day:
-            lectures_by_day[day].sort()
-        
-        # Tìm các cặp tiết liên tiếp (consecutive pairs) theo ngày
-        pairs_by_day = {}  # day -> list of pairs (start_slot, end_slot)
-        for day, slots in lectures_by_day.items():
-            pairs = []
-            i = 0
-            while i < len(slots) - 1:
-                if slots[i + 1] - slots[i] == 1:  # 2 slot liền nhau
-                    pairs.append((slots[i], slots[i + 1]))
-                    i += 2  # Bỏ qua slot đã ghép cặp
-                else:
-                    i += 1
-            pairs_by_day[day] = pairs
-        
-        total_pairs = sum(len(pairs) for pairs in pairs_by_day.values())
-        days_with_pairs = [day for day, pairs in pairs_by_day.items() if len(pairs) > 0]
-        
-        penalty = 0
-        
-        # === TRƯỜNG HỢP 1: 2 TIẾT ===
-        if num_lectures == 2:
-            if total_pairs == 1:
-                # Hoàn hảo: có đúng 1 cặp 2 tiết liên tiếp
-                return 0
-            else:
-                # Vi phạm: 2 tiết không liên tiếp
-                return 2  # Giảm từ 5 xuống 2
-        
-        # === QUY TẮC CHUNG: Tránh quá tải - KHÔNG cho phép tất cả tiết cùng ngày ===
-        if num_lectures >= 3 and len(lectures_by_day) == 1:
-            # PENALTY CỰC NẶNG: Tất cả tiết ở cùng 1 ngày
-            penalty += 10  # Giảm từ 30 xuống 10 (cho phép TS escape nếu cần)
-        
-        # === TRƯỜNG HỢP 2: 3 TIẾT ===
-        if num_lectures == 3:
-            if total_pairs == 1 and len(lectures_by_day) >= 2:
-                # Hoàn hảo: có 1 cặp liên tiếp + 1 tiết rời, trên ít nhất 2 ngày khác nhau
-                if len(days_with_pairs) == 1:
-                    return 0
-                else:
-                    return 0
-            elif total_pairs == 0:
-                # Vi phạm nghiêm trọng: không có cặp liên tiếp nào
-                penalty += 3  # Giảm từ 8 xuống 3
-            elif total_pairs == 1 and len(lectures_by_day) == 1:
-                # Vi phạm: có 1 cặp nhưng tất cả cùng ngày (quá tải)
-                penalty += 5  # Giảm từ 20 xuống 5 (+ 10 ở trên = 15 tổng)
-            else:
-                # Trường hợp khác
-                penalty += 2  # Giảm từ 5 xuống 2
-        
-        # === TRƯỜNG HỢP 3: 4 TIẾT ===
-        elif num_lectures == 4:
-            if total_pairs == 2 and len(days_with_pairs) >= 2:
-                # Hoàn hảo: có đúng 2 cặp liên tiếp trên ít nhất 2 ngày khác nhau
-                return 0
-            elif total_pairs < 2:
-                # Vi phạm: không đủ 2 cặp
-                penalty += (2 - total_pairs) * 3  # Giảm từ 8 xuống 3
-            elif total_pairs == 2 and len(days_with_pairs) == 1:
-                # Vi phạm: có 2 cặp nhưng cùng ngày (quá tải)
-                penalty += 5  # Giảm từ 15 xuống 5
-            else:
-                # Trường hợp khác
-                penalty += 1  # Giảm từ 3 xuống 1
-        
-        # === TRƯỜNG HỢP >= 5 TIẾT ===
-        elif num_lectures >= 5:
-            # Yêu cầu tối thiểu: có ít nhất 2 cặp liên tiếp
-            if total_pairs < 2:
-                penalty += (2 - total_pairs) * 2  # Giảm từ 6 xuống 2
-            # Yêu cầu các cặp phải trải đều trên nhiều ngày
-            if len(days_with_pairs) < 2:
-                penalty += 3  # Giảm từ 8 xuống 3
-        
-        return penalty
+        return int(penalty_kernels.consecutiveness_penalty(self._kernel_input(periods), self.instance.periods_per_day))
 
     def _compute_teacher_lecture_consolidation_penalty(self, teacher: str) -> int:
         """
@@ -854,45 +1103,22 @@ class TimetableState:
         if teacher not in self.teacher_course_lectures:
             return 0
         
-        # Collect all lectures của teacher (tất cả courses)
-        all_lectures = []
-        for course_idx, lectures_dict in self.teacher_course_lectures[teacher].items():
-            course_type = self.instance.courses[course_idx].course_type
-            for lecture_id, assignment in lectures_dict.items():
-                if assignment is not None:  # Đã được xếp
-                    period, room_idx = assignment
-                    day, slot = self.instance.period_to_slot(period)
-                    all_lectures.append({
-                        'day': day,
-                        'slot': slot,
-                        'period': period,
-                        'room_idx': room_idx,
-                        'course_idx': course_idx,
-                        'course_type': course_type
-                    })
-        
-        if len(all_lectures) <= 1:
+        lectures = [
+            (assignment[0], assignment[1], self._course_type_code[course_idx])
+            for course_idx, lectures_dict in self.teacher_course_lectures[teacher].items()
+            for assignment in lectures_dict.values()
+            if assignment is not None
+        ]
+        if len(lectures) <= 1:
             return 0
-        
-        # Sort by day, then slot
-        all_lectures.sort(key=lambda x: (x['day'], x['slot']))
-        
-        # Check consecutive lectures
-        penalty = 0
-        for i in range(len(all_lectures) - 1):
-            lec1 = all_lectures[i]
-            lec2 = all_lectures[i + 1]
-            
-            # Only check if on same day and consecutive slots
-            if lec1['day'] == lec2['day'] and lec2['slot'] == lec1['slot'] + 1:
-                # Consecutive lectures on same day
-                if lec1['room_idx'] != lec2['room_idx']:
-                    # ✅ FIX: Only penalize if SAME course type
-                    if lec1['course_type'] and lec2['course_type'] and lec1['course_type'] == lec2['course_type']:
-                        penalty += 1  # Same type → should use same room
-                    # Different types (LT↔TH) → MUST change room → no penalty
-        
-        return penalty
+        lectures.sort(key=lambda lecture: lecture[0])
+        periods, rooms, types = zip(*lectures)
+        return int(penalty_kernels.consolidation_penalty(
+            self._kernel_input(periods),
+            self._kernel_input(rooms),
+            self._kernel_input(types),
+            self.instance.periods_per_day,
+        ))
 
     def _compute_teacher_working_days_penalty(self, teacher: str) -> int:
         """
@@ -920,36 +1146,15 @@ class TimetableState:
         if teacher not in self.teacher_course_lectures:
             return 0
         
-        # 1. Đếm tổng số tiết của GV
-        total_lectures = 0
-        for course_idx, lectures_dict in self.teacher_course_lectures[teacher].items():
-            for lecture_id, assignment in lectures_dict.items():
-                if assignment is not None:  # Đã được xếp
-                    total_lectures += 1
-        
-        if total_lectures <= 0:
-            return 0
-        
-        # 2. Đếm số ngày hoạt động của GV
-        active_days = set()
-        for course_idx, lectures_dict in self.teacher_course_lectures[teacher].items():
-            for lecture_id, assignment in lectures_dict.items():
-                if assignment is not None:
-                    period, _ = assignment
-                    day, _ = self.instance.period_to_slot(period)
-                    active_days.add(day)
-        
-        # 3. Tính số ngày tối thiểu lý thuyết
-        # - Mỗi ngày tối đa N ca (N = periods_per_day)
-        # - Nên min_days = ⌈total_lectures / periods_per_day⌉
-        periods_per_day = self.instance.periods_per_day
-        min_days_theoretical = (total_lectures + periods_per_day - 1) // periods_per_day  # Ceiling division
-        
-        # 4. Penalty = số ngày thực tế - số ngày tối thiểu
-        actual_days = len(active_days)
-        penalty = max(0, actual_days - min_days_theoretical)
-        
-        return penalty
+        periods = [
+            assignment[0]
+            for lectures_dict in self.teacher_course_lectures[teacher].values()
+            for assignment in lectures_dict.values()
+            if assignment is not None
+        ]
+        return int(penalty_kernels.working_days_penalty(
+            self._kernel_input(periods), self.instance.periods_per_day, self.instance.days
+        ))
 
     def _can_place(self, lecture_id: int, period: int, room_idx: int) -> bool:
         """
@@ -993,10 +1198,13 @@ class TimetableState:
         if period in self.instance.unavailability[course_idx]:
             return False
         
-        # Check 2: Room not already booked at this period
+        # Check 2: Room not already booked at this period (kể cả bởi đợt khác)
         room = self.instance.rooms[room_idx]
         if room_idx in self.period_rooms[period]:
             return False
+        blocked = self.instance.blocked_cells.get(period)
+        if blocked and room_idx in blocked:
+            return False
         
         # Check 3: Teacher conflict
         owner = self.period_teacher_owner[period].get(teacher)
@@ -1068,10 +1276,13 @@ class TimetableState:
         if period in self.instance.unavailability[course_idx]:
             return False
         
-        # Check 2: Room not already booked at this period
+        # Check 2: Room not already booked at this period (kể cả bởi đợt khác)
         room = self.instance.rooms[room_idx]
         if room_idx in self.period_rooms[period]:
             return False
+        blocked = self.instance.blocked_cells.get(period)
+        if blocked and room_idx in blocked:
+            return False
         
         # Check 3: Teacher conflict
         owner = self.period_teacher_owner[period].get(teacher)
@@ -1209,12 +1420,71 @@ class TimetableState:
                 return room_idx
         return None
 
+    def _slot_free_for(self, lecture_id: int, period: int, ignore: Optional[int] = None) -> bool:
+        """True nếu teacher và curricula của lecture đều rảnh tại period.
+
+        ``ignore`` là lecture sẽ rời khỏi period (ví dụ: đối tác swap), nên
+        không tính là xung đột.
+        """
+
+        course_idx = self.instance.lectures[lecture_id].course
+        if period in self.instance.unavailability[course_idx]:
+            return False
+        teacher = self.instance.course_teachers[course_idx]
+        owner = self.period_teacher_owner[period].get(teacher)
+        if owner is not None and owner != lecture_id and owner != ignore:
+            return False
+        for curriculum_idx in self.instance.course_curriculums[course_idx]:
+            owner = self.period_curriculum_owner[period].get(curriculum_idx)
+            if owner is not None and owner != lecture_id and owner != ignore:
+                return False
+        return True
+
+    def free_periods_for(self, lecture_id: int) -> List[int]:
+        """Feasible periods where the lecture's teacher and curricula are free."""
+
+        course_idx = self.instance.lectures[lecture_id].course
+        return [p for p in self.instance.feasible_periods[course_idx] if self._slot_free_for(lecture_id, p)]
+
+    def free_rooms_for(self, lecture_id: int, period: int) -> List[int]:
+        """Statically compatible rooms that are unoccupied at period."""
+
+        course_idx = self.instance.lectures[lecture_id].course
+        occupied = self.period_rooms[period]
+        blocked = self.instance.blocked_cells.get(period, ())
+        return [
+            r for r in self.instance.course_compatible_rooms[course_idx]
+            if occupied.get(r, lecture_id) == lecture_id and r not in blocked
+        ]
+
+    def swap_is_feasible(self, lecture_a: int, lecture_b: int) -> bool:
+        """Check the hard constraints of ``swap_lectures`` without touching state."""
+
+        assign_a = self.assignments.get(lecture_a)
+        assign_b = self.assignments.get(lecture_b)
+        if assign_a is None or assign_b is None or assign_a == assign_b:
+            return False
+        course_a = self.instance.lectures[lecture_a].course
+        course_b = self.instance.lectures[lecture_b].course
+        if assign_b[1] not in self.instance.course_room_sets[course_a]:
+            return False
+        if assign_a[1] not in self.instance.course_room_sets[course_b]:
+            return False
+        if assign_a[0] == assign_b[0]:
+            return True
+        return (
+            self._slot_free_for(lecture_a, assign_b[0], ignore=lecture_b)
+            and self._slot_free_for(lecture_b, assign_a[0], ignore=lecture_a)
+        )
+
     def conflicts_for(self, lecture_id: int, period: int, room_idx: int) -> Optional[Set[int]]:
         """Return conflicting lecture ids for placing lecture at period/room, or None if forbidden."""
 
         course_idx = self.instance.lectures[lecture_id].course
         if period in self.instance.unavailability[course_idx]:
             return None
+        if room_idx in self.instance.blocked_cells.get(period, ()):
+            return None
         conflicts: Set[int] = set()
         occupant = self.period_rooms[period].get(room_idx)
         if occupant is not None and occupant != lecture_id:
@@ -1278,6 +1548,8 @@ class TimetableState:
         day, slot = self.instance.period_to_slot(period)
         old_penalty = self.course_mwd_penalty[course_idx]
         self.course_day_counts[course_idx][day] -= 1
+        if self._course_day_array is not None:
+            self._course_day_array[course_idx, day] -= 1
         if self.course_day_counts[course_idx][day] == 0:
             self.course_active_days[course_idx] -= 1
         new_penalty = self._compute_course_mwd_penalty(course_idx)
@@ -1339,6 +1611,8 @@ class TimetableState:
         day, slot = self.instance.period_to_slot(period)
         old_penalty = self.course_mwd_penalty[course_idx]
         self.course_day_counts[course_idx][day] += 1
+        if self._course_day_array is not None:
+            self._course_day_array[course_idx, day] += 1
         if self.course_day_counts[course_idx][day] == 1:
             self.course_active_days[course_idx] += 1
         new_penalty = self._compute_course_mwd_penalty(course_idx)
@@ -1430,12 +1704,43 @@ class TimetableState:
                 return False
             if len(self.period_curriculums[period]) != len(self.period_curriculum_owner[period]):
                 return False
-        for lecture_id, (period, _room_idx) in self.assignments.items():
+        blocked_cells = self.instance.blocked_cells
+        for lecture_id, (period, room_idx) in self.assignments.items():
             course_idx = self.instance.lectures[lecture_id].course
             if period in self.instance.unavailability[course_idx]:
                 return False
+            if blocked_cells and room_idx in blocked_cells.get(period, ()):
+                return False
+        # Đếm lại trùng lịch từ assignments chỉ khi có kernel JIT (rẻ); không thì dùng các chỉ số incremental ở trên
+        if self._use_jit:
+            return self.count_hard_conflicts() == 0
         return True
 
+    def count_hard_conflicts(self) -> int:
+        """Count room/teacher/curriculum double-bookings from the raw assignments."""
+
+        instance = self.instance
+        lecture_count = len(instance.lectures)
+        periods = [-1] * lecture_count
+        rooms = [0] * lecture_count
+        for lecture_id, (period, room_idx) in self.assignments.items():
+            periods[lecture_id] = period
+            rooms[lecture_id] = room_idx
+        if instance.lecture_teacher_array is not None:
+            teachers, curr_ptr, curr_idx = (
+                instance.lecture_teacher_array, instance.lecture_curr_ptr, instance.lecture_curr_idx
+            )
+        else:  # Không có NumPy: instance không dựng sẵn mảng, kernel chạy trên list
+            teachers = [instance.courses[lecture.course].teacher_index for lecture in instance.lectures]
+            curr_ptr, curr_idx = [0], []
+            for lecture in instance.lectures:
+                curr_idx.extend(instance.course_curriculums[lecture.course])
+                curr_ptr.append(len(curr_idx))
+        return int(penalty_kernels.hard_conflict_count(
+            self._kernel_input(periods), self._kernel_input(rooms), teachers, curr_ptr, curr_idx,
+            instance.total_periods, len(instance.rooms), max(1, len(instance.teachers)), len(instance.curriculums),
+        ))
+
 
 def _candidate_order(instance: CBCTTInstance) -> List[int]:
     """
@@ -1486,13 +1791,28 @@ def _candidate_order(instance: CBCTTInstance) -> List[int]:
     return order
 
 
-def _build_initial_solution(instance: CBCTTInstance, rng: random.Random, strategy: str, builder_deadline: float) -> TimetableState:
+# Deterministic mode (count budget, không time limit): xây lời giải ban đầu giới hạn theo số bước
+# thay cho deadline, để cùng seed luôn ra cùng lời giải ban đầu và cùng chuỗi RNG
+INIT_BACKTRACK_STEPS_PER_LECTURE = 200
+INIT_REPAIR_STEPS_PER_LECTURE = 50
+
+
+def _build_initial_solution(instance: CBCTTInstance, rng: random.Random, strategy: str, builder_deadline: Optional[float], max_steps: Optional[int] = None) -> TimetableState:
+    """Backtracking constructor, stopped by ``builder_deadline`` or - if given - by ``max_steps`` backtrack calls."""
+
     state = TimetableState(instance)
     order = _candidate_order(instance)
     sys.setrecursionlimit(max(10000, len(order) * 20))
+    steps = [0]
+
+    def out_of_budget() -> bool:
+        if max_steps is not None:
+            return steps[0] > max_steps
+        return time.time() > builder_deadline
 
     def backtrack(index: int) -> bool:
-        if time.time() > builder_deadline:
+        steps[0] += 1
+        if out_of_budget():
             return False
         if index >= len(order):
             return True
@@ -1643,8 +1963,7 @@ def _build_initial_solution(instance: CBCTTInstance, rng: random.Random, strateg
         return False
 
     attempts = 0
-    deadline = builder_deadline
-    while time.time() <= deadline and attempts < 4:
+    while not out_of_budget() and attempts < 4:
         if backtrack(0):
             return state
         attempts += 1
@@ -1653,15 +1972,26 @@ def _build_initial_solution(instance: CBCTTInstance, rng: random.Random, strateg
     raise RuntimeError("Failed to build initial feasible solution within budget")
 
 
-def _repair_initial_solution(instance: CBCTTInstance, rng: random.Random, builder_deadline: float) -> TimetableState:
-    """Fallback constructor using ejection-based repairs when pure backtracking fails."""
+def _repair_initial_solution(instance: CBCTTInstance, rng: random.Random, builder_deadline: Optional[float], max_steps: Optional[int] = None) -> TimetableState:
+    """Fallback constructor using ejection-based repairs when pure backtracking fails.
+
+    Stopped by ``builder_deadline`` or - if given - by ``max_steps`` queue pops.
+    """
 
     state = TimetableState(instance)
     order = _candidate_order(instance)
     queue = deque(order)
     retries: Dict[int, int] = defaultdict(int)
     max_retry = max(10, len(order) * 6)
-    while queue and time.time() <= builder_deadline:
+    steps = 0
+
+    def out_of_budget() -> bool:
+        if max_steps is not None:
+            return steps > max_steps
+        return time.time() > builder_deadline
+
+    while queue and not out_of_budget():
+        steps += 1
         lecture_id = queue.popleft()
         if lecture_id in state.assignments:
             continue
@@ -1704,7 +2034,7 @@ def _repair_initial_solution(instance: CBCTTInstance, rng: random.Random, builde
                 state.unassign(lecture_id)
             for conflict, (p_old, r_old) in reversed(removed):
                 state.move_lecture(conflict, p_old, r_old, commit=True)
-            if time.time() > builder_deadline:
+            if out_of_budget():
                 break
         if not placed:
             retries[lecture_id] += 1
@@ -1716,7 +2046,20 @@ def _repair_initial_solution(instance: CBCTTInstance, rng: random.Random, builde
     raise RuntimeError("Fallback repair failed to build feasible solution")
 
 
-def build_initial_solution(instance: CBCTTInstance, rng: random.Random, strategy: str, start_time: float, time_limit: float) -> TimetableState:
+def build_initial_solution(instance: CBCTTInstance, rng: random.Random, strategy: str, start_time: float, time_limit: float, deterministic: bool = False) -> TimetableState:
+    """Greedy backtracking, falling back to ejection repair.
+
+    With ``deterministic`` (count-only search budget) both phases are bounded
+    by step counts instead of ``time_limit``, so the result does not depend
+    on machine load.
+    """
+
+    if deterministic:
+        lectures = max(1, len(instance.lectures))
+        try:
+            return _build_initial_solution(instance, rng, strategy, None, lectures * INIT_BACKTRACK_STEPS_PER_LECTURE)
+        except RuntimeError:
+            return _repair_initial_solution(instance, rng, None, lectures * INIT_REPAIR_STEPS_PER_LECTURE)
     overall_deadline = start_time + max(time_limit, 0.5)
     now = time.time()
     max_budget = max(0.5, time_limit * 0.35)
@@ -1751,6 +2094,10 @@ class Move:
     def signature(self) -> Tuple:
         raise NotImplementedError
 
+    def attributes(self, state: TimetableState) -> List[Tuple[int, int]]:
+        """(lecture, target period) pairs this move would create."""
+        raise NotImplementedError
+
 
 class MoveLectureMove(Move):
     name = "move"
@@ -1780,6 +2127,9 @@ class MoveLectureMove(Move):
     def signature(self) -> Tuple:
         return (self.name, self.lecture, self.period, self.room)
 
+    def attributes(self, state: TimetableState) -> List[Tuple[int, int]]:
+        return [(self.lecture, self.period)]
+
 
 class SwapLecturesMove(Move):
     name = "swap"
@@ -1807,6 +2157,13 @@ class SwapLecturesMove(Move):
         a, b = sorted((self.lecture_a, self.lecture_b))
         return (self.name, a, b)
 
+    def attributes(self, state: TimetableState) -> List[Tuple[int, int]]:
+        assign_a = state.assignments.get(self.lecture_a)
+        assign_b = state.assignments.get(self.lecture_b)
+        if assign_a is None or assign_b is None:
+            return []
+        return [(self.lecture_a, assign_b[0]), (self.lecture_b, assign_a[0])]
+
 
 class KempeChainMove(Move):
     name = "kempe"
@@ -1833,11 +2190,121 @@ class KempeChainMove(Move):
         items = tuple(sorted((lecture, target[0]) for lecture, target in self.mapping.items()))
         return (self.name, items)
 
+    def attributes(self, state: TimetableState) -> List[Tuple[int, int]]:
+        return [(lecture, target[0]) for lecture, target in self.mapping.items()]
+
+
+class BatchMoveEvaluator:
+    """Vectorised partial-delta scoring for simple (lecture, period, room) moves.
+
+    Scores room capacity, min working days, room stability and teacher
+    preference deltas for many ``MoveLectureMove`` candidates in one NumPy
+    call, with the same penalty units and weights as ``TimetableState``.
+    Consecutiveness / S6 / S7 are NOT included, so the score is only a
+    screening value: callers keep the best candidates and evaluate them
+    exactly through the scalar ``Move.evaluate`` path.
+    """
+
+    def __init__(self, state: TimetableState) -> None:
+        if np is None:
+            raise RuntimeError("NumPy is required for BatchMoveEvaluator")
+        instance = state.instance
+        self.state = state
+        weights = state.weights
+        self.w_capacity = weights['ROOM_CAPACITY']
+        self.w_mwd = weights['MIN_WORKING_DAYS'] * state.MWD_PENALTY_PER_DAY
+        self.w_room = weights['ROOM_STABILITY'] * state.ROOM_STABILITY_PENALTY_PER_ROOM
+        self.w_pref = weights['TEACHER_PREFERENCE']
+        self.room_capacity = np.array([room.capacity for room in instance.rooms], dtype=np.int64)
+        self.course_students = np.array(instance.course_students, dtype=np.int64)
+        self.course_min_days = np.array([c.min_working_days for c in instance.courses], dtype=np.int64)
+        self.lecture_course = np.array([lec.course for lec in instance.lectures], dtype=np.int64)
+        self.period_day = np.array(
+            [instance.period_to_slot(p)[0] for p in range(instance.total_periods)], dtype=np.int64
+        )
+        # pref_cost[course, period] = 1 nếu GV có nguyện vọng và period nằm ngoài nguyện vọng
+        self.pref_cost = np.zeros((len(instance.courses), instance.total_periods), dtype=np.int64)
+        for course_idx, teacher in enumerate(instance.course_teachers):
+            preferred = instance.teacher_preferred_periods.get(teacher, set())
+            if preferred:
+                self.pref_cost[course_idx, :] = 1
+                self.pref_cost[course_idx, sorted(preferred)] = 0
+
+    @staticmethod
+    def supports(move: Move) -> bool:
+        return isinstance(move, MoveLectureMove)
+
+    def score(self, moves: Sequence[MoveLectureMove]) -> "np.ndarray":
+        """Return partial weighted deltas for ``moves`` (same order)."""
+
+        state = self.state
+        count = len(moves)
+        if count == 0:
+            return np.zeros(0, dtype=np.float64)
+        lectures = np.fromiter((m.lecture for m in moves), dtype=np.int64, count=count)
+        new_periods = np.fromiter((m.period for m in moves), dtype=np.int64, count=count)
+        new_rooms = np.fromiter((m.room for m in moves), dtype=np.int64, count=count)
+        origins = [state.assignments[m.lecture] for m in moves]
+        old_periods = np.fromiter((o[0] for o in origins), dtype=np.int64, count=count)
+        old_rooms = np.fromiter((o[1] for o in origins), dtype=np.int64, count=count)
+        courses = self.lecture_course[lectures]
+
+        # Room capacity (overflow)
+        students = self.course_students[courses]
+        capacity_delta = (
+            np.maximum(0, students - self.room_capacity[new_rooms])
+            - np.maximum(0, students - self.room_capacity[old_rooms])
+        )
+
+        # Min working days
+        course_days = state.day_count_array()[courses]
+        active = np.count_nonzero(course_days, axis=1)
+        rows = np.arange(count)
+        old_days = self.period_day[old_periods]
+        new_days = self.period_day[new_periods]
+        changes_day = old_days != new_days
+        new_active = (
+            active
+            - (changes_day & (course_days[rows, old_days] == 1))
+            + (changes_day & (course_days[rows, new_days] == 0))
+        )
+        min_days = self.course_min_days[courses]
+        mwd_delta = np.maximum(0, min_days - new_active) - np.maximum(0, min_days - active)
+
+        # Room stability (số phòng khác nhau của course)
+        room_counts = state.course_room_counts
+        used = np.fromiter(
+            (sum(1 for v in room_counts[c].values() if v > 0) for c in courses.tolist()),
+            dtype=np.int64, count=count,
+        )
+        old_room_count = np.fromiter(
+            (room_counts[c].get(r, 0) for c, r in zip(courses.tolist(), old_rooms.tolist())),
+            dtype=np.int64, count=count,
+        )
+        new_room_count = np.fromiter(
+            (room_counts[c].get(r, 0) for c, r in zip(courses.tolist(), new_rooms.tolist())),
+            dtype=np.int64, count=count,
+        )
+        changes_room = old_rooms != new_rooms
+        new_used = used - (changes_room & (old_room_count == 1)) + (changes_room & (new_room_count == 0))
+        room_delta = np.maximum(0, new_used - 1) - np.maximum(0, used - 1)
+
+        # Teacher preference
+        pref_delta = self.pref_cost[courses, new_periods] - self.pref_cost[courses, old_periods]
+
+        return (
+            capacity_delta * self.w_capacity
+            + mwd_delta * self.w_mwd
+            + room_delta * self.w_room
+            + pref_delta * self.w_pref
+        )
+
 
 class Neighborhood:
     """Base neighborhood operator."""
 
     name: str
+    budget: Optional["SearchBudget"] = None  # Gán bởi run_metaheuristic
 
     def generate_candidate(self, state: TimetableState, rng: random.Random) -> Optional[Move]:
         raise NotImplementedError
@@ -1859,18 +2326,14 @@ class MoveLectureNeighborhood(Neighborhood):
         current = state.assignments.get(lecture_id)
         if current is None:
             return None
-        course_idx = instance.lectures[lecture_id].course
-        periods = instance.feasible_periods[course_idx]
-        if not periods:
-            return None
-        period = rng.choice(periods)
-        room = rng.choice(instance.course_room_preference[course_idx])
-        tries = 0
-        while current == (period, room) and tries < 5:
-            period = rng.choice(periods)
-            room = rng.choice(instance.course_room_preference[course_idx])
-            tries += 1
-        return MoveLectureMove(lecture_id, period, room)
+        # Chỉ lấy period mà GV + curricula đang rảnh, phòng tương thích còn trống
+        periods = state.free_periods_for(lecture_id)
+        rng.shuffle(periods)
+        for period in periods[:5]:
+            rooms = [r for r in state.free_rooms_for(lecture_id, period) if (period, r) != current]
+            if rooms:
+                return MoveLectureMove(lecture_id, period, rng.choice(rooms))
+        return None
 
 
 class RoomChangeNeighborhood(Neighborhood):
@@ -1926,12 +2389,17 @@ class SwapLecturesNeighborhood(Neighborhood):
     name = "SwapLectures"
 
     def generate_candidate(self, state: TimetableState, rng: random.Random) -> Optional[Move]:
-        lecture_count = len(state.instance.lectures)
-        lecture_a = rng.randrange(lecture_count)
-        lecture_b = rng.randrange(lecture_count)
-        if lecture_a == lecture_b:
+        instance = state.instance
+        lecture_a = rng.randrange(len(instance.lectures))
+        course_a = instance.lectures[lecture_a].course
+        if not instance.course_swap_partners[course_a]:
             return None
-        return SwapLecturesMove(lecture_a, lecture_b)
+        # Lấy mẫu trong các lecture có phòng tương thích, lọc nhanh trước khi evaluate
+        for _ in range(8):
+            lecture_b = instance.swap_partner_lecture(course_a, rng)
+            if state.swap_is_feasible(lecture_a, lecture_b):
+                return SwapLecturesMove(lecture_a, lecture_b)
+        return None
 
 
 class KempeChainNeighborhood(Neighborhood):
@@ -2469,10 +2937,14 @@ class TeacherWorkingDaysNeighborhood(Neighborhood):
             self._start_time = time.time()
         
         # Calculate adaptive threshold
-        elapsed_time = time.time() - self._start_time
-        # Estimate total time limit (we don't have it directly, use reasonable estimate)
-        estimated_time_limit = 300.0  # 5 minutes default
-        threshold = self._get_adaptive_threshold(elapsed_time, estimated_time_limit)
+        if self.budget is not None and self.budget.deterministic:
+            # Deterministic mode: phase theo số iteration/evaluation, không theo đồng hồ
+            threshold = self._get_adaptive_threshold(self.budget.progress(), 1.0)
+        else:
+            elapsed_time = time.time() - self._start_time
+            # Estimate total time limit (we don't have it directly, use reasonable estimate)
+            estimated_time_limit = 300.0  # 5 minutes default
+            threshold = self._get_adaptive_threshold(elapsed_time, estimated_time_limit)
         
         # Step 1: Tìm teachers có penalty > 0, sort theo penalty giảm dần
         teachers_with_penalty = []
@@ -2847,6 +3319,8 @@ class NeighborhoodManager:
         self.neighborhoods = list(neighborhoods)
         self.weights = [1.0 for _ in neighborhoods]
         self.usage = [0 for _ in neighborhoods]
+        self.generated = [0 for _ in neighborhoods]  # generate_candidate() calls, including None
+        self.feasible = [0 for _ in neighborhoods]  # evaluate() != None
 
     def select(self, rng: random.Random) -> Tuple[int, Neighborhood]:
         total = sum(self.weights)
@@ -2867,37 +3341,362 @@ class NeighborhoodManager:
         else:
             self.weights[index] = max(self.weights[index] * 0.95, 0.1)
 
+    def record_candidate(self, index: int, feasible: bool) -> None:
+        self.generated[index] += 1
+        if feasible:
+            self.feasible[index] += 1
+
+    @property
+    def feasible_ratio(self) -> float:
+        generated = sum(self.generated)
+        return sum(self.feasible) / generated if generated else 0.0
+
+    def candidate_stats(self) -> Dict[str, List[int]]:
+        return {
+            nb.name: [self.generated[idx], self.feasible[idx]]
+            for idx, nb in enumerate(self.neighborhoods)
+        }
+
+    def state_dict(self) -> Dict[str, Dict[str, float]]:
+        """Operator weights/counters keyed by neighborhood name (for checkpoints)."""
+
+        return {
+            nb.name: {
+                "weight": self.weights[idx],
+                "usage": self.usage[idx],
+                "generated": self.generated[idx],
+                "feasible": self.feasible[idx],
+            }
+            for idx, nb in enumerate(self.neighborhoods)
+        }
+
+    def load_state_dict(self, data: Dict[str, Dict[str, float]]) -> None:
+        for idx, nb in enumerate(self.neighborhoods):
+            saved = data.get(nb.name)
+            if saved is None:
+                continue
+            self.weights[idx] = saved["weight"]
+            self.usage[idx] = saved["usage"]
+            self.generated[idx] = saved["generated"]
+            self.feasible[idx] = saved["feasible"]
+
+
+class TabuList:
+    """Move-signature tabu memory with expiry-ordered eviction.
+
+    Entries live in a dict (O(1) lookup) plus a min-heap keyed by expiry
+    iteration; ``expire`` pops everything whose tenure has passed, so the
+    size stays bounded by the largest tenure instead of growing with the run.
+    ``capacity`` is a hard upper bound (oldest expiry evicted first).
+    """
+
+    def __init__(self, capacity: int = 256) -> None:
+        self.capacity = capacity
+        self._expiry: Dict[Tuple, int] = {}
+        self._heap: List[Tuple[int, int, Tuple]] = []
+        self._counter = 0
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+    def is_tabu(self, key: Tuple, iteration: int) -> bool:
+        return self._expiry.get(key, 0) > iteration
+
+    def add(self, key: Tuple, expiry: int) -> None:
+        self._expiry[key] = expiry
+        self._counter += 1
+        heapq.heappush(self._heap, (expiry, self._counter, key))
+        while len(self._expiry) > self.capacity:
+            self._pop()
+
+    def expire(self, iteration: int) -> None:
+        while self._heap and self._heap[0][0] <= iteration:
+            self._pop()
+
+    def _pop(self) -> None:
+        expiry, _, key = heapq.heappop(self._heap)
+        # Chỉ xóa nếu entry chưa bị ghi đè bằng expiry mới hơn
+        if self._expiry.get(key) == expiry:
+            del self._expiry[key]
+
+    def clear(self) -> None:
+        self._expiry.clear()
+        self._heap.clear()
+
+    def state_dict(self) -> Dict[Tuple, int]:
+        return dict(self._expiry)
+
+    def load_state_dict(self, data: Dict[Tuple, int]) -> None:
+        self.clear()
+        for key, expiry in sorted(data.items(), key=lambda item: item[1]):
+            self.add(key, expiry)
+
+
+class AttributeTabuList:
+    """Attribute tabu: (lecture, period) forbidden until an iteration.
+
+    Stored as a dense ``lectures × periods`` int array, so memory is fixed
+    and lookups are O(1). Entries expire implicitly by comparison with the
+    current iteration.
+    """
+
+    def __init__(self, lecture_count: int, period_count: int) -> None:
+        self.period_count = period_count
+        self._expiry = array("l", [0]) * (lecture_count * period_count)
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+    def is_tabu(self, lecture_id: int, period: int, iteration: int) -> bool:
+        return self._expiry[lecture_id * self.period_count + period] > iteration
+
+    def add(self, lecture_id: int, period: int, expiry: int) -> None:
+        self._expiry[lecture_id * self.period_count + period] = expiry
+
+    def expire(self, iteration: int) -> None:
+        pass  # expiry so sánh trực tiếp với iteration, không cần dọn
+
+    def clear(self) -> None:
+        self._expiry = array("l", [0]) * len(self._expiry)
+
+    def state_dict(self) -> Dict[int, int]:
+        # Chỉ lưu các ô khác 0 (portable, không phụ thuộc kích thước 'l' của platform)
+        return {idx: value for idx, value in enumerate(self._expiry) if value}
+
+    def load_state_dict(self, data: Dict[int, int]) -> None:
+        self.clear()
+        for idx, value in data.items():
+            self._expiry[idx] = value
+
+
+class SearchBudget:
+    """Stopping rule for SA/TS: wall-clock, iteration count and/or evaluation count.
+
+    The search stops as soon as ANY configured limit is reached. Without a
+    time limit (count limits only) the run is deterministic: together with
+    the seed it gives bit-identical timetables on any machine, because no
+    decision depends on ``time.time()``. Every candidate attempt counts as an
+    evaluation, including a ``generate_candidate()`` that returns None.
+
+    ``should_stop`` is an optional callback polled on every check for
+    cooperative cancellation (e.g. a background job cancelled by the user);
+    it must be cheap and rate-limit any I/O itself. Once it returns True the
+    budget stays exhausted and ``cancelled`` is set.
+    """
+
+    def __init__(self, time_limit: Optional[float] = None, max_iterations: Optional[int] = None, max_evaluations: Optional[int] = None, should_stop: Optional[Callable[[], bool]] = None) -> None:
+        if time_limit is None and max_iterations is None and max_evaluations is None:
+            raise ValueError("SearchBudget needs at least one limit")
+        self.time_limit = time_limit
+        self.max_iterations = max_iterations
+        self.max_evaluations = max_evaluations
+        self.should_stop = should_stop
+        self.cancelled = False
+        self.iterations = 0
+        self.evaluations = 0
+        self.start_time = time.time()
+
+    @property
+    def deterministic(self) -> bool:
+        return self.time_limit is None
+
+    def start(self, start_time: float) -> None:
+        self.start_time = start_time
+        self.iterations = 0
+        self.evaluations = 0
+
+    def exhausted(self) -> bool:
+        if self.cancelled:
+            return True
+        if self.should_stop is not None and self.should_stop():
+            self.cancelled = True
+            return True
+        if self.max_iterations is not None and self.iterations >= self.max_iterations:
+            return True
+        if self.max_evaluations is not None and self.evaluations >= self.max_evaluations:
+            return True
+        if self.time_limit is not None and time.time() - self.start_time >= self.time_limit:
+            return True
+        return False
+
+    def progress(self) -> float:
+        """Fraction of the budget used (0..1); count-based in deterministic mode."""
+
+        fractions: List[float] = []
+        if self.max_iterations:
+            fractions.append(self.iterations / self.max_iterations)
+        if self.max_evaluations:
+            fractions.append(self.evaluations / self.max_evaluations)
+        if self.time_limit and not self.deterministic:
+            fractions.append((time.time() - self.start_time) / self.time_limit)
+        return min(1.0, max(fractions)) if fractions else 0.0
+
+    def to_dict(self) -> Dict[str, Optional[float]]:
+        return {
+            "time_limit": self.time_limit,
+            "max_iterations": self.max_iterations,
+            "max_evaluations": self.max_evaluations,
+            "iterations": self.iterations,
+            "evaluations": self.evaluations,
+            "deterministic": self.deterministic,
+            "cancelled": self.cancelled,
+        }
+
+
+class SolverCheckpoint:
+    """Periodic, atomic on-disk checkpoint of the metaheuristic phase.
+
+    Payload: best/current assignments, RNG state, search state (temperature
+    or tabu memory/tenure), operator weights and total optimisation time
+    already spent. Written to ``<path>.tmp`` then ``os.replace``d, so a
+    killed worker never leaves a truncated checkpoint behind. The content
+    hash of the instance and the run seed are stored too, so a checkpoint is
+    only resumed on the exact data and seed it was written for.
+    """
+
+    VERSION = 3
+
+    def __init__(self, path: Path, interval: float = 30.0, seed: Optional[int] = None) -> None:
+        self.path = Path(path)
+        self.interval = interval
+        self.seed = seed
+        self._last_write = 0.0
+        self._instance_hash: Optional[str] = None
+
+    def due(self, elapsed: float) -> bool:
+        return self.interval > 0 and elapsed - self._last_write >= self.interval
+
+    def save(self, search, search_state: Dict, best_assignments: Dict[int, Tuple[int, int]], best_cost: float, best_breakdown: ScoreBreakdown, elapsed: float) -> None:
+        state = search.state
+        if self._instance_hash is None:
+            self._instance_hash = checkpoint_instance_hash(state.instance)
+        payload = {
+            "version": self.VERSION,
+            "meta": search.meta,
+            "instance": state.instance.name,
+            "instance_hash": self._instance_hash,
+            "seed": self.seed,
+            "lecture_count": len(state.instance.lectures),
+            "elapsed": search.elapsed_offset + elapsed,
+            "best_assignments": dict(best_assignments),
+            "best_cost": best_cost,
+            "best_breakdown": asdict(best_breakdown),
+            "current_assignments": state.clone_assignments(),
+            "rng_state": search.rng.getstate(),
+            "manager": search.manager.state_dict(),
+            "search": search_state,
+            "budget": search.budget.to_dict() if search.budget is not None else None,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with tmp_path.open("wb") as handle:
+            pickle.dump(payload, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp_path, self.path)
+        self._last_write = elapsed
+
+    @staticmethod
+    def load(path: Path) -> Dict:
+        with Path(path).open("rb") as handle:
+            payload = pickle.load(handle)
+        if payload.get("version") != SolverCheckpoint.VERSION:
+            raise ValueError(f"Unsupported checkpoint version: {payload.get('version')}")
+        return payload
+
+
+def checkpoint_instance_hash(instance: CBCTTInstance) -> str:
+    """Content hash identifying the instance a checkpoint belongs to."""
+
+    try:
+        from .result_cache import instance_hash
+    except ImportError:
+        from result_cache import instance_hash
+    return instance_hash(instance)
+
+
+def restore_from_checkpoint(instance: CBCTTInstance, payload: Dict, rng: random.Random, seed: Optional[int] = None) -> TimetableState:
+    """Rebuild the current state from a checkpoint and restore the RNG.
+
+    Raises ``ValueError`` when the checkpoint was written for different data
+    (same lecture count is not enough: lecture ids would map to other courses)
+    or, if ``seed`` is given, by a run with another seed.
+    """
+
+    if payload["lecture_count"] != len(instance.lectures):
+        raise ValueError(
+            f"Checkpoint has {payload['lecture_count']} lectures, instance has {len(instance.lectures)}"
+        )
+    if payload["instance_hash"] != checkpoint_instance_hash(instance):
+        raise ValueError(
+            f"Checkpoint was written for instance {payload['instance']!r} with different data"
+        )
+    if seed is not None and payload["seed"] != seed:
+        raise ValueError(f"Checkpoint was written with seed {payload['seed']}, this run uses seed {seed}")
+    rng.setstate(payload["rng_state"])
+    return rebuild_state(instance, payload["current_assignments"])
+
 
 class SimulatedAnnealing:
     """Simulated annealing metaheuristic."""
 
-    def __init__(self, state: TimetableState, neighborhoods: Sequence[Neighborhood], rng: random.Random, logger: ProgressLogger) -> None:
+    meta = "SA"
+
+    def __init__(self, state: TimetableState, neighborhoods: Sequence[Neighborhood], rng: random.Random, logger: ProgressLogger, checkpoint: Optional[SolverCheckpoint] = None, resume: Optional[Dict] = None, budget: Optional[SearchBudget] = None) -> None:
         self.state = state
         self.manager = NeighborhoodManager(neighborhoods)
         self.rng = rng
         self.logger = logger
+        self.budget = budget
+        self.checkpoint = checkpoint
+        self.resume = resume
+        self.elapsed_offset = resume["elapsed"] if resume else 0.0
+        if resume:
+            self.manager.load_state_dict(resume["manager"])
 
     def run(self, best_assignments: Dict[int, Tuple[int, int]], best_breakdown: ScoreBreakdown, start_time: float, time_limit: float) -> Tuple[Dict[int, Tuple[int, int]], ScoreBreakdown]:
         state = self.state
         rng = self.rng
-        start_temp = max(1.0, state.current_cost / max(1, len(state.assignments)))
-        temperature = start_temp
+        saved = self.resume["search"] if self.resume else {}
+        start_temp = saved.get("start_temp", max(1.0, state.current_cost / max(1, len(state.assignments))))
+        temperature = saved.get("temperature", start_temp)
         alpha = 0.995
         min_temp = 0.05
-        accepted = 0
-        attempted = 0
-        best_cost = state.current_cost
-        last_improvement_iter = 0
-        iteration = 0
+        accepted = saved.get("accepted", 0)
+        attempted = saved.get("attempted", 0)
+        best_cost = self.resume["best_cost"] if self.resume else state.current_cost
+        last_improvement_iter = saved.get("last_improvement_iter", 0)
+        iteration = saved.get("iteration", 0)
         last_log = 0.0
         stagnation_limit = 2000
-        while time.time() - start_time < time_limit:
+
+        budget = self.budget or SearchBudget(time_limit=time_limit)
+        budget.start(start_time)
+
+        def snapshot() -> Dict:
+            return {
+                "start_temp": start_temp,
+                "temperature": temperature,
+                "accepted": accepted,
+                "attempted": attempted,
+                "last_improvement_iter": last_improvement_iter,
+                "iteration": iteration,
+            }
+
+        while not budget.exhausted():
             iteration += 1
+            budget.iterations += 1
             idx, operator = self.manager.select(rng)
             move = operator.generate_candidate(state, rng)
             if move is None:
+                # Failed generation: still an attempt (operators probe move_lecture internally)
+                budget.evaluations += 1
+                self.manager.record_candidate(idx, False)
+                self.manager.reward(idx, False)
                 continue
             delta = move.evaluate(state)
+            budget.evaluations += 1
+            self.manager.record_candidate(idx, delta is not None)
             if delta is None:
                 self.manager.reward(idx, False)
                 continue
@@ -2932,57 +3731,149 @@ class SimulatedAnnealing:
             if now - last_log >= 2.0:
                 accept_rate = accepted / attempted if attempted else 0.0
                 hard_ok = state.check_hard_constraints()
-                self.logger.log(now, best_cost, state.current_cost, hard_ok, accept_rate, operator.name)
+                self.logger.log(now, best_cost, state.current_cost, hard_ok, accept_rate, operator.name, self.manager.feasible_ratio,
+                                temperature=temperature, breakdown=best_breakdown, progress=budget.progress())
                 last_log = now
+            if self.checkpoint is not None and self.checkpoint.due(now):
+                self.checkpoint.save(self, snapshot(), best_assignments, best_cost, best_breakdown, now)
+        if self.checkpoint is not None:
+            self.checkpoint.save(self, snapshot(), best_assignments, best_cost, best_breakdown, time.time() - start_time)
         return best_assignments, best_breakdown
 
 
 class TabuSearch:
-    """Tabu search metaheuristic with adaptive tenure and diversification."""
+    """Tabu search metaheuristic with adaptive tenure and diversification.
 
-    def __init__(self, state: TimetableState, neighborhoods: Sequence[Neighborhood], rng: random.Random, logger: ProgressLogger) -> None:
+    ``tabu_mode``:
+        - "move": cấm lặp lại đúng move signature (TabuList)
+        - "attribute": cấm đưa lecture quay lại period vừa rời (AttributeTabuList)
+    """
+
+    MAX_TENURE = 55  # base_tenure tối đa 50 + randint(0, 5)
+    meta = "TS"
+
+    def __init__(self, state: TimetableState, neighborhoods: Sequence[Neighborhood], rng: random.Random, logger: ProgressLogger, tabu_mode: str = "move", batch_eval: bool = False, checkpoint: Optional[SolverCheckpoint] = None, resume: Optional[Dict] = None, budget: Optional[SearchBudget] = None) -> None:
+        if tabu_mode not in ("move", "attribute"):
+            raise ValueError(f"Unknown tabu mode '{tabu_mode}'")
         self.state = state
         self.manager = NeighborhoodManager(neighborhoods)
         self.rng = rng
         self.logger = logger
+        self.budget = budget
+        self.tabu_mode = tabu_mode
+        # Batch evaluator (opt-in): sàng lọc move đơn giản bằng NumPy, chỉ evaluate đầy đủ top-k.
+        # Điểm sàng lọc không gồm consecutiveness/S6/S7 nên quỹ đạo tìm kiếm khác chế độ mặc định
+        self.batch_evaluator = BatchMoveEvaluator(state) if batch_eval and np is not None else None
+        if tabu_mode == "attribute":
+            instance = state.instance
+            self.tabu = AttributeTabuList(len(instance.lectures), instance.total_periods)
+        else:
+            self.tabu = TabuList(capacity=self.MAX_TENURE * 4)
+        self.checkpoint = checkpoint
+        self.resume = resume
+        self.elapsed_offset = resume["elapsed"] if resume else 0.0
+        if resume:
+            self.manager.load_state_dict(resume["manager"])
+            saved = resume["search"]
+            if saved.get("tabu_mode") == tabu_mode:
+                self.tabu.load_state_dict(saved["tabu"])
+
+    def _is_tabu(self, move: Move, signature: Tuple, iteration: int) -> bool:
+        if self.tabu_mode == "attribute":
+            return any(
+                self.tabu.is_tabu(lecture, period, iteration)
+                for lecture, period in move.attributes(self.state)
+            )
+        return self.tabu.is_tabu(signature, iteration)
+
+    def _make_tabu(self, move: Move, signature: Tuple, origins: List[Tuple[int, int]], expiry: int) -> None:
+        if self.tabu_mode == "attribute":
+            # Cấm lecture quay lại period cũ trong tenure
+            for lecture, period in origins:
+                self.tabu.add(lecture, period, expiry)
+        else:
+            self.tabu.add(signature, expiry)
 
     def run(self, best_assignments: Dict[int, Tuple[int, int]], best_breakdown: ScoreBreakdown, start_time: float, time_limit: float) -> Tuple[Dict[int, Tuple[int, int]], ScoreBreakdown]:
         state = self.state
         rng = self.rng
-        iteration = 0
-        tabu: Dict[Tuple, int] = {}
-        base_tenure = 25  # Tăng từ 15 → 25: tabu list lâu hơn để tránh lặp lại
-        best_cost = state.current_cost
+        saved = self.resume["search"] if self.resume else {}
+        iteration = saved.get("iteration", 0)
+        tabu = self.tabu
+        base_tenure = saved.get("base_tenure", 25)  # Tăng từ 15 → 25: tabu list lâu hơn để tránh lặp lại
+        best_cost = self.resume["best_cost"] if self.resume else state.current_cost
         last_log = 0.0
         non_tabu_count = 0  # Track non-tabu moves selected
         tabu_count = 0  # Track tabu moves rejected
-        no_improve = 0
+        no_improve = saved.get("no_improve", 0)
         sample_size = 80  # TĂNG từ 20 → 80: khám phá tốt hơn, find better neighbors
-        diversify_counter = 0  # Counter để trigger diversification
-        while time.time() - start_time < time_limit:
+        batch = self.batch_evaluator
+        # Với batch evaluator: lấy mẫu rộng gấp đôi, move đơn giản chỉ evaluate top batch_keep
+        wide_sample_size = sample_size * 2 if batch is not None else sample_size
+        batch_keep = sample_size // 2
+        diversify_counter = saved.get("diversify_counter", 0)  # Counter để trigger diversification
+
+        budget = self.budget or SearchBudget(time_limit=time_limit)
+        budget.start(start_time)
+
+        def snapshot() -> Dict:
+            return {
+                "iteration": iteration,
+                "base_tenure": base_tenure,
+                "no_improve": no_improve,
+                "diversify_counter": diversify_counter,
+                "tabu_mode": self.tabu_mode,
+                "tabu": tabu.state_dict(),
+            }
+
+        while not budget.exhausted():
             iteration += 1
+            budget.iterations += 1
+            tabu.expire(iteration)
             candidates: List[Tuple[int, bool, int, Move, Tuple]] = []
+            simple_moves: List[Tuple[int, Move]] = []
             
             # Collect more candidates with retry logic
             generation_attempts = 0
-            while len(candidates) < sample_size and generation_attempts < sample_size * 3:
+            while len(candidates) + len(simple_moves) < wide_sample_size and generation_attempts < wide_sample_size * 3:
                 generation_attempts += 1
                 idx, operator = self.manager.select(rng)
                 move = operator.generate_candidate(state, rng)
                 if move is None:
+                    budget.evaluations += 1
+                    self.manager.record_candidate(idx, False)
+                    continue
+                if batch is not None and batch.supports(move):
+                    simple_moves.append((idx, move))
                     continue
                 delta = move.evaluate(state)
+                budget.evaluations += 1
+                self.manager.record_candidate(idx, delta is not None)
                 if delta is None:
                     continue
                 signature = move.signature()
-                is_tabu = tabu.get(signature, 0) > iteration
+                is_tabu = self._is_tabu(move, signature, iteration)
                 candidates.append((delta, is_tabu, idx, move, signature))
             
+            if simple_moves:
+                # Sàng lọc bằng NumPy, rồi evaluate chính xác (scalar) các move tốt nhất
+                scores = batch.score([move for _, move in simple_moves])
+                for pos in np.argsort(scores, kind="stable")[:batch_keep].tolist():
+                    idx, move = simple_moves[pos]
+                    delta = move.evaluate(state)
+                    budget.evaluations += 1
+                    self.manager.record_candidate(idx, delta is not None)
+                    if delta is None:
+                        continue
+                    signature = move.signature()
+                    is_tabu = self._is_tabu(move, signature, iteration)
+                    candidates.append((delta, is_tabu, idx, move, signature))
+            
             if not candidates:
                 continue
             
-            # Sort: non-tabu first, then by delta
-            candidates.sort(key=lambda item: (item[1], item[0]))
+            # Sort theo delta; vòng chọn bên dưới bỏ qua move tabu trừ khi đạt aspiration
+            candidates.sort(key=lambda item: item[0])
             
             # Count tabu vs non-tabu for statistics
             for delta, is_tabu, idx, move, signature in candidates:
@@ -3001,13 +3892,20 @@ class TabuSearch:
                 chosen = candidates[0]
             
             delta, is_tabu, idx, move, signature = chosen
+            origins = []
+            if self.tabu_mode == "attribute":
+                origins = [
+                    (lecture, state.assignments[lecture][0])
+                    for lecture, _ in move.attributes(state)
+                    if lecture in state.assignments
+                ]
             delta_apply = move.apply(state)
             if delta_apply is None:
                 continue
             
             # Update tabu with probabilistic tenure
             tenure_length = base_tenure + rng.randint(0, 5)
-            tabu[signature] = iteration + tenure_length
+            self._make_tabu(move, signature, origins, iteration + tenure_length)
             
             improvement = False
             if state.current_cost < best_cost:
@@ -3042,18 +3940,38 @@ class TabuSearch:
                 total_candidates = non_tabu_count + tabu_count
                 accept_rate = non_tabu_count / total_candidates if total_candidates > 0 else 1.0
                 hard_ok = state.check_hard_constraints()
-                self.logger.log(now, best_cost, state.current_cost, hard_ok, accept_rate, move.name)
+                self.logger.log(now, best_cost, state.current_cost, hard_ok, accept_rate, move.name, self.manager.feasible_ratio,
+                                tenure=base_tenure, breakdown=best_breakdown, progress=budget.progress())
                 last_log = now
                 # Reset counters for next logging interval
                 non_tabu_count = 0
                 tabu_count = 0
+            if self.checkpoint is not None and self.checkpoint.due(now):
+                self.checkpoint.save(self, snapshot(), best_assignments, best_cost, best_breakdown, now)
         
+        if self.checkpoint is not None:
+            self.checkpoint.save(self, snapshot(), best_assignments, best_cost, best_breakdown, time.time() - start_time)
         return best_assignments, best_breakdown
 
 
-def run_metaheuristic(state: TimetableState, meta: str, rng: random.Random, logger: ProgressLogger, remaining_time: float) -> Tuple[Dict[int, Tuple[int, int]], ScoreBreakdown]:
-    best_assignments = state.clone_assignments()
-    best_breakdown = state.score_breakdown()
+def run_metaheuristic(state: TimetableState, meta: str, rng: random.Random, logger: ProgressLogger, remaining_time: float, tabu_mode: str = "move", batch_eval: bool = False, checkpoint: Optional[SolverCheckpoint] = None, resume: Optional[Dict] = None, budget: Optional[SearchBudget] = None) -> Tuple[Dict[int, Tuple[int, int]], ScoreBreakdown]:
+    """Run SA/TS on ``state``.
+
+    ``budget`` replaces/combines the wall-clock ``remaining_time`` with
+    iteration/evaluation limits (see ``SearchBudget``); when omitted the
+    search stops on ``remaining_time`` only.
+
+    ``checkpoint`` enables periodic checkpoint writes; ``resume`` is a payload
+    from ``SolverCheckpoint.load`` (state/RNG already restored via
+    ``restore_from_checkpoint``) and continues the best solution, operator
+    weights and search state from it.
+    """
+    if resume:
+        best_assignments = dict(resume["best_assignments"])
+        best_breakdown = ScoreBreakdown(**resume["best_breakdown"])
+    else:
+        best_assignments = state.clone_assignments()
+        best_breakdown = state.score_breakdown()
     
     neighborhoods: List[Neighborhood] = [
         TeacherWorkingDaysNeighborhood(),  # Priority 1: Teacher working days (weight 2.5) - S7
@@ -3069,13 +3987,18 @@ def run_metaheuristic(state: TimetableState, meta: str, rng: random.Random, logg
         SwapForPairingNeighborhood(),
     ]
     start_time = time.time()
-    if remaining_time <= 0.0:
+    if budget is None:
+        budget = SearchBudget(time_limit=remaining_time)
+    if budget.time_limit is not None and budget.time_limit <= 0.0:
         return best_assignments, best_breakdown
+    for neighborhood in neighborhoods:
+        neighborhood.budget = budget
     if meta.upper() == "TS":
-        search = TabuSearch(state, neighborhoods, rng, logger)
+        search = TabuSearch(state, neighborhoods, rng, logger, tabu_mode=tabu_mode, batch_eval=batch_eval, checkpoint=checkpoint, resume=resume, budget=budget)
     else:
-        search = SimulatedAnnealing(state, neighborhoods, rng, logger)
+        search = SimulatedAnnealing(state, neighborhoods, rng, logger, checkpoint=checkpoint, resume=resume, budget=budget)
     best_assignments, best_breakdown = search.run(best_assignments, best_breakdown, start_time, remaining_time)
+    logger.log_candidate_stats(search.manager.candidate_stats())
     return best_assignments, best_breakdown
 
 
@@ -3108,15 +4031,74 @@ def write_solution(instance: CBCTTInstance, assignments: Dict[int, Tuple[int, in
                 handle.write(f"{course.id} {room} {day} {slot}\n")
 
 
+def write_instance(instance: CBCTTInstance, path: Path) -> None:
+    """Ghi instance ra file .ctt (định dạng ``parse_instance`` đọc được).
+
+    Nguyện vọng được ghi theo GV (``teacher day period``) như file export từ DB.
+    """
+
+    preference_rows = [
+        (teacher, *instance.period_to_slot(period))
+        for teacher in instance.teachers
+        for period in sorted(instance.teacher_preferred_periods.get(teacher, ()))
+    ]
+    unavailability_rows = [
+        (course.id, *instance.period_to_slot(period))
+        for course in instance.courses
+        for period in sorted(instance.unavailability[course.index])
+    ]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as handle:
+        handle.write(f"Name: {instance.name}\n")
+        handle.write(f"Courses: {len(instance.courses)}\n")
+        handle.write(f"Rooms: {len(instance.rooms)}\n")
+        handle.write(f"Days: {instance.days}\n")
+        handle.write(f"Periods_per_day: {instance.periods_per_day}\n")
+        handle.write(f"Curricula: {len(instance.curriculums)}\n")
+        handle.write(f"Constraints: {len(unavailability_rows)}\n")
+        handle.write(f"Preferences: {len(preference_rows)}\n\n")
+
+        handle.write("COURSES:\n")
+        for course in instance.courses:
+            line = f"{course.id} {course.teacher} {course.lectures} {course.min_working_days} {course.students} {course.course_type}"
+            handle.write(f"{line} {course.equipment}\n" if course.equipment else f"{line}\n")
+        handle.write("\nROOMS:\n")
+        for room in instance.rooms:
+            line = f"{room.id} {room.capacity} {room.room_type}"
+            handle.write(f"{line} {room.equipment}\n" if room.equipment else f"{line}\n")
+        handle.write("\nCURRICULA:\n")
+        for curriculum in instance.curriculums:
+            members = " ".join(instance.courses[c].id for c in curriculum.courses)
+            handle.write(f"{curriculum.name} {len(curriculum.courses)} {members}\n")
+        handle.write("\nUNAVAILABILITY_CONSTRAINTS:\n")
+        for course_id, day, slot in unavailability_rows:
+            handle.write(f"{course_id} {day} {slot}\n")
+        handle.write("\nPREFERENCES:\n")
+        for teacher, day, slot in preference_rows:
+            handle.write(f"{teacher} {day} {slot}\n")
+        handle.write("\nEND.\n")
+
+
 def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Curriculum-Based Course Timetabling solver (ITC-2007 Track 3)")
     parser.add_argument("--instance", type=str, default=None, help="Path to .ctt instance file")
     parser.add_argument("--out", type=str, default="solution.sol", help="Output .sol path")
     parser.add_argument("--seed", type=int, default=42, help="Random seed")
-    parser.add_argument("--time_limit", type=float, default=180.0, help="Time limit in seconds")
+    parser.add_argument("--time_limit", type=float, default=None, help="Time limit in seconds (mặc định 180; bỏ qua cho tìm kiếm nếu chỉ dùng max_iterations/max_evaluations)")
+    parser.add_argument("--max_iterations", type=int, default=None, help="Giới hạn số iteration của SA/TS (deterministic)")
+    parser.add_argument("--max_evaluations", type=int, default=None, help="Giới hạn số lần evaluate move (deterministic)")
     parser.add_argument("--meta", type=str, default="SA", choices=["SA", "TS"], help="Metaheuristic (SA or TS)")
+    parser.add_argument("--tabu_mode", type=str, default="move", choices=["move", "attribute"], help="Tabu memory: move signature hoặc (lecture, period) attribute")
+    parser.add_argument("--checkpoint", type=str, default=None, help="Ghi checkpoint định kỳ vào file này")
+    parser.add_argument("--checkpoint_interval", type=float, default=30.0, help="Chu kỳ ghi checkpoint (giây)")
+    parser.add_argument("--resume", type=str, default=None, help="Tiếp tục tối ưu từ checkpoint")
+    parser.add_argument("--no_jit", action="store_true", help="Không dùng Numba JIT penalty kernels (mặc định bật khi có Numba)")
+    parser.add_argument("--decompose", action="store_true", help="Tách instance thành các thành phần độc lập và giải song song")
+    parser.add_argument("--workers", type=int, default=None, help="Số process tối đa khi --decompose (mặc định: số CPU)")
+    parser.add_argument("--batch_eval", action="store_true", help="Lọc move đơn giản bằng NumPy batch evaluator trong Tabu Search (thử nghiệm)")
     parser.add_argument("--init", type=str, default="greedy-cprop", choices=["greedy-cprop", "random-repair"], help="Initial constructor strategy")
     parser.add_argument("--log", type=str, default=None, help="CSV progress log path")
+    parser.add_argument("--no_compiled", action="store_true", help="Luôn parse lại file .ctt, không dùng/ghi bản compiled (thư mục $SOLVER_INSTANCE_CACHE_DIR)")
     parser.add_argument("--dry_run_parse", action="store_true", help="Only parse the instance and print counts")
     parser.add_argument("--enforce_room_per_course", action="store_true", help="Ưu tiên xếp mỗi course vào đúng 1 phòng (phòng = tên lớp)")
     return parser.parse_args(argv)
@@ -3124,8 +4106,14 @@ def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
 
 def main(argv: Optional[Sequence[str]] = None) -> None:
     args = parse_args(argv)
+    if args.no_jit:
+        penalty_kernels.set_jit_enabled(False)
     rng = random.Random(args.seed)
-    instance = parse_instance(args.instance, enforce_room_per_course=args.enforce_room_per_course)
+    instance = load_instance(
+        args.instance,
+        enforce_room_per_course=args.enforce_room_per_course,
+        use_compiled=not args.no_compiled,
+    )
     if args.dry_run_parse:
         print(f"Tên instance: {instance.name}")
         print(f"Số khóa học: {len(instance.courses)}")
@@ -3134,16 +4122,29 @@ def main(argv: Optional[Sequence[str]] = None) -> None:
         print(f"Số ngày: {instance.days}; tiết/ngày: {instance.periods_per_day}")
         print(f"Tổng số tiết: {instance.total_periods}")
         return
-    start_time = time.time()
-    try:
-        state = build_initial_solution(instance, rng, args.init, start_time, args.time_limit)
-    except RuntimeError:
-        state = build_initial_solution(instance, rng, "random-repair", start_time, args.time_limit)
-    elapsed = time.time() - start_time
-    remaining_time = max(0.0, args.time_limit - elapsed)
-    log_path = Path(args.log) if args.log else None
-    with ProgressLogger(log_path) as logger:
-        best_assignments, best_breakdown = run_metaheuristic(state, args.meta, rng, logger, remaining_time)
+    # Count budget (max_iterations/max_evaluations) without --time_limit → tìm kiếm deterministic
+    count_budget = args.max_iterations is not None or args.max_evaluations is not None
+    time_limit = args.time_limit if args.time_limit is not None else 180.0
+    if args.decompose and not args.resume:
+        try:
+            from .decomposition import solve_decomposed
+        except ImportError:
+            from decomposition import solve_decomposed
+        best_assignments, component_stats = solve_decomposed(
+            instance, meta=args.meta, seed=args.seed, init_method=args.init,
+            time_limit=args.time_limit if (args.time_limit is not None or not count_budget) else None,
+            max_workers=args.workers, tabu_mode=args.tabu_mode, batch_eval=args.batch_eval,
+            max_iterations=args.max_iterations, max_evaluations=args.max_evaluations,
+        )
+        print("--- Components ---")
+        for entry in component_stats:
+            print(
+                f"#{entry['index']}: courses={entry['courses']} lectures={entry['lectures']} rooms={entry['rooms']} "
+                f"teachers={entry['teachers']} cost {entry['initial_cost']} -> {entry['final_cost']} in {entry['elapsed']:.1f}s"
+            )
+        budget_info = [entry["budget"] for entry in component_stats]
+    else:
+        best_assignments, budget_info = _solve_single(instance, args, rng, time_limit, count_budget)
     final_state = rebuild_state(instance, best_assignments)
     if not final_state.check_hard_constraints():
         raise RuntimeError("Final timetable violates hard constraints")
@@ -3160,6 +4161,42 @@ def main(argv: Optional[Sequence[str]] = None) -> None:
     print(f"Teacher working days (S7): {breakdown.teacher_working_days}")
     print(f"Teacher preferences (S8): {breakdown.teacher_preference_violations}")
     print(f"Total cost: {breakdown.total}")
+    print(f"Budget: {budget_info}")
+
+
+def _solve_single(instance: CBCTTInstance, args: argparse.Namespace, rng: random.Random, time_limit: float, count_budget: bool) -> Tuple[Dict[int, Tuple[int, int]], Dict]:
+    """CLI path: build (or resume) a single state and run SA/TS on it."""
+
+    start_time = time.time()
+    resume = None
+    if args.resume:
+        # Tiếp tục từ checkpoint: bỏ qua bước xây lời giải ban đầu, cả time_limit dành cho tối ưu
+        resume = SolverCheckpoint.load(Path(args.resume))
+        state = restore_from_checkpoint(instance, resume, rng, seed=args.seed)
+        print(f"Resumed from {args.resume}: best={resume['best_cost']} elapsed={resume['elapsed']:.1f}s")
+    else:
+        deterministic = args.time_limit is None and count_budget
+        try:
+            state = build_initial_solution(instance, rng, args.init, start_time, time_limit, deterministic)
+        except RuntimeError:
+            state = build_initial_solution(instance, rng, "random-repair", start_time, time_limit, deterministic)
+    elapsed = time.time() - start_time
+    remaining_time = max(0.0, time_limit - elapsed)
+    budget = SearchBudget(
+        time_limit=remaining_time if (args.time_limit is not None or not count_budget) else None,
+        max_iterations=args.max_iterations,
+        max_evaluations=args.max_evaluations,
+    )
+    checkpoint_path = args.checkpoint or args.resume
+    checkpoint = SolverCheckpoint(Path(checkpoint_path), args.checkpoint_interval, seed=args.seed) if checkpoint_path else None
+    log_path = Path(args.log) if args.log else None
+    with ProgressLogger(log_path) as logger:
+        best_assignments, best_breakdown = run_metaheuristic(
+            state, args.meta, rng, logger, remaining_time,
+            tabu_mode=args.tabu_mode, batch_eval=args.batch_eval,
+            checkpoint=checkpoint, resume=resume, budget=budget,
+        )
+    return best_assignments, budget.to_dict()
 
 
 if __name__ == "__main__":
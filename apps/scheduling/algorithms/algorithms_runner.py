@@ -2,25 +2,41 @@
 Service để chạy thuật toán scheduling algorithm từ Django
 """
 
+import copy
 import logging
+import os
 import time
 import random
 from pathlib import Path
-from typing import Dict, Tuple, Optional
+from typing import Callable, Dict, List, Tuple, Optional
 from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connections
 
 from ..algorithms.algorithms_core import (
-    parse_instance,
+    write_instance,
     build_initial_solution,
     run_metaheuristic,
+    rebuild_state,
+    restore_from_checkpoint,
     write_solution,
+    SolverCheckpoint,
+    SearchBudget,
     CBCTTInstance,
     TimetableState,
     ScoreBreakdown,
     ProgressLogger
 )
-from ..algorithms.algorithms_data_adapter import export_to_ctt
-from ..models import DotXep, PhanCong, ThoiKhoaBieu, TimeSlot
+from ..algorithms.algorithms_data_adapter import build_instance_from_db, timeslot_by_cell, timeslot_cell
+from ..algorithms.decomposition import build_task, run_tasks, solve_decomposed
+from ..algorithms.multi_dot import (
+    Occupancy, blocked_cells_for, merge_occupancy, occupied_cells, repair_room_conflicts, union_weeks
+)
+from ..algorithms.result_cache import ResultCache, instance_hash, solve_cache_key
+from ..algorithms.solve_time_model import SolveTimeModel, downsample_curve, instance_features
+from ..algorithms.weight_loader import WeightLoader
+from ..models import DotXep, LopMonHoc, PhanCong, SolverRun, ThoiKhoaBieu
+from ..utils.weeks import week_mask
 
 logger = logging.getLogger(__name__)
 
@@ -41,29 +57,86 @@ class AlgorithmRunner:
         self.dot_xep = None
         self.instance = None
         self.ctt_file_path = None
+        self.prepare_time = None
+        self.solver_run = None  # SolverRun của lần chạy gần nhất (lưu lịch sử)
+        
+    @property
+    def checkpoint_path(self) -> Path:
+        """File checkpoint của đợt (settings.SOLVER_CHECKPOINT_DIR) - dùng để resume sau khi worker restart"""
+        checkpoint_dir = getattr(settings, 'SOLVER_CHECKPOINT_DIR',
+                                 Path(settings.BASE_DIR) / 'output' / 'test_web_algo' / 'checkpoints')
+        return Path(checkpoint_dir) / f'checkpoint_{self.ma_dot}.pkl'
         
+    @property
+    def result_cache(self) -> ResultCache:
+        """Cache kết quả solver trên đĩa (cấu hình qua settings.SOLVER_RESULT_CACHE_*)"""
+        return ResultCache(
+            Path(getattr(settings, 'SOLVER_RESULT_CACHE_DIR',
+                         Path(settings.BASE_DIR) / 'output' / 'test_web_algo' / 'result_cache')),
+            max_entries=getattr(settings, 'SOLVER_RESULT_CACHE_MAX_ENTRIES', 200),
+            max_bytes=getattr(settings, 'SOLVER_RESULT_CACHE_MAX_MB', 200) * 1024 * 1024,
+            max_age=getattr(settings, 'SOLVER_RESULT_CACHE_MAX_AGE_DAYS', 30) * 86400.0,
+        )
+    
+    @staticmethod
+    def _history_runs():
+        return SolverRun.objects.filter(
+            status='SUCCESS', decompose=False, cost_curve__isnull=False, features__isnull=False
+        )
+    
+    @classmethod
+    def run_history(cls, max_runs: int = 2000) -> List[Dict]:
+        """Lịch sử các lần chạy (đặc trưng + đường cost) cho model dự đoán thời gian giải"""
+        rows = cls._history_runs().order_by('-created_at').values(
+            'algorithm', 'features', 'initial_cost', 'final_cost', 'phase_timings', 'cost_curve'
+        )[:max_runs]
+        return [
+            {
+                'strategy': row['algorithm'],
+                'features': row['features'],
+                'initial_cost': row['initial_cost'],
+                'final_cost': row['final_cost'],
+                'init_time': (row['phase_timings'] or {}).get('init', 0.0),
+                'curve': row['cost_curve'],
+            }
+            for row in rows
+        ]
+    
+    @classmethod
+    def solve_time_model(cls) -> SolveTimeModel:
+        """SolveTimeModel đã fit trên run_history(), cache (CACHES['default']) theo id
+        SolverRun mới nhất trong lịch sử - có lần chạy mới thì fit lại"""
+        latest = cls._history_runs().order_by('-id').values_list('id', flat=True).first()
+        cache = caches['default']
+        key = f'solve_time_model:{latest}'
+        model = cache.get(key)
+        if model is None:
+            model = SolveTimeModel().fit(cls.run_history())
+            cache.set(key, model, None)
+        return model
+    
     def prepare_data(self) -> bool:
         """
-        Chuẩn bị dữ liệu: export DB sang .ctt file
+        Chuẩn bị dữ liệu: dựng instance trực tiếp từ DB
+        (ghi thêm file .ctt để debug nếu settings.SOLVER_EXPORT_CTT)
         
         Returns:
             True nếu thành công, False nếu thất bại
         """
+        start_time = time.time()
         try:
             # Lấy đợt xếp
             self.dot_xep = DotXep.objects.get(ma_dot=self.ma_dot)
             logger.info(f"Found DotXep: {self.dot_xep.ma_dot} - {self.dot_xep.ten_dot}")
             
-            # Export sang .ctt file vào thư mục output/
-            output_dir = Path(settings.BASE_DIR) / 'output' / 'test_web_algo' / 'ctt_files'
-            output_dir.mkdir(parents=True, exist_ok=True)
+            self.instance = build_instance_from_db(self.dot_xep)
             
-            self.ctt_file_path = str(export_to_ctt(
-                dot_xep=self.dot_xep,
-                output_dir=str(output_dir)
-            ))
-            
-            logger.info(f"Exported to CTT file: {self.ctt_file_path}")
+            if getattr(settings, 'SOLVER_EXPORT_CTT', False):
+                ctt_file = Path(settings.BASE_DIR) / 'output' / 'test_web_algo' / 'ctt_files' / f'{self.ma_dot}.ctt'
+                write_instance(self.instance, ctt_file)
+                self.ctt_file_path = str(ctt_file)
+                logger.info(f"Exported to CTT file: {self.ctt_file_path}")
+            self.prepare_time = time.time() - start_time
             return True
             
         except DotXep.DoesNotExist:
@@ -77,7 +150,19 @@ class AlgorithmRunner:
         self,
         strategy: str = "TS",
         init_method: str = "greedy-cprop",
-        time_limit: float = 180.0
+        time_limit: Optional[float] = 180.0,
+        tabu_mode: str = "move",
+        batch_eval: bool = False,
+        resume_path: Optional[str] = None,
+        checkpoint_interval: Optional[float] = None,
+        max_iterations: Optional[int] = None,
+        max_evaluations: Optional[int] = None,
+        decompose: bool = False,
+        max_workers: Optional[int] = None,
+        use_cache: bool = True,
+        force: bool = False,
+        should_stop: Optional[Callable[[], bool]] = None,
+        on_progress: Optional[Callable[[Dict], None]] = None
     ) -> Optional[Dict]:
         """
         Chạy thuật toán optimization
@@ -85,37 +170,100 @@ class AlgorithmRunner:
         Args:
             strategy: "TS" (Tabu Search) hoặc "SA" (Simulated Annealing)
             init_method: "greedy-cprop" hoặc "random-repair"
-            time_limit: Thời gian tối đa (giây)
+            time_limit: Thời gian tối đa (giây). None + max_iterations/max_evaluations
+                → tìm kiếm deterministic (cùng seed cho kết quả giống hệt trên mọi máy)
+            tabu_mode: "move" (signature) hoặc "attribute" (lecture, period) - chỉ dùng cho TS
+            batch_eval: Sàng lọc move đơn giản bằng NumPy batch evaluator (TS, thử nghiệm)
+            resume_path: Checkpoint để tiếp tục (bỏ qua bước xây lời giải ban đầu).
+                Mỗi lần gọi là 1 "slice" tối ưu dài time_limit giây.
+            checkpoint_interval: Chu kỳ ghi checkpoint (giây) vào checkpoint_path, <= 0 để tắt.
+                Mặc định settings.SOLVER_CHECKPOINT_INTERVAL (0 = tắt)
+            max_iterations: Giới hạn số iteration của SA/TS (optional)
+            max_evaluations: Giới hạn số lần evaluate move (optional)
+            decompose: Tách thành các thành phần độc lập (không chung GV/curriculum/phòng)
+                và giải song song (bỏ qua khi resume)
+            max_workers: Số process tối đa khi decompose (mặc định: số CPU)
+            use_cache: Trả kết quả đã lưu nếu cùng instance + weights + thuật toán + seed + budget
+            force: Bỏ qua kết quả đã lưu, chạy lại và ghi đè cache
+            should_stop: Callback huỷ hợp tác (job bị huỷ) - SA/TS dừng ở lần kiểm tra
+                budget kế tiếp và trả lời giải tốt nhất hiện có (result['cancelled'] = True).
+                Khi decompose, process này gọi callback và báo dừng cho các worker
+            on_progress: Callback nhận tiến trình: {'phase': 'init'|'search', ...} và mỗi
+                điểm log của SA/TS (best/current cost, temperature/tenure, breakdown...)
             
         Returns:
             Dictionary chứa kết quả, hoặc None nếu thất bại
         """
-        if not self.ctt_file_path:
-            logger.error("CTT file not prepared. Call prepare_data() first.")
+        if self.instance is None:
+            logger.error("Instance not prepared. Call prepare_data() first.")
             return None
         
         try:
-            # Parse instance
-            logger.info(f"Parsing CTT instance: {self.ctt_file_path}")
-            self.instance = parse_instance(self.ctt_file_path, enforce_room_per_course=True)
-            
             logger.info(f"Instance loaded: {len(self.instance.courses)} courses, "
                        f"{len(self.instance.rooms)} rooms, "
                        f"{self.instance.days} days × {self.instance.periods_per_day} periods")
             
+            # Trọng số dùng cho cả cache key và solver
+            weights = WeightLoader.load_weights(None)
+            self.instance.weights = weights
+            
+            cache_key = None
+            if use_cache and not resume_path:
+                cache_key = solve_cache_key(
+                    self.instance, weights, strategy, self.seed,
+                    {'time_limit': time_limit, 'max_iterations': max_iterations, 'max_evaluations': max_evaluations},
+                    init_method=init_method, tabu_mode=tabu_mode, batch_eval=batch_eval, decompose=decompose
+                )
+                cached = None if force else self.result_cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"Cache hit {cache_key[:12]} - dùng lại kết quả đã lưu")
+                    result = self._from_cache(cached, cache_key)
+                    self._record_run('CACHED', strategy, init_method, time_limit, decompose, result)
+                    return result
+            
+            if should_stop is not None and should_stop():
+                self._record_run('CANCELLED', strategy, init_method, time_limit, decompose, error='Đã huỷ trước khi chạy')
+                return {'success': False, 'cancelled': True, 'error': 'Đã huỷ trước khi chạy'}
+            
+            if decompose and not resume_path:
+                result = self._run_decomposed(
+                    strategy, init_method, time_limit, tabu_mode, batch_eval,
+                    max_iterations, max_evaluations, max_workers, should_stop
+                )
+                if result['cancelled']:
+                    self._record_run('CANCELLED', strategy, init_method, time_limit, decompose, result)
+                else:
+                    self._store_result(cache_key, result)
+                    self._record_run('SUCCESS', strategy, init_method, time_limit, decompose, result)
+                return result
+            
             # Initialize
+            count_budget = max_iterations is not None or max_evaluations is not None
+            if time_limit is None and not count_budget:
+                time_limit = 180.0
+            init_time_limit = time_limit if time_limit is not None else 180.0
             rng = random.Random(self.seed)
             start_time = time.time()
             
-            # Build initial solution
-            logger.info(f"Building initial solution with {init_method}...")
-            state = build_initial_solution(
-                self.instance,
-                rng,
-                init_method,
-                start_time,
-                time_limit
-            )
+            resume = None
+            if resume_path:
+                # Resume: khôi phục state + RNG từ checkpoint
+                logger.info(f"Resuming from checkpoint: {resume_path}")
+                resume = SolverCheckpoint.load(Path(resume_path))
+                state = restore_from_checkpoint(self.instance, resume, rng, seed=self.seed)
+            else:
+                # Build initial solution
+                logger.info(f"Building initial solution with {init_method}...")
+                if on_progress is not None:
+                    on_progress({'phase': 'init'})
+                state = build_initial_solution(
+                    self.instance,
+                    rng,
+                    init_method,
+                    start_time,
+                    init_time_limit,
+                    deterministic=time_limit is None
+                )
             
             initial_cost = state.current_cost
             initial_breakdown = state.score_breakdown()
@@ -127,33 +275,62 @@ class AlgorithmRunner:
             logger.info(f"  - Lecture Consecutiveness: {initial_breakdown.lecture_consecutiveness}")
             
             # Run metaheuristic - enable optimization phase for Teacher Lecture Consolidation
-            remaining_time = time_limit - elapsed_init
-            if remaining_time > 0:
-                logger.info(f"Running {strategy} optimization for {remaining_time:.2f}s...")
+            remaining_time = init_time_limit - elapsed_init
+            budget = SearchBudget(
+                time_limit=remaining_time if time_limit is not None else None,
+                max_iterations=max_iterations,
+                max_evaluations=max_evaluations,
+                should_stop=should_stop,
+            )
+            if budget.time_limit is None or budget.time_limit > 0:
+                logger.info(f"Running {strategy} optimization with budget {budget.to_dict()}...")
                 
                 # Enable optimization phase: activate Teacher Lecture Consolidation penalty
                 state._optimization_phase = True
                 
                 log_file = Path(settings.BASE_DIR) / 'output' / 'test_web_algo' / f'progress_{self.ma_dot}.csv'
-                progress_logger = ProgressLogger(log_file)
+                listener = None
+                if on_progress is not None:
+                    on_progress({'phase': 'search', 'initial_cost': initial_cost, 'init_time': round(elapsed_init, 3)})
+                    listener = lambda point: on_progress({'phase': 'search', **point})
+                progress_logger = ProgressLogger(log_file, listener=listener)
+                if checkpoint_interval is None:
+                    checkpoint_interval = getattr(settings, 'SOLVER_CHECKPOINT_INTERVAL', 0)
+                checkpoint = (
+                    SolverCheckpoint(self.checkpoint_path, checkpoint_interval, seed=self.seed)
+                    if checkpoint_interval > 0 else None
+                )
                 
                 best_assignments, best_breakdown = run_metaheuristic(
                     state,
                     strategy,
                     rng,
                     progress_logger,
-                    remaining_time
+                    remaining_time,
+                    tabu_mode=tabu_mode,
+                    batch_eval=batch_eval,
+                    checkpoint=checkpoint,
+                    resume=resume,
+                    budget=budget
                 )
                 
+                progress_logger.close()
+                feasible_ratio = progress_logger.feasible_ratio
+                cost_curve = progress_logger.curve
+                
                 final_cost = best_breakdown.total
                 logger.info(f"Optimization completed. Final cost: {final_cost}")
+                logger.info(f"  - Feasible candidate ratio: {feasible_ratio * 100:.1f}%")
                 logger.info(f"  - Teacher Preferences: {best_breakdown.teacher_preference_violations}")
                 logger.info(f"  - Curriculum Compactness: {best_breakdown.curriculum_compactness}")
                 logger.info(f"  - Lecture Consecutiveness: {best_breakdown.lecture_consecutiveness}")
             else:
-                best_assignments = state.clone_assignments()
-                best_breakdown = initial_breakdown
-                final_cost = initial_cost
+                checkpoint = None
+                best_assignments = dict(resume['best_assignments']) if resume else state.clone_assignments()
+                best_breakdown = rebuild_state(self.instance, best_assignments).score_breakdown() if resume else initial_breakdown
+                final_cost = best_breakdown.total
+                feasible_ratio = None
+                cost_curve = []
             
             # Save solution to .sol file
             sol_dir = Path(settings.BASE_DIR) / 'output' / 'test_web_algo'
@@ -162,36 +339,228 @@ class AlgorithmRunner:
             write_solution(self.instance, best_assignments, sol_file)
             logger.info(f"Solution saved to: {sol_file}")
             
+            # Đường best cost theo thời gian tìm kiếm (tính từ sau khi dựng lời giải ban đầu)
+            time_elapsed = time.time() - start_time
+            cost_curve = downsample_curve(
+                [(0.0, initial_cost), *cost_curve, (max(0.0, time_elapsed - elapsed_init), final_cost)]
+            )
+            
             # Return results
-            return {
+            result = {
                 'success': True,
                 'ma_dot': self.ma_dot,
                 'initial_cost': initial_cost,
                 'final_cost': final_cost,
                 'improvement': initial_cost - final_cost,
                 'improvement_percent': (initial_cost - final_cost) / initial_cost * 100 if initial_cost > 0 else 0,
-                'time_elapsed': time.time() - start_time,
-                'breakdown': {
-                    'room_capacity': best_breakdown.room_capacity,
-                    'min_working_days': best_breakdown.min_working_days,
-                    'curriculum_compactness': best_breakdown.curriculum_compactness,
-                    'lecture_consecutiveness': best_breakdown.lecture_consecutiveness,
-                    'room_stability': best_breakdown.room_stability,
-                    'teacher_lecture_consolidation': best_breakdown.teacher_lecture_consolidation,
-                    'teacher_working_days': best_breakdown.teacher_working_days,
-                    'teacher_preferences': best_breakdown.teacher_preference_violations,
-                },
+                'time_elapsed': time_elapsed,
+                'init_time': elapsed_init,
+                'breakdown': self._breakdown_to_dict(best_breakdown),
+                'feasible_ratio': feasible_ratio,
+                'hard_violations': self._hard_violations(best_assignments),
+                'features': instance_features(self.instance),
+                'cost_curve': cost_curve,
+                'checkpoint_path': str(checkpoint.path) if checkpoint else None,
+                'resumed': resume is not None,
+                'cancelled': budget.cancelled,
+                'seed': self.seed,
+                'budget': budget.to_dict(),
                 'sol_file': str(sol_file),
                 'assignments': self._format_assignments(best_assignments)
             }
+            if budget.cancelled:
+                # Lời giải dừng sớm không ứng với budget trong cache key - không cache
+                logger.info(f"Search cancelled after {budget.iterations} iterations")
+                self._record_run('CANCELLED', strategy, init_method, time_limit, False, result)
+            else:
+                self._store_result(cache_key, result)
+                self._record_run('SUCCESS', strategy, init_method, time_limit, False, result)
+            return result
             
         except Exception as e:
             logger.error(f"Error during optimization: {e}", exc_info=True)
+            self._record_run('FAILED', strategy, init_method, time_limit, decompose, error=str(e))
             return {
                 'success': False,
                 'error': str(e)
             }
     
+    def _run_decomposed(
+        self,
+        strategy: str,
+        init_method: str,
+        time_limit: Optional[float],
+        tabu_mode: str,
+        batch_eval: bool,
+        max_iterations: Optional[int],
+        max_evaluations: Optional[int],
+        max_workers: Optional[int],
+        should_stop: Optional[Callable[[], bool]] = None
+    ) -> Dict:
+        """Giải từng thành phần độc lập trong process riêng rồi ghép kết quả"""
+        start_time = time.time()
+        count_budget = max_iterations is not None or max_evaluations is not None
+        if time_limit is None and not count_budget:
+            time_limit = 180.0
+        
+        log_dir = Path(settings.BASE_DIR) / 'output' / 'test_web_algo' / f'progress_{self.ma_dot}_components'
+        log_dir.mkdir(parents=True, exist_ok=True)
+        # Worker process không dùng DB - đóng kết nối để không chia sẻ socket qua fork
+        connections.close_all()
+        best_assignments, component_stats = solve_decomposed(
+            self.instance,
+            meta=strategy,
+            seed=self.seed,
+            init_method=init_method,
+            time_limit=time_limit,
+            max_workers=max_workers,
+            tabu_mode=tabu_mode,
+            batch_eval=batch_eval,
+            max_iterations=max_iterations,
+            max_evaluations=max_evaluations,
+            optimization_phase=True,
+            log_dir=log_dir,
+            should_stop=should_stop
+        )
+        for entry in component_stats:
+            logger.info(
+                f"  - Component #{entry['index']}: {entry['lectures']} lectures, {entry['rooms']} rooms, "
+                f"{entry['teachers']} teachers, cost {entry['initial_cost']} → {entry['final_cost']} "
+                f"in {entry['elapsed']:.1f}s"
+            )
+        
+        best_breakdown = rebuild_state(self.instance, best_assignments).score_breakdown()
+        initial_cost = sum(entry['initial_cost'] for entry in component_stats)
+        final_cost = best_breakdown.total
+        logger.info(f"Decomposed optimization completed. Final cost: {final_cost}")
+        
+        sol_dir = Path(settings.BASE_DIR) / 'output' / 'test_web_algo'
+        sol_file = sol_dir / f'solution_{self.ma_dot}.sol'
+        write_solution(self.instance, best_assignments, sol_file)
+        logger.info(f"Solution saved to: {sol_file}")
+        
+        budgets = [entry['budget'] for entry in component_stats]
+        return {
+            'success': True,
+            'ma_dot': self.ma_dot,
+            'initial_cost': initial_cost,
+            'final_cost': final_cost,
+            'improvement': initial_cost - final_cost,
+            'improvement_percent': (initial_cost - final_cost) / initial_cost * 100 if initial_cost > 0 else 0,
+            'time_elapsed': time.time() - start_time,
+            'breakdown': self._breakdown_to_dict(best_breakdown),
+            'hard_violations': self._hard_violations(best_assignments),
+            'feasible_ratio': None,
+            'checkpoint_path': None,
+            'resumed': False,
+            'cancelled': any(b['cancelled'] for b in budgets),
+            'seed': self.seed,
+            'budget': {
+                'time_limit': time_limit,
+                'max_iterations': max_iterations,
+                'max_evaluations': max_evaluations,
+                'iterations': sum(b['iterations'] for b in budgets),
+                'evaluations': sum(b['evaluations'] for b in budgets),
+                'deterministic': all(b['deterministic'] for b in budgets),
+                'cancelled': any(b['cancelled'] for b in budgets),
+            },
+            'components': component_stats,
+            'sol_file': str(sol_file),
+            'assignments': self._format_assignments(best_assignments)
+        }
+    
+    def _store_result(self, cache_key: Optional[str], result: Dict) -> None:
+        if cache_key is None or not result.get('success'):
+            return
+        try:
+            self.result_cache.put(cache_key, result)
+        except OSError as e:
+            logger.warning(f"Không ghi được result cache: {e}")
+    
+    def _hard_violations(self, assignments: Dict[int, Tuple[int, int]]) -> int:
+        """Số vi phạm cứng: trùng phòng / GV / curriculum + lecture chưa xếp"""
+        state = TimetableState(self.instance)
+        state.assignments = dict(assignments)
+        return state.count_hard_conflicts() + len(self.instance.lectures) - len(assignments)
+    
+    def _record_run(
+        self,
+        status: str,
+        strategy: str,
+        init_method: str,
+        time_limit: Optional[float],
+        decompose: bool = False,
+        result: Optional[Dict] = None,
+        error: Optional[str] = None,
+        details: Optional[Dict] = None
+    ) -> None:
+        """Ghi lần chạy vào SolverRun (bỏ qua nếu không ghi được - không ảnh hưởng kết quả)"""
+        result = result or {}
+        # Kết quả cache: thời gian / đường cost là của lần chạy gốc, không ghi lại
+        timed = status != 'CACHED'
+        init_time = result.get('init_time') if timed else None
+        time_elapsed = result.get('time_elapsed') if timed else None
+        phase_timings = {
+            'prepare': self.prepare_time,
+            'init': init_time,
+            'search': time_elapsed - init_time if time_elapsed is not None and init_time is not None else None,
+        }
+        details = dict(details or {})
+        for key in ('components', 'feasible_ratio', 'cache_key', 'resumed'):
+            if result.get(key) is not None:
+                details[key] = result[key]
+        try:
+            self.solver_run = SolverRun.objects.create(
+                ma_dot=self.dot_xep,
+                status=status,
+                algorithm=strategy.upper(),
+                init_method=init_method,
+                seed=self.seed,
+                time_limit=time_limit,
+                budget=result.get('budget'),
+                decompose=decompose,
+                instance_hash=instance_hash(self.instance) if self.instance is not None else '',
+                release=getattr(settings, 'SOLVER_RELEASE', ''),
+                features=result.get('features'),
+                initial_cost=result.get('initial_cost'),
+                final_cost=result.get('final_cost'),
+                breakdown=result.get('breakdown'),
+                hard_violations=result.get('hard_violations'),
+                time_elapsed=time_elapsed,
+                phase_timings={key: round(value, 3) for key, value in phase_timings.items() if value is not None},
+                cost_curve=result.get('cost_curve') if timed else None,
+                details=details or None,
+                error=error[:500] if error else None,
+            )
+            if result:
+                result['solver_run_id'] = self.solver_run.id
+        except DatabaseError:
+            self.solver_run = None
+            logger.exception(f"Không ghi được lịch sử chạy của {self.ma_dot}")
+    
+    def _from_cache(self, cached: Dict, cache_key: str) -> Dict:
+        """Kết quả từ cache: ghi lại file .sol từ assignments đã lưu"""
+        assignments = {
+            int(lecture_id): (data['period_absolute'], self.instance.room_by_id[data['room_id']])
+            for lecture_id, data in cached['assignments'].items()
+        }
+        sol_file = Path(settings.BASE_DIR) / 'output' / 'test_web_algo' / f'solution_{self.ma_dot}.sol'
+        write_solution(self.instance, assignments, sol_file)
+        return {**cached, 'sol_file': str(sol_file), 'cached': True, 'cache_key': cache_key}
+    
+    @staticmethod
+    def _breakdown_to_dict(breakdown: ScoreBreakdown) -> Dict:
+        return {
+            'room_capacity': breakdown.room_capacity,
+            'min_working_days': breakdown.min_working_days,
+            'curriculum_compactness': breakdown.curriculum_compactness,
+            'lecture_consecutiveness': breakdown.lecture_consecutiveness,
+            'room_stability': breakdown.room_stability,
+            'teacher_lecture_consolidation': breakdown.teacher_lecture_consolidation,
+            'teacher_working_days': breakdown.teacher_working_days,
+            'teacher_preferences': breakdown.teacher_preference_violations,
+        }
+    
     def _format_assignments(self, assignments: Dict[int, Tuple[int, int]]) -> Dict:
         """
         Format assignments để dễ đọc
@@ -221,109 +590,354 @@ class AlgorithmRunner:
         
         return formatted
     
-    def save_to_database(self, assignments: Dict[int, Tuple[int, int]]) -> bool:
+    def save_to_database(self, assignments: Dict[int, Tuple[int, int]],
+                         user: str = 'solver', batch_size: int = 500) -> Optional[Dict]:
         """
-        Lưu kết quả vào database (ThoiKhoaBieu)
+        Lưu kết quả vào database (ThoiKhoaBieu) theo kiểu diff
+        
+        Nạp bảng tham chiếu (TimeSlot, LopMonHoc, PhongHoc) và TKB hiện có của
+        đợt 1 lần, so với phân công mới rồi chỉ ghi phần thay đổi:
+        - Bản ghi trùng (lớp, time slot, phòng): giữ nguyên
+        - Bản ghi đã xóa mềm trùng khóa: phục hồi (unique_together tính cả bản ghi đã xóa)
+        - Bản ghi cũ còn thừa của cùng lớp: dời sang vị trí mới (UPDATE)
+        - Còn thiếu: tạo mới; còn thừa: xóa mềm
+        Tất cả trong 1 transaction, ghi bằng bulk_create/bulk_update theo lô,
+        TKBLog ghi kèm bằng bulk_create.
+        
+        Tham số lần chạy (thuật toán, seed, budget, cost) đã nằm trong
+        SolverRun - chỉ đánh dấu đã lưu và thời gian lưu.
         
         Args:
             assignments: {lecture_id: (period, room_idx)}
+            user: Người thực hiện (ghi vào TKBLog)
+            batch_size: Số bản ghi mỗi lô bulk
             
         Returns:
-            True nếu thành công
+            Thống kê {'created', 'updated', 'restored', 'deleted', 'unchanged',
+            'skipped', 'elapsed'} hoặc None nếu lỗi database (đã rollback);
+            lỗi khác (dữ liệu/logic) được raise tiếp
         """
+        from datetime import date, timedelta
+        from django.db import transaction
+        from ..models import IdSequence, LopMonHoc, PhongHoc, TKBLog
+        
+        save_start = time.time()
         try:
-            # Xóa thời khóa biểu cũ của đợt này
-            ThoiKhoaBieu.objects.filter(ma_dot=self.dot_xep).delete()
-            logger.info(f"Deleted old schedules for {self.ma_dot}")
-            
-            # Tạo base ID từ timestamp để unique (8 chữ số)
-            import time
-            from datetime import date, timedelta
-            base_id = int(time.time()) % 100000000  # 8 chữ số
-            
-            # Ngày bắt đầu mặc định (có thể lấy từ DotXep hoặc đặt mặc định)
-            # Giả sử học kỳ bắt đầu vào ngày hiện tại hoặc lấy từ semester info
-            ngay_bat_dau = date.today()  # Có thể thay bằng ngày cụ thể của học kỳ
-            
-            # Tạo mapping từ course_id (string) sang LopMonHoc
-            from ..models import PhongHoc, LopMonHoc
-            course_id_to_lop = {}
-            for lop in LopMonHoc.objects.all():
-                course_id_to_lop[lop.ma_lop] = lop
-            
-            # Tạo mapping từ room_id (string) sang PhongHoc
-            room_id_to_phong = {p.ma_phong: p for p in PhongHoc.objects.all()}
+            # Bảng tham chiếu: mỗi bảng 1 query thay vì 1 query mỗi lecture
+            # (day, slot) → TimeSlot theo đúng quy đổi lúc dựng instance
+            slot_by_cell = timeslot_by_cell()
+            course_ids = {course.id for course in self.instance.courses}
+            lop_by_id = {
+                lop.ma_lop: lop
+                for lop in LopMonHoc.objects.select_related('ma_mon_hoc').filter(ma_lop__in=course_ids)
+            }
+            room_ids = set(PhongHoc.objects.values_list('ma_phong', flat=True))
             
-            # Tạo ThoiKhoaBieu mới
-            created_count = 0
+            # Phân công mới → khóa (ma_lop, time_slot_id, ma_phong)
+            desired = []
+            seen = set()
+            skipped = 0
             for lecture_id, (period, room_idx) in assignments.items():
-                course_idx = self.instance.lectures[lecture_id].course
-                course_id = self.instance.courses[course_idx].id
+                course_id = self.instance.courses[self.instance.lectures[lecture_id].course].id
                 room_id = self.instance.rooms[room_idx].id
                 
-                # Tính day và period
-                day = period // self.instance.periods_per_day
-                slot = period % self.instance.periods_per_day
-                
-                # Chuyển từ 0-based sang DB format (Thứ 2-7 = 2-7, Ca 1-5 = 1-5)
-                db_day = day + 2  # 0→2, 1→3, ..., 5→7
-                db_period = slot + 1  # 0→1, 1→2, ..., 4→5
-                
-                # Tìm TimeSlot tương ứng
-                try:
-                    time_slot = TimeSlot.objects.get(thu=db_day, ca__ma_khung_gio=db_period)
-                except TimeSlot.DoesNotExist:
-                    logger.warning(f"TimeSlot not found for day={db_day}, period={db_period}")
-                    continue
-                
-                # Tìm LopMonHoc
-                if course_id not in course_id_to_lop:
+                day, slot = self.instance.period_to_slot(period)
+                time_slot_id = slot_by_cell.get((day, slot))
+                if time_slot_id is None:
+                    logger.warning(f"TimeSlot not found for day={day}, slot={slot}")
+                elif course_id not in lop_by_id:
                     logger.warning(f"LopMonHoc not found for course_id={course_id}")
+                elif room_id not in room_ids:
+                    logger.warning(f"PhongHoc not found for room_id={room_id}")
+                elif (course_id, time_slot_id, room_id) in seen:
+                    # Trùng khóa unique (lời giải vi phạm ràng buộc cứng) - chỉ lưu 1 bản
+                    logger.warning(f"Duplicate assignment {course_id} @ {time_slot_id}/{room_id}")
+                else:
+                    seen.add((course_id, time_slot_id, room_id))
+                    desired.append((course_id, time_slot_id, room_id))
                     continue
+                skipped += 1
+            
+            with transaction.atomic():
+                live_by_key = {}
+                deleted_by_key = {}
+                for tkb in ThoiKhoaBieu.objects.select_for_update().filter(ma_dot=self.dot_xep):
+                    key = (tkb.ma_lop_id, tkb.time_slot_id_id, tkb.ma_phong_id)
+                    (deleted_by_key if tkb.is_deleted else live_by_key)[key] = tkb
                 
-                lop_mon_hoc = course_id_to_lop[course_id]
+                unchanged = 0
+                restored = []
+                pending = []
+                for key in desired:
+                    if live_by_key.pop(key, None) is not None:
+                        unchanged += 1
+                    elif key in deleted_by_key:
+                        tkb = deleted_by_key.pop(key)
+                        tkb.is_deleted = False
+                        restored.append(tkb)
+                    else:
+                        pending.append(key)
                 
-                # Lấy số tuần học từ môn học
-                so_tuan = lop_mon_hoc.ma_mon_hoc.so_tuan if lop_mon_hoc.ma_mon_hoc.so_tuan else 15
-                # Tạo pattern tuần học: "111...1" (n lần với n = so_tuan)
-                # Tất cả môn đều bắt đầu từ tuần 1 và học liên tục
-                tuan_hoc_pattern = "1" * so_tuan
+                # Bản ghi cũ còn thừa theo lớp: ưu tiên dời sang vị trí mới thay vì xóa + tạo
+                leftovers: Dict[str, List[ThoiKhoaBieu]] = {}
+                for tkb in live_by_key.values():
+                    leftovers.setdefault(tkb.ma_lop_id, []).append(tkb)
                 
-                # Tính ngày kết thúc dựa trên số tuần (1 tuần = 7 ngày)
-                ngay_ket_thuc = ngay_bat_dau + timedelta(weeks=so_tuan)
+                logs = [
+                    TKBLog(ma_tkb=tkb.ma_tkb, action='RESTORE', user=user,
+                           old_data={'is_deleted': True}, new_data={'is_deleted': False},
+                           reason='Solver: phục hồi lịch trùng kết quả mới')
+                    for tkb in restored
+                ]
+                updated = []
+                new_keys = []
+                for ma_lop, time_slot_id, ma_phong in pending:
+                    if not leftovers.get(ma_lop):
+                        new_keys.append((ma_lop, time_slot_id, ma_phong))
+                        continue
+                    tkb = leftovers[ma_lop].pop()
+                    old_data = {'ma_phong': tkb.ma_phong_id, 'time_slot_id': tkb.time_slot_id_id}
+                    tkb.time_slot_id_id = time_slot_id
+                    tkb.ma_phong_id = ma_phong
+                    updated.append(tkb)
+                    logs.append(TKBLog(
+                        ma_tkb=tkb.ma_tkb, action='UPDATE', user=user, old_data=old_data,
+                        new_data={'ma_phong': ma_phong, 'time_slot_id': time_slot_id},
+                        reason=f'Solver: {old_data["time_slot_id"]}/{old_data["ma_phong"]} → {time_slot_id}/{ma_phong}'
+                    ))
                 
-                # Tìm PhongHoc
-                if room_id not in room_id_to_phong:
-                    logger.warning(f"PhongHoc not found for room_id={room_id}")
-                    continue
+                # Mã TKB cho bản ghi mới: giữ chỗ cả lô trong 1 lần từ bộ đếm
+                codes = IdSequence.next_codes(ThoiKhoaBieu, len(new_keys)) if new_keys else []
+                to_create = []
+                ngay_bat_dau = date.today()  # Có thể thay bằng ngày cụ thể của học kỳ
+                for ma_tkb, (ma_lop, time_slot_id, ma_phong) in zip(codes, new_keys):
+                    # Pattern tuần học "111...1" theo số tuần của môn, học liên tục từ tuần 1
+                    so_tuan = lop_by_id[ma_lop].ma_mon_hoc.so_tuan or 15
+                    tkb = ThoiKhoaBieu(
+                        ma_tkb=ma_tkb,
+                        ma_dot=self.dot_xep,
+                        ma_lop_id=ma_lop,
+                        time_slot_id_id=time_slot_id,
+                        ma_phong_id=ma_phong,
+                        tuan_hoc="1" * so_tuan,
+                        ngay_bd=ngay_bat_dau,
+                        ngay_kt=ngay_bat_dau + timedelta(weeks=so_tuan)
+                    )
+                    to_create.append(tkb)
+                    logs.append(TKBLog(
+                        ma_tkb=ma_tkb, action='CREATE', user=user, old_data=None,
+                        new_data={'ma_lop': ma_lop, 'ma_phong': ma_phong,
+                                  'time_slot_id': time_slot_id, 'tuan_hoc': tkb.tuan_hoc},
+                        reason='Solver: tạo lịch mới'
+                    ))
                 
-                phong = room_id_to_phong[room_id]
+                removed = [tkb for rows in leftovers.values() for tkb in rows]
+                for tkb in removed:
+                    tkb.is_deleted = True
+                    logs.append(TKBLog(
+                        ma_tkb=tkb.ma_tkb, action='DELETE', user=user,
+                        old_data={'ma_lop': tkb.ma_lop_id, 'ma_phong': tkb.ma_phong_id,
+                                  'time_slot_id': tkb.time_slot_id_id},
+                        new_data={'is_deleted': True},
+                        reason='Solver: không còn trong kết quả mới'
+                    ))
                 
-                # Tạo mã TKB unique (max 15 chars)
-                # Format: TKB + base_id (8 digits) + counter (4 digits) = 15 chars
-                ma_tkb = f"TKB{base_id:08d}{created_count:04d}"
-                
-                # Kiểm tra độ dài (safety check)
-                if len(ma_tkb) > 15:
-                    # Fallback: chỉ dùng counter
-                    ma_tkb = f"TKB{(base_id + created_count):011d}"[:15]
-                
-                # Tạo ThoiKhoaBieu
-                ThoiKhoaBieu.objects.create(
-                    ma_tkb=ma_tkb,
-                    ma_dot=self.dot_xep,
-                    ma_lop=lop_mon_hoc,
-                    time_slot_id=time_slot,
-                    ma_phong=phong,
-                    tuan_hoc=tuan_hoc_pattern,
-                    ngay_bd=ngay_bat_dau,
-                    ngay_kt=ngay_ket_thuc
+                ThoiKhoaBieu.objects.bulk_update(removed + restored, ['is_deleted'], batch_size=batch_size)
+                ThoiKhoaBieu.objects.bulk_update(updated, ['time_slot_id', 'ma_phong'], batch_size=batch_size)
+                ThoiKhoaBieu.objects.bulk_create(to_create, batch_size=batch_size)
+                TKBLog.objects.bulk_create(logs, batch_size=batch_size)
+                if to_create or updated or restored or removed:
+                    DotXep.bump_schedule_version(self.ma_dot)  # bulk không phát signal
+            
+            stats = {
+                'created': len(to_create),
+                'updated': len(updated),
+                'restored': len(restored),
+                'deleted': len(removed),
+                'unchanged': unchanged,
+                'skipped': skipped,
+                'elapsed': round(time.time() - save_start, 3),
+            }
+            logger.info(f"Saved schedules for {self.ma_dot}: {stats}")
+            # Lời giải đã vào DB - checkpoint của lần chạy không còn cần để resume
+            self.checkpoint_path.unlink(missing_ok=True)
+            
+            if self.solver_run is not None:
+                self.solver_run.saved_to_db = True
+                self.solver_run.phase_timings = {
+                    **(self.solver_run.phase_timings or {}), 'save': stats['elapsed']
+                }
+                self.solver_run.details = {**(self.solver_run.details or {}), 'save_stats': stats}
+                self.solver_run.save(update_fields=['saved_to_db', 'phase_timings', 'details'])
+            return stats
+            
+        except DatabaseError:
+            logger.exception(f"Error saving schedules for {self.ma_dot} to database")
+            return None
+
+
+class MultiDotRunner:
+    """Xếp lịch nhiều đợt cùng lúc (mỗi đợt 1 worker process), dùng chung phòng học"""
+    
+    def __init__(self, ma_dots: List[str], seed: int = 42, max_workers: Optional[int] = None):
+        """
+        Khởi tạo runner
+        
+        Args:
+            ma_dots: Danh sách mã đợt - thứ tự là độ ưu tiên giữ phòng khi sửa xung đột
+            seed: Random seed (đợt thứ i dùng seed + i)
+            max_workers: Số process tối đa (mặc định: số CPU)
+        """
+        self.ma_dots = list(dict.fromkeys(ma_dots))
+        self.seed = seed
+        self.max_workers = max_workers
+        self.runners = [AlgorithmRunner(ma_dot=ma_dot, seed=seed + index) for index, ma_dot in enumerate(self.ma_dots)]
+    
+    def prepare_data(self) -> bool:
+        """Dựng instance từ DB cho từng đợt"""
+        return all(runner.prepare_data() for runner in self.runners)
+    
+    def _committed_cells(self) -> Occupancy:
+        """Ô (phòng, ngày, ca) → tuần học đã dùng bởi các đợt khác cùng học kỳ - coi là ô cố định"""
+        semesters = {runner.dot_xep.ma_du_kien_dt_id for runner in self.runners}
+        rows = ThoiKhoaBieu.objects.filter(
+            ma_dot__ma_du_kien_dt__in=semesters,
+            is_deleted=False,
+            ma_phong__isnull=False
+        ).exclude(
+            ma_dot__in=self.ma_dots
+        ).order_by().values_list('ma_phong_id', 'time_slot_id__thu', 'time_slot_id__ca_id', 'tuan_hoc')
+        # Cùng quy đổi TimeSlot → (day, slot) với lúc dựng instance
+        cells: Occupancy = {}
+        for ma_phong, thu, ca, tuan_hoc in rows:
+            cell = timeslot_cell(thu, ca)
+            if cell is not None:
+                key = (ma_phong, *cell)
+                cells[key] = cells.get(key, 0) | week_mask(tuan_hoc)
+        return cells
+    
+    @staticmethod
+    def _course_weeks(runner: AlgorithmRunner) -> List[int]:
+        """
+        Bitmask tuần học của từng course (lớp) của đợt, như save_to_database sẽ ghi:
+        tuần của các dòng TKB hiện có của lớp, lớp chưa có TKB: '1' * số tuần của môn
+        """
+        course_ids = [course.id for course in runner.instance.courses]
+        existing: Dict[str, int] = {}
+        for ma_lop, tuan_hoc in ThoiKhoaBieu.objects.filter(
+            ma_dot=runner.dot_xep, is_deleted=False, ma_lop__in=course_ids
+        ).order_by().values_list('ma_lop_id', 'tuan_hoc'):
+            existing[ma_lop] = existing.get(ma_lop, 0) | week_mask(tuan_hoc)
+        so_tuan = dict(
+            LopMonHoc.objects.filter(ma_lop__in=course_ids).values_list('ma_lop', 'ma_mon_hoc__so_tuan')
+        )
+        return [
+            existing.get(ma_lop) or week_mask('1' * (so_tuan.get(ma_lop) or 15))
+            for ma_lop in course_ids
+        ]
+    
+    def run(
+        self,
+        strategy: str = "TS",
+        init_method: str = "greedy-cprop",
+        time_limit: Optional[float] = 180.0,
+        tabu_mode: str = "move",
+        batch_eval: bool = False,
+        max_iterations: Optional[int] = None,
+        max_evaluations: Optional[int] = None,
+        save_to_db: bool = False
+    ) -> Dict:
+        """
+        Giải đồng thời các đợt rồi sửa xung đột phòng giữa chúng
+        
+        Returns:
+            Dictionary: success, dots (kết quả từng đợt), committed_cells, time_elapsed
+        """
+        start_time = time.time()
+        try:
+            committed = self._committed_cells()
+            weights = WeightLoader.load_weights(None)
+            log_dir = Path(settings.BASE_DIR) / 'output' / 'test_web_algo'
+            tasks = []
+            course_weeks = []
+            for index, runner in enumerate(self.runners):
+                runner.instance.weights = weights
+                course_weeks.append(self._course_weeks(runner))
+                # blocked_cells không phân biệt course: chặn ô trùng tuần với bất kỳ lớp nào của đợt.
+                # Chỉ là ràng buộc lúc giải - đặt trên bản sao, runner.instance giữ nguyên
+                solve_instance = copy.copy(runner.instance)
+                solve_instance.blocked_cells = blocked_cells_for(
+                    runner.instance, committed, union_weeks(course_weeks[-1])
                 )
-                created_count += 1
+                tasks.append(build_task(
+                    solve_instance, index, runner.seed, meta=strategy, init_method=init_method,
+                    time_limit=time_limit, tabu_mode=tabu_mode, batch_eval=batch_eval,
+                    max_iterations=max_iterations, max_evaluations=max_evaluations, optimization_phase=True,
+                    log_path=log_dir / f'progress_{runner.ma_dot}.csv'
+                ))
+            workers = min(len(tasks), self.max_workers or os.cpu_count() or 1)
+            logger.info(f"Multi-dot solve: {self.ma_dots}, {len(committed)} committed cells, workers={workers}")
             
-            logger.info(f"Created {created_count} ThoiKhoaBieu records")
-            return True
+            # Worker process không dùng DB - đóng kết nối để không chia sẻ socket qua fork
+            connections.close_all()
+            results = run_tasks(tasks, workers)
             
+            # Coordinated room repair: đợt trước giữ phòng, đợt sau đổi phòng/tiết khi trùng
+            occupied = dict(committed)
+            dots = []
+            for runner, weeks, result in zip(self.runners, course_weeks, results):
+                assignments, repair = repair_room_conflicts(runner.instance, result['assignments'], occupied, weeks)
+                merge_occupancy(occupied, occupied_cells(runner.instance, assignments, weeks))
+                complete = not repair['unresolved']
+                breakdown = rebuild_state(runner.instance, assignments).score_breakdown()
+                logger.info(
+                    f"  - {runner.ma_dot}: cost {result['initial_cost']} → {breakdown.total}, "
+                    f"room conflicts {repair['conflicts']} (room {repair['room_changed']}, "
+                    f"period {repair['period_changed']}, unresolved {len(repair['unresolved'])})"
+                )
+                
+                entry = {
+                    'ma_dot': runner.ma_dot,
+                    'seed': runner.seed,
+                    'initial_cost': result['initial_cost'],
+                    'final_cost': breakdown.total,
+                    'breakdown': AlgorithmRunner._breakdown_to_dict(breakdown),
+                    'time_elapsed': result['elapsed'],
+                    'budget': result['budget'],
+                    'room_repair': repair,
+                    'lectures_scheduled': len(assignments),
+                    'saved_to_db': False,
+                }
+                if complete:
+                    sol_file = log_dir / f'solution_{runner.ma_dot}.sol'
+                    write_solution(runner.instance, assignments, sol_file)
+                    entry['sol_file'] = str(sol_file)
+                runner._record_run(
+                    'SUCCESS' if complete else 'FAILED', strategy, init_method, time_limit,
+                    result={
+                        **entry,
+                        'hard_violations': runner._hard_violations(assignments),
+                        'features': instance_features(runner.instance),
+                    },
+                    error=None if complete else f"{len(repair['unresolved'])} lecture không sửa được xung đột phòng",
+                    details={'multi_dot': self.ma_dots, 'room_repair': repair},
+                )
+                entry['solver_run_id'] = runner.solver_run.id if runner.solver_run else None
+                if complete and save_to_db:
+                    entry['save_stats'] = runner.save_to_database(assignments)
+                    entry['saved_to_db'] = entry['save_stats'] is not None
+                dots.append(entry)
+            
+            return {
+                'success': all(not entry['room_repair']['unresolved'] for entry in dots),
+                'dots': dots,
+                'committed_cells': len(committed),
+                'time_elapsed': time.time() - start_time,
+            }
+        
         except Exception as e:
-            logger.error(f"Error saving to database: {e}", exc_info=True)
-            return False
+            logger.error(f"Error during multi-dot optimization: {e}", exc_info=True)
+            return {
+                'success': False,
+                'error': str(e)
+            }
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Benchmark load instance: parse .ctt + dựng index vs load bản compiled.
+
+Đo thời gian trung bình cho ``parse_instance`` (đọc + tách text + dựng
+mọi index) và ``load_instance`` (hash nội dung + unpickle bản compiled
+trong thư mục cache - ``compiled_instance_path``), kèm thời gian tạo
+``TimetableState`` rỗng.
+
+Usage:
+    python benchmark_instance_load.py --instance ../test_data/dot1.ctt --repeat 20
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# algorithms_core.py nằm ở ../../
+ALGO_DIR = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(ALGO_DIR))
+
+from algorithms_core import (  # noqa: E402
+    TimetableState,
+    compiled_instance_path,
+    load_instance,
+    parse_instance,
+)
+
+
+def timed(func, repeat: int) -> float:
+    """Thời gian trung bình (ms) của ``func`` qua ``repeat`` lần."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1000.0 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parse .ctt vs compiled instance")
+    parser.add_argument("--instance", type=str, default=str(ALGO_DIR / "alo_origin" / "test_data" / "dot1.ctt"))
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    # Lần đầu ghi bản compiled (nếu chưa có / đã cũ)
+    instance = load_instance(args.instance)
+
+    parse_ms = timed(lambda: parse_instance(args.instance), args.repeat)
+    load_ms = timed(lambda: load_instance(args.instance), args.repeat)
+    state_ms = timed(lambda: TimetableState(instance), args.repeat)
+
+    print("=" * 60)
+    print(f"Instance: {Path(args.instance).name} | lectures: {len(instance.lectures)} | repeat: {args.repeat}")
+    print(f"Compiled: {compiled_instance_path(Path(args.instance))}")
+    print("=" * 60)
+    print(f"parse_instance : {parse_ms:10.2f} ms")
+    print(f"load_instance  : {load_ms:10.2f} ms")
+    print(f"Speedup        : {parse_ms / load_ms if load_ms > 0 else 0.0:10.2f}x")
+    print(f"TimetableState : {state_ms:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark JIT penalty kernels (Numba) vs Python thuần.
+
+Đo số move/giây (evaluate, commit=False) trên cùng một tập candidate cho
+hai chế độ và kiểm tra delta giống hệt nhau (bit-identical).
+
+Usage:
+    python benchmark_jit.py --instance ../test_data/dot1.ctt --moves 5000
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+# algorithms_core.py nằm ở ../../
+ALGO_DIR = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(ALGO_DIR))
+
+import penalty_kernels  # noqa: E402
+from algorithms_core import (  # noqa: E402
+    MoveLectureNeighborhood,
+    SwapLecturesNeighborhood,
+    build_initial_solution,
+    load_instance,
+    rebuild_state,
+)
+
+
+def generate_moves(state, count: int, seed: int):
+    """Sinh danh sách candidate cố định để hai chế độ dùng chung."""
+    rng = random.Random(seed)
+    neighborhoods = [MoveLectureNeighborhood(), SwapLecturesNeighborhood()]
+    moves = []
+    attempts = 0
+    while len(moves) < count and attempts < count * 10:
+        attempts += 1
+        move = rng.choice(neighborhoods).generate_candidate(state, rng)
+        if move is not None:
+            moves.append(move)
+    return moves
+
+
+def measure(instance, assignments, moves, use_jit: bool):
+    """Trả về (moves/sec, danh sách delta)."""
+    penalty_kernels.set_jit_enabled(use_jit)
+    state = rebuild_state(instance, assignments)
+    # Warm-up: lần gọi đầu của Numba bao gồm thời gian compile
+    for move in moves[:20]:
+        move.evaluate(state)
+    start = time.perf_counter()
+    deltas = [move.evaluate(state) for move in moves]
+    elapsed = time.perf_counter() - start
+    return len(moves) / elapsed if elapsed > 0 else 0.0, deltas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Numba JIT penalty kernels")
+    parser.add_argument("--instance", type=str, default=str(ALGO_DIR / "alo_origin" / "test_data" / "dot1.ctt"))
+    parser.add_argument("--moves", type=int, default=5000, help="Số candidate để evaluate")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    instance = load_instance(args.instance)
+    rng = random.Random(args.seed)
+    penalty_kernels.set_jit_enabled(False)
+    base = build_initial_solution(instance, rng, "greedy-cprop", time.time(), 120.0)
+    assignments = base.clone_assignments()
+    moves = generate_moves(base, args.moves, args.seed)
+
+    print("=" * 60)
+    print(f"Instance: {Path(args.instance).name} | candidates: {len(moves)}")
+    print(f"Numba available: {penalty_kernels.NUMBA_AVAILABLE}")
+    print("=" * 60)
+
+    py_rate, py_deltas = measure(instance, assignments, moves, use_jit=False)
+    print(f"Python thuần : {py_rate:10.1f} moves/s")
+
+    if not penalty_kernels.NUMBA_AVAILABLE:
+        print("Numba chưa được cài - bỏ qua chế độ JIT (pip install numba)")
+        return
+
+    jit_rate, jit_deltas = measure(instance, assignments, moves, use_jit=True)
+    print(f"Numba JIT    : {jit_rate:10.1f} moves/s")
+    print(f"Speedup      : {jit_rate / py_rate:10.2f}x")
+    identical = py_deltas == jit_deltas
+    print(f"Bit-identical deltas: {'✅' if identical else '❌'}")
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+"""
+Presolve: tách instance thành các thành phần độc lập và giải song song.
+
+Hai course thuộc cùng một thành phần nếu chúng có chung giảng viên, chung
+curriculum, hoặc có chung ít nhất một phòng tương thích (sức chứa, loại
+phòng, thiết bị - ``CBCTTInstance.course_room_sets``). Các thành phần khác
+nhau không bao giờ tranh chấp GV / curriculum / phòng, nên mỗi thành phần
+được giải như một sub-instance riêng trong một process, rồi ghép kết quả.
+Mọi soft penalty đều tính theo course / GV / curriculum nên tổng cost bằng
+tổng cost của các thành phần.
+
+Đợt nhiều khoa (không chung GV, không chung phòng) sẽ chạy xong trong
+khoảng thời gian của thành phần lớn nhất. Đợt chỉ có 1 thành phần được giải
+trực tiếp trong process hiện tại.
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    from . import penalty_kernels
+    from .algorithms_core import (
+        CBCTTInstance,
+        Curriculum,
+        Lecture,
+        ProgressLogger,
+        SearchBudget,
+        WeightLoader,
+        build_initial_solution,
+        run_metaheuristic,
+    )
+except ImportError:
+    # Standalone mode (chạy trực tiếp algorithms_core.py)
+    import penalty_kernels
+    from algorithms_core import (
+        CBCTTInstance,
+        Curriculum,
+        Lecture,
+        ProgressLogger,
+        SearchBudget,
+        WeightLoader,
+        build_initial_solution,
+        run_metaheuristic,
+    )
+
+logger = logging.getLogger(__name__)
+
+# Chu kỳ (giây) process cha gọi should_stop / worker đọc cờ dừng chung
+STOP_POLL_INTERVAL = 0.5
+
+# Thời gian tối thiểu (giây) cho 1 thành phần khi chia time_limit
+MIN_COMPONENT_TIME = 1.0
+
+
+@dataclass
+class Component:
+    """Một thành phần liên thông của đồ thị xung đột (chỉ số theo instance gốc)."""
+
+    index: int
+    courses: List[int]
+    rooms: List[int]
+    teachers: List[str]
+    curricula: List[int]
+    lecture_count: int
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "index": self.index,
+            "courses": len(self.courses),
+            "lectures": self.lecture_count,
+            "rooms": len(self.rooms),
+            "teachers": len(self.teachers),
+            "curricula": len(self.curricula),
+        }
+
+
+def find_components(instance: CBCTTInstance) -> List[Component]:
+    """Union-find trên course theo cạnh GV, curriculum và phòng tương thích.
+
+    Trả về danh sách thành phần, lớn nhất (nhiều lecture nhất) trước.
+    """
+
+    parent = list(range(len(instance.courses)))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(a: int, b: int) -> None:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+
+    first_by_teacher: Dict[str, int] = {}
+    first_by_room: Dict[int, int] = {}
+    for course in instance.courses:
+        owner = first_by_teacher.setdefault(course.teacher, course.index)
+        union(owner, course.index)
+        for room_idx in instance.course_room_sets[course.index]:
+            owner = first_by_room.setdefault(room_idx, course.index)
+            union(owner, course.index)
+    for curriculum in instance.curriculums:
+        for course_idx in curriculum.courses[1:]:
+            union(curriculum.courses[0], course_idx)
+
+    groups: Dict[int, List[int]] = {}
+    for course in instance.courses:
+        groups.setdefault(find(course.index), []).append(course.index)
+
+    components: List[Component] = []
+    for courses in groups.values():
+        rooms: Set[int] = set()
+        curricula: Set[int] = set()
+        for course_idx in courses:
+            rooms.update(instance.course_room_sets[course_idx])
+            curricula.update(instance.course_curriculums[course_idx])
+        components.append(Component(
+            index=0,
+            courses=courses,
+            rooms=sorted(rooms),
+            teachers=sorted({instance.course_teachers[c] for c in courses}),
+            curricula=sorted(curricula),
+            lecture_count=sum(len(instance.course_lecture_ids[c]) for c in courses),
+        ))
+    components.sort(key=lambda comp: (-comp.lecture_count, comp.courses[0]))
+    for position, component in enumerate(components):
+        component.index = position
+    return components
+
+
+def build_subinstance(instance: CBCTTInstance, component: Component, weights: Optional[Dict[str, float]] = None) -> Tuple[CBCTTInstance, List[int]]:
+    """Tạo sub-instance cho ``component``.
+
+    Returns:
+        (sub_instance, lecture_map) với ``lecture_map[sub_lecture_id]`` là
+        lecture id gốc. Phòng của sub-instance thứ ``i`` là ``component.rooms[i]``.
+    """
+
+    course_map = {old: new for new, old in enumerate(component.courses)}
+    room_map = {old: new for new, old in enumerate(component.rooms)}
+
+    teachers: List[str] = []
+    teacher_by_id: Dict[str, int] = {}
+    courses = []
+    for new_idx, old_idx in enumerate(component.courses):
+        course = instance.courses[old_idx]
+        if course.teacher not in teacher_by_id:
+            teacher_by_id[course.teacher] = len(teachers)
+            teachers.append(course.teacher)
+        courses.append(replace(course, index=new_idx, teacher_index=teacher_by_id[course.teacher]))
+
+    rooms = [replace(instance.rooms[old], index=new) for new, old in enumerate(component.rooms)]
+
+    curriculums: List[Curriculum] = []
+    course_curriculums: List[List[int]] = [[] for _ in courses]
+    for old_idx in component.curricula:
+        curriculum = instance.curriculums[old_idx]
+        members = [course_map[c] for c in curriculum.courses]
+        for member in members:
+            course_curriculums[member].append(len(curriculums))
+        curriculums.append(Curriculum(curriculum.name, members, len(curriculums)))
+
+    lectures: List[Lecture] = []
+    lecture_map: List[int] = []
+    course_lecture_ids: List[List[int]] = [[] for _ in courses]
+    for course in courses:
+        for old_lid in instance.course_lecture_ids[component.courses[course.index]]:
+            lecture = Lecture(len(lectures), course.index, instance.lectures[old_lid].index)
+            lectures.append(lecture)
+            lecture_map.append(old_lid)
+            course_lecture_ids[course.index].append(lecture.id)
+
+    course_room_preference: List[List[int]] = []
+    for old_idx in component.courses:
+        order = [room_map[r] for r in instance.course_room_preference[old_idx] if r in room_map]
+        if not order:
+            order = [room_map[r] for r in instance.course_compatible_rooms[old_idx]]
+        course_room_preference.append(order)
+
+    # Lecture neighbors: cùng GV hoặc cùng curriculum (như parse_instance)
+    lecture_neighbors: List[Set[int]] = [set() for _ in lectures]
+    groups: List[List[int]] = []
+    teacher_lectures: Dict[str, List[int]] = {}
+    for course in courses:
+        teacher_lectures.setdefault(course.teacher, []).extend(course_lecture_ids[course.index])
+    groups.extend(teacher_lectures.values())
+    for curriculum in curriculums:
+        groups.append([lid for c in curriculum.courses for lid in course_lecture_ids[c]])
+    for lecture_ids in groups:
+        for lid in lecture_ids:
+            lecture_neighbors[lid].update(lecture_ids)
+    for lid, neighbors in enumerate(lecture_neighbors):
+        neighbors.discard(lid)
+
+    sub_instance = CBCTTInstance(
+        name=f"{instance.name}#c{component.index}",
+        days=instance.days,
+        periods_per_day=instance.periods_per_day,
+        courses=courses,
+        rooms=rooms,
+        curriculums=curriculums,
+        unavailability=[set(instance.unavailability[old]) for old in component.courses],
+        preferences=[set(instance.preferences[old]) for old in component.courses],
+        lectures=lectures,
+        course_curriculums=course_curriculums,
+        feasible_periods=[list(instance.feasible_periods[old]) for old in component.courses],
+        course_room_preference=course_room_preference,
+        course_teachers=[course.teacher for course in courses],
+        course_students=[course.students for course in courses],
+        course_lecture_ids=course_lecture_ids,
+        lecture_neighbors=lecture_neighbors,
+        course_by_id={course.id: course.index for course in courses},
+        room_by_id={room.id: room.index for room in rooms},
+        curriculum_by_id={curriculum.name: curriculum.index for curriculum in curriculums},
+        teacher_by_id=teacher_by_id,
+        teachers=teachers,
+        teacher_preferred_periods={
+            teacher: set(periods)
+            for teacher, periods in instance.teacher_preferred_periods.items()
+            if teacher in teacher_by_id
+        },
+        weights=weights,
+        blocked_cells={
+            period: {room_map[r] for r in rooms_blocked if r in room_map}
+            for period, rooms_blocked in instance.blocked_cells.items()
+        },
+    )
+    return sub_instance, lecture_map
+
+
+def split_time_limit(time_limit: Optional[float], components: List[Component], workers: int) -> List[Optional[float]]:
+    """Chia ``time_limit`` (wall-clock của cả đợt) cho các thành phần.
+
+    ``workers`` process chạy song song cho tổng ``time_limit × workers`` giây CPU,
+    chia theo số lecture của thành phần, mỗi phần không quá ``time_limit`` (1
+    thành phần chỉ chạy trên 1 process) và không dưới ``MIN_COMPONENT_TIME``.
+    Thành phần nhiều hơn worker thì phải chờ nhau nên mỗi phần nhận ít hơn
+    ``time_limit`` và cả đợt vẫn xong trong khoảng ``time_limit``.
+    """
+
+    if time_limit is None:
+        return [None] * len(components)
+    total_lectures = sum(component.lecture_count for component in components) or 1
+    cpu_budget = time_limit * max(1, min(workers, len(components)))
+    return [
+        min(time_limit, max(MIN_COMPONENT_TIME, cpu_budget * component.lecture_count / total_lectures))
+        for component in components
+    ]
+
+
+def build_task(
+    instance: CBCTTInstance,
+    index: int,
+    seed: int,
+    meta: str = "TS",
+    init_method: str = "greedy-cprop",
+    time_limit: Optional[float] = 180.0,
+    tabu_mode: str = "move",
+    batch_eval: bool = False,
+    max_iterations: Optional[int] = None,
+    max_evaluations: Optional[int] = None,
+    optimization_phase: bool = False,
+    log_path: Optional[Path] = None,
+) -> Dict:
+    """Đóng gói tham số cho ``solve_instance_task`` (picklable)."""
+
+    count_budget = max_iterations is not None or max_evaluations is not None
+    return {
+        "index": index,
+        "instance": instance,
+        "seed": seed,
+        "meta": meta,
+        "init_method": init_method,
+        "time_limit": time_limit if time_limit is not None else 180.0,
+        "deterministic": time_limit is None and count_budget,
+        "max_iterations": max_iterations,
+        "max_evaluations": max_evaluations,
+        "tabu_mode": tabu_mode,
+        "batch_eval": batch_eval,
+        "optimization_phase": optimization_phase,
+        "jit": penalty_kernels.jit_enabled(),
+        "log_path": str(log_path) if log_path else None,
+    }
+
+
+class _StopEventCheck:
+    """``should_stop`` trong worker process: đọc cờ dừng chung (Manager.Event), tối đa 1 lần / interval giây"""
+
+    def __init__(self, event, interval: float = STOP_POLL_INTERVAL) -> None:
+        self.event = event
+        self.interval = interval
+        self._last_check = 0.0
+
+    def __call__(self) -> bool:
+        now = time.monotonic()
+        if now - self._last_check < self.interval:
+            return False
+        self._last_check = now
+        return self.event.is_set()
+
+
+def solve_instance_task(task: Dict, should_stop: Optional[Callable[[], bool]] = None) -> Dict:
+    """Worker: giải 1 instance độc lập - sub-instance hoặc cả 1 đợt (chạy trong process riêng).
+
+    ``should_stop`` dùng khi chạy trong process hiện tại; trong worker process
+    cờ dừng đến qua ``task["stop_event"]`` (do ``run_tasks`` gán).
+    """
+
+    if should_stop is None and task.get("stop_event") is not None:
+        should_stop = _StopEventCheck(task["stop_event"])
+    if task["jit"] != penalty_kernels.jit_enabled():
+        penalty_kernels.set_jit_enabled(task["jit"])
+    sub_instance: CBCTTInstance = task["instance"]
+    rng = random.Random(task["seed"])
+    time_limit = task["time_limit"]
+    start_time = time.time()
+    try:
+        state = build_initial_solution(sub_instance, rng, task["init_method"], start_time, time_limit, task["deterministic"])
+    except RuntimeError:
+        state = build_initial_solution(sub_instance, rng, "random-repair", start_time, time_limit, task["deterministic"])
+    initial_cost = state.current_cost
+    remaining_time = max(0.0, time_limit - (time.time() - start_time))
+    budget = SearchBudget(
+        time_limit=None if task["deterministic"] else remaining_time,
+        max_iterations=task["max_iterations"],
+        max_evaluations=task["max_evaluations"],
+        should_stop=should_stop,
+    )
+    state._optimization_phase = task["optimization_phase"]
+    log_path = Path(task["log_path"]) if task["log_path"] else None
+    with ProgressLogger(log_path) as progress_logger:
+        best_assignments, best_breakdown = run_metaheuristic(
+            state, task["meta"], rng, progress_logger, remaining_time,
+            tabu_mode=task["tabu_mode"], batch_eval=task["batch_eval"], budget=budget,
+        )
+    return {
+        "index": task["index"],
+        "assignments": best_assignments,
+        "initial_cost": initial_cost,
+        "final_cost": best_breakdown.total,
+        "breakdown": asdict(best_breakdown),
+        "elapsed": time.time() - start_time,
+        "budget": budget.to_dict(),
+    }
+
+
+def run_tasks(tasks: List[Dict], workers: int, should_stop: Optional[Callable[[], bool]] = None) -> List[Dict]:
+    """Chạy các task tuần tự (1 worker) hoặc song song trong ProcessPoolExecutor.
+
+    Khi chạy song song, process cha gọi ``should_stop`` mỗi ``STOP_POLL_INTERVAL``
+    giây và bật cờ dừng chung để mọi worker trả lời giải tốt nhất hiện có.
+    Worker được fork từ process hiện tại: caller có kết nối DB phải đóng trước
+    (``connections.close_all()``) để không chia sẻ socket qua fork.
+    """
+
+    if workers <= 1 or len(tasks) <= 1:
+        return [solve_instance_task(task, should_stop) for task in tasks]
+    if should_stop is None:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(solve_instance_task, tasks))
+    with multiprocessing.Manager() as manager:
+        stop_event = manager.Event()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(solve_instance_task, {**task, "stop_event": stop_event}) for task in tasks]
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=STOP_POLL_INTERVAL, return_when=FIRST_EXCEPTION)
+                if any(future.exception() is not None for future in done):
+                    stop_event.set()
+                    break
+                if not stop_event.is_set() and should_stop():
+                    stop_event.set()
+            return [future.result() for future in futures]
+
+
+def solve_decomposed(
+    instance: CBCTTInstance,
+    meta: str = "TS",
+    seed: int = 42,
+    init_method: str = "greedy-cprop",
+    time_limit: Optional[float] = 180.0,
+    max_workers: Optional[int] = None,
+    tabu_mode: str = "move",
+    batch_eval: bool = False,
+    max_iterations: Optional[int] = None,
+    max_evaluations: Optional[int] = None,
+    weights: Optional[Dict[str, float]] = None,
+    optimization_phase: bool = False,
+    log_dir: Optional[Path] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> Tuple[Dict[int, Tuple[int, int]], List[Dict]]:
+    """Giải từng thành phần độc lập (song song nếu có > 1) và ghép lời giải.
+
+    ``time_limit`` là thời gian của cả đợt, chia cho các thành phần theo số
+    lecture (``split_time_limit``); budget đếm (max_iterations / max_evaluations)
+    áp dụng cho từng thành phần. Thành phần ``index`` dùng seed ``seed + index``,
+    nên với budget đếm (``time_limit=None``) kết quả vẫn deterministic.
+    ``should_stop`` (huỷ hợp tác) được chuyển tới mọi worker qua ``run_tasks``.
+
+    Returns:
+        (assignments theo lecture id / room index của instance gốc,
+         thống kê từng thành phần)
+    """
+
+    components = find_components(instance)
+    if weights is None:
+        weights = WeightLoader.load_weights(None)
+    workers = min(len(components), max_workers or os.cpu_count() or 1)
+    time_limits = split_time_limit(time_limit, components, workers)
+    tasks: List[Dict] = []
+    lecture_maps: List[List[int]] = []
+    for component, component_time_limit in zip(components, time_limits):
+        sub_instance, lecture_map = build_subinstance(instance, component, weights)
+        lecture_maps.append(lecture_map)
+        tasks.append(build_task(
+            sub_instance, component.index, seed + component.index, meta=meta,
+            init_method=init_method, time_limit=component_time_limit, tabu_mode=tabu_mode,
+            batch_eval=batch_eval, max_iterations=max_iterations, max_evaluations=max_evaluations,
+            optimization_phase=optimization_phase,
+            log_path=log_dir / f"progress_c{component.index}.csv" if log_dir else None,
+        ))
+    logger.info(
+        f"Decomposition: {len(components)} component(s), lectures={[c.lecture_count for c in components]}, "
+        f"workers={workers}, time_limits={time_limits}"
+    )
+
+    results = run_tasks(tasks, workers, should_stop)
+
+    assignments: Dict[int, Tuple[int, int]] = {}
+    stats: List[Dict] = []
+    for component, lecture_map, task, result in zip(components, lecture_maps, tasks, results):
+        for sub_lid, (period, sub_room) in result["assignments"].items():
+            assignments[lecture_map[sub_lid]] = (period, component.rooms[sub_room])
+        entry = component.summary()
+        entry.update({
+            "initial_cost": result["initial_cost"],
+            "final_cost": result["final_cost"],
+            "breakdown": result["breakdown"],
+            "time_limit": task["time_limit"],
+            "elapsed": result["elapsed"],
+            "budget": result["budget"],
+        })
+        stats.append(entry)
+    return assignments, stats
@@ -0,0 +1,155 @@
+"""
+Xếp lịch nhiều đợt (DotXep) dùng chung phòng học.
+
+Các đợt trong cùng học kỳ tranh chấp PhongHoc. Mỗi đợt được giải độc lập
+(song song, xem ``decomposition.run_tasks``) với các ô (phòng, tiết) đã bị
+đợt khác chiếm là ô cố định (``CBCTTInstance.blocked_cells``). Vì các đợt
+giải đồng thời không nhìn thấy nhau, sau cùng chạy một bước sửa phòng
+tuần tự: đợt đứng trước giữ nguyên, lecture của đợt sau bị trùng phòng được
+chuyển sang phòng trống khác cùng tiết, nếu không được thì sang tiết khác
+(chọn vị trí có delta nhỏ nhất).
+
+Ô được biểu diễn bằng (room_id, day, slot) để so sánh giữa các instance có
+chỉ số phòng / period khác nhau. Mỗi ô đã chiếm kèm bitmask tuần học (như
+``apps.scheduling.utils.weeks.week_mask``): hai lớp cùng phòng, cùng tiết nhưng
+học các tuần rời nhau không xung đột.
+"""
+
+from __future__ import annotations
+
+import copy
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+try:
+    from .algorithms_core import CBCTTInstance, TimetableState
+except ImportError:
+    # Standalone mode (chạy trực tiếp algorithms_core.py)
+    from algorithms_core import CBCTTInstance, TimetableState
+
+Cell = Tuple[str, int, int]  # (room_id, day, slot)
+Occupancy = Dict[Cell, int]  # ô → bitmask các tuần đã bị chiếm
+
+# Bitmask "học mọi tuần" (như apps.scheduling.utils.weeks.ALL_WEEKS - module này chạy được standalone): giao với mask nào cũng khác 0
+ALL_WEEKS = -1
+
+
+def union_weeks(course_weeks: Optional[Sequence[int]]) -> int:
+    """Hợp tuần học của mọi course (ALL_WEEKS nếu không có thông tin tuần)."""
+
+    if course_weeks is None:
+        return ALL_WEEKS
+    mask = 0
+    for weeks in course_weeks:
+        mask |= weeks
+    return mask
+
+
+def occupied_cells(instance: CBCTTInstance, assignments: Dict[int, Tuple[int, int]], course_weeks: Optional[Sequence[int]] = None) -> Occupancy:
+    """Các ô (room_id, day, slot) mà ``assignments`` đang dùng, kèm tuần học (``course_weeks`` theo course index)."""
+
+    cells: Occupancy = {}
+    for lecture_id, (period, room_idx) in assignments.items():
+        day, slot = instance.period_to_slot(period)
+        cell = (instance.rooms[room_idx].id, day, slot)
+        weeks = course_weeks[instance.lectures[lecture_id].course] if course_weeks is not None else ALL_WEEKS
+        cells[cell] = cells.get(cell, 0) | weeks
+    return cells
+
+
+def merge_occupancy(target: Occupancy, cells: Occupancy) -> None:
+    """Gộp ``cells`` vào ``target`` (OR tuần học của ô trùng)."""
+
+    for cell, weeks in cells.items():
+        target[cell] = target.get(cell, 0) | weeks
+
+
+def blocked_cells_for(instance: CBCTTInstance, occupied: Occupancy, weeks: int = ALL_WEEKS) -> Dict[int, Set[int]]:
+    """Chuyển ô đã bị chiếm sang dạng ``blocked_cells`` (period → room indices) của instance.
+
+    Chỉ chặn ô có tuần học giao với ``weeks``. Phòng không có trong instance
+    hoặc ngày/ca ngoài lưới được bỏ qua.
+    """
+
+    blocked: Dict[int, Set[int]] = {}
+    for (room_id, day, slot), occupied_weeks in occupied.items():
+        if not occupied_weeks & weeks:
+            continue
+        room_idx = instance.room_by_id.get(room_id)
+        if room_idx is None:
+            continue
+        if not (0 <= day < instance.days and 0 <= slot < instance.periods_per_day):
+            continue
+        blocked.setdefault(day * instance.periods_per_day + slot, set()).add(room_idx)
+    return blocked
+
+
+def _best_placement(state: TimetableState, lecture_id: int, periods: Iterable[int]) -> Optional[Tuple[int, int]]:
+    course_idx = state.instance.lectures[lecture_id].course
+    best: Optional[Tuple[int, int]] = None
+    best_delta: Optional[float] = None
+    for period in periods:
+        for room_idx in state.instance.course_compatible_rooms[course_idx]:
+            delta = state.move_lecture(lecture_id, period, room_idx, commit=False)
+            if delta is not None and (best_delta is None or delta < best_delta):
+                best, best_delta = (period, room_idx), delta
+    return best
+
+
+def repair_room_conflicts(
+    instance: CBCTTInstance,
+    assignments: Dict[int, Tuple[int, int]],
+    occupied: Occupancy,
+    course_weeks: Optional[Sequence[int]] = None,
+) -> Tuple[Dict[int, Tuple[int, int]], Dict]:
+    """Sửa các lecture đang dùng ô đã bị chiếm trong ``occupied``.
+
+    Lecture chỉ trùng khi tuần học của course (``course_weeks``, mặc định mọi
+    tuần) giao với tuần đã bị chiếm của ô. Lecture không trùng giữ nguyên;
+    lecture trùng được đổi phòng cùng tiết, nếu không được thì đổi sang tiết
+    khả thi khác (chỉ tránh các ô trùng tuần với course của nó).
+    ``instance`` không bị thay đổi (ô bị chặn đặt trên bản sao).
+
+    Returns:
+        (assignments đã sửa, stats) - stats gồm ``conflicts``,
+        ``room_changed``, ``period_changed`` và ``unresolved`` (lecture ids
+        không xếp lại được, không có trong assignments trả về).
+    """
+
+    def weeks_of(lecture_id: int) -> int:
+        return course_weeks[instance.lectures[lecture_id].course] if course_weeks is not None else ALL_WEEKS
+
+    # TimetableState đọc instance.blocked_cells mỗi lần kiểm tra: giữ chỗ trước, chặn theo tuần sau.
+    # Bản sao nông - chỉ blocked_cells khác instance của caller
+    instance = copy.copy(instance)
+    instance.blocked_cells = {}
+    state = TimetableState(instance)
+    displaced: List[int] = []
+    for lecture_id in sorted(assignments):
+        period, room_idx = assignments[lecture_id]
+        day, slot = instance.period_to_slot(period)
+        if occupied.get((instance.rooms[room_idx].id, day, slot), 0) & weeks_of(lecture_id):
+            displaced.append(lecture_id)
+        elif state.move_lecture(lecture_id, period, room_idx, commit=True) is None:
+            displaced.append(lecture_id)
+
+    stats: Dict = {"conflicts": len(displaced), "room_changed": 0, "period_changed": 0, "unresolved": []}
+    blocked_by_weeks: Dict[int, Dict[int, Set[int]]] = {}
+    for lecture_id in displaced:
+        weeks = weeks_of(lecture_id)
+        if weeks not in blocked_by_weeks:
+            blocked_by_weeks[weeks] = blocked_cells_for(instance, occupied, weeks)
+        instance.blocked_cells = blocked_by_weeks[weeks]
+        original_period = assignments[lecture_id][0]
+        target = _best_placement(state, lecture_id, [original_period])
+        if target is not None:
+            stats["room_changed"] += 1
+        else:
+            course_idx = instance.lectures[lecture_id].course
+            target = _best_placement(state, lecture_id, instance.feasible_periods[course_idx])
+            if target is None:
+                stats["unresolved"].append(lecture_id)
+                continue
+            stats["period_changed"] += 1
+        state.move_lecture(lecture_id, target[0], target[1], commit=True)
+
+    return state.clone_assignments(), stats
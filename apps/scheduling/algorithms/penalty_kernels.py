@@ -0,0 +1,204 @@
+"""
+Penalty kernels cho TimetableState (consecutiveness, S6, S7, hard occupancy).
+
+Mỗi kernel chỉ viết một lần, bằng tập con Python mà Numba hỗ trợ (vòng lặp,
+số nguyên, list ``[0] * n``), nhận list hoặc mảng NumPy số nguyên. Khi Numba
+cài sẵn, kernel được biên dịch bằng ``numba.njit`` (TimetableState truyền mảng
+NumPy); không có Numba hoặc tắt JIT thì chính các hàm Python đó được gọi với
+list. Chỉ có phép tính số nguyên nên kết quả hai chế độ giống hệt nhau
+(bit-identical).
+
+Bật / tắt:
+    - Mặc định bật khi import được Numba
+    - Biến môi trường ``SCHEDULING_JIT=0`` (đọc lúc import) để tắt
+    - Hoặc gọi ``set_jit_enabled(False)`` trước khi tạo TimetableState
+    - CLI: ``algorithms_core.py --no_jit``
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Import-time capability check
+try:
+    import numba  # noqa: F401
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+def consecutiveness_penalty(periods, periods_per_day):
+    """Kernel của ``TimetableState._compute_course_consecutiveness_penalty``.
+
+    ``periods`` là mảng period đã sắp xếp tăng dần của 1 course.
+    """
+    n = len(periods)
+    if n <= 1:
+        return 0
+
+    # Periods tăng dần → nhóm theo ngày liền nhau, slot tăng dần trong ngày
+    n_days = 0
+    total_pairs = 0
+    days_with_pairs = 0
+    i = 0
+    while i < n:
+        day = periods[i] // periods_per_day
+        j = i
+        while j < n and periods[j] // periods_per_day == day:
+            j += 1
+        pairs = 0
+        k = i
+        while k < j - 1:
+            if periods[k + 1] - periods[k] == 1:
+                pairs += 1
+                k += 2
+            else:
+                k += 1
+        n_days += 1
+        total_pairs += pairs
+        if pairs > 0:
+            days_with_pairs += 1
+        i = j
+
+    if n == 2:
+        if total_pairs == 1:
+            return 0
+        return 2
+
+    penalty = 0
+    if n >= 3 and n_days == 1:
+        penalty += 10
+
+    if n == 3:
+        if total_pairs == 1 and n_days >= 2:
+            return 0
+        elif total_pairs == 0:
+            penalty += 3
+        elif total_pairs == 1 and n_days == 1:
+            penalty += 5
+        else:
+            penalty += 2
+    elif n == 4:
+        if total_pairs == 2 and days_with_pairs >= 2:
+            return 0
+        elif total_pairs < 2:
+            penalty += (2 - total_pairs) * 3
+        elif total_pairs == 2 and days_with_pairs == 1:
+            penalty += 5
+        else:
+            penalty += 1
+    elif n >= 5:
+        if total_pairs < 2:
+            penalty += (2 - total_pairs) * 2
+        if days_with_pairs < 2:
+            penalty += 3
+
+    return penalty
+
+
+def consolidation_penalty(periods, rooms, types, periods_per_day):
+    """Kernel S6: số lần GV đổi phòng giữa 2 lecture liên tiếp cùng loại.
+
+    ``periods`` / ``rooms`` / ``types`` là các lecture của GV, đã sắp xếp
+    (ổn định) theo period. ``types`` là mã loại course (0 = không xác định,
+    không bao giờ bị phạt).
+    """
+    penalty = 0
+    for idx in range(len(periods) - 1):
+        if periods[idx] // periods_per_day != periods[idx + 1] // periods_per_day:
+            continue
+        if periods[idx + 1] - periods[idx] != 1:
+            continue
+        if rooms[idx] != rooms[idx + 1] and types[idx] != 0 and types[idx] == types[idx + 1]:
+            penalty += 1
+    return penalty
+
+
+def working_days_penalty(periods, periods_per_day, days):
+    """Kernel S7: số ngày lên trường vượt quá ⌈tổng tiết / periods_per_day⌉."""
+    total = len(periods)
+    if total <= 0:
+        return 0
+    active = [False] * days
+    for idx in range(total):
+        active[periods[idx] // periods_per_day] = True
+    actual_days = 0
+    for day in range(days):
+        if active[day]:
+            actual_days += 1
+    min_days = (total + periods_per_day - 1) // periods_per_day
+    return max(0, actual_days - min_days)
+
+
+def hard_conflict_count(periods, rooms, teachers, curr_ptr, curr_idx, total_periods, n_rooms, n_teachers, n_curricula):
+    """Đếm số xung đột phòng / GV / curriculum trên cùng period.
+
+    ``periods[l] < 0`` nghĩa là lecture chưa được xếp. Curricula của lecture
+    ``l`` là ``curr_idx[curr_ptr[l]:curr_ptr[l + 1]]`` (dạng CSR).
+    """
+    room_occ = [0] * (total_periods * n_rooms)
+    teacher_occ = [0] * (total_periods * n_teachers)
+    curr_occ = [0] * (total_periods * max(1, n_curricula))
+    conflicts = 0
+    for lec in range(len(periods)):
+        period = periods[lec]
+        if period < 0:
+            continue
+        key = period * n_rooms + rooms[lec]
+        if room_occ[key] > 0:
+            conflicts += 1
+        room_occ[key] += 1
+        key = period * n_teachers + teachers[lec]
+        if teacher_occ[key] > 0:
+            conflicts += 1
+        teacher_occ[key] += 1
+        for pos in range(curr_ptr[lec], curr_ptr[lec + 1]):
+            key = period * n_curricula + curr_idx[pos]
+            if curr_occ[key] > 0:
+                conflicts += 1
+            curr_occ[key] += 1
+    return conflicts
+
+
+# Bản Python thuần luôn giữ lại (dùng khi tắt JIT và để kiểm tra bit-identical)
+PY_KERNELS = {
+    "consecutiveness_penalty": consecutiveness_penalty,
+    "consolidation_penalty": consolidation_penalty,
+    "working_days_penalty": working_days_penalty,
+    "hard_conflict_count": hard_conflict_count,
+}
+_JIT_KERNELS = {}
+JIT_ENABLED = False
+
+
+def _compile():
+    if not _JIT_KERNELS:
+        from numba import njit
+        for name, func in PY_KERNELS.items():
+            _JIT_KERNELS[name] = njit(func)
+    return _JIT_KERNELS
+
+
+def set_jit_enabled(enabled: bool) -> bool:
+    """Bật/tắt JIT kernels. Trả về trạng thái thực tế (False nếu thiếu Numba)."""
+    global JIT_ENABLED, consecutiveness_penalty, consolidation_penalty, working_days_penalty, hard_conflict_count
+    if enabled and not NUMBA_AVAILABLE:
+        logger.info("Numba không khả dụng - dùng penalty kernels Python thuần")
+        enabled = False
+    kernels = _compile() if enabled else PY_KERNELS
+    consecutiveness_penalty = kernels["consecutiveness_penalty"]
+    consolidation_penalty = kernels["consolidation_penalty"]
+    working_days_penalty = kernels["working_days_penalty"]
+    hard_conflict_count = kernels["hard_conflict_count"]
+    JIT_ENABLED = enabled
+    return enabled
+
+
+def jit_enabled() -> bool:
+    return JIT_ENABLED
+
+
+set_jit_enabled(os.environ.get("SCHEDULING_JIT", "1").lower() not in ("0", "false", "no"))
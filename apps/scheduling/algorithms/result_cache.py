@@ -0,0 +1,162 @@
+"""
+Cache kết quả solver trên đĩa, key theo hash nội dung của instance.
+
+Key = SHA-256 của:
+    - dạng chuẩn hoá (canonical) của ``CBCTTInstance``: courses, rooms,
+      curricula, unavailability, preferences, thứ tự phòng ưu tiên, ô bị
+      chặn - chỉ dữ liệu gốc, không gồm các index dẫn xuất;
+    - trọng số soft constraint đã load;
+    - thuật toán, seed và budget (cùng các tham số solver khác).
+
+Mỗi entry là 1 file JSON ``<key>.json``, ghi atomic (tmp + os.replace).
+Eviction theo tuổi (mtime) và theo tổng số entry / tổng dung lượng (LRU:
+``get`` cập nhật mtime của entry được dùng).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+try:
+    from .algorithms_core import CBCTTInstance
+except ImportError:
+    # Standalone mode (chạy trực tiếp algorithms_core.py)
+    from algorithms_core import CBCTTInstance
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+
+def canonical_instance(instance: CBCTTInstance) -> Dict:
+    """Dạng chuẩn hoá (JSON-able) của dữ liệu gốc của instance.
+
+    Thứ tự course được giữ nguyên vì lecture id phụ thuộc vào nó; các tập
+    (unavailability, preferences, blocked cells) được sắp xếp.
+    """
+
+    rooms = instance.rooms
+    return {
+        "days": instance.days,
+        "periods_per_day": instance.periods_per_day,
+        "courses": [
+            [c.id, c.teacher, c.lectures, c.min_working_days, c.students, c.course_type, c.equipment]
+            for c in instance.courses
+        ],
+        "rooms": [[r.id, r.capacity, r.room_type, r.equipment] for r in rooms],
+        "curricula": [
+            [cur.name, [instance.courses[c].id for c in cur.courses]]
+            for cur in instance.curriculums
+        ],
+        "unavailability": [sorted(periods) for periods in instance.unavailability],
+        "preferences": [sorted(periods) for periods in instance.preferences],
+        "room_preference": [
+            [rooms[r].id for r in order] for order in instance.course_room_preference
+        ],
+        "blocked_cells": sorted(
+            [period, sorted(rooms[r].id for r in blocked)]
+            for period, blocked in instance.blocked_cells.items()
+            if blocked
+        ),
+    }
+
+
+def instance_hash(instance: CBCTTInstance) -> str:
+    """SHA-256 của ``canonical_instance``."""
+
+    payload = json.dumps(canonical_instance(instance), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def solve_cache_key(instance: CBCTTInstance, weights: Dict[str, float], meta: str, seed: int, budget: Dict, **params) -> str:
+    """Key cache cho 1 lần giải: instance + weights + thuật toán + seed + budget + tham số khác."""
+
+    payload = {
+        "version": CACHE_VERSION,
+        "instance": instance_hash(instance),
+        "weights": {key: float(value) for key, value in sorted(weights.items())},
+        "meta": meta.upper(),
+        "seed": seed,
+        "budget": budget,
+        "params": params,
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Kho kết quả solver trên đĩa với eviction theo tuổi và dung lượng."""
+
+    def __init__(self, root: Path, max_entries: int = 200, max_bytes: int = 200 * 1024 * 1024, max_age: float = 30 * 86400.0) -> None:
+        self.root = Path(root)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict]:
+        path = self._path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+                return None
+            with path.open("r", encoding="utf-8") as handle:
+                payload = json.load(handle)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as exc:
+            logger.warning(f"Bỏ qua cache entry hỏng {path.name}: {exc}")
+            path.unlink(missing_ok=True)
+            return None
+        if payload.get("version") != CACHE_VERSION:
+            return None
+        os.utime(path)  # LRU: entry vừa dùng được giữ lâu hơn
+        return payload.get("result")
+
+    def put(self, key: str, result: Dict) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_suffix(".json.tmp")
+        with tmp_path.open("w", encoding="utf-8") as handle:
+            json.dump({"version": CACHE_VERSION, "created": time.time(), "result": result}, handle, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self) -> int:
+        """Xoá entry quá hạn, rồi entry cũ nhất cho tới khi đủ giới hạn số lượng / dung lượng."""
+
+        if not self.root.exists():
+            return 0
+        now = time.time()
+        entries = []
+        removed = 0
+        for path in self.root.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+                removed += 1
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+            _, size, path = entries.pop(0)
+            path.unlink(missing_ok=True)
+            total_bytes -= size
+            removed += 1
+        return removed
+
+    def clear(self) -> None:
+        for path in self.root.glob("*.json"):
+            path.unlink(missing_ok=True)
@@ -0,0 +1,235 @@
+"""
+Dự đoán thời gian giải (và chất lượng) từ đặc trưng của instance.
+
+Đặc trưng (``instance_features``):
+    - ``lectures``: số lecture cần xếp
+    - ``room_scarcity``: max theo loại phòng của lecture / (số phòng × số tiết)
+    - ``curriculum_density``: số lecture xung đột trung bình (cùng GV / cùng
+      curriculum) chia số tiết
+    - ``teacher_load``: max theo GV của lecture / số tiết GV được dạy
+      (nguyện vọng là ràng buộc cứng nên dùng số tiết nguyện vọng nếu có)
+    - ``preferences``: tổng số tiết nguyện vọng
+
+Lịch sử mỗi lần chạy (``SolverRun``, xem ``AlgorithmRunner.run_history``) gồm
+đặc trưng, cost ban đầu, thời gian dựng lời giải ban đầu và đường best cost
+theo thời gian. Mỗi lần chạy sinh các mẫu (mức chất lượng
+r = target / initial_cost, thời gian đầu tiên đạt target); ``SolveTimeModel`` là hồi quy ridge tuyến tính trên
+log(thời gian). Lần chạy không đạt mức r (bị cắt bởi time limit) không sinh
+mẫu cho mức đó nên dự đoán có xu hướng lạc quan ở mức r thấp.
+"""
+
+from __future__ import annotations
+
+import math
+import statistics
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is listed in requirements
+    np = None
+
+try:
+    from .algorithms_core import CBCTTInstance
+except ImportError:
+    # Standalone mode (chạy trực tiếp algorithms_core.py)
+    from algorithms_core import CBCTTInstance
+
+FEATURE_NAMES = ("lectures", "room_scarcity", "curriculum_density", "teacher_load", "preferences")
+
+# Các mức chất lượng (cost / initial_cost) dùng để sinh mẫu từ đường cost
+RATIO_LEVELS = (0.95, 0.9, 0.8, 0.7, 0.6, 0.5, 0.4, 0.3, 0.2, 0.1)
+
+# Cần tối thiểu số lần chạy này (cùng thuật toán hoặc gộp) để fit model
+MIN_RUNS = 3
+
+
+def instance_features(instance: CBCTTInstance) -> Dict[str, float]:
+    """Đặc trưng độ khó của instance (xem docstring module)."""
+
+    total_periods = max(1, instance.total_periods)
+    lectures = len(instance.lectures)
+
+    lectures_by_type: Dict[str, int] = {}
+    for course in instance.courses:
+        lectures_by_type[course.course_type] = lectures_by_type.get(course.course_type, 0) + course.lectures
+    rooms_by_type: Dict[str, int] = {}
+    for room in instance.rooms:
+        rooms_by_type[room.room_type] = rooms_by_type.get(room.room_type, 0) + 1
+    room_scarcity = max(
+        (count / (max(1, rooms_by_type.get(room_type, 0)) * total_periods)
+         for room_type, count in lectures_by_type.items()),
+        default=0.0,
+    )
+
+    curriculum_density = (
+        sum(len(neighbors) for neighbors in instance.lecture_neighbors) / lectures / total_periods
+        if lectures else 0.0
+    )
+
+    teacher_lectures: Dict[str, int] = {}
+    for course in instance.courses:
+        teacher_lectures[course.teacher] = teacher_lectures.get(course.teacher, 0) + course.lectures
+    teacher_load = max(
+        (count / (len(instance.teacher_preferred_periods.get(teacher, ())) or total_periods)
+         for teacher, count in teacher_lectures.items()),
+        default=0.0,
+    )
+
+    return {
+        "lectures": float(lectures),
+        "room_scarcity": round(room_scarcity, 6),
+        "curriculum_density": round(curriculum_density, 6),
+        "teacher_load": round(teacher_load, 6),
+        "preferences": float(sum(len(periods) for periods in instance.teacher_preferred_periods.values())),
+    }
+
+
+def time_to_target(curve: Sequence[Sequence[float]], target_cost: float) -> Optional[float]:
+    """Thời điểm đầu tiên best cost <= ``target_cost`` trên đường (elapsed, best_cost)."""
+
+    for elapsed, best_cost in curve:
+        if best_cost <= target_cost:
+            return float(elapsed)
+    return None
+
+
+def downsample_curve(curve: Sequence[Sequence[float]], max_points: int = 100) -> List[List[float]]:
+    """Giữ tối đa ``max_points`` điểm (luôn giữ điểm đầu và cuối)."""
+
+    points = [[float(elapsed), float(cost)] for elapsed, cost in curve]
+    if len(points) <= max_points:
+        return points
+    step = (len(points) - 1) / (max_points - 1)
+    return [points[round(i * step)] for i in range(max_points)]
+
+
+def run_samples(run: Dict) -> List[Tuple[Dict[str, float], float, float]]:
+    """Các mẫu (features, ratio, seconds) từ 1 lần chạy trong lịch sử."""
+
+    initial_cost = run.get("initial_cost") or 0
+    curve = run.get("curve") or []
+    if initial_cost <= 0 or not curve or not run.get("features"):
+        return []
+    init_time = float(run.get("init_time") or 0.0)
+    samples = []
+    for ratio in RATIO_LEVELS:
+        reached = time_to_target(curve, ratio * initial_cost)
+        if reached is not None:
+            samples.append((run["features"], ratio, max(0.1, init_time + reached)))
+    return samples
+
+
+class SolveTimeModel:
+    """Hồi quy ridge: log(seconds) ~ features + thuật toán + log(ratio)."""
+
+    def __init__(self, ridge: float = 1e-3) -> None:
+        self.ridge = ridge
+        self.coef: Optional[List[float]] = None
+        self.n_runs = 0
+        self.n_samples = 0
+        self.rmse_log = None
+        self.typical_ratio: Dict[str, float] = {}
+
+    @staticmethod
+    def _row(features: Dict[str, float], strategy: str) -> List[float]:
+        return [
+            1.0,
+            math.log1p(features.get("lectures", 0.0)),
+            features.get("room_scarcity", 0.0),
+            features.get("curriculum_density", 0.0),
+            features.get("teacher_load", 0.0),
+            math.log1p(features.get("preferences", 0.0)),
+            1.0 if strategy.upper() == "SA" else 0.0,
+        ]
+
+    @property
+    def ready(self) -> bool:
+        return self.coef is not None
+
+    def fit(self, runs: Iterable[Dict]) -> "SolveTimeModel":
+        rows: List[List[float]] = []
+        targets: List[float] = []
+        ratios: Dict[str, List[float]] = {}
+        runs = [run for run in runs if not run.get("decompose")]
+        for run in runs:
+            strategy = run.get("strategy", "TS")
+            if run.get("initial_cost"):
+                ratios.setdefault(strategy.upper(), []).append(run["final_cost"] / run["initial_cost"])
+            for features, ratio, seconds in run_samples(run):
+                rows.append(self._row(features, strategy) + [math.log(ratio)])
+                targets.append(math.log(seconds))
+        self.n_runs = len(runs)
+        self.n_samples = len(rows)
+        self.typical_ratio = {strategy: statistics.median(values) for strategy, values in ratios.items()}
+        if np is None or self.n_runs < MIN_RUNS or self.n_samples < len(FEATURE_NAMES) + 3:
+            self.coef = None
+            return self
+
+        x = np.asarray(rows, dtype=float)
+        y = np.asarray(targets, dtype=float)
+        penalty = self.ridge * np.eye(x.shape[1])
+        penalty[0, 0] = 0.0  # Không phạt intercept
+        coef = np.linalg.solve(x.T @ x + penalty, x.T @ y)
+        self.coef = coef.tolist()
+        self.rmse_log = float(np.sqrt(np.mean((x @ coef - y) ** 2)))
+        return self
+
+    def predict_seconds(self, features: Dict[str, float], target_ratio: float, strategy: str = "TS") -> Optional[float]:
+        """Thời gian (giây, gồm dựng lời giải ban đầu) để đạt cost = target_ratio × initial_cost."""
+
+        if not self.ready or target_ratio <= 0:
+            return None
+        row = self._row(features, strategy) + [math.log(target_ratio)]
+        return math.exp(sum(c * v for c, v in zip(self.coef, row)))
+
+    def predict_ratio(self, features: Dict[str, float], seconds: float, strategy: str = "TS") -> Optional[float]:
+        """Mức cost / initial_cost dự kiến đạt được sau ``seconds`` giây."""
+
+        if not self.ready or seconds <= 0:
+            return None
+        slope = self.coef[-1]
+        if slope >= 0:
+            return None  # Lịch sử chưa cho thấy chạy lâu hơn → cost thấp hơn
+        base = sum(c * v for c, v in zip(self.coef[:-1], self._row(features, strategy)))
+        ratio = math.exp((math.log(seconds) - base) / slope)
+        return min(1.0, max(min(RATIO_LEVELS), ratio))
+
+    def suggest(
+        self,
+        features: Dict[str, float],
+        strategy: str = "TS",
+        target_ratio: Optional[float] = None,
+        margin: float = 1.25,
+        min_seconds: float = 30.0,
+        max_seconds: float = 600.0,
+    ) -> Dict:
+        """Gợi ý time limit cho UI / server."""
+
+        strategy = strategy.upper()
+        if target_ratio is None:
+            target_ratio = self.typical_ratio.get(strategy) or (
+                statistics.median(self.typical_ratio.values()) if self.typical_ratio else None
+            )
+        suggestion = {
+            "available": self.ready and target_ratio is not None,
+            "strategy": strategy,
+            "target_ratio": round(target_ratio, 4) if target_ratio else None,
+            "n_runs": self.n_runs,
+            "n_samples": self.n_samples,
+            "rmse_log": round(self.rmse_log, 4) if self.rmse_log is not None else None,
+        }
+        if not suggestion["available"]:
+            suggestion["reason"] = f"Cần ít nhất {MIN_RUNS} lần chạy có đường cost trong lịch sử"
+            return suggestion
+        seconds = self.predict_seconds(features, target_ratio, strategy)
+        suggestion["predicted_seconds"] = round(seconds, 1)
+        limit = min(max_seconds, max(min_seconds, seconds * margin))
+        suggestion["suggested_time_limit"] = int(math.ceil(limit / 10.0) * 10)
+        suggestion["expected_ratio"] = {
+            str(int(limit_s)): (round(ratio, 4) if ratio is not None else None)
+            for limit_s in (60, 180, 400)
+            for ratio in [self.predict_ratio(features, limit_s, strategy)]
+        }
+        return suggestion
+
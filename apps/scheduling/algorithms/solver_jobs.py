@@ -0,0 +1,415 @@
+"""
+Job xếp lịch chạy nền (không cần broker ngoài).
+
+Hàng đợi là bảng ``SolverJob``; ``manage.py solver_worker`` chạy một pool
+process, mỗi process lặp: nhận job QUEUED (compare-and-set trên cột status),
+chạy ``solve_dot`` và ghi kết quả.
+
+- Loại trừ theo đợt: ràng buộc unique có điều kiện ``UQ_SOLVERJOB_ActiveDot``
+  (tối đa 1 job QUEUED/RUNNING mỗi đợt) - ``enqueue`` báo ``DotBusyError``.
+- Giới hạn đồng thời: ``max_concurrent_jobs`` (settings.SOLVER_MAX_CONCURRENT_JOBS,
+  mặc định số CPU - 1) áp dụng cho tổng số job RUNNING của mọi worker và job
+  chạy trực tiếp trong web process (``run_inline``, chỉ để debug); đếm và nhận
+  job trong cùng transaction dưới khóa ``CLAIM_LOCK``.
+- Huỷ: job QUEUED chuyển thẳng sang CANCELLED; job RUNNING được đặt
+  ``cancel_requested`` và vòng SA/TS dừng ở lần kiểm tra budget kế tiếp
+  (``JobStopCheck`` là ``SearchBudget.should_stop``, đồng thời ghi heartbeat).
+  Dừng sớm (``finish_early``) cũng dừng vòng SA/TS nhưng giữ và lưu lời giải
+  tốt nhất hiện có (job DONE) - dùng khi cost đã chững lại.
+- Tiến trình: ``JobProgressRecorder`` ghi snapshot mới nhất (phase, best/current
+  cost, temperature / tabu tenure, accept rate, breakdown, đường best cost) vào
+  ``SolverJob.progress``, tối đa 1 lần / settings.SOLVER_PROGRESS_INTERVAL giây;
+  endpoint SSE đọc lại bản ghi này.
+- Job RUNNING không có heartbeat quá settings.SOLVER_JOB_STALE_SECONDS (worker
+  bị kill) được đánh dấu FAILED khi worker khởi động / mỗi vòng poll.
+"""
+
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from ..models import DotXep, IdSequence, SolverJob
+from .solve_time_model import downsample_curve
+
+logger = logging.getLogger(__name__)
+
+# Dòng IdSequence dùng làm khóa khi nhận job (claim_next)
+CLAIM_LOCK = 'solver:claim'
+
+
+class DotBusyError(Exception):
+    """Đợt đã có job đang chờ / đang chạy"""
+
+    def __init__(self, job: Optional[SolverJob]):
+        self.job = job
+        super().__init__(f"Đợt đang có job #{job.id} ({job.status})" if job else "Đợt đang có job khác")
+
+
+def max_concurrent_jobs() -> int:
+    """Số job chạy đồng thời tối đa (không vượt quá số CPU)"""
+    cpus = os.cpu_count() or 1
+    configured = getattr(settings, 'SOLVER_MAX_CONCURRENT_JOBS', 0)
+    return max(1, min(cpus, configured or cpus - 1))
+
+
+def worker_name(index: int = 0) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}-{index}"
+
+
+def enqueue(dot_xep: DotXep, params: Dict, user: Optional[str] = None, run_inline: bool = False) -> SolverJob:
+    """
+    Tạo job cho đợt
+
+    Args:
+        run_inline: Xin chạy ngay trong process hiện tại (debug). Nếu còn chỗ trong
+            ``max_concurrent_jobs`` job được tạo ở trạng thái RUNNING (vẫn giữ loại trừ
+            theo đợt và hỗ trợ huỷ), ngược lại vào hàng đợi như job chạy nền -
+            người gọi kiểm tra ``job.status``
+
+    Raises:
+        DotBusyError: Đợt đã có job QUEUED/RUNNING
+    """
+    try:
+        with transaction.atomic():
+            if run_inline:
+                # Cùng khóa và cách đếm với claim_next: job inline chiếm 1 chỗ như job của worker
+                IdSequence.reserve(CLAIM_LOCK)
+                run_inline = SolverJob.objects.filter(status='RUNNING').count() < max_concurrent_jobs()
+            now = timezone.now()
+            return SolverJob.objects.create(
+                ma_dot=dot_xep,
+                params=params,
+                created_by=user,
+                status='RUNNING' if run_inline else 'QUEUED',
+                started_at=now if run_inline else None,
+                heartbeat_at=now if run_inline else None,
+                worker=f"web:{worker_name()}" if run_inline else None,
+            )
+    except IntegrityError:
+        raise DotBusyError(
+            SolverJob.objects.filter(ma_dot=dot_xep, status__in=SolverJob.ACTIVE_STATUSES).first()
+        )
+
+
+def claim_next(worker: str) -> Optional[SolverJob]:
+    """Nhận job QUEUED cũ nhất (None nếu hết job hoặc đã đủ số job đang chạy)
+
+    Đếm job RUNNING và nhận job trong cùng 1 transaction sau khi khóa dòng
+    IdSequence ``CLAIM_LOCK`` (UPDATE giữ khóa ghi tới hết transaction): các
+    worker nhận job lần lượt, không thể cùng thấy còn chỗ rồi cùng vượt giới hạn.
+    """
+    limit = max_concurrent_jobs()
+    with transaction.atomic():
+        IdSequence.reserve(CLAIM_LOCK)
+        if SolverJob.objects.filter(status='RUNNING').count() >= limit:
+            return None
+        candidates = SolverJob.objects.filter(status='QUEUED').order_by('created_at', 'id').values_list('id', flat=True)
+        for job_id in list(candidates[:20]):
+            now = timezone.now()
+            # Compare-and-set: job có thể vừa bị huỷ (QUEUED → CANCELLED không cần khóa)
+            claimed = SolverJob.objects.filter(id=job_id, status='QUEUED').update(
+                status='RUNNING', worker=worker, started_at=now, heartbeat_at=now
+            )
+            if claimed:
+                return SolverJob.objects.select_related('ma_dot').get(id=job_id)
+    return None
+
+
+def request_cancel(job: SolverJob, finish_early: bool = False) -> SolverJob:
+    """
+    Huỷ job: QUEUED → CANCELLED ngay, RUNNING → đặt cờ để solver tự dừng
+
+    Args:
+        finish_early: Job đang chạy dừng tìm kiếm nhưng vẫn lưu lời giải tốt nhất
+    """
+    now = timezone.now()
+    if SolverJob.objects.filter(id=job.id, status='QUEUED').update(
+        status='CANCELLED', cancel_requested=True, finished_at=now
+    ):
+        logger.info(f"Job #{job.id} cancelled before start")
+    elif SolverJob.objects.filter(id=job.id, status='RUNNING').update(
+        **({'finish_early': True} if finish_early else {'cancel_requested': True})
+    ):
+        logger.info(f"Job #{job.id} {'finish early' if finish_early else 'cancel'} requested")
+    job.refresh_from_db()
+    return job
+
+
+def fail_stale_jobs() -> int:
+    """Đánh dấu FAILED các job RUNNING mất heartbeat (worker bị kill / restart)"""
+    stale_after = getattr(settings, 'SOLVER_JOB_STALE_SECONDS', 600)
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    count = SolverJob.objects.filter(status='RUNNING', heartbeat_at__lt=cutoff).update(
+        status='FAILED', finished_at=timezone.now(), error=f'Worker không phản hồi quá {stale_after}s'
+    )
+    if count:
+        logger.warning(f"Marked {count} stale solver job(s) as FAILED")
+    return count
+
+
+class JobStopCheck:
+    """``should_stop`` cho SearchBudget: đọc cờ huỷ / dừng sớm + ghi heartbeat, tối đa 1 lần / interval giây"""
+
+    def __init__(self, job_id: int, interval: float = 1.0):
+        self.job_id = job_id
+        self.interval = interval
+        self.cancelled = False
+        self.finish_early = False
+        self._last_check = 0.0
+
+    def __call__(self) -> bool:
+        if self.cancelled or self.finish_early:
+            return True
+        now = time.monotonic()
+        if now - self._last_check < self.interval:
+            return False
+        self._last_check = now
+        jobs = SolverJob.objects.filter(id=self.job_id)
+        jobs.update(heartbeat_at=timezone.now())
+        flags = jobs.values_list('cancel_requested', 'finish_early').first()
+        if flags:
+            self.cancelled, self.finish_early = flags
+        return self.cancelled or self.finish_early
+
+
+class JobProgressRecorder:
+    """
+    ``on_progress`` cho AlgorithmRunner: gộp các điểm tiến trình thành 1 snapshot và
+    ghi vào SolverJob.progress (kèm heartbeat)
+
+    Ghi ngay khi đổi phase, còn lại tối đa 1 lần / interval giây; ``seq`` tăng mỗi
+    lần ghi để client SSE biết có dữ liệu mới.
+    """
+
+    def __init__(self, job_id: int, interval: Optional[float] = None, max_curve_points: int = 100):
+        self.job_id = job_id
+        self.interval = interval if interval is not None else getattr(settings, 'SOLVER_PROGRESS_INTERVAL', 1.0)
+        self.max_curve_points = max_curve_points
+        self.snapshot: Dict = {'seq': 0, 'phase': 'queued', 'curve': []}
+        self._last_write = 0.0
+
+    def __call__(self, point: Dict) -> None:
+        phase_changed = point.get('phase', self.snapshot['phase']) != self.snapshot['phase']
+        self.snapshot.update(point)
+        if 'best_cost' in point and 'elapsed' in point:
+            self.snapshot['curve'] = downsample_curve(
+                self.snapshot['curve'] + [[point['elapsed'], point['best_cost']]], self.max_curve_points
+            )
+        now = time.monotonic()
+        if phase_changed or now - self._last_write >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        self._last_write = time.monotonic()
+        self.snapshot['seq'] += 1
+        self.snapshot['updated_at'] = timezone.now().isoformat()
+        SolverJob.objects.filter(id=self.job_id).update(progress=self.snapshot, heartbeat_at=timezone.now())
+
+
+def solve_dot(
+    ma_dot: str,
+    params: Dict,
+    should_stop: Optional[Callable[[], bool]] = None,
+    on_progress: Optional[Callable[[Dict], None]] = None
+) -> Tuple[int, Dict]:
+    """
+    Chạy thuật toán cho 1 đợt (dùng chung cho API chạy trực tiếp và worker)
+
+    Args:
+        params: strategy, init_method, time_limit (None khi chạy theo budget đếm),
+            time_limit_auto, seed, max_iterations, max_evaluations, decompose, batch_eval, force, save_to_db
+        should_stop: Xem AlgorithmRunner.run_optimization. Nếu callback có thuộc tính
+            ``finish_early`` = True khi dừng (JobStopCheck), lời giải tốt nhất vẫn được lưu;
+            ngược lại lần chạy bị huỷ và không lưu
+        on_progress: Callback tiến trình (xem AlgorithmRunner.run_optimization), thêm các
+            phase 'prepare' và 'save'
+
+    Returns:
+        (HTTP status, response dict theo format của algo_scheduler_run_api)
+    """
+    from .algorithms_runner import AlgorithmRunner
+    from .solve_time_model import instance_features
+
+    strategy = params['strategy']
+    init_method = params['init_method']
+    seed = params.get('seed', 42)
+    time_limit = params.get('time_limit')
+
+    runner = AlgorithmRunner(ma_dot=ma_dot, seed=seed)
+    report = on_progress or (lambda point: None)
+
+    logger.info("📊 Step 1: Chuẩn bị dữ liệu (export DB sang CTT)")
+    report({'phase': 'prepare'})
+    if not runner.prepare_data():
+        return 400, {
+            'status': 'error',
+            'message': 'Không thể chuẩn bị dữ liệu. Kiểm tra xem DotXep có tồn tại và có dữ liệu hợp lệ không.'
+        }
+
+    suggestion = None
+    if params.get('time_limit_auto'):
+        # Không cấp CPU quá mức cần: dùng thời gian dự đoán để đạt mức cost thường gặp
+        suggestion = runner.solve_time_model().suggest(
+            instance_features(runner.instance), strategy=strategy
+        )
+        time_limit = float(suggestion.get('suggested_time_limit') or 180)
+        logger.info(f"   Time limit (auto): {time_limit}s - {suggestion}")
+
+    logger.info("🔧 Step 2: Chạy thuật toán optimization")
+    result = runner.run_optimization(
+        strategy=strategy,
+        init_method=init_method,
+        time_limit=time_limit,
+        max_iterations=params.get('max_iterations'),
+        max_evaluations=params.get('max_evaluations'),
+        decompose=params.get('decompose', False),
+        batch_eval=params.get('batch_eval', False),
+        force=params.get('force', False),
+        should_stop=should_stop,
+        on_progress=on_progress
+    )
+
+    if not result or not result.get('success'):
+        error_msg = result.get('error', 'Thuật toán thất bại') if result else 'Lỗi không xác định'
+        logger.error(f"❌ Optimization failed: {error_msg}")
+        return 500, {
+            'status': 'error',
+            'message': error_msg,
+            'cancelled': bool(result and result.get('cancelled')),
+        }
+
+    stopped_early = result.get('cancelled', False)
+    # Dừng theo yêu cầu: "dừng sớm" vẫn giữ lời giải tốt nhất, "huỷ" thì bỏ
+    cancelled = stopped_early and not getattr(should_stop, 'finish_early', False)
+    if params.get('save_to_db', True) and not cancelled:
+        logger.info("💾 Step 3: Lưu kết quả vào database")
+        report({'phase': 'save'})
+        assignments = {
+            int(lecture_id): (data['period_absolute'], runner.instance.room_by_id[data['room_id']])
+            for lecture_id, data in result.get('assignments', {}).items()
+            if data['room_id'] in runner.instance.room_by_id
+        }
+        result['save_stats'] = runner.save_to_database(assignments)
+        result['saved_to_db'] = result['save_stats'] is not None
+        if not result['saved_to_db']:
+            logger.warning("⚠️  Lưu vào database thất bại, nhưng optimization thành công")
+            result['warning'] = 'Lưu vào database thất bại'
+    else:
+        result['saved_to_db'] = False
+
+    logger.info(f"✅ Xếp lịch hoàn tất!")
+    logger.info(f"   Initial cost: {result['initial_cost']}")
+    logger.info(f"   Final cost: {result['final_cost']}")
+    logger.info(f"   Improvement: {result['improvement']} ({result['improvement_percent']:.1f}%)")
+    logger.info(f"   Teacher preferences: {result['breakdown']['teacher_preferences']} violations")
+
+    response = {
+        'status': 'success',
+        'ma_dot': result['ma_dot'],
+        'initial_cost': result['initial_cost'],
+        'final_cost': result['final_cost'],
+        'improvement': result['improvement'],
+        'improvement_percent': round(result['improvement_percent'], 2),
+        'time_elapsed': round(result['time_elapsed'], 2),
+        'breakdown': result['breakdown'],
+        'sol_file': result['sol_file'],
+        'saved_to_db': result['saved_to_db'],
+        'save_stats': result.get('save_stats'),
+        'cancelled': cancelled,
+        'stopped_early': stopped_early and not cancelled,
+        'message': (
+            f'Đã dừng theo yêu cầu - lời giải tốt nhất có cost {result["final_cost"]} (không lưu vào database)'
+            if cancelled else
+            f'Đã dừng sớm theo yêu cầu - cost giảm từ {result["initial_cost"]} xuống {result["final_cost"]} ({result["improvement_percent"]:.1f}%)'
+            if stopped_early else
+            f'Xếp lịch thành công! Cost giảm từ {result["initial_cost"]} xuống {result["final_cost"]} ({result["improvement_percent"]:.1f}%)'
+        ),
+        'details': {
+            'strategy': strategy,
+            'init_method': init_method,
+            'seed': seed,
+            'budget': result.get('budget'),
+            'cached': result.get('cached', False),
+            'solver_run_id': result.get('solver_run_id'),
+            'lectures_scheduled': len(result.get('assignments', {}))
+        }
+    }
+    if suggestion is not None:
+        response['details']['time_limit_suggestion'] = suggestion
+    if result.get('components'):
+        # Thống kê từng thành phần khi chạy decompose
+        response['details']['components'] = [
+            {key: value for key, value in entry.items() if key != 'breakdown'}
+            for entry in result['components']
+        ]
+    if 'warning' in result:
+        response['warning'] = result['warning']
+    return 200, response
+
+
+def run_job(job: SolverJob) -> Tuple[int, SolverJob]:
+    """Chạy job đã ở trạng thái RUNNING và ghi kết quả
+
+    Returns:
+        (HTTP status của solve_dot, job sau khi cập nhật)
+    """
+    stop_check = JobStopCheck(job.id)
+    progress = JobProgressRecorder(job.id)
+    try:
+        status_code, response = solve_dot(job.ma_dot_id, job.params, should_stop=stop_check, on_progress=progress)
+    except Exception as e:
+        logger.exception(f"Job #{job.id} failed: {e}")
+        status_code, response = 500, {'status': 'error', 'message': f'Lỗi: {str(e)}'}
+    progress({'phase': 'done'})
+
+    if response.get('cancelled') or (stop_check.cancelled and response['status'] != 'success'):
+        status = 'CANCELLED'
+    elif response['status'] == 'success':
+        status = 'DONE'
+    else:
+        status = 'FAILED'
+    solver_run_id = response.get('details', {}).get('solver_run_id')
+    SolverJob.objects.filter(id=job.id).update(
+        status=status,
+        result=response,
+        error=None if status == 'DONE' else response.get('message', '')[:500],
+        solver_run_id=solver_run_id,
+        finished_at=timezone.now(),
+    )
+    job.refresh_from_db()
+    logger.info(f"Job #{job.id} ({job.ma_dot_id}) finished: {status}")
+    return status_code, job
+
+
+def worker_loop(worker: str, poll_interval: float = 2.0, once: bool = False,
+                should_exit: Optional[Callable[[], bool]] = None) -> int:
+    """
+    Vòng lặp của 1 worker process
+
+    Args:
+        once: Thoát khi hàng đợi trống (thay vì chờ job mới)
+        should_exit: Callback dừng worker giữa các job (vd. nhận SIGTERM)
+
+    Returns:
+        Số job đã chạy
+    """
+    processed = 0
+    while not (should_exit and should_exit()):
+        fail_stale_jobs()
+        job = claim_next(worker)
+        if job is None:
+            if once and not SolverJob.objects.filter(status='QUEUED').exists():
+                break
+            time.sleep(poll_interval)
+            continue
+        logger.info(f"[{worker}] Job #{job.id}: {job.ma_dot_id} {job.params}")
+        run_job(job)
+        processed += 1
+    return processed
@@ -8,4 +8,4 @@ class SchedulingConfig(AppConfig):
     
     def ready(self):
         """Import signals and perform startup tasks"""
-        pass
+        from . import signals  # noqa: F401
@@ -0,0 +1,131 @@
+"""
+Management command đo thời gian và bộ nhớ xuất Excel TKB
+Usage: python manage.py benchmark_excel_export [--rows 10000] [--source-dot DOT1]
+
+Tạo 1 đợt giả với N dòng TKB (trong transaction, rollback khi xong), so sánh
+workbook dựng trong bộ nhớ (style riêng từng ô) với bản streaming write-only
+của algo_scheduler_export_excel_api.
+"""
+
+import time
+import tracemalloc
+from itertools import product
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+
+from apps.scheduling.models import (
+    DotXep, IdSequence, LopMonHoc, PhanCong, PhongHoc, ThoiKhoaBieu, TimeSlot
+)
+
+BENCHMARK_DOT = 'BENCH_EXPORT'
+
+
+def _in_memory_export(ma_dot):
+    """Cách cũ: Workbook thường, object đầy đủ, style gán cho từng ô"""
+    from openpyxl import Workbook
+    from openpyxl.styles import Alignment, Border, Side
+    from io import BytesIO
+
+    border = Border(left=Side(style='thin'), right=Side(style='thin'),
+                    top=Side(style='thin'), bottom=Side(style='thin'))
+    lop_to_gv = {
+        pc.ma_lop.ma_lop: pc.ma_gv
+        for pc in PhanCong.objects.filter(ma_dot_id=ma_dot).select_related('ma_lop', 'ma_gv')
+    }
+    wb = Workbook()
+    ws = wb.active
+    tkb_list = ThoiKhoaBieu.objects.filter(ma_dot_id=ma_dot).select_related(
+        'ma_lop', 'ma_lop__ma_mon_hoc', 'ma_phong', 'time_slot_id__ca'
+    ).order_by('time_slot_id__thu', 'time_slot_id__ca__ma_khung_gio')
+    for row_num, tkb in enumerate(tkb_list, 2):
+        gv = lop_to_gv.get(tkb.ma_lop.ma_lop)
+        row_data = [
+            row_num - 1, tkb.ma_lop.ma_lop, tkb.ma_lop.ma_mon_hoc.ten_mon_hoc, tkb.ma_lop.nhom_mh,
+            gv.ma_gv if gv else 'N/A', gv.ten_gv if gv else 'Chưa phân công',
+            tkb.ma_phong.ma_phong, tkb.ma_phong.loai_phong, tkb.ma_phong.suc_chua,
+            tkb.time_slot_id.thu, tkb.time_slot_id.ca.ma_khung_gio,
+            str(tkb.time_slot_id.ca.gio_bat_dau), str(tkb.time_slot_id.ca.gio_ket_thuc), tkb.tuan_hoc,
+        ]
+        for col_num, value in enumerate(row_data, 1):
+            cell = ws.cell(row=row_num, column=col_num)
+            cell.value = str(value) if value is not None else ''
+            cell.border = border
+            cell.alignment = Alignment(vertical='center')
+    output = BytesIO()
+    wb.save(output)
+    return output.getbuffer().nbytes
+
+
+def _streaming_export(ma_dot):
+    """Bản streaming: gọi API thật và đọc hết response"""
+    from apps.sap_lich.views import algo_scheduler_export_excel_api
+
+    response = algo_scheduler_export_excel_api(RequestFactory().get('/', {'ma_dot': ma_dot}))
+    if response.status_code != 200:
+        raise CommandError(f'Export failed: {response.content[:200]}')
+    size = sum(len(chunk) for chunk in response.streaming_content)
+    # Không gọi response.close(): signal request_finished sẽ đóng kết nối DB giữa transaction
+    response.file_to_stream.close()
+    return size
+
+
+class Command(BaseCommand):
+    help = 'Benchmark in-memory vs streaming Excel export of a synthetic timetable'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Number of TKB rows to generate')
+        parser.add_argument(
+            '--source-dot',
+            type=str,
+            default=None,
+            help='Dot whose PhanCong/classes are reused (default: first dot with assignments)'
+        )
+
+    def _build_dot(self, rows, source_dot):
+        source = DotXep.objects.filter(ma_dot=source_dot).first() if source_dot else (
+            DotXep.objects.filter(phan_cong_list__isnull=False).distinct().first()
+        )
+        if source is None:
+            raise CommandError('Không có đợt xếp nào có phân công để làm dữ liệu mẫu')
+        dot = DotXep.objects.create(ma_dot=BENCHMARK_DOT, ma_du_kien_dt=source.ma_du_kien_dt, ten_dot='Benchmark')
+        assignments = list(PhanCong.objects.filter(ma_dot=source).values_list('ma_lop_id', 'ma_gv_id'))
+        PhanCong.objects.bulk_create(
+            [PhanCong(ma_dot=dot, ma_lop_id=ma_lop, ma_gv_id=ma_gv) for ma_lop, ma_gv in assignments]
+        )
+        lops = list(LopMonHoc.objects.filter(ma_lop__in=[ma_lop for ma_lop, _ in assignments]))
+        slots = list(TimeSlot.objects.values_list('time_slot_id', flat=True))
+        rooms = list(PhongHoc.objects.values_list('ma_phong', flat=True))
+        combos = list(product(lops, slots, rooms))[:rows]
+        if len(combos) < rows:
+            self.stdout.write(self.style.WARNING(f'Chỉ tạo được {len(combos)} dòng (lớp × slot × phòng)'))
+        codes = IdSequence.next_codes(ThoiKhoaBieu, len(combos))
+        ThoiKhoaBieu.objects.bulk_create([
+            ThoiKhoaBieu(ma_tkb=code, ma_dot=dot, ma_lop=lop, time_slot_id_id=slot, ma_phong_id=room,
+                         tuan_hoc='1' * 15)
+            for code, (lop, slot, room) in zip(codes, combos)
+        ], batch_size=2000)
+        return len(combos)
+
+    def _measure(self, label, func):
+        start = time.perf_counter()
+        size = func(BENCHMARK_DOT)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        func(BENCHMARK_DOT)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f'{label:<12} {elapsed:8.2f} s   peak {peak / 1024 / 1024:8.1f} MiB   file {size / 1024:8.0f} KiB'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = self._build_dot(options['rows'], options['source_dot'])
+            self.stdout.write(self.style.WARNING(f'🔄 Benchmark Excel export: {created} rows'))
+            self._measure('in-memory', _in_memory_export)
+            self._measure('streaming', _streaming_export)
+            transaction.set_rollback(True)  # Không giữ lại dữ liệu giả
+        self.stdout.write(self.style.SUCCESS('✅ Done (synthetic data rolled back)'))
@@ -0,0 +1,86 @@
+"""
+Management command chạy worker xếp lịch nền
+Usage: python manage.py solver_worker [--workers 3] [--poll-interval 2] [--once]
+"""
+
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _worker_process(index, poll_interval, once):
+    """Entry point của từng worker process"""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()  # start method "spawn" (Windows): process con chưa setup Django
+
+    from apps.scheduling.algorithms.solver_jobs import worker_loop, worker_name
+
+    stopping = []
+    # Dừng sau job hiện tại khi nhận SIGTERM; job đang chạy không bị cắt ngang
+    signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker_loop(worker_name(index), poll_interval=poll_interval, once=once, should_exit=lambda: bool(stopping))
+
+
+class Command(BaseCommand):
+    help = 'Run background solver workers (jobs from tb_SOLVER_JOB)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Number of worker processes (default: SOLVER_MAX_CONCURRENT_JOBS / CPU count - 1)'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds between queue polls when idle'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit when the queue is empty'
+        )
+
+    def handle(self, *args, **options):
+        from apps.scheduling.algorithms.solver_jobs import fail_stale_jobs, max_concurrent_jobs
+
+        workers = options['workers'] or max_concurrent_jobs()
+        stale = fail_stale_jobs()
+        self.stdout.write(self.style.WARNING(
+            f'🔄 Starting {workers} solver worker(s), concurrency limit {max_concurrent_jobs()}'
+        ))
+        if stale:
+            self.stdout.write(f'Marked {stale} stale job(s) as FAILED')
+
+        # Không chia sẻ kết nối DB của process cha cho các process con (fork)
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(
+                target=_worker_process,
+                args=(index, options['poll_interval'], options['once']),
+                name=f'solver-worker-{index}'
+            )
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Stopping workers after their current job...'))
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()  # SIGTERM → worker dừng sau job hiện tại
+            for process in processes:
+                process.join()
+
+        self.stdout.write(self.style.SUCCESS('✅ Solver workers stopped'))
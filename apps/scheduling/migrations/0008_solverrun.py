@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-18 22:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0007_alter_tkblog_action'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SolverRun',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_column='NgayTao', verbose_name='Thời gian chạy')),
+                ('status', models.CharField(choices=[('SUCCESS', 'Thành công'), ('CACHED', 'Dùng kết quả cache'), ('FAILED', 'Thất bại')], db_column='TrangThai', default='SUCCESS', max_length=10, verbose_name='Trạng thái')),
+                ('algorithm', models.CharField(db_column='ThuatToan', max_length=10, verbose_name='Thuật toán')),
+                ('init_method', models.CharField(blank=True, db_column='KhoiTao', max_length=30, null=True, verbose_name='Khởi tạo')),
+                ('seed', models.IntegerField(blank=True, db_column='Seed', null=True, verbose_name='Seed')),
+                ('time_limit', models.FloatField(blank=True, db_column='TimeLimit', null=True, verbose_name='Time limit (s)')),
+                ('budget', models.JSONField(blank=True, db_column='Budget', null=True, verbose_name='Budget')),
+                ('decompose', models.BooleanField(db_column='Decompose', default=False, verbose_name='Tách thành phần')),
+                ('instance_hash', models.CharField(blank=True, db_column='InstanceHash', default='', max_length=64, verbose_name='Instance hash')),
+                ('release', models.CharField(blank=True, db_column='PhienBan', default='', max_length=50, verbose_name='Phiên bản')),
+                ('features', models.JSONField(blank=True, db_column='DacTrung', null=True, verbose_name='Đặc trưng instance')),
+                ('initial_cost', models.FloatField(blank=True, db_column='CostBanDau', null=True, verbose_name='Cost ban đầu')),
+                ('final_cost', models.FloatField(blank=True, db_column='CostCuoi', null=True, verbose_name='Cost cuối')),
+                ('breakdown', models.JSONField(blank=True, db_column='Breakdown', null=True, verbose_name='Chi tiết ràng buộc mềm')),
+                ('hard_violations', models.IntegerField(blank=True, db_column='ViPhamCung', null=True, verbose_name='Vi phạm cứng')),
+                ('time_elapsed', models.FloatField(blank=True, db_column='ThoiGian', null=True, verbose_name='Thời gian (s)')),
+                ('phase_timings', models.JSONField(blank=True, db_column='ThoiGianPha', null=True, verbose_name='Thời gian từng pha (s)')),
+                ('cost_curve', models.JSONField(blank=True, db_column='DuongCost', null=True, verbose_name='Đường cost [[giây, best_cost], ...]')),
+                ('saved_to_db', models.BooleanField(db_column='DaLuuTKB', default=False, verbose_name='Đã lưu TKB')),
+                ('details', models.JSONField(blank=True, db_column='ChiTiet', null=True, verbose_name='Chi tiết khác')),
+                ('error', models.CharField(blank=True, db_column='Loi', max_length=500, null=True, verbose_name='Lỗi')),
+                ('ma_dot', models.ForeignKey(db_column='MaDot', on_delete=django.db.models.deletion.CASCADE, related_name='solver_run_list', to='scheduling.dotxep', verbose_name='Đợt xếp')),
+            ],
+            options={
+                'verbose_name': 'Lần chạy solver',
+                'verbose_name_plural': 'Lịch sử chạy solver',
+                'db_table': 'tb_SOLVER_RUN',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['ma_dot', 'created_at'], name='IX_SOLVERRUN_Dot'), models.Index(fields=['status', 'algorithm'], name='IX_SOLVERRUN_Status')],
+            },
+        ),
+    ]
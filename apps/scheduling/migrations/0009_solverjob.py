@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-18 22:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0008_solverrun'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='solverrun',
+            name='status',
+            field=models.CharField(choices=[('SUCCESS', 'Thành công'), ('CACHED', 'Dùng kết quả cache'), ('CANCELLED', 'Đã huỷ'), ('FAILED', 'Thất bại')], db_column='TrangThai', default='SUCCESS', max_length=10, verbose_name='Trạng thái'),
+        ),
+        migrations.CreateModel(
+            name='SolverJob',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('QUEUED', 'Đang chờ'), ('RUNNING', 'Đang chạy'), ('DONE', 'Hoàn thành'), ('FAILED', 'Thất bại'), ('CANCELLED', 'Đã huỷ')], db_column='TrangThai', default='QUEUED', max_length=10, verbose_name='Trạng thái')),
+                ('params', models.JSONField(db_column='ThamSo', verbose_name='Tham số')),
+                ('created_by', models.CharField(blank=True, db_column='NguoiTao', max_length=150, null=True, verbose_name='Người tạo')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_column='NgayTao', verbose_name='Thời gian tạo')),
+                ('started_at', models.DateTimeField(blank=True, db_column='BatDau', null=True, verbose_name='Bắt đầu')),
+                ('finished_at', models.DateTimeField(blank=True, db_column='KetThuc', null=True, verbose_name='Kết thúc')),
+                ('heartbeat_at', models.DateTimeField(blank=True, db_column='Heartbeat', null=True, verbose_name='Heartbeat')),
+                ('worker', models.CharField(blank=True, db_column='Worker', max_length=100, null=True, verbose_name='Worker')),
+                ('cancel_requested', models.BooleanField(db_column='YeuCauHuy', default=False, verbose_name='Yêu cầu huỷ')),
+                ('result', models.JSONField(blank=True, db_column='KetQua', null=True, verbose_name='Kết quả')),
+                ('error', models.CharField(blank=True, db_column='Loi', max_length=500, null=True, verbose_name='Lỗi')),
+                ('ma_dot', models.ForeignKey(db_column='MaDot', on_delete=django.db.models.deletion.CASCADE, related_name='solver_job_list', to='scheduling.dotxep', verbose_name='Đợt xếp')),
+                ('solver_run', models.ForeignKey(blank=True, db_column='SolverRunId', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='job_list', to='scheduling.solverrun', verbose_name='Lần chạy')),
+            ],
+            options={
+                'verbose_name': 'Job xếp lịch',
+                'verbose_name_plural': 'Hàng đợi xếp lịch',
+                'db_table': 'tb_SOLVER_JOB',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='IX_SOLVERJOB_Status')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['QUEUED', 'RUNNING'])), fields=('ma_dot',), name='UQ_SOLVERJOB_ActiveDot')],
+            },
+        ),
+    ]
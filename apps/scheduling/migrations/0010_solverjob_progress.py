@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 22:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0009_solverjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='solverjob',
+            name='finish_early',
+            field=models.BooleanField(db_column='DungSom', default=False, verbose_name='Dừng sớm (giữ lời giải tốt nhất)'),
+        ),
+        migrations.AddField(
+            model_name='solverjob',
+            name='progress',
+            field=models.JSONField(blank=True, db_column='TienTrinh', null=True, verbose_name='Tiến trình (snapshot mới nhất)'),
+        ),
+    ]
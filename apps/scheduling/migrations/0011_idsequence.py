@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 22:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0010_solverjob_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('ten_chuoi', models.CharField(db_column='TenChuoi', max_length=50, primary_key=True, serialize=False, verbose_name='Tên chuỗi')),
+                ('gia_tri_cuoi', models.BigIntegerField(db_column='GiaTriCuoi', default=0, verbose_name='Giá trị đã cấp')),
+            ],
+            options={
+                'verbose_name': 'Bộ đếm mã',
+                'verbose_name_plural': 'Bộ đếm mã',
+                'db_table': 'tb_ID_SEQUENCE',
+                'default_permissions': (),
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 23:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduling', '0011_idsequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dotxep',
+            name='phien_ban_tkb',
+            field=models.PositiveIntegerField(db_column='PhienBanTKB', default=0, editable=False, verbose_name='Phiên bản TKB'),
+        ),
+    ]
@@ -4,13 +4,82 @@ Chuyển đổi từ SQL Server schema sang Django ORM
 UPDATED: Sync với csdl_tkb.sql thật
 """
 
-from django.db import models
+import threading
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Subquery
+from django.db.models.functions import Coalesce, Greatest
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 
 
+# Có lần tăng phiên bản dữ liệu dùng chung đang chờ transaction hiện tại (của thread) commit
+_shared_schedule_bump = threading.local()
+
+
+class IdSequence(models.Model):
+    """Bộ đếm cấp mã tự sinh - tb_ID_SEQUENCE
+    Mỗi dòng là 1 chuỗi mã (VD: "tb_TKB:TKB-"), GiaTriCuoi là số đã cấp gần nhất.
+    Cấp N mã bằng 1 câu UPDATE (khóa dòng tới hết transaction) thay vì quét
+    toàn bảng tìm mã lớn nhất - không trùng khi nhiều request/process cùng tạo."""
+    ten_chuoi = models.CharField(max_length=50, primary_key=True, db_column='TenChuoi', verbose_name="Tên chuỗi")
+    gia_tri_cuoi = models.BigIntegerField(default=0, db_column='GiaTriCuoi', verbose_name="Giá trị đã cấp")
+    
+    class Meta:
+        db_table = 'tb_ID_SEQUENCE'
+        verbose_name = "Bộ đếm mã"
+        verbose_name_plural = "Bộ đếm mã"
+        default_permissions = ()
+    
+    @classmethod
+    def reserve(cls, name, count=1, initial=None):
+        """Giữ chỗ ``count`` giá trị liên tiếp của chuỗi ``name``, trả về range.
+        ``initial()`` cho giá trị bắt đầu khi chuỗi chưa có (chỉ gọi 1 lần)."""
+        with transaction.atomic():
+            if not cls.objects.filter(ten_chuoi=name).update(gia_tri_cuoi=F('gia_tri_cuoi') + count):
+                start = initial() if initial else 0
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(ten_chuoi=name, gia_tri_cuoi=start + count)
+                    return range(start + 1, start + count + 1)
+                except IntegrityError:
+                    # Process khác vừa tạo chuỗi - cấp tiếp từ giá trị của nó
+                    cls.objects.filter(ten_chuoi=name).update(gia_tri_cuoi=F('gia_tri_cuoi') + count)
+            last = cls.objects.values_list('gia_tri_cuoi', flat=True).get(ten_chuoi=name)
+        return range(last - count + 1, last + 1)
+    
+    @staticmethod
+    def _name(model, prefix):
+        return f"{model._meta.db_table}:{prefix}"
+    
+    @classmethod
+    def next_codes(cls, model, count=1, prefix=None, width=None):
+        """Cấp ``count`` mã dạng {prefix}{số} cho khóa chính của ``model``
+        (mặc định model.CODE_PREFIX / CODE_WIDTH). Lần đầu khởi tạo từ mã lớn nhất hiện có."""
+        prefix = prefix if prefix is not None else model.CODE_PREFIX
+        width = width or model.CODE_WIDTH
+        pk_name = model._meta.pk.name
+        
+        def initial():
+            codes = model.objects.filter(**{f'{pk_name}__startswith': prefix}).values_list(pk_name, flat=True)
+            return max((int(code[len(prefix):]) for code in codes if code[len(prefix):].isdigit()), default=0)
+        
+        return [f'{prefix}{num:0{width}d}' for num in cls.reserve(cls._name(model, prefix), count, initial)]
+    
+    @classmethod
+    def observe(cls, model, code, prefix=None):
+        """Mã nhập tay (VD: import Excel) cùng dạng: đẩy bộ đếm qua mã đó để không cấp trùng"""
+        prefix = prefix if prefix is not None else model.CODE_PREFIX
+        suffix = str(code)[len(prefix):]
+        if str(code).startswith(prefix) and suffix.isdigit():
+            cls.objects.filter(ten_chuoi=cls._name(model, prefix)).update(
+                gia_tri_cuoi=Greatest(F('gia_tri_cuoi'), int(suffix))
+            )
+
+
 class Khoa(models.Model):
     """Khoa - Faculty/Department - tb_KHOA"""
+    CODE_PREFIX, CODE_WIDTH = 'KHOA-', 3  # Mã tự sinh, cấp qua IdSequence
     ma_khoa = models.CharField(max_length=12, primary_key=True, blank=True, db_column='MaKhoa', verbose_name="Mã khoa")
     ten_khoa = models.CharField(max_length=200, db_column='TenKhoa', verbose_name="Tên khoa")
     
@@ -24,12 +93,7 @@ class Khoa(models.Model):
     def save(self, *args, **kwargs):
         """Auto-generate ma_khoa: KHOA-001, KHOA-002, ..."""
         if not self.ma_khoa:
-            last = Khoa.objects.filter(ma_khoa__startswith='KHOA-').order_by('-ma_khoa').first()
-            if last and last.ma_khoa[5:].isdigit():
-                num = int(last.ma_khoa[5:]) + 1
-                self.ma_khoa = f'KHOA-{num:03d}'
-            else:
-                self.ma_khoa = 'KHOA-001'
+            self.ma_khoa = IdSequence.next_codes(Khoa)[0]
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -56,13 +120,7 @@ class BoMon(models.Model):
         if not self.ma_bo_mon:
             # Extract khoa number from ma_khoa (e.g., KHOA-001 -> 001)
             khoa_num = self.ma_khoa_id.split('-')[-1] if '-' in self.ma_khoa_id else '000'
-            prefix = f'BM-{khoa_num}-'
-            last = BoMon.objects.filter(ma_bo_mon__startswith=prefix).order_by('-ma_bo_mon').first()
-            if last and last.ma_bo_mon[len(prefix):].isdigit():
-                num = int(last.ma_bo_mon[len(prefix):]) + 1
-                self.ma_bo_mon = f'{prefix}{num:03d}'
-            else:
-                self.ma_bo_mon = f'{prefix}001'
+            self.ma_bo_mon = IdSequence.next_codes(BoMon, prefix=f'BM-{khoa_num}-', width=3)[0]
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -71,6 +129,7 @@ class BoMon(models.Model):
 
 class GiangVien(models.Model):
     """Giảng viên - Teacher/Lecturer - tb_GIANG_VIEN"""
+    CODE_PREFIX, CODE_WIDTH = 'GV', 3  # Mã tự sinh, cấp qua IdSequence
     ma_gv = models.CharField(max_length=12, primary_key=True, blank=True, db_column='MaGV', verbose_name="Mã giảng viên")
     ma_bo_mon = models.ForeignKey(BoMon, on_delete=models.CASCADE, db_column='MaBoMon',
                                   related_name='giang_vien_list', verbose_name="Bộ môn")
@@ -92,12 +151,7 @@ class GiangVien(models.Model):
     def save(self, *args, **kwargs):
         """Auto-generate ma_gv: GV001, GV002, ..."""
         if not self.ma_gv:
-            last = GiangVien.objects.filter(ma_gv__startswith='GV').order_by('-ma_gv').first()
-            if last and last.ma_gv[2:].isdigit():
-                num = int(last.ma_gv[2:]) + 1
-                self.ma_gv = f'GV{num:03d}'
-            else:
-                self.ma_gv = 'GV001'
+            self.ma_gv = IdSequence.next_codes(GiangVien)[0]
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -252,6 +306,7 @@ class PhongHoc(models.Model):
 
 class RangBuocMem(models.Model):
     """Ràng buộc mềm - tb_RANG_BUOC_MEM"""
+    CODE_PREFIX, CODE_WIDTH = 'RBM-', 3  # Mã tự sinh, cấp qua IdSequence
     ma_rang_buoc = models.CharField(max_length=15, primary_key=True, blank=True, db_column='MaRangBuoc', 
                                    verbose_name="Mã ràng buộc")
     ten_rang_buoc = models.CharField(max_length=200, db_column='TenRangBuoc', verbose_name="Tên ràng buộc")
@@ -268,12 +323,7 @@ class RangBuocMem(models.Model):
     def save(self, *args, **kwargs):
         """Auto-generate ma_rang_buoc: RBM-001, RBM-002, ..."""
         if not self.ma_rang_buoc:
-            last = RangBuocMem.objects.filter(ma_rang_buoc__startswith='RBM-').order_by('-ma_rang_buoc').first()
-            if last and last.ma_rang_buoc[4:].isdigit():
-                num = int(last.ma_rang_buoc[4:]) + 1
-                self.ma_rang_buoc = f'RBM-{num:03d}'
-            else:
-                self.ma_rang_buoc = 'RBM-001'
+            self.ma_rang_buoc = IdSequence.next_codes(RangBuocMem)[0]
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -282,6 +332,7 @@ class RangBuocMem(models.Model):
 
 class LopMonHoc(models.Model):
     """Lớp môn học - Class - tb_LOP_MONHOC"""
+    CODE_PREFIX, CODE_WIDTH = 'LOP-', 8  # Mã tự sinh, cấp qua IdSequence
     ma_lop = models.CharField(max_length=12, primary_key=True, blank=True, db_column='MaLop', verbose_name="Mã lớp")
     ma_mon_hoc = models.ForeignKey(MonHoc, on_delete=models.CASCADE, db_column='MaMonHoc',
                                    related_name='lop_list', verbose_name="Môn học")
@@ -315,12 +366,7 @@ class LopMonHoc(models.Model):
     def save(self, *args, **kwargs):
         """Auto-generate ma_lop: LOP-00000001, LOP-00000002, ..."""
         if not self.ma_lop:
-            last = LopMonHoc.objects.filter(ma_lop__startswith='LOP-').order_by('-ma_lop').first()
-            if last and last.ma_lop[4:].isdigit():
-                num = int(last.ma_lop[4:]) + 1
-                self.ma_lop = f'LOP-{num:08d}'
-            else:
-                self.ma_lop = 'LOP-00000001'
+            self.ma_lop = IdSequence.next_codes(LopMonHoc)[0]
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -346,6 +392,10 @@ class DotXep(models.Model):
     ngay_tao = models.DateTimeField(auto_now_add=True, null=True, blank=True, db_column='NgayTao', verbose_name="Ngày tạo")
     ngay_khoa = models.DateTimeField(null=True, blank=True, db_column='NgayKhoa', 
                                     verbose_name="Ngày khóa")
+    # Tăng mỗi khi TKB / phân công của đợt thay đổi - cùng phiên bản dữ liệu dùng chung
+    # (SHARED_SCHEDULE_SEQUENCE) tạo thành khóa cache lưới TKB (schedule_version)
+    phien_ban_tkb = models.PositiveIntegerField(default=0, editable=False, db_column='PhienBanTKB',
+                                                verbose_name="Phiên bản TKB")
     
     class Meta:
         db_table = 'tb_DOT_XEP'
@@ -368,6 +418,45 @@ class DotXep(models.Model):
                 self.ma_dot = f"DOT_{uuid.uuid4().hex[:8].upper()}"
         super().save(*args, **kwargs)
     
+    # Dòng IdSequence giữ phiên bản dữ liệu dùng chung của mọi đợt (ca học, phòng, môn, GV...)
+    SHARED_SCHEDULE_SEQUENCE = 'schedule:shared'
+    
+    @classmethod
+    def bump_schedule_version(cls, *ma_dots):
+        """Tăng phiên bản TKB của các đợt. Không truyền đợt nào = tăng phiên bản dữ liệu
+        dùng chung (1 dòng IdSequence) thay vì ghi lại mọi dòng tb_DOT_XEP.
+        
+        Phiên bản dùng chung chỉ tăng khi transaction commit và 1 lần cho cả transaction:
+        không giữ khóa dòng IdSequence (mọi đợt dùng chung) tới hết transaction. Transaction
+        bị rollback có thể làm lần commit kế tiếp tăng thừa 1 lần - chỉ làm mất cache."""
+        if not ma_dots:
+            _shared_schedule_bump.pending = True
+            transaction.on_commit(cls._apply_shared_schedule_bump)
+            return
+        cls.objects.filter(ma_dot__in=ma_dots).update(phien_ban_tkb=F('phien_ban_tkb') + 1)
+    
+    @classmethod
+    def _apply_shared_schedule_bump(cls):
+        if getattr(_shared_schedule_bump, 'pending', False):
+            _shared_schedule_bump.pending = False
+            IdSequence.reserve(cls.SHARED_SCHEDULE_SEQUENCE)
+    
+    @classmethod
+    def shared_schedule_version(cls):
+        return IdSequence.objects.filter(ten_chuoi=cls.SHARED_SCHEDULE_SEQUENCE).values_list(
+            'gia_tri_cuoi', flat=True
+        ).first() or 0
+    
+    @classmethod
+    def schedule_version(cls, ma_dot):
+        """Khóa cache TKB của đợt: '{phiên bản đợt}.{phiên bản dữ liệu dùng chung}'.
+        Đọc từ DB mỗi lần gọi (1 query) - không dùng phien_ban_tkb đã nạp trên instance"""
+        shared = IdSequence.objects.filter(ten_chuoi=cls.SHARED_SCHEDULE_SEQUENCE).values('gia_tri_cuoi')[:1]
+        phien_ban_tkb, shared_version = cls.objects.filter(ma_dot=ma_dot).annotate(
+            shared_version=Coalesce(Subquery(shared), 0)
+        ).values_list('phien_ban_tkb', 'shared_version').get()
+        return f'{phien_ban_tkb}.{shared_version}'
+    
     def __str__(self):
         return f"{self.ma_dot} - {self.ten_dot or ''}"
 
@@ -528,6 +617,7 @@ class ThoiKhoaBieu(models.Model):
     Lưu lịch dạy cụ thể cho mỗi buổi học
     - TuanHoc: Pattern tuần học (VD: "1111010100000000" = tuần 1-4, 6-8 học)
     - NgayBD, NgayKT: Ngày bắt đầu/kết thúc toàn bộ khoá học (không phải từng buổi)"""
+    CODE_PREFIX, CODE_WIDTH = 'TKB-', 8  # Mã tự sinh, cấp qua IdSequence
     ma_tkb = models.CharField(max_length=15, primary_key=True, blank=True, db_column='MaTKB', verbose_name="Mã TKB")
     ma_dot = models.ForeignKey(DotXep, on_delete=models.CASCADE, db_column='MaDot',
                               related_name='tkb_list', verbose_name="Đợt xếp")
@@ -569,12 +659,7 @@ class ThoiKhoaBieu(models.Model):
     def save(self, *args, **kwargs):
         """Auto-generate ma_tkb: TKB-00000001, TKB-00000002, ..."""
         if not self.ma_tkb:
-            last = ThoiKhoaBieu.objects.filter(ma_tkb__startswith='TKB-').order_by('-ma_tkb').first()
-            if last and last.ma_tkb[4:].isdigit():
-                num = int(last.ma_tkb[4:]) + 1
-                self.ma_tkb = f'TKB-{num:08d}'
-            else:
-                self.ma_tkb = 'TKB-00000001'
+            self.ma_tkb = IdSequence.next_codes(ThoiKhoaBieu)[0]
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -621,3 +706,117 @@ class TKBLog(models.Model):
     
     def __str__(self):
         return f"{self.action} - {self.ma_tkb} - {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
+
+
+class SolverRun(models.Model):
+    """Lịch sử chạy thuật toán xếp lịch - tb_SOLVER_RUN
+    Lưu tham số (thuật toán, seed, budget), instance hash và kết quả (breakdown,
+    vi phạm cứng, thời gian từng pha, đường cost theo thời gian đã downsample)"""
+    STATUS_CHOICES = [
+        ('SUCCESS', 'Thành công'),
+        ('CACHED', 'Dùng kết quả cache'),
+        ('CANCELLED', 'Đã huỷ'),
+        ('FAILED', 'Thất bại'),
+    ]
+    
+    id = models.AutoField(primary_key=True)
+    ma_dot = models.ForeignKey(DotXep, on_delete=models.CASCADE, db_column='MaDot',
+                              related_name='solver_run_list', verbose_name="Đợt xếp")
+    created_at = models.DateTimeField(auto_now_add=True, db_column='NgayTao', verbose_name="Thời gian chạy")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='SUCCESS', db_column='TrangThai',
+                              verbose_name="Trạng thái")
+    algorithm = models.CharField(max_length=10, db_column='ThuatToan', verbose_name="Thuật toán")
+    init_method = models.CharField(max_length=30, null=True, blank=True, db_column='KhoiTao',
+                                   verbose_name="Khởi tạo")
+    seed = models.IntegerField(null=True, blank=True, db_column='Seed', verbose_name="Seed")
+    time_limit = models.FloatField(null=True, blank=True, db_column='TimeLimit', verbose_name="Time limit (s)")
+    budget = models.JSONField(null=True, blank=True, db_column='Budget', verbose_name="Budget")
+    decompose = models.BooleanField(default=False, db_column='Decompose', verbose_name="Tách thành phần")
+    instance_hash = models.CharField(max_length=64, blank=True, default='', db_column='InstanceHash',
+                                     verbose_name="Instance hash")
+    release = models.CharField(max_length=50, blank=True, default='', db_column='PhienBan',
+                               verbose_name="Phiên bản")
+    features = models.JSONField(null=True, blank=True, db_column='DacTrung', verbose_name="Đặc trưng instance")
+    initial_cost = models.FloatField(null=True, blank=True, db_column='CostBanDau', verbose_name="Cost ban đầu")
+    final_cost = models.FloatField(null=True, blank=True, db_column='CostCuoi', verbose_name="Cost cuối")
+    breakdown = models.JSONField(null=True, blank=True, db_column='Breakdown',
+                                 verbose_name="Chi tiết ràng buộc mềm")
+    hard_violations = models.IntegerField(null=True, blank=True, db_column='ViPhamCung',
+                                          verbose_name="Vi phạm cứng")
+    time_elapsed = models.FloatField(null=True, blank=True, db_column='ThoiGian', verbose_name="Thời gian (s)")
+    phase_timings = models.JSONField(null=True, blank=True, db_column='ThoiGianPha',
+                                     verbose_name="Thời gian từng pha (s)")
+    cost_curve = models.JSONField(null=True, blank=True, db_column='DuongCost',
+                                  verbose_name="Đường cost [[giây, best_cost], ...]")
+    saved_to_db = models.BooleanField(default=False, db_column='DaLuuTKB', verbose_name="Đã lưu TKB")
+    details = models.JSONField(null=True, blank=True, db_column='ChiTiet', verbose_name="Chi tiết khác")
+    error = models.CharField(max_length=500, null=True, blank=True, db_column='Loi', verbose_name="Lỗi")
+    
+    class Meta:
+        db_table = 'tb_SOLVER_RUN'
+        verbose_name = "Lần chạy solver"
+        verbose_name_plural = "Lịch sử chạy solver"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['ma_dot', 'created_at'], name='IX_SOLVERRUN_Dot'),
+            models.Index(fields=['status', 'algorithm'], name='IX_SOLVERRUN_Status'),
+        ]
+    
+    def __str__(self):
+        return f"{self.ma_dot_id} - {self.algorithm} seed={self.seed} - {self.final_cost}"
+
+
+class SolverJob(models.Model):
+    """Hàng đợi job xếp lịch chạy nền - tb_SOLVER_JOB
+    Worker (manage.py solver_worker) lấy job QUEUED, chạy và ghi kết quả.
+    Mỗi đợt chỉ có tối đa 1 job đang chờ / đang chạy (ràng buộc UQ_SOLVERJOB_ActiveDot)"""
+    STATUS_CHOICES = [
+        ('QUEUED', 'Đang chờ'),
+        ('RUNNING', 'Đang chạy'),
+        ('DONE', 'Hoàn thành'),
+        ('FAILED', 'Thất bại'),
+        ('CANCELLED', 'Đã huỷ'),
+    ]
+    ACTIVE_STATUSES = ('QUEUED', 'RUNNING')
+    
+    id = models.AutoField(primary_key=True)
+    ma_dot = models.ForeignKey(DotXep, on_delete=models.CASCADE, db_column='MaDot',
+                              related_name='solver_job_list', verbose_name="Đợt xếp")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='QUEUED', db_column='TrangThai',
+                              verbose_name="Trạng thái")
+    params = models.JSONField(db_column='ThamSo', verbose_name="Tham số")
+    created_by = models.CharField(max_length=150, null=True, blank=True, db_column='NguoiTao',
+                                  verbose_name="Người tạo")
+    created_at = models.DateTimeField(auto_now_add=True, db_column='NgayTao', verbose_name="Thời gian tạo")
+    started_at = models.DateTimeField(null=True, blank=True, db_column='BatDau', verbose_name="Bắt đầu")
+    finished_at = models.DateTimeField(null=True, blank=True, db_column='KetThuc', verbose_name="Kết thúc")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, db_column='Heartbeat', verbose_name="Heartbeat")
+    worker = models.CharField(max_length=100, null=True, blank=True, db_column='Worker', verbose_name="Worker")
+    cancel_requested = models.BooleanField(default=False, db_column='YeuCauHuy', verbose_name="Yêu cầu huỷ")
+    finish_early = models.BooleanField(default=False, db_column='DungSom',
+                                       verbose_name="Dừng sớm (giữ lời giải tốt nhất)")
+    progress = models.JSONField(null=True, blank=True, db_column='TienTrinh',
+                                verbose_name="Tiến trình (snapshot mới nhất)")
+    result = models.JSONField(null=True, blank=True, db_column='KetQua', verbose_name="Kết quả")
+    error = models.CharField(max_length=500, null=True, blank=True, db_column='Loi', verbose_name="Lỗi")
+    solver_run = models.ForeignKey(SolverRun, on_delete=models.SET_NULL, null=True, blank=True,
+                                   db_column='SolverRunId', related_name='job_list', verbose_name="Lần chạy")
+    
+    class Meta:
+        db_table = 'tb_SOLVER_JOB'
+        verbose_name = "Job xếp lịch"
+        verbose_name_plural = "Hàng đợi xếp lịch"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='IX_SOLVERJOB_Status'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['ma_dot'],
+                condition=models.Q(status__in=['QUEUED', 'RUNNING']),
+                name='UQ_SOLVERJOB_ActiveDot'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Job #{self.id} - {self.ma_dot_id} - {self.status}"
@@ -0,0 +1,41 @@
+"""
+Signals của app scheduling
+- Phiên bản TKB theo đợt (DotXep.phien_ban_tkb): tăng khi TKB / phân công của đợt
+  thay đổi. Dữ liệu dùng chung hiển thị trên lưới TKB thay đổi → tăng 1 phiên bản chung
+  (DotXep.SHARED_SCHEDULE_SEQUENCE, tăng 1 lần khi transaction commit), khóa cache dùng
+  cả hai (DotXep.schedule_version).
+  Ghi hàng loạt (bulk_create / bulk_update) không phát signal → nơi ghi tự gọi
+  DotXep.bump_schedule_version.
+"""
+
+from django.db.models.signals import post_delete, post_save
+
+from .models import (
+    DotXep, GiangVien, GVDayMon, KhungTG, LopMonHoc, MonHoc, NguyenVong, PhanCong, PhongHoc, ThoiKhoaBieu, TimeSlot
+)
+
+# Model có ma_dot: đổi → tăng phiên bản đợt đó
+DOT_SCHEDULE_MODELS = (ThoiKhoaBieu, PhanCong, NguyenVong)
+# Dữ liệu dùng chung trên lưới TKB / trong ScheduleOccupancy (ca học, tên môn, tên GV,
+# phòng, GV dạy môn...): đổi → tăng phiên bản chung
+SHARED_SCHEDULE_MODELS = (KhungTG, TimeSlot, LopMonHoc, MonHoc, GiangVien, PhongHoc, GVDayMon)
+
+
+def bump_dot_schedule_version(sender, instance, **kwargs):
+    if instance.ma_dot_id:
+        DotXep.bump_schedule_version(instance.ma_dot_id)
+
+
+def bump_shared_schedule_version(sender, **kwargs):
+    DotXep.bump_schedule_version()
+
+
+for model in DOT_SCHEDULE_MODELS:
+    for signal in (post_save, post_delete):
+        signal.connect(bump_dot_schedule_version, sender=model,
+                       dispatch_uid=f'schedule_version_{model.__name__}_{signal is post_save}')
+
+for model in SHARED_SCHEDULE_MODELS:
+    for signal in (post_save, post_delete):
+        signal.connect(bump_shared_schedule_version, sender=model,
+                       dispatch_uid=f'schedule_version_{model.__name__}_{signal is post_save}')
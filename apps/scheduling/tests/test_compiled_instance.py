@@ -0,0 +1,71 @@
+"""
+load_instance: bản compiled nằm trong thư mục cache (không cạnh file .ctt),
+dùng lại khi .ctt không đổi và dựng lại khi .ctt bị sửa
+"""
+
+import os
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from apps.scheduling.algorithms import algorithms_core
+from apps.scheduling.algorithms.algorithms_core import (
+    compiled_cache_dir, compiled_instance_path, load_instance, parse_instance, write_instance
+)
+
+
+class CompiledInstanceTest(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.source_dir = Path(tmp.name) / 'ctt'
+        self.cache_dir = Path(tmp.name) / 'cache'
+        self.ctt = self.source_dir / 'tiny.ctt'
+        write_instance(parse_instance(None), self.ctt)
+
+    def load(self):
+        return load_instance(str(self.ctt), cache_dir=self.cache_dir)
+
+    def test_written_to_cache_dir(self):
+        instance = self.load()
+        compiled = compiled_instance_path(self.ctt, cache_dir=self.cache_dir)
+        self.assertEqual(compiled.parent, self.cache_dir)
+        self.assertTrue(compiled.exists())
+        self.assertEqual(sorted(path.name for path in self.source_dir.iterdir()), ['tiny.ctt'])
+
+        with mock.patch.object(algorithms_core, 'parse_instance', wraps=parse_instance) as parse:
+            cached = self.load()
+        parse.assert_not_called()
+        self.assertEqual(cached.courses, instance.courses)
+
+    def test_changed_ctt_invalidates(self):
+        self.assertEqual(self.load().courses[0].students, parse_instance(None).courses[0].students)
+        content = self.ctt.read_text(encoding='utf-8').splitlines()
+        first_course = content.index('COURSES:') + 1
+        fields = content[first_course].split()
+        fields[4] = '999'  # sĩ số
+        content[first_course] = ' '.join(fields)
+        self.ctt.write_text('\n'.join(content) + '\n', encoding='utf-8')
+
+        with mock.patch.object(algorithms_core, 'parse_instance', wraps=parse_instance) as parse:
+            reloaded = self.load()
+        parse.assert_called_once()
+        self.assertEqual(reloaded.courses[0].students, 999)
+        with mock.patch.object(algorithms_core, 'parse_instance', wraps=parse_instance) as parse:
+            self.assertEqual(self.load().courses[0].students, 999)
+        parse.assert_not_called()
+
+    def test_same_name_in_other_dir_not_shared(self):
+        other = self.source_dir / 'other' / 'tiny.ctt'
+        other.parent.mkdir()
+        other.write_bytes(self.ctt.read_bytes())
+        self.assertNotEqual(compiled_instance_path(self.ctt, cache_dir=self.cache_dir),
+                            compiled_instance_path(other, cache_dir=self.cache_dir))
+
+    def test_default_cache_dir_from_env(self):
+        with mock.patch.dict(os.environ, {'SOLVER_INSTANCE_CACHE_DIR': str(self.cache_dir)}):
+            self.assertEqual(compiled_cache_dir(), self.cache_dir)
+            self.assertEqual(compiled_instance_path(self.ctt).parent, self.cache_dir)
@@ -0,0 +1,81 @@
+"""
+Presolve tách thành phần: find_components, chia time limit, ghép lời giải và thống kê
+trên instance có 2 thành phần rời nhau (khác GV, khác curriculum, khác loại phòng)
+"""
+
+from django.test import SimpleTestCase
+
+from apps.scheduling.algorithms.algorithms_core import Course, Curriculum, Room, build_instance, rebuild_state
+from apps.scheduling.algorithms.decomposition import (
+    MIN_COMPONENT_TIME, find_components, solve_decomposed, split_time_limit
+)
+from apps.scheduling.algorithms.weight_loader import get_default_weights
+
+
+def two_component_instance():
+    """Thành phần 0: C0 (2 lecture) + C1 (1 lecture), GV T0, phòng LT R0 / R1.
+    Thành phần 1: C2 (1 lecture), GV T1, phòng TH R2."""
+    courses = [
+        Course('C0', 'T0', 2, 1, 30, 0, 0, so_ca_tuan=2),
+        Course('C1', 'T0', 1, 1, 30, 1, 0),
+        Course('C2', 'T1', 1, 1, 20, 2, 1, course_type='TH'),
+    ]
+    rooms = [Room('R0', 40, 0), Room('R1', 40, 1), Room('R2', 40, 2, room_type='TH')]
+    curriculums = [Curriculum('MH-A', [0, 1], 0), Curriculum('MH-B', [2], 1)]
+    return build_instance('two-components', 2, 3, courses, rooms, curriculums,
+                          [set() for _ in courses], [set() for _ in courses])
+
+
+class DecompositionTest(SimpleTestCase):
+
+    def setUp(self):
+        self.instance = two_component_instance()
+
+    def test_find_components(self):
+        components = find_components(self.instance)
+        self.assertEqual([component.summary() for component in components], [
+            {'index': 0, 'courses': 2, 'lectures': 3, 'rooms': 2, 'teachers': 1, 'curricula': 1},
+            {'index': 1, 'courses': 1, 'lectures': 1, 'rooms': 1, 'teachers': 1, 'curricula': 1},
+        ])
+        self.assertEqual((components[0].courses, components[0].rooms, components[0].teachers), ([0, 1], [0, 1], ['T0']))
+        self.assertEqual((components[1].courses, components[1].rooms, components[1].curricula), ([2], [2], [1]))
+
+    def test_shared_room_joins_components(self):
+        instance = build_instance(
+            'shared-room', 2, 3,
+            [Course('C0', 'T0', 1, 1, 30, 0, 0), Course('C1', 'T1', 1, 1, 30, 1, 1)],
+            [Room('R0', 40, 0)], [Curriculum('MH-A', [0], 0), Curriculum('MH-B', [1], 1)],
+            [set(), set()], [set(), set()],
+        )
+        self.assertEqual([component.courses for component in find_components(instance)], [[0, 1]])
+
+    def test_split_time_limit(self):
+        components = find_components(self.instance)  # 3 và 1 lecture
+        self.assertEqual(split_time_limit(100.0, components, 1), [75.0, 25.0])
+        self.assertEqual(split_time_limit(100.0, components, 2), [100.0, 50.0])
+        self.assertEqual(split_time_limit(2.0, components, 1), [1.5, MIN_COMPONENT_TIME])
+        self.assertEqual(split_time_limit(None, components, 1), [None, None])
+
+    def test_merge_and_stats(self):
+        weights = get_default_weights()
+        assignments, stats = solve_decomposed(
+            self.instance, meta='TS', seed=3, time_limit=None, max_workers=1,
+            max_iterations=30, weights=weights,
+        )
+
+        self.assertEqual(sorted(assignments), [lecture.id for lecture in self.instance.lectures])
+        for lecture in self.instance.lectures:
+            _, room = assignments[lecture.id]
+            self.assertIn(room, self.instance.course_room_sets[lecture.course])  # phòng theo chỉ số gốc
+        self.assertEqual(len({assignments[lid] for lid in self.instance.course_lecture_ids[0]}), 2)
+
+        self.assertEqual([entry['lectures'] for entry in stats], [3, 1])
+        self.assertEqual([entry['time_limit'] for entry in stats], [180.0, 180.0])
+        for entry in stats:
+            self.assertEqual(entry['budget']['iterations'], 30)
+            self.assertLessEqual(entry['final_cost'], entry['initial_cost'])
+
+        # Soft penalty tính theo course / GV / curriculum → cost ghép = tổng cost từng thành phần
+        self.instance.weights = weights
+        merged = rebuild_state(self.instance, assignments)
+        self.assertAlmostEqual(merged.current_cost, sum(entry['final_cost'] for entry in stats))
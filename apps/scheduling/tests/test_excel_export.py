@@ -0,0 +1,98 @@
+"""
+ExcelExporter: file xuất ra mở lại được bằng openpyxl (tiêu đề, dữ liệu, style)
+và file tạm được đóng khi response đóng
+"""
+
+from datetime import datetime
+from io import BytesIO
+
+from django.test import TestCase
+from openpyxl import load_workbook
+
+from apps.scheduling.models import BoMon, Khoa
+from apps.scheduling.utils.excel_export import XLSX_CONTENT_TYPE, ExcelExporter
+
+
+def read_sheet(response):
+    workbook = load_workbook(BytesIO(b''.join(response.streaming_content)))
+    response.close()
+    return workbook.worksheets[0]
+
+
+def values(sheet):
+    return [[cell.value for cell in row] for row in sheet.iter_rows()]
+
+
+class StreamWorkbookTest(TestCase):
+
+    def test_round_trip(self):
+        rows = iter([
+            ['KHOA-001', 'Công nghệ thông tin', datetime(2025, 9, 1, 7, 30)],
+            ['KHOA-002', None, 42],
+        ])
+        response = ExcelExporter.stream_workbook(['Mã', 'Tên', 'Ngày'], rows, 'khoa', title='Danh sách')
+        self.assertEqual(response['Content-Type'], XLSX_CONTENT_TYPE)
+        self.assertIn('filename="khoa.xlsx"', response['Content-Disposition'])
+
+        sheet = read_sheet(response)
+        self.assertEqual(sheet.title, 'Danh sách')
+        self.assertEqual(values(sheet), [
+            ['Mã', 'Tên', 'Ngày'],
+            ['KHOA-001', 'Công nghệ thông tin', '01/09/2025 07:30'],
+            ['KHOA-002', None, '42'],
+        ])
+        self.assertEqual(sheet.freeze_panes, 'A2')
+        self.assertEqual(sheet.column_dimensions['B'].width, len('Công nghệ thông tin') + 2)
+
+        header, cell = sheet['A1'], sheet['A2']
+        self.assertEqual(header.style, 'export_header')
+        self.assertTrue(header.font.b)
+        self.assertEqual(header.font.color.rgb, '00FFFFFF')
+        self.assertEqual(header.fill.fgColor.rgb, '000066CC')
+        self.assertEqual(header.alignment.horizontal, 'center')
+        self.assertEqual(cell.style, 'export_cell')
+        self.assertEqual(cell.border.left.style, 'thin')
+
+    def test_rows_beyond_width_sample(self):
+        rows = ([f'R{index}'] for index in range(250))
+        sheet = read_sheet(ExcelExporter.stream_workbook(['Mã'], rows, 'many'))
+        self.assertEqual(sheet.max_row, 251)
+        self.assertEqual(sheet['A251'].value, 'R249')
+
+    def test_tempfile_closed_with_response(self):
+        response = ExcelExporter.stream_workbook(['Mã'], [['A']], 'khoa')
+        output = response.file_to_stream
+        self.assertFalse(output.closed)
+        b''.join(response.streaming_content)
+        response.close()
+        self.assertTrue(output.closed)
+
+
+class ExportQuerysetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cntt = Khoa.objects.create(ma_khoa='KHOA-001', ten_khoa='CNTT')
+        dien = Khoa.objects.create(ma_khoa='KHOA-002', ten_khoa='Điện')
+        BoMon.objects.create(ma_bo_mon='BM-001', ma_khoa=cntt, ten_bo_mon='KHMT')
+        BoMon.objects.create(ma_bo_mon='BM-002', ma_khoa=dien, ten_bo_mon='Tự động hóa')
+
+    def test_column_values(self):
+        queryset = BoMon.objects.order_by('ma_bo_mon')
+        response = ExcelExporter.export_queryset(
+            queryset, ['ma_bo_mon', 'ten_bo_mon', 'ma_khoa.ten_khoa', 'khong_co'],
+            ['Mã', 'Tên', 'Khoa', 'Trống'], 'bo_mon'
+        )
+        self.assertEqual(values(read_sheet(response)), [
+            ['Mã', 'Tên', 'Khoa', 'Trống'],
+            ['BM-001', 'KHMT', 'CNTT', None],
+            ['BM-002', 'Tự động hóa', 'Điện', None],
+        ])
+
+    def test_object_values(self):
+        queryset = BoMon.objects.order_by('ma_bo_mon')
+        response = ExcelExporter.export_queryset(queryset, ['ma_bo_mon', 'ma_khoa'], ['Mã', 'Khoa'], 'bo_mon')
+        self.assertEqual(values(read_sheet(response))[1:], [
+            ['BM-001', str(Khoa.objects.get(ma_khoa='KHOA-001'))],
+            ['BM-002', str(Khoa.objects.get(ma_khoa='KHOA-002'))],
+        ])
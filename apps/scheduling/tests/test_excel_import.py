@@ -0,0 +1,97 @@
+"""
+Cấp mã qua IdSequence và import Excel theo lô (chạy thử / ghi thật, báo cáo lỗi theo dòng)
+"""
+
+from io import BytesIO
+
+import pandas as pd
+from django.test import RequestFactory, TestCase
+from openpyxl import load_workbook
+
+from apps.scheduling.models import BoMon, IdSequence, Khoa
+from apps.scheduling.utils.excel_import import IMPORT_REPORT_SESSION_KEY, ExcelImporter
+
+
+class IdSequenceTest(TestCase):
+
+    def test_reserve_consecutive_ranges(self):
+        calls = []
+
+        def initial():
+            calls.append(1)
+            return 10
+
+        self.assertEqual(list(IdSequence.reserve('test', 3, initial)), [11, 12, 13])
+        self.assertEqual(list(IdSequence.reserve('test', 2, initial)), [14, 15])
+        self.assertEqual(len(calls), 1)  # initial() chỉ gọi khi tạo chuỗi
+
+    def test_next_codes_continue_from_existing(self):
+        Khoa.objects.create(ma_khoa='KHOA-007', ten_khoa='Cũ')
+        self.assertEqual(IdSequence.next_codes(Khoa, 2), ['KHOA-008', 'KHOA-009'])
+        self.assertEqual(Khoa.objects.create(ten_khoa='Mới').ma_khoa, 'KHOA-010')
+
+    def test_observe_skips_manual_codes(self):
+        IdSequence.next_codes(Khoa)
+        IdSequence.observe(Khoa, 'KHOA-050')
+        IdSequence.observe(Khoa, 'OTHER-999')
+        self.assertEqual(IdSequence.next_codes(Khoa), ['KHOA-051'])
+
+
+class ExcelImportTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Khoa.objects.create(ma_khoa='KHOA-001', ten_khoa='CNTT')
+
+    def bo_mon_frame(self):
+        # Cột đã chuẩn hóa như validate_and_import (verbose_name bỏ dấu, lower)
+        return pd.DataFrame([
+            {'ma bo mon': 'BM-1', 'khoa': 'KHOA-001', 'ten bo mon': 'KHMT'},
+            {'ma bo mon': 'BM-2', 'khoa': 'KHOA-999', 'ten bo mon': 'HTTT'},  # khoa không tồn tại
+            {'ma bo mon': 'BM-3', 'khoa': 'KHOA-001', 'ten bo mon': None},  # thiếu tên
+            {'ma bo mon': 'BM-1', 'khoa': 'KHOA-001', 'ten bo mon': 'Trùng'},  # trùng mã dòng 2
+            {'ma bo mon': None, 'khoa': 'KHOA-001', 'ten bo mon': 'CNPM'},  # mã tự sinh
+        ])
+
+    def assertErrorRows(self, report):
+        self.assertEqual(
+            [(item['row'], item['column']) for item in report['errors']],
+            [(3, 'Khoa'), (4, 'Tên bộ môn'), (5, 'Mã bộ môn')]
+        )
+        self.assertIn('KHOA-999', report['errors'][0]['message'])
+        self.assertIn('dòng 2', report['errors'][2]['message'])
+
+    def test_dry_run_reports_without_writing(self):
+        report = ExcelImporter.import_dataframe(self.bo_mon_frame(), BoMon, dry_run=True)
+        self.assertEqual((report['created'], report['updated'], report['dry_run']), (2, 0, True))
+        self.assertErrorRows(report)
+        self.assertFalse(BoMon.objects.exists())
+
+    def test_commit_writes_valid_rows(self):
+        report = ExcelImporter.import_dataframe(self.bo_mon_frame(), BoMon)
+        self.assertEqual((report['created'], report['updated']), (2, 0))
+        self.assertErrorRows(report)
+        self.assertEqual(
+            sorted(BoMon.objects.values_list('ten_bo_mon', flat=True)), ['CNPM', 'KHMT']
+        )
+        self.assertTrue(BoMon.objects.get(ten_bo_mon='CNPM').ma_bo_mon.startswith('BM-001-'))
+
+        # Import lại: dòng đã có → cập nhật
+        frame = pd.DataFrame([{'ma bo mon': 'BM-1', 'khoa': 'KHOA-001', 'ten bo mon': 'Khoa học máy tính'}])
+        report = ExcelImporter.import_dataframe(frame, BoMon)
+        self.assertEqual((report['created'], report['updated'], report['errors']), (0, 1, []))
+        self.assertEqual(BoMon.objects.get(ma_bo_mon='BM-1').ten_bo_mon, 'Khoa học máy tính')
+
+    def test_error_report_download(self):
+        report = ExcelImporter.import_dataframe(self.bo_mon_frame(), BoMon, dry_run=True)
+        request = RequestFactory().get('/')
+        request.session = {IMPORT_REPORT_SESSION_KEY: {'model': BoMon._meta.label, 'errors': report['errors']}}
+        response = ExcelImporter.report_response(request, BoMon)
+        workbook = load_workbook(BytesIO(b''.join(response.streaming_content)))
+        response.close()
+        rows = [row for row in workbook.active.iter_rows(values_only=True) if any(row)]
+        header = rows.index(('Dòng', 'Cột', 'Giá trị', 'Lỗi'))
+        self.assertEqual(
+            [(row[0], row[1], row[2]) for row in rows[header + 1:]],
+            [('3', 'Khoa', 'KHOA-999'), ('4', 'Tên bộ môn', None), ('5', 'Mã bộ môn', 'BM-1')]
+        )
@@ -0,0 +1,74 @@
+"""
+build_instance_from_db phải cho cùng instance với đường cũ export_to_ctt + parse_instance
+"""
+
+import tempfile
+from datetime import time
+
+from django.test import TestCase
+
+from apps.scheduling.algorithms.algorithms_core import parse_instance
+from apps.scheduling.algorithms.algorithms_data_adapter import build_instance_from_db, export_to_ctt
+from apps.scheduling.models import (
+    BoMon, DotXep, DuKienDT, GiangVien, Khoa, KhungTG, LopMonHoc, MonHoc, NguyenVong, PhanCong, PhongHoc, TimeSlot
+)
+
+# Thuộc tính so sánh: dữ liệu gốc và các index dẫn xuất solver dùng
+COMPARED_FIELDS = (
+    'days', 'periods_per_day', 'courses', 'rooms', 'curriculums', 'unavailability', 'preferences',
+    'lectures', 'course_curriculums', 'feasible_periods', 'course_room_preference', 'course_teachers',
+    'course_students', 'course_lecture_ids', 'lecture_neighbors', 'course_by_id', 'room_by_id',
+    'curriculum_by_id', 'teacher_by_id', 'teachers', 'teacher_preferred_periods',
+)
+
+
+class InstanceBuilderEquivalenceTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        khoa = Khoa.objects.create(ma_khoa='KHOA-001', ten_khoa='CNTT')
+        bo_mon = BoMon.objects.create(ma_bo_mon='BM-001', ma_khoa=khoa, ten_bo_mon='KHMT')
+        gv_a = GiangVien.objects.create(ma_gv='GV001', ma_bo_mon=bo_mon, ten_gv='Nguyễn Văn A')
+        gv_b = GiangVien.objects.create(ma_gv='GV002', ma_bo_mon=bo_mon, ten_gv='Trần Thị B')
+        ly_thuyet = MonHoc.objects.create(ma_mon_hoc='MH001', ten_mon_hoc='Cấu trúc dữ liệu',
+                                          so_tiet_lt=30, so_tiet_th=0)
+        thuc_hanh = MonHoc.objects.create(ma_mon_hoc='MH002', ten_mon_hoc='Thực hành mạng',
+                                          so_tiet_lt=0, so_tiet_th=30)
+        for ma_khung_gio in (1, 2):
+            ca = KhungTG.objects.create(ma_khung_gio=ma_khung_gio, ten_ca=f'Ca {ma_khung_gio}',
+                                        gio_bat_dau=time(7), gio_ket_thuc=time(9, 30))
+            for thu in (2, 3, 4):
+                if (thu, ma_khung_gio) != (4, 2):  # Thứ 4 ca 2 không có TimeSlot → không xếp được
+                    TimeSlot.objects.create(time_slot_id=f'Thu{thu}-Ca{ma_khung_gio}', thu=thu, ca=ca)
+        PhongHoc.objects.create(ma_phong='A101', suc_chua=60, loai_phong='Lý thuyết', thiet_bi='Máy chiếu')
+        PhongHoc.objects.create(ma_phong='A102', suc_chua=30, loai_phong='Lý thuyết')
+        PhongHoc.objects.create(ma_phong='B201', suc_chua=40, loai_phong='Thực hành', thiet_bi='PC')
+        du_kien = DuKienDT.objects.create(ma_du_kien_dt='2025-2026_HK1', nam_hoc='2025-2026', hoc_ky=1)
+        cls.dot = DotXep.objects.create(ma_dot='DOT1', ma_du_kien_dt=du_kien, ten_dot='Đợt 1')
+        for ma_lop, mon, nhom, to_mh, so_sv, so_ca, thiet_bi, gv in (
+            ('LOP-1', ly_thuyet, 1, 0, 55, 3, 'Máy chiếu', gv_a),
+            ('LOP-2', ly_thuyet, 2, 0, 25, 1, None, gv_b),
+            ('LOP-3', thuc_hanh, 1, 1, 35, 2, 'PC', gv_a),
+            ('LOP-4', thuc_hanh, 2, 1, None, 1, None, None),  # chưa phân GV, không rõ sĩ số
+        ):
+            lop = LopMonHoc.objects.create(ma_lop=ma_lop, ma_mon_hoc=mon, nhom_mh=nhom, to_mh=to_mh,
+                                           so_luong_sv=so_sv, so_ca_tuan=so_ca, thiet_bi_yeu_cau=thiet_bi)
+            PhanCong.objects.create(ma_dot=cls.dot, ma_lop=lop, ma_gv=gv)
+        for gv, time_slot in ((gv_a, 'Thu2-Ca1'), (gv_a, 'Thu3-Ca2'), (gv_b, 'Thu4-Ca1')):
+            NguyenVong.objects.create(ma_gv=gv, ma_dot=cls.dot, time_slot_id_id=time_slot)
+
+    def test_matches_ctt_round_trip(self):
+        built = build_instance_from_db(self.dot)
+        with tempfile.TemporaryDirectory() as output_dir:
+            parsed = parse_instance(str(export_to_ctt(self.dot, output_dir=output_dir)))
+
+        self.assertEqual(built.name, parsed.name)
+        for name in COMPARED_FIELDS:
+            self.assertEqual(getattr(built, name), getattr(parsed, name), name)
+
+        # Fixture thực sự phủ các nhánh: ô thiếu TimeSlot, nguyện vọng, phòng / lớp TH, thiết bị
+        self.assertEqual((built.days, built.periods_per_day), (3, 2))
+        self.assertTrue(all(built.unavailability[course.index] == {5} for course in built.courses))
+        self.assertEqual(built.teacher_preferred_periods, {'GV001': {0, 3}, 'GV002': {4}})
+        self.assertEqual([course.course_type for course in built.courses], ['LT', 'LT', 'TH', 'TH'])
+        self.assertEqual(built.courses[0].equipment, 'Máy chiếu')
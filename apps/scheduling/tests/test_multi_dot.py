@@ -0,0 +1,47 @@
+"""
+Sửa xung đột phòng giữa các đợt: ô đã bị chiếm chỉ trùng khi tuần học giao nhau
+"""
+
+import random
+import time
+
+from django.test import TestCase
+
+from apps.scheduling.algorithms.algorithms_core import build_initial_solution, parse_instance
+from apps.scheduling.algorithms.multi_dot import occupied_cells, repair_room_conflicts
+from apps.scheduling.utils.weeks import week_mask
+
+FIRST_HALF = week_mask('1' * 8 + '0' * 7)
+SECOND_HALF = week_mask('0' * 8 + '1' * 7)
+
+
+class RepairRoomConflictsTest(TestCase):
+
+    def setUp(self):
+        self.instance = parse_instance(None)
+        state = build_initial_solution(self.instance, random.Random(1), 'greedy-cprop', time.time(), 180.0,
+                                       deterministic=True)
+        self.assignments = state.clone_assignments()
+        period, room_idx = self.assignments[0]
+        day, slot = self.instance.period_to_slot(period)
+        self.cell = (self.instance.rooms[room_idx].id, day, slot)
+
+    def test_disjoint_weeks_keep_room(self):
+        weeks = [FIRST_HALF] * len(self.instance.courses)
+        assignments, stats = repair_room_conflicts(self.instance, self.assignments, {self.cell: SECOND_HALF}, weeks)
+        self.assertEqual(assignments, self.assignments)
+        self.assertEqual(stats['conflicts'], 0)
+        self.assertEqual(occupied_cells(self.instance, assignments, weeks)[self.cell], FIRST_HALF)
+
+    def test_overlapping_weeks_move_lecture(self):
+        assignments, stats = repair_room_conflicts(self.instance, self.assignments, {self.cell: SECOND_HALF})
+        self.assertEqual(stats['conflicts'], 1)
+        self.assertEqual(stats['unresolved'], [])
+        self.assertNotIn(self.cell, occupied_cells(self.instance, assignments))
+
+    def test_instance_not_modified(self):
+        blocked = {0: {1}}
+        self.instance.blocked_cells = blocked
+        repair_room_conflicts(self.instance, self.assignments, {self.cell: SECOND_HALF})
+        self.assertIs(self.instance.blocked_cells, blocked)
+        self.assertEqual(blocked, {0: {1}})
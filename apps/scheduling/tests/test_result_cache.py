@@ -0,0 +1,149 @@
+"""
+Cache kết quả solver: key gồm fingerprint instance + weights + thuật toán + seed + budget
++ tham số, hit / miss / eviction trên đĩa và hết hiệu lực khi dữ liệu đợt đổi
+"""
+
+import os
+import tempfile
+import time as time_module
+from datetime import time
+from pathlib import Path
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from apps.scheduling.algorithms.algorithms_core import parse_instance
+from apps.scheduling.algorithms.algorithms_runner import AlgorithmRunner
+from apps.scheduling.algorithms.result_cache import CACHE_VERSION, ResultCache, instance_hash, solve_cache_key
+from apps.scheduling.models import (
+    BoMon, DotXep, DuKienDT, GiangVien, Khoa, KhungTG, LopMonHoc, MonHoc, PhanCong, PhongHoc, TimeSlot
+)
+
+WEIGHTS = {'MIN_WORKING_DAYS': 1.0, 'ROOM_CAPACITY': 2.0}
+BUDGET = {'time_limit': None, 'max_iterations': 100, 'max_evaluations': None}
+
+
+class SolveCacheKeyTest(SimpleTestCase):
+
+    def setUp(self):
+        self.instance = parse_instance(None)
+
+    def key(self, instance=None, weights=WEIGHTS, meta='TS', seed=1, budget=BUDGET, **params):
+        params = {'init_method': 'greedy-cprop', **params}
+        return solve_cache_key(instance or self.instance, weights, meta, seed, budget, **params)
+
+    def test_same_inputs_same_key(self):
+        self.assertEqual(instance_hash(self.instance), instance_hash(parse_instance(None)))
+        self.assertEqual(self.key(), self.key(instance=parse_instance(None)))
+        self.assertEqual(self.key(), self.key(meta='ts'))
+        self.assertEqual(self.key(), self.key(weights=dict(reversed(list(WEIGHTS.items())))))
+
+    def test_every_part_changes_key(self):
+        blocked = parse_instance(None)
+        blocked.blocked_cells = {0: {0}}
+        self.assertNotEqual(instance_hash(blocked), instance_hash(self.instance))
+
+        base = self.key()
+        variants = {
+            'instance': self.key(instance=blocked),
+            'weights': self.key(weights={**WEIGHTS, 'ROOM_CAPACITY': 3.0}),
+            'meta': self.key(meta='SA'),
+            'seed': self.key(seed=2),
+            'budget': self.key(budget={**BUDGET, 'max_iterations': 200}),
+            'params': self.key(init_method='random-repair'),
+            'extra param': self.key(decompose=True),
+        }
+        for part, key in variants.items():
+            self.assertNotEqual(key, base, part)
+        self.assertEqual(len(set(variants.values())), len(variants))
+
+
+class ResultCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = Path(self.tmp.name)
+
+    def test_hit_and_miss(self):
+        cache = ResultCache(self.root)
+        self.assertIsNone(cache.get('missing'))
+        cache.put('key', {'final_cost': 12, 'assignments': {'0': {'room_id': 'R1'}}})
+        self.assertEqual(cache.get('key'), {'final_cost': 12, 'assignments': {'0': {'room_id': 'R1'}}})
+        self.assertEqual([path.name for path in self.root.iterdir()], ['key.json'])  # không còn file .tmp
+
+    def test_stale_or_corrupt_entries_ignored(self):
+        cache = ResultCache(self.root, max_age=60)
+        cache.put('old', {'final_cost': 1})
+        past = time_module.time() - 120
+        os.utime(self.root / 'old.json', (past, past))
+        self.assertIsNone(cache.get('old'))
+        self.assertFalse((self.root / 'old.json').exists())
+
+        (self.root / 'broken.json').write_text('{not json', encoding='utf-8')
+        self.assertIsNone(cache.get('broken'))
+        (self.root / 'other.json').write_text(f'{{"version": {CACHE_VERSION + 1}, "result": {{}}}}', encoding='utf-8')
+        self.assertIsNone(cache.get('other'))
+
+    def test_evicts_least_recently_used(self):
+        cache = ResultCache(self.root, max_entries=2)
+        cache.put('a', {'n': 1})
+        cache.put('b', {'n': 2})
+        past = time_module.time() - 10
+        os.utime(self.root / 'a.json', (past - 5, past - 5))
+        os.utime(self.root / 'b.json', (past, past))
+        cache.get('a')  # a vừa dùng → b cũ nhất
+        cache.put('c', {'n': 3})
+        self.assertEqual(sorted(path.stem for path in self.root.glob('*.json')), ['a', 'c'])
+
+
+class RunnerResultCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        khoa = Khoa.objects.create(ma_khoa='KHOA-001', ten_khoa='CNTT')
+        bo_mon = BoMon.objects.create(ma_bo_mon='BM-001', ma_khoa=khoa, ten_bo_mon='KHMT')
+        cls.gv = GiangVien.objects.create(ma_gv='GV001', ma_bo_mon=bo_mon, ten_gv='Nguyễn Văn A')
+        cls.mon = MonHoc.objects.create(ma_mon_hoc='MH001', ten_mon_hoc='Cấu trúc dữ liệu', so_tiet_lt=30, so_tiet_th=0)
+        ca = KhungTG.objects.create(ma_khung_gio=1, ten_ca='Ca 1', gio_bat_dau=time(7), gio_ket_thuc=time(9, 30))
+        for thu in (2, 3, 4):
+            TimeSlot.objects.create(time_slot_id=f'Thu{thu}-Ca1', thu=thu, ca=ca)
+        for ma_phong in ('A101', 'A102'):
+            PhongHoc.objects.create(ma_phong=ma_phong, suc_chua=60)
+        du_kien = DuKienDT.objects.create(ma_du_kien_dt='2025-2026_HK1', nam_hoc='2025-2026', hoc_ky=1)
+        cls.dot = DotXep.objects.create(ma_dot='DOT1', ma_du_kien_dt=du_kien, ten_dot='Đợt 1')
+        cls.add_class(1)
+
+    @classmethod
+    def add_class(cls, nhom):
+        lop = LopMonHoc.objects.create(ma_lop=f'LOP-{nhom}', ma_mon_hoc=cls.mon, nhom_mh=nhom, to_mh=0,
+                                       so_luong_sv=40, so_ca_tuan=1)
+        PhanCong.objects.create(ma_dot=cls.dot, ma_lop=lop, ma_gv=cls.gv)
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings_override = override_settings(SOLVER_RESULT_CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def run_solver(self):
+        runner = AlgorithmRunner('DOT1', seed=5)
+        self.assertTrue(runner.prepare_data())
+        result = runner.run_optimization(strategy='TS', time_limit=None, max_iterations=20)
+        self.assertTrue(result['success'])
+        return result
+
+    def test_cache_hit_then_invalidated_by_schedule_change(self):
+        first = self.run_solver()
+        self.assertFalse(first.get('cached'))
+        second = self.run_solver()
+        self.assertTrue(second['cached'])
+        self.assertEqual(second['assignments'], first['assignments'])
+        self.assertEqual(second['final_cost'], first['final_cost'])
+
+        version = DotXep.schedule_version('DOT1')
+        self.add_class(2)  # phân công mới → phiên bản TKB của đợt tăng, instance đổi
+        self.assertNotEqual(DotXep.schedule_version('DOT1'), version)
+        third = self.run_solver()
+        self.assertFalse(third.get('cached'))
+        self.assertTrue(self.run_solver()['cached'])  # kết quả mới được cache theo key mới
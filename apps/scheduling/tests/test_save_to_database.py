@@ -0,0 +1,137 @@
+"""
+AlgorithmRunner.save_to_database: ghi kết quả solver dạng diff so với TKB hiện có
+"""
+
+import tempfile
+from collections import Counter
+from datetime import time
+from pathlib import Path
+from unittest import mock
+
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+
+from apps.scheduling.algorithms.algorithms_data_adapter import timeslot_cell
+from apps.scheduling.algorithms.algorithms_runner import AlgorithmRunner
+from apps.scheduling.models import (
+    BoMon, DotXep, DuKienDT, GiangVien, Khoa, KhungTG, LopMonHoc, MonHoc, PhanCong, PhongHoc,
+    TKBLog, ThoiKhoaBieu, TimeSlot
+)
+
+
+class SaveToDatabaseTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        khoa = Khoa.objects.create(ma_khoa='KHOA-001', ten_khoa='CNTT')
+        bo_mon = BoMon.objects.create(ma_bo_mon='BM-001', ma_khoa=khoa, ten_bo_mon='KHMT')
+        gv = GiangVien.objects.create(ma_gv='GV001', ma_bo_mon=bo_mon, ten_gv='Nguyễn Văn A')
+        mon = MonHoc.objects.create(ma_mon_hoc='MH001', ten_mon_hoc='Cấu trúc dữ liệu', so_tuan=10)
+        ca = KhungTG.objects.create(ma_khung_gio=1, ten_ca='Ca 1', gio_bat_dau=time(7), gio_ket_thuc=time(9, 30))
+        for thu in (2, 3):
+            TimeSlot.objects.create(time_slot_id=f'Thu{thu}-Ca1', thu=thu, ca=ca)
+        for ma_phong in ('A101', 'A102'):
+            PhongHoc.objects.create(ma_phong=ma_phong, suc_chua=60)
+        du_kien = DuKienDT.objects.create(ma_du_kien_dt='2025-2026_HK1', nam_hoc='2025-2026', hoc_ky=1)
+        dot = DotXep.objects.create(ma_dot='DOT1', ma_du_kien_dt=du_kien, ten_dot='Đợt 1')
+        for nhom in range(1, 6):
+            lop = LopMonHoc.objects.create(ma_lop=f'LOP-{nhom}', ma_mon_hoc=mon, nhom_mh=nhom,
+                                           so_luong_sv=40, so_ca_tuan=1)
+            PhanCong.objects.create(ma_dot=dot, ma_lop=lop, ma_gv=gv)
+        for ma_tkb, ma_lop, ma_phong, time_slot, is_deleted in (
+            ('TKB-1', 'LOP-1', 'A101', 'Thu2-Ca1', False),  # giữ nguyên
+            ('TKB-2', 'LOP-2', 'A101', 'Thu3-Ca1', False),  # dời sang A102 Thu3
+            ('TKB-3', 'LOP-3', 'A102', 'Thu2-Ca1', True),   # đã xóa mềm, kết quả mới trùng → phục hồi
+            ('TKB-5', 'LOP-5', 'A102', 'Thu3-Ca1', False),  # không còn trong kết quả → xóa mềm
+        ):
+            ThoiKhoaBieu.objects.create(ma_tkb=ma_tkb, ma_dot=dot, ma_lop_id=ma_lop, ma_phong_id=ma_phong,
+                                        time_slot_id_id=time_slot, tuan_hoc='1' * 10, is_deleted=is_deleted)
+
+    def setUp(self):
+        self.runner = AlgorithmRunner('DOT1')
+        self.assertTrue(self.runner.prepare_data())
+        instance = self.runner.instance
+        self.lecture_by_lop = {
+            instance.courses[lecture.course].id: lecture.id for lecture in instance.lectures
+        }
+        self.room_by_id = {room.id: room.index for room in instance.rooms}
+
+    def assignment(self, thu, ma_phong):
+        day, slot = timeslot_cell(thu, 1)
+        return self.runner.instance.periods_per_day * day + slot, self.room_by_id[ma_phong]
+
+    def solution(self):
+        return {
+            self.lecture_by_lop['LOP-1']: self.assignment(2, 'A101'),
+            self.lecture_by_lop['LOP-2']: self.assignment(3, 'A102'),
+            self.lecture_by_lop['LOP-3']: self.assignment(2, 'A102'),
+            self.lecture_by_lop['LOP-4']: self.assignment(3, 'A101'),
+        }
+
+    def live_rows(self):
+        return set(ThoiKhoaBieu.objects.filter(ma_dot_id='DOT1', is_deleted=False).values_list(
+            'ma_lop_id', 'ma_phong_id', 'time_slot_id_id'
+        ))
+
+    def version(self):
+        return DotXep.objects.values_list('phien_ban_tkb', flat=True).get(ma_dot='DOT1')
+
+    def test_diff_paths(self):
+        version = self.version()
+        stats = self.runner.save_to_database(self.solution(), user='tester')
+
+        self.assertEqual(
+            {key: stats[key] for key in ('created', 'updated', 'restored', 'deleted', 'unchanged', 'skipped')},
+            {'created': 1, 'updated': 1, 'restored': 1, 'deleted': 1, 'unchanged': 1, 'skipped': 0}
+        )
+        self.assertEqual(self.live_rows(), {
+            ('LOP-1', 'A101', 'Thu2-Ca1'),
+            ('LOP-2', 'A102', 'Thu3-Ca1'),
+            ('LOP-3', 'A102', 'Thu2-Ca1'),
+            ('LOP-4', 'A101', 'Thu3-Ca1'),
+        })
+        # Dời chỗ giữ nguyên mã TKB, xóa là xóa mềm
+        self.assertEqual(ThoiKhoaBieu.objects.get(ma_tkb='TKB-2').ma_phong_id, 'A102')
+        self.assertTrue(ThoiKhoaBieu.objects.get(ma_tkb='TKB-5').is_deleted)
+        created = ThoiKhoaBieu.objects.get(ma_lop_id='LOP-4')
+        self.assertEqual(created.tuan_hoc, '1' * 10)
+
+        logs = TKBLog.objects.filter(user='tester')
+        self.assertEqual(Counter(logs.values_list('action', flat=True)),
+                         Counter({'CREATE': 1, 'UPDATE': 1, 'RESTORE': 1, 'DELETE': 1}))
+        self.assertEqual(logs.get(action='UPDATE').old_data, {'ma_phong': 'A101', 'time_slot_id': 'Thu3-Ca1'})
+        self.assertEqual(logs.get(action='CREATE').ma_tkb, created.ma_tkb)
+        self.assertEqual(logs.get(action='DELETE').ma_tkb, 'TKB-5')
+        self.assertEqual(self.version(), version + 1)
+
+    def test_removes_checkpoint_after_save(self):
+        with tempfile.TemporaryDirectory() as checkpoint_dir, override_settings(SOLVER_CHECKPOINT_DIR=checkpoint_dir):
+            checkpoint = self.runner.checkpoint_path
+            self.assertEqual(checkpoint.parent, Path(checkpoint_dir))
+            checkpoint.write_bytes(b'checkpoint')
+            self.runner.save_to_database(self.solution())
+            self.assertFalse(checkpoint.exists())
+
+    def test_unchanged_solution_writes_nothing(self):
+        self.runner.save_to_database(self.solution())
+        version = self.version()
+        log_count = TKBLog.objects.count()
+
+        stats = self.runner.save_to_database(self.solution())
+
+        self.assertEqual(stats['unchanged'], 4)
+        self.assertEqual(stats['created'] + stats['updated'] + stats['restored'] + stats['deleted'], 0)
+        self.assertEqual(TKBLog.objects.count(), log_count)
+        self.assertEqual(self.version(), version)
+
+    def test_database_error_rolls_back(self):
+        rows = self.live_rows()
+        with mock.patch.object(TKBLog.objects, 'bulk_create', side_effect=DatabaseError('boom')), \
+                self.assertLogs('apps.scheduling.algorithms.algorithms_runner', 'ERROR'):
+            self.assertIsNone(self.runner.save_to_database(self.solution()))
+        self.assertEqual(self.live_rows(), rows)
+
+    def test_other_errors_propagate(self):
+        with mock.patch.object(TKBLog.objects, 'bulk_create', side_effect=ValueError('bug')):
+            with self.assertRaises(ValueError):
+                self.runner.save_to_database(self.solution())
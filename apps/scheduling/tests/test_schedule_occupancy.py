@@ -0,0 +1,133 @@
+"""
+ScheduleOccupancy: trùng phòng / GV chỉ tính khi tuần học giao nhau, bỏ qua dòng đang sửa
+"""
+
+from datetime import time
+
+from django.core.cache import caches
+from django.db import transaction
+from django.test import TestCase
+
+from apps.sap_lich.occupancy import ScheduleOccupancy
+from apps.sap_lich.views import validate_tkb_constraints
+from apps.scheduling.models import (
+    BoMon, DotXep, DuKienDT, GiangVien, Khoa, KhungTG, LopMonHoc, MonHoc, PhanCong, PhongHoc,
+    ThoiKhoaBieu, TimeSlot
+)
+from apps.scheduling.utils.weeks import ALL_WEEKS, week_mask
+
+FIRST_HALF = '1' * 8 + '0' * 7
+SECOND_HALF = '0' * 8 + '1' * 7
+
+
+class ScheduleOccupancyTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        khoa = Khoa.objects.create(ma_khoa='KHOA-001', ten_khoa='CNTT')
+        bo_mon = BoMon.objects.create(ma_bo_mon='BM-001', ma_khoa=khoa, ten_bo_mon='KHMT')
+        gv = GiangVien.objects.create(ma_gv='GV001', ma_bo_mon=bo_mon, ten_gv='Nguyễn Văn A')
+        GiangVien.objects.create(ma_gv='GV002', ma_bo_mon=bo_mon, ten_gv='Trần Thị B')
+        mon = MonHoc.objects.create(ma_mon_hoc='MH001', ten_mon_hoc='Cấu trúc dữ liệu')
+        ca = KhungTG.objects.create(ma_khung_gio=1, ten_ca='Ca 1', gio_bat_dau=time(7), gio_ket_thuc=time(9, 30))
+        for thu in (2, 3):
+            TimeSlot.objects.create(time_slot_id=f'Thu{thu}-Ca1', thu=thu, ca=ca)
+        for ma_phong in ('A101', 'A102'):
+            PhongHoc.objects.create(ma_phong=ma_phong, suc_chua=60)
+        du_kien = DuKienDT.objects.create(ma_du_kien_dt='2025-2026_HK1', nam_hoc='2025-2026', hoc_ky=1)
+        cls.dot = DotXep.objects.create(ma_dot='DOT1', ma_du_kien_dt=du_kien, ten_dot='Đợt 1')
+        cls.lops = []
+        for nhom in (1, 2, 3):
+            lop = LopMonHoc.objects.create(ma_lop=f'LOP-{nhom}', ma_mon_hoc=mon, nhom_mh=nhom, so_luong_sv=40)
+            PhanCong.objects.create(ma_dot=cls.dot, ma_lop=lop, ma_gv=gv)
+            cls.lops.append(lop)
+        # LOP-1: A101 Thu2 nửa đầu học kỳ
+        ThoiKhoaBieu.objects.create(
+            ma_tkb='TKB-1', ma_dot=cls.dot, ma_lop=cls.lops[0], ma_phong_id='A101',
+            time_slot_id_id='Thu2-Ca1', tuan_hoc=FIRST_HALF
+        )
+
+    def setUp(self):
+        caches['schedule'].clear()
+        self.occupancy = ScheduleOccupancy.load(DotXep.objects.get(ma_dot='DOT1'))
+
+    def test_week_mask(self):
+        self.assertEqual(week_mask('101'), 0b101)
+        self.assertEqual(week_mask(''), ALL_WEEKS)
+        self.assertFalse(week_mask(FIRST_HALF) & week_mask(SECOND_HALF))
+
+    def test_room_conflict_by_weeks(self):
+        room_conflict = self.occupancy.room_conflict
+        self.assertEqual(room_conflict('A101', 'Thu2-Ca1', week_mask('1' * 15)), 'TKB-1')
+        self.assertIsNone(room_conflict('A101', 'Thu2-Ca1', week_mask(SECOND_HALF)))
+        self.assertIsNone(room_conflict('A102', 'Thu2-Ca1'))
+        self.assertIsNone(room_conflict('A101', 'Thu3-Ca1'))
+
+    def test_teacher_conflict_by_weeks(self):
+        teacher_conflict = self.occupancy.teacher_conflict
+        self.assertEqual(teacher_conflict('GV001', 'Thu2-Ca1', week_mask(FIRST_HALF)), 'TKB-1')
+        self.assertIsNone(teacher_conflict('GV001', 'Thu2-Ca1', week_mask(SECOND_HALF)))
+        self.assertIsNone(teacher_conflict('GV002', 'Thu2-Ca1'))
+
+    def test_excludes_edited_row(self):
+        self.assertIsNone(self.occupancy.room_conflict('A101', 'Thu2-Ca1', exclude={'TKB-1'}))
+        self.assertIsNone(self.occupancy.teacher_conflict('GV001', 'Thu2-Ca1', exclude={'TKB-1'}))
+
+    def test_incremental_updates(self):
+        occupancy = self.occupancy
+        occupancy.place('TKB-2', 'LOP-2', 'A102', 'Thu2-Ca1', SECOND_HALF)
+        self.assertEqual(occupancy.occupied_rooms('Thu2-Ca1'), ['A101', 'A102'])
+        self.assertEqual(occupancy.teacher_load['GV001'], 2)
+
+        occupancy.place('TKB-2', 'LOP-2', 'A102', 'Thu3-Ca1', SECOND_HALF)  # di chuyển
+        self.assertEqual(occupancy.occupied_rooms('Thu2-Ca1'), ['A101'])
+        self.assertEqual(occupancy.room_conflict('A102', 'Thu3-Ca1'), 'TKB-2')
+
+        occupancy.set_teacher('LOP-2', 'GV002', 'Trần Thị B')  # giữ mask khi đổi GV
+        self.assertIsNone(occupancy.teacher_conflict('GV001', 'Thu3-Ca1'))
+        self.assertEqual(occupancy.teacher_conflict('GV002', 'Thu3-Ca1', week_mask(SECOND_HALF)), 'TKB-2')
+        self.assertIsNone(occupancy.teacher_conflict('GV002', 'Thu3-Ca1', week_mask(FIRST_HALF)))
+
+        occupancy.remove('TKB-2')
+        self.assertEqual(occupancy.occupied_rooms('Thu3-Ca1'), [])
+        self.assertEqual(occupancy.teacher_load, {'GV001': 1, 'GV002': 0})
+
+    def test_validate_constraints(self):
+        # Cùng phòng, cùng GV, tuần giao nhau → 2 lỗi cứng
+        result = validate_tkb_constraints('DOT1', 'LOP-2', 'A101', 'Thu2-Ca1', tuan_hoc='1' * 15)
+        self.assertFalse(result['valid'])
+        self.assertEqual(len(result['errors']), 2)
+        self.assertIn('LOP-1', result['errors'][0])
+
+        # Tuần rời nhau → hợp lệ
+        result = validate_tkb_constraints('DOT1', 'LOP-2', 'A101', 'Thu2-Ca1', tuan_hoc=SECOND_HALF)
+        self.assertTrue(result['valid'], result['errors'])
+
+        # Sửa chính dòng đó → không tự trùng
+        result = validate_tkb_constraints('DOT1', 'LOP-1', 'A101', 'Thu2-Ca1', exclude_ma_tkb='TKB-1')
+        self.assertTrue(result['valid'], result['errors'])
+
+        result = validate_tkb_constraints('DOT1', 'LOP-2', 'X999', 'Thu2-Ca1')
+        self.assertEqual(len(result['errors']), 1)
+        self.assertIn('Lỗi dữ liệu', result['errors'][0])
+
+    def test_cached_per_version(self):
+        dot = DotXep.objects.get(ma_dot='DOT1')
+        self.assertIs(type(ScheduleOccupancy.load(dot)), ScheduleOccupancy)
+        with self.assertNumQueries(1):  # chỉ đọc phiên bản
+            ScheduleOccupancy.load(dot)
+        ThoiKhoaBieu.objects.filter(ma_tkb='TKB-1').get().delete()  # signal tăng phiên bản
+        # Cùng instance DotXep đã nạp trước khi sửa vẫn thấy phiên bản mới
+        fresh = ScheduleOccupancy.load(dot)
+        self.assertIsNone(fresh.room_conflict('A101', 'Thu2-Ca1'))
+
+    def test_shared_version_bumped_once_on_commit(self):
+        version = DotXep.schedule_version('DOT1')
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for ma_phong in ('B201', 'B202', 'B203'):
+                    PhongHoc.objects.create(ma_phong=ma_phong, suc_chua=40)
+                self.assertEqual(DotXep.schedule_version('DOT1'), version)  # chưa commit
+        dot_version, shared_version = DotXep.schedule_version('DOT1').split('.')
+        self.assertEqual(dot_version, version.split('.')[0])
+        self.assertEqual(int(shared_version), int(version.split('.')[1]) + 1)
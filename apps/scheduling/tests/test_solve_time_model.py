@@ -0,0 +1,132 @@
+"""
+Dự đoán thời gian giải: fit / predict trên lịch sử, thiếu lịch sử, cache model theo
+lần chạy mới nhất và cache đặc trưng theo phiên bản TKB của đợt
+"""
+
+import math
+from datetime import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import Client, SimpleTestCase, TestCase
+from django.urls import reverse
+
+from apps.scheduling.algorithms import algorithms_data_adapter
+from apps.scheduling.algorithms.algorithms_runner import AlgorithmRunner
+from apps.scheduling.algorithms.solve_time_model import MIN_RUNS, SolveTimeModel
+from apps.scheduling.models import (
+    BoMon, DotXep, DuKienDT, GiangVien, Khoa, KhungTG, LopMonHoc, MonHoc, PhanCong, PhongHoc, SolverRun, TimeSlot
+)
+
+STATS_URL = reverse('sap_lich:algo_scheduler_get_stats_api')
+
+
+def synthetic_run(lectures, strategy='TS', initial_cost=1000.0):
+    """Lần chạy giả: cost giảm theo 1 / (1 + t / lectures) - instance lớn hơn thì chậm hơn"""
+    curve = [[t, initial_cost / (1 + t / lectures)] for t in range(0, 2000, 5)]
+    return {
+        'strategy': strategy,
+        'features': {'lectures': float(lectures), 'room_scarcity': 0.2, 'curriculum_density': 0.1,
+                     'teacher_load': 0.3, 'preferences': 0.0},
+        'initial_cost': initial_cost,
+        'final_cost': curve[-1][1],
+        'init_time': 1.0,
+        'curve': curve,
+    }
+
+
+class SolveTimeModelTest(SimpleTestCase):
+
+    def test_fit_and_predict(self):
+        runs = [synthetic_run(lectures) for lectures in (40, 80, 160, 320)]
+        model = SolveTimeModel().fit(runs)
+        self.assertTrue(model.ready)
+        self.assertEqual(model.n_runs, 4)
+
+        small, large = runs[0]['features'], runs[-1]['features']
+        self.assertLess(model.predict_seconds(small, 0.5), model.predict_seconds(large, 0.5))
+        self.assertLess(model.predict_seconds(small, 0.5), model.predict_seconds(small, 0.2))
+        seconds = model.predict_seconds(small, 0.5)
+        self.assertTrue(math.isclose(model.predict_ratio(small, seconds), 0.5, rel_tol=1e-6))
+
+        suggestion = model.suggest(small, target_ratio=0.5)
+        self.assertTrue(suggestion['available'])
+        self.assertGreaterEqual(suggestion['suggested_time_limit'], suggestion['predicted_seconds'])
+        self.assertEqual(set(suggestion['expected_ratio']), {'60', '180', '400'})
+
+    def test_too_little_history(self):
+        runs = [synthetic_run(40 * (index + 1)) for index in range(MIN_RUNS - 1)]
+        model = SolveTimeModel().fit(runs)
+        self.assertFalse(model.ready)
+        self.assertIsNone(model.predict_seconds(runs[0]['features'], 0.5))
+        suggestion = model.suggest(runs[0]['features'], target_ratio=0.5)
+        self.assertFalse(suggestion['available'])
+        self.assertIn('reason', suggestion)
+
+
+class SolveTimePredictionCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        khoa = Khoa.objects.create(ma_khoa='KHOA-001', ten_khoa='CNTT')
+        bo_mon = BoMon.objects.create(ma_bo_mon='BM-001', ma_khoa=khoa, ten_bo_mon='KHMT')
+        cls.gv = GiangVien.objects.create(ma_gv='GV001', ma_bo_mon=bo_mon, ten_gv='Nguyễn Văn A')
+        cls.mon = MonHoc.objects.create(ma_mon_hoc='MH001', ten_mon_hoc='Cấu trúc dữ liệu', so_tuan=10)
+        ca = KhungTG.objects.create(ma_khung_gio=1, ten_ca='Ca 1', gio_bat_dau=time(7), gio_ket_thuc=time(9, 30))
+        for thu in (2, 3):
+            TimeSlot.objects.create(time_slot_id=f'Thu{thu}-Ca1', thu=thu, ca=ca)
+        PhongHoc.objects.create(ma_phong='A101', suc_chua=60)
+        du_kien = DuKienDT.objects.create(ma_du_kien_dt='2025-2026_HK1', nam_hoc='2025-2026', hoc_ky=1)
+        cls.dot = DotXep.objects.create(ma_dot='DOT1', ma_du_kien_dt=du_kien, ten_dot='Đợt 1')
+        lop = LopMonHoc.objects.create(ma_lop='LOP-1', ma_mon_hoc=cls.mon, nhom_mh=1, so_luong_sv=40, so_ca_tuan=1)
+        PhanCong.objects.create(ma_dot=cls.dot, ma_lop=lop, ma_gv=cls.gv)
+        for lectures in (40, 80, 160):
+            cls.add_run(lectures)
+
+    @classmethod
+    def add_run(cls, lectures):
+        run = synthetic_run(lectures)
+        return SolverRun.objects.create(
+            ma_dot=cls.dot, algorithm=run['strategy'], features=run['features'], initial_cost=run['initial_cost'],
+            final_cost=run['final_cost'], phase_timings={'init': run['init_time']}, cost_curve=run['curve']
+        )
+
+    def setUp(self):
+        caches['default'].clear()
+        caches['schedule'].clear()
+        self.client = Client(HTTP_HOST='localhost')
+        self.client.force_login(self.user)
+
+    def test_model_cached_until_new_run(self):
+        model = AlgorithmRunner.solve_time_model()
+        self.assertEqual(model.n_runs, 3)
+        with self.assertNumQueries(1):  # chỉ đọc id lần chạy mới nhất
+            self.assertEqual(AlgorithmRunner.solve_time_model().coef, model.coef)
+
+        self.add_run(320)
+        self.assertEqual(AlgorithmRunner.solve_time_model().n_runs, 4)
+
+    def test_features_cached_per_schedule_version(self):
+        build = mock.patch.object(algorithms_data_adapter, 'build_instance_from_db',
+                                  wraps=algorithms_data_adapter.build_instance_from_db)
+        with build as build_instance:
+            first = self.client.get(STATS_URL, {'ma_dot': 'DOT1', 'target_ratio': '0.5'}).json()
+            second = self.client.get(STATS_URL, {'ma_dot': 'DOT1'}).json()
+            self.assertEqual(build_instance.call_count, 1)
+            self.assertEqual(first['prediction']['features'], second['prediction']['features'])
+            self.assertTrue(first['prediction']['available'])
+            self.assertEqual(first['prediction']['target_ratio'], 0.5)
+
+            lop = LopMonHoc.objects.create(ma_lop='LOP-2', ma_mon_hoc=self.mon, nhom_mh=2,
+                                           so_luong_sv=40, so_ca_tuan=1)
+            PhanCong.objects.create(ma_dot=self.dot, ma_lop=lop, ma_gv=self.gv)
+            third = self.client.get(STATS_URL, {'ma_dot': 'DOT1'}).json()
+            self.assertEqual(build_instance.call_count, 2)
+            self.assertEqual(third['prediction']['features']['lectures'], 2.0)
+
+    def test_rejects_bad_target_ratio(self):
+        for value in ('abc', '0', '-0.5', '1.5', 'nan'):
+            response = self.client.get(STATS_URL, {'ma_dot': 'DOT1', 'target_ratio': value})
+            self.assertEqual(response.status_code, 400, value)
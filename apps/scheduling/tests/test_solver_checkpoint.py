@@ -0,0 +1,46 @@
+"""
+Checkpoint solver chỉ được resume trên đúng dữ liệu (hash nội dung instance) và seed đã ghi
+"""
+
+import random
+import tempfile
+import time
+from dataclasses import replace
+from pathlib import Path
+
+from django.test import TestCase
+
+from apps.scheduling.algorithms.algorithms_core import (
+    ProgressLogger, SearchBudget, SolverCheckpoint, build_initial_solution, parse_instance,
+    restore_from_checkpoint, run_metaheuristic
+)
+
+
+class SolverCheckpointTest(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = Path(tmp.name) / 'solve.ckpt'
+        instance = parse_instance(None)
+        rng = random.Random(3)
+        state = build_initial_solution(instance, rng, 'greedy-cprop', time.time(), 180.0, deterministic=True)
+        with ProgressLogger(None) as logger:
+            run_metaheuristic(
+                state, 'SA', rng, logger, 0.0, checkpoint=SolverCheckpoint(path, seed=3), budget=SearchBudget(max_iterations=20)
+            )
+        self.payload = SolverCheckpoint.load(path)
+
+    def test_resume_same_instance(self):
+        state = restore_from_checkpoint(parse_instance(None), self.payload, random.Random(), seed=3)
+        self.assertEqual(state.clone_assignments(), self.payload['current_assignments'])
+
+    def test_rejects_changed_instance(self):
+        instance = parse_instance(None)
+        instance.rooms[0] = replace(instance.rooms[0], capacity=instance.rooms[0].capacity + 1)
+        with self.assertRaisesMessage(ValueError, 'different data'):
+            restore_from_checkpoint(instance, self.payload, random.Random())
+
+    def test_rejects_other_seed(self):
+        with self.assertRaisesMessage(ValueError, 'seed 3'):
+            restore_from_checkpoint(parse_instance(None), self.payload, random.Random(), seed=4)
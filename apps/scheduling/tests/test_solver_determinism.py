@@ -0,0 +1,90 @@
+"""
+Solver chạy với count budget (max_iterations, không time limit) phải cho kết quả
+giống hệt nhau với cùng seed: cả bước xây lời giải ban đầu lẫn SA/TS không phụ thuộc đồng hồ
+"""
+
+import random
+import time
+from unittest import mock
+
+import numpy as np
+from django.test import TestCase
+
+from apps.scheduling.algorithms import algorithms_core
+from apps.scheduling.algorithms.algorithms_core import (
+    Neighborhood, ProgressLogger, SearchBudget, SimulatedAnnealing, TabuSearch, build_initial_solution,
+    parse_instance, run_metaheuristic
+)
+
+
+class _SlowClock:
+    """time.time() tăng 1000s mỗi lần gọi: mọi deadline theo đồng hồ đều đã hết"""
+
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        self.now += 1000.0
+        return self.now
+
+
+class _NoMove(Neighborhood):
+    """Operator không sinh được move nào"""
+
+    name = 'NoMove'
+
+    def generate_candidate(self, state, rng):
+        return None
+
+
+class DeterministicBudgetTest(TestCase):
+
+    def solve(self, meta, seed=7):
+        instance = parse_instance(None)
+        rng = random.Random(seed)
+        state = build_initial_solution(instance, rng, 'greedy-cprop', time.time(), 180.0, deterministic=True)
+        budget = SearchBudget(max_iterations=100)
+        with ProgressLogger(None) as logger:
+            assignments, _ = run_metaheuristic(state, meta, rng, logger, 0.0, budget=budget)
+        return assignments, budget.iterations
+
+    def test_same_seed_same_assignments(self):
+        for meta in ('SA', 'TS'):
+            with self.subTest(meta=meta):
+                first, iterations = self.solve(meta)
+                second, _ = self.solve(meta)
+                self.assertEqual(first, second)
+                self.assertEqual(iterations, 100)
+
+    def test_independent_of_wall_clock(self):
+        expected, _ = self.solve('SA')
+        with mock.patch.object(algorithms_core.time, 'time', _SlowClock()):
+            slow, _ = self.solve('SA')
+        self.assertEqual(slow, expected)
+
+    def test_failed_generations_use_budget(self):
+        state = build_initial_solution(parse_instance(None), random.Random(1), 'greedy-cprop', time.time(), 180.0,
+                                       deterministic=True)
+        for search_class in (SimulatedAnnealing, TabuSearch):
+            with self.subTest(search=search_class.meta), ProgressLogger(None) as logger:
+                budget = SearchBudget(max_evaluations=50)
+                search = search_class(state, [_NoMove()], random.Random(1), logger, budget=budget)
+                search.run(state.clone_assignments(), state.score_breakdown(), time.time(), 0.0)
+                self.assertGreaterEqual(budget.evaluations, 50)
+                self.assertEqual(search.manager.generated, [budget.evaluations])
+                self.assertEqual(search.manager.feasible_ratio, 0.0)
+
+    def test_batch_eval_is_opt_in(self):
+        state = build_initial_solution(parse_instance(None), random.Random(2), 'greedy-cprop', time.time(), 180.0,
+                                       deterministic=True)
+        with ProgressLogger(None) as logger:
+            self.assertIsNone(TabuSearch(state, [_NoMove()], random.Random(2), logger).batch_evaluator)
+            self.assertIsNotNone(TabuSearch(state, [_NoMove()], random.Random(2), logger, batch_eval=True).batch_evaluator)
+
+    def test_batch_day_counts_stay_in_sync(self):
+        state = build_initial_solution(parse_instance(None), random.Random(2), 'greedy-cprop', time.time(), 180.0,
+                                       deterministic=True)
+        with ProgressLogger(None) as logger:
+            run_metaheuristic(state, 'TS', random.Random(2), logger, 0.0, batch_eval=True,
+                              budget=SearchBudget(max_iterations=50))
+        np.testing.assert_array_equal(state.day_count_array(), np.array(state.course_day_counts))
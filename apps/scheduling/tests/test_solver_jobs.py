@@ -0,0 +1,140 @@
+"""
+Hàng đợi solver: claim_next không vượt giới hạn số job chạy đồng thời,
+ghi tiến trình theo chu kỳ và stream SSE
+"""
+
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from apps.sap_lich import views
+from apps.scheduling.algorithms.solver_jobs import JobProgressRecorder, claim_next, enqueue
+from apps.scheduling.models import DotXep, DuKienDT, SolverJob
+
+
+@override_settings(SOLVER_MAX_CONCURRENT_JOBS=1)
+class ClaimNextTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        du_kien = DuKienDT.objects.create(ma_du_kien_dt='2025-2026_HK1', nam_hoc='2025-2026', hoc_ky=1)
+        cls.jobs = [
+            SolverJob.objects.create(
+                ma_dot=DotXep.objects.create(ma_dot=f'DOT{index}', ma_du_kien_dt=du_kien, ten_dot=f'Đợt {index}'),
+                params={}
+            )
+            for index in (1, 2)
+        ]
+
+    def test_respects_limit(self):
+        job = claim_next('worker-a')
+        self.assertEqual((job.id, job.status, job.worker), (self.jobs[0].id, 'RUNNING', 'worker-a'))
+        self.assertIsNone(claim_next('worker-b'))  # đã đủ 1 job RUNNING
+
+        SolverJob.objects.filter(id=job.id).update(status='DONE')
+        self.assertEqual(claim_next('worker-b').id, self.jobs[1].id)
+        self.assertIsNone(claim_next('worker-b'))  # hết job QUEUED
+
+    def test_inline_jobs_count_toward_limit(self):
+        du_kien = DuKienDT.objects.get()
+        inline = enqueue(DotXep.objects.create(ma_dot='DOT3', ma_du_kien_dt=du_kien), {}, run_inline=True)
+        self.assertEqual(inline.status, 'RUNNING')
+        self.assertIsNone(claim_next('worker-a'))  # job inline chiếm chỗ duy nhất
+
+        # Hết chỗ: yêu cầu chạy trực tiếp vẫn vào hàng đợi
+        queued = enqueue(DotXep.objects.create(ma_dot='DOT4', ma_du_kien_dt=du_kien), {}, run_inline=True)
+        self.assertEqual((queued.status, queued.started_at), ('QUEUED', None))
+
+    def test_run_api_queues_by_default(self):
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        DotXep.objects.create(ma_dot='DOT3', ma_du_kien_dt=DuKienDT.objects.get())
+        response = client.post(reverse('sap_lich:algo_scheduler_run_api'), {'ma_dot': 'DOT3'},
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(SolverJob.objects.get(id=response.json()['job_id']).status, 'QUEUED')
+
+
+class JobProgressRecorderTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        du_kien = DuKienDT.objects.create(ma_du_kien_dt='2025-2026_HK1', nam_hoc='2025-2026', hoc_ky=1)
+        dot = DotXep.objects.create(ma_dot='DOT1', ma_du_kien_dt=du_kien, ten_dot='Đợt 1')
+        cls.job = SolverJob.objects.create(ma_dot=dot, params={})
+
+    def stored(self):
+        return SolverJob.objects.values_list('progress', flat=True).get(id=self.job.id)
+
+    def test_throttles_writes_within_phase(self):
+        recorder = JobProgressRecorder(self.job.id, interval=3600)
+        recorder({'phase': 'search', 'elapsed': 0.5, 'best_cost': 100})  # đổi phase → ghi ngay
+        self.assertEqual(self.stored()['seq'], 1)
+
+        recorder({'phase': 'search', 'elapsed': 1.0, 'best_cost': 90})
+        recorder({'phase': 'search', 'elapsed': 1.5, 'best_cost': 80})
+        stored = self.stored()
+        self.assertEqual((stored['seq'], stored['best_cost']), (1, 100))
+        self.assertEqual(recorder.snapshot['curve'], [[0.5, 100], [1.0, 90], [1.5, 80]])
+
+        recorder({'phase': 'save'})  # đổi phase → ghi cả các điểm đã gộp
+        stored = self.stored()
+        self.assertEqual((stored['seq'], stored['phase'], stored['best_cost']), (2, 'save', 80))
+        self.assertEqual(len(stored['curve']), 3)
+
+    def test_writes_after_interval(self):
+        recorder = JobProgressRecorder(self.job.id, interval=0)
+        for cost in (100, 90, 80):
+            recorder({'phase': 'search', 'elapsed': 1.0, 'best_cost': cost})
+        self.assertEqual(self.stored()['seq'], 3)
+
+
+PROGRESS_URL = reverse('sap_lich:algo_scheduler_job_progress_api')
+
+
+class JobProgressStreamTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        du_kien = DuKienDT.objects.create(ma_du_kien_dt='2025-2026_HK1', nam_hoc='2025-2026', hoc_ky=1)
+        dot = DotXep.objects.create(ma_dot='DOT1', ma_du_kien_dt=du_kien, ten_dot='Đợt 1')
+        cls.job = SolverJob.objects.create(
+            ma_dot=dot, params={}, status='RUNNING', progress={'seq': 2, 'phase': 'search', 'best_cost': 80}
+        )
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client = Client(HTTP_HOST='localhost')
+        self.client.force_login(self.user)
+
+    def stream(self, **headers):
+        response = self.client.get(PROGRESS_URL, {'job_id': self.job.id}, **headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return [block for block in b''.join(response.streaming_content).decode().split('\n\n') if block]
+
+    def test_done_job(self):
+        SolverJob.objects.filter(id=self.job.id).update(status='DONE')
+        events = self.stream()
+        self.assertTrue(events[0].startswith('retry: '))
+        progress_id, progress_event, progress_data = events[1].split('\n')
+        self.assertEqual((progress_id, progress_event), ('id: 2', 'event: progress'))
+        self.assertEqual(json.loads(progress_data[len('data: '):])['job_status'], 'DONE')
+        self.assertTrue(events[2].startswith('event: done\ndata: '))
+        self.assertEqual(len(events), 3)
+
+    @mock.patch.object(views, 'JOB_PROGRESS_STREAM_MAX_SECONDS', 0.3)
+    @override_settings(SOLVER_PROGRESS_INTERVAL=0.1)
+    def test_running_job_stream_is_capped(self):
+        # Job chưa xong: stream đóng sau JOB_PROGRESS_STREAM_MAX_SECONDS để EventSource kết nối lại
+        events = self.stream()
+        self.assertEqual([event.split('\n')[0] for event in events], ['retry: 400', 'id: 2'])
+
+        # Kết nối lại với Last-Event-ID: không gửi lại sự kiện đã nhận
+        self.assertEqual(self.stream(HTTP_LAST_EVENT_ID='2'), ['retry: 400'])
+
+    def test_unknown_job(self):
+        response = self.client.get(PROGRESS_URL, {'job_id': 999})
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,51 @@
+"""
+AlgorithmRunner._record_run: ghi SolverRun cho mỗi lần chạy; lỗi DB chỉ được log
+(không làm hỏng kết quả), lỗi khác (bug) không bị nuốt
+"""
+
+from unittest import mock
+
+from django.db import DatabaseError
+from django.test import TestCase
+
+from apps.scheduling.algorithms.algorithms_runner import AlgorithmRunner
+from apps.scheduling.models import DotXep, DuKienDT, SolverRun
+
+RESULT = {'initial_cost': 120.0, 'final_cost': 80.0, 'init_time': 1.5, 'time_elapsed': 10.0}
+
+
+class RecordRunTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        du_kien = DuKienDT.objects.create(ma_du_kien_dt='2025-2026_HK1', nam_hoc='2025-2026', hoc_ky=1)
+        cls.dot = DotXep.objects.create(ma_dot='DOT1', ma_du_kien_dt=du_kien, ten_dot='Đợt 1')
+
+    def setUp(self):
+        self.runner = AlgorithmRunner('DOT1', seed=5)
+        self.runner.dot_xep = self.dot
+        self.runner.prepare_time = 0.5
+
+    def test_records_run(self):
+        result = dict(RESULT)
+        self.runner._record_run('SUCCESS', 'ts', 'greedy-cprop', 60.0, result=result)
+        run = SolverRun.objects.get()
+        self.assertEqual(result['solver_run_id'], run.id)
+        self.assertEqual(self.runner.solver_run, run)
+        self.assertEqual((run.status, run.algorithm, run.seed), ('SUCCESS', 'TS', 5))
+        self.assertEqual(run.phase_timings, {'prepare': 0.5, 'init': 1.5, 'search': 8.5})
+
+    def test_database_error_logged(self):
+        result = dict(RESULT)
+        with mock.patch.object(SolverRun.objects, 'create', side_effect=DatabaseError('disk full')):
+            with self.assertLogs('apps.scheduling.algorithms.algorithms_runner', 'ERROR') as logs:
+                self.runner._record_run('SUCCESS', 'TS', 'greedy-cprop', 60.0, result=result)
+        self.assertIsNone(self.runner.solver_run)
+        self.assertNotIn('solver_run_id', result)
+        self.assertIn('DOT1', logs.output[0])
+        self.assertIsNotNone(logs.records[0].exc_info)
+
+    def test_other_errors_propagate(self):
+        with mock.patch.object(SolverRun.objects, 'create', side_effect=TypeError('bad field')):
+            with self.assertRaises(TypeError):
+                self.runner._record_run('SUCCESS', 'TS', 'greedy-cprop', 60.0, result=dict(RESULT))
@@ -0,0 +1,144 @@
+"""
+Bộ nhớ tabu: TabuList hết hạn theo tenure và bị chặn bởi capacity, AttributeTabuList
+cấm (lecture, period) trong tenure; TabuSearch vẫn chọn move tabu khi đạt aspiration
+"""
+
+import random
+import time
+
+from django.test import TestCase
+
+from apps.scheduling.algorithms.algorithms_core import (
+    AttributeTabuList, Move, Neighborhood, ProgressLogger, SearchBudget, TabuList, TabuSearch,
+    build_initial_solution, parse_instance
+)
+
+
+class TabuListTest(TestCase):
+
+    def test_tenure_expiry(self):
+        tabu = TabuList()
+        tabu.add(('move', 1), expiry=5)
+        self.assertTrue(tabu.is_tabu(('move', 1), 4))
+        self.assertFalse(tabu.is_tabu(('move', 1), 5))
+        self.assertFalse(tabu.is_tabu(('move', 2), 0))
+
+        tabu.expire(4)
+        self.assertEqual(len(tabu), 1)
+        tabu.expire(5)
+        self.assertEqual(len(tabu), 0)
+
+    def test_readd_extends_tenure(self):
+        tabu = TabuList()
+        tabu.add(('move', 1), expiry=5)
+        tabu.add(('move', 1), expiry=10)
+        tabu.expire(5)  # entry heap cũ (expiry 5) không được xóa entry mới
+        self.assertTrue(tabu.is_tabu(('move', 1), 9))
+        tabu.expire(10)
+        self.assertEqual(len(tabu), 0)
+
+    def test_capacity_bound(self):
+        tabu = TabuList(capacity=3)
+        for index in range(10):
+            tabu.add(('move', index), expiry=10 + index)
+            self.assertLessEqual(len(tabu), 3)
+        # Entry có expiry sớm nhất bị đẩy ra trước
+        self.assertEqual(sorted(tabu.state_dict()), [('move', 7), ('move', 8), ('move', 9)])
+
+    def test_state_dict_round_trip(self):
+        tabu = TabuList()
+        tabu.add(('a',), expiry=3)
+        tabu.add(('b',), expiry=7)
+        restored = TabuList()
+        restored.load_state_dict(tabu.state_dict())
+        restored.expire(3)
+        self.assertEqual(restored.state_dict(), {('b',): 7})
+
+
+class AttributeTabuListTest(TestCase):
+
+    def test_tenure_expiry(self):
+        tabu = AttributeTabuList(lecture_count=3, period_count=4)
+        tabu.add(1, 2, expiry=6)
+        self.assertTrue(tabu.is_tabu(1, 2, 5))
+        self.assertFalse(tabu.is_tabu(1, 2, 6))
+        self.assertFalse(tabu.is_tabu(1, 3, 0))
+        self.assertFalse(tabu.is_tabu(2, 2, 0))
+
+    def test_fixed_size_and_round_trip(self):
+        tabu = AttributeTabuList(lecture_count=3, period_count=4)
+        for iteration in range(50):
+            tabu.add(iteration % 3, iteration % 4, expiry=iteration + 5)
+        self.assertEqual(len(tabu), 12)
+
+        restored = AttributeTabuList(lecture_count=3, period_count=4)
+        restored.load_state_dict(tabu.state_dict())
+        self.assertEqual(restored.state_dict(), tabu.state_dict())
+        tabu.clear()
+        self.assertEqual(tabu.state_dict(), {})
+
+
+class _FixedMove(Move):
+    """Move có delta cố định, apply chỉ ghi lại là đã được chọn"""
+
+    name = 'Fixed'
+
+    def __init__(self, key, delta, applied):
+        self.key = key
+        self.delta = delta
+        self.applied = applied
+
+    def evaluate(self, state):
+        return self.delta
+
+    def apply(self, state):
+        self.applied.append(self.key)
+        return self.delta
+
+    def signature(self):
+        return ('fixed', self.key)
+
+    def attributes(self, state):
+        return [(0, 0)]
+
+
+class _Cycle(Neighborhood):
+
+    name = 'Cycle'
+
+    def __init__(self, moves):
+        self.moves = moves
+        self.index = 0
+
+    def generate_candidate(self, state, rng):
+        self.index += 1
+        return self.moves[self.index % len(self.moves)]
+
+
+class AspirationTest(TestCase):
+
+    def setUp(self):
+        self.state = build_initial_solution(parse_instance(None), random.Random(1), 'greedy-cprop', time.time(), 180.0,
+                                            deterministic=True)
+
+    def choose(self, tabu_delta, tabu_mode='move'):
+        """Một vòng TS với move tabu (delta ``tabu_delta``) và move tự do xấu hơn (delta +3)."""
+        applied = []
+        moves = [_FixedMove('tabu', tabu_delta, applied), _FixedMove('free', 3, applied)]
+        with ProgressLogger(None) as logger:
+            search = TabuSearch(self.state, [_Cycle(moves)], random.Random(2), logger, tabu_mode=tabu_mode,
+                                budget=SearchBudget(max_iterations=1))
+            if tabu_mode == 'attribute':
+                search.tabu.add(0, 0, expiry=100)
+                moves[1].attributes = lambda state: [(0, 1)]
+            else:
+                search.tabu.add(moves[0].signature(), expiry=100)
+            search.run(self.state.clone_assignments(), self.state.score_breakdown(), time.time(), 0.0)
+        return applied
+
+    def test_tabu_move_skipped_without_improvement(self):
+        self.assertEqual(self.choose(tabu_delta=0), ['free'])
+
+    def test_tabu_move_beating_best_is_chosen(self):
+        self.assertEqual(self.choose(tabu_delta=-5), ['tabu'])
+        self.assertEqual(self.choose(tabu_delta=-5, tabu_mode='attribute'), ['tabu'])
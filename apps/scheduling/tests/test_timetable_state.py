@@ -0,0 +1,103 @@
+"""
+TimetableState.check_hard_constraints: chỉ đếm lại trùng lịch từ assignments khi bật JIT;
+penalty kernels bản Numba và Python thuần cho cùng kết quả
+"""
+
+import random
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from django.test import TestCase
+
+from apps.scheduling.algorithms import algorithms_core, penalty_kernels
+from apps.scheduling.algorithms.algorithms_core import (
+    MoveLectureNeighborhood, SwapLecturesNeighborhood, TimetableState, build_initial_solution, parse_instance,
+    rebuild_state
+)
+
+DOT1_CTT = Path(algorithms_core.__file__).resolve().parent / 'alo_origin' / 'test_data' / 'dot1.ctt'
+
+
+class CheckHardConstraintsTest(TestCase):
+
+    def setUp(self):
+        self.state = build_initial_solution(parse_instance(None), random.Random(1), 'greedy-cprop', time.time(), 180.0,
+                                            deterministic=True)
+
+    def test_incremental_without_jit(self):
+        self.state._use_jit = False
+        with mock.patch.object(TimetableState, 'count_hard_conflicts') as count:
+            self.assertTrue(self.state.check_hard_constraints())
+        count.assert_not_called()
+
+    def test_recount_with_jit(self):
+        self.state._use_jit = True
+        with mock.patch.object(TimetableState, 'count_hard_conflicts', return_value=1) as count:
+            self.assertFalse(self.state.check_hard_constraints())
+        count.assert_called_once()
+
+
+@unittest.skipUnless(penalty_kernels.NUMBA_AVAILABLE, 'Numba chưa được cài')
+class PenaltyKernelsJitTest(TestCase):
+    """Cùng tập move trên dot1.ctt: delta, breakdown và số xung đột giống hệt giữa 2 chế độ"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.addClassCleanup(penalty_kernels.set_jit_enabled, penalty_kernels.jit_enabled())
+        penalty_kernels.set_jit_enabled(False)
+        cls.instance = parse_instance(str(DOT1_CTT))
+        # Xếp first-fit (greedy-cprop trên dot1 mất vài chục giây, test chỉ cần một state hợp lệ)
+        rng = random.Random(3)
+        base = TimetableState(cls.instance)
+        for lecture in cls.instance.lectures:
+            periods = sorted(cls.instance.feasible_periods[lecture.course])
+            rooms = sorted(cls.instance.course_room_sets[lecture.course])
+            rng.shuffle(periods)
+            rng.shuffle(rooms)
+            next((True for period in periods for room in rooms[:5]
+                  if base.move_lecture(lecture.id, period, room) is not None), None)
+        cls.assignments = base.clone_assignments()
+        neighborhoods = [MoveLectureNeighborhood(), SwapLecturesNeighborhood()]
+        cls.moves = [
+            move for move in (rng.choice(neighborhoods).generate_candidate(base, rng) for _ in range(400))
+            if move is not None
+        ]
+
+    def evaluate(self, use_jit):
+        self.assertEqual(penalty_kernels.set_jit_enabled(use_jit), use_jit)
+        state = rebuild_state(self.instance, self.assignments)
+        self.assertEqual(state._use_jit, use_jit)
+        deltas, breakdown = [move.evaluate(state) for move in self.moves], state.score_breakdown()
+        lecture_a, lecture_b = self.instance.lectures[:2]
+        state.assignments[lecture_b.id] = state.assignments[lecture_a.id]  # cùng phòng, cùng period
+        return deltas, breakdown, state.count_hard_conflicts()
+
+    def test_identical_deltas(self):
+        python_deltas, python_breakdown, python_conflicts = self.evaluate(False)
+        jit_deltas, jit_breakdown, jit_conflicts = self.evaluate(True)
+        self.assertEqual(len(self.assignments), len(self.instance.lectures))
+        self.assertGreater(len(self.moves), 100)
+        self.assertGreater(python_conflicts, 0)
+        self.assertEqual(jit_deltas, python_deltas)
+        self.assertEqual(jit_breakdown, python_breakdown)
+        self.assertEqual(jit_conflicts, python_conflicts)
+
+
+class CountHardConflictsTest(TestCase):
+
+    def test_without_numpy(self):
+        state = build_initial_solution(parse_instance(None), random.Random(1), 'greedy-cprop', time.time(), 180.0,
+                                       deterministic=True)
+        lecture_a, lecture_b = state.instance.lectures[:2]
+        state.assignments[lecture_b.id] = state.assignments[lecture_a.id]  # cùng phòng, cùng period
+        expected = state.count_hard_conflicts()
+        self.assertGreater(expected, 0)
+        with mock.patch.object(algorithms_core, 'np', None):
+            instance = parse_instance(None)
+            self.assertIsNone(instance.lecture_teacher_array)
+            state.instance = instance
+            state._use_jit = False
+            self.assertEqual(state.count_hard_conflicts(), expected)
@@ -0,0 +1,96 @@
+"""
+Số query của các API đọc TKB không tăng theo số dòng TKB
+(thông tin giảng viên lấy từ chỉ mục lớp → GV dùng chung của đợt, không tra từng dòng)
+"""
+
+from datetime import time
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from apps.sap_lich.views import (
+    algo_scheduler_export_excel_api, build_schedule_data,
+    tkb_gv_schedule_api, tkb_mini_schedule_api
+)
+from apps.scheduling.models import (
+    BoMon, DotXep, DuKienDT, GiangVien, Khoa, KhungTG, LopMonHoc, MonHoc,
+    PhanCong, PhongHoc, ThoiKhoaBieu, TimeSlot
+)
+
+
+class TKBQueryCountTest(TestCase):
+    """Gọi mỗi API với ít và nhiều dòng TKB, số query phải như nhau"""
+
+    @classmethod
+    def setUpTestData(cls):
+        khoa = Khoa.objects.create(ma_khoa='KHOA-001', ten_khoa='CNTT')
+        bo_mon = BoMon.objects.create(ma_bo_mon='BM-001', ma_khoa=khoa, ten_bo_mon='KHMT')
+        cls.gv = GiangVien.objects.create(ma_gv='GV001', ma_bo_mon=bo_mon, ten_gv='Nguyễn Văn A')
+        cls.mon = MonHoc.objects.create(ma_mon_hoc='MH001', ten_mon_hoc='Cấu trúc dữ liệu')
+        ca = KhungTG.objects.create(ma_khung_gio=1, ten_ca='Ca 1', gio_bat_dau=time(7), gio_ket_thuc=time(9, 30))
+        cls.slots = [
+            TimeSlot.objects.create(time_slot_id=f'Thu{thu}-Ca1', thu=thu, ca=ca) for thu in range(2, 8)
+        ]
+        cls.phong = PhongHoc.objects.create(ma_phong='A101', suc_chua=60)
+        du_kien = DuKienDT.objects.create(ma_du_kien_dt='2025-2026_HK1', nam_hoc='2025-2026', hoc_ky=1)
+        cls.dot = DotXep.objects.create(ma_dot='DOT1', ma_du_kien_dt=du_kien, ten_dot='Đợt 1')
+        cls.factory = RequestFactory()
+
+    def setUp(self):
+        caches['schedule'].clear()
+
+    def add_rows(self, count, is_deleted=False):
+        """Thêm ``count`` lớp (mỗi lớp 1 phân công + 1 dòng TKB)"""
+        start = LopMonHoc.objects.count()
+        for index in range(start, start + count):
+            lop = LopMonHoc.objects.create(ma_mon_hoc=self.mon, nhom_mh=index + 1, so_luong_sv=40)
+            PhanCong.objects.create(ma_dot=self.dot, ma_lop=lop, ma_gv=self.gv)
+            ThoiKhoaBieu.objects.create(
+                ma_dot=self.dot, ma_lop=lop, ma_phong=self.phong,
+                time_slot_id=self.slots[index % len(self.slots)], tuan_hoc='1' * 15, is_deleted=is_deleted
+            )
+
+    def count_queries(self, call):
+        caches['schedule'].clear()  # đo cả lần dựng chỉ mục
+        with CaptureQueriesContext(connection) as ctx:
+            call()
+        return len(ctx.captured_queries)
+
+    def assertConstantQueries(self, call):
+        self.add_rows(2)
+        self.add_rows(1, is_deleted=True)
+        few = self.count_queries(call)
+        self.add_rows(8)
+        self.add_rows(4, is_deleted=True)
+        self.assertEqual(self.count_queries(call), few)
+
+    def test_mini_schedule(self):
+        def call():
+            request = self.factory.get('/', {'ma_dot': 'DOT1', 'view_type': 'teacher', 'selected_id': 'GV001'})
+            self.assertEqual(tkb_mini_schedule_api(request).status_code, 200)
+        self.assertConstantQueries(call)
+
+    def test_gv_schedule(self):
+        def call():
+            request = self.factory.get('/', {'ma_dot': 'DOT1', 'ma_gv': 'GV001'})
+            self.assertEqual(tkb_gv_schedule_api(request).status_code, 200)
+        self.assertConstantQueries(call)
+
+    def test_export_excel(self):
+        def call():
+            response = algo_scheduler_export_excel_api(self.factory.get('/', {'ma_dot': 'DOT1'}))
+            self.assertEqual(response.status_code, 200)
+            b''.join(response.streaming_content)
+            response.file_to_stream.close()
+        self.assertConstantQueries(call)
+
+    def test_build_schedule_data(self):
+        def call():
+            dot = DotXep.objects.get(ma_dot='DOT1')
+            tkb_list = ThoiKhoaBieu.objects.filter(ma_dot=dot, is_deleted=False).select_related(
+                'ma_lop', 'ma_lop__ma_mon_hoc', 'ma_phong', 'time_slot_id', 'time_slot_id__ca'
+            )
+            build_schedule_data(tkb_list, 'general', 1, dot)
+        self.assertConstantQueries(call)
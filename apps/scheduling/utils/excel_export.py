@@ -3,109 +3,191 @@ Excel Export Utility for Scheduling System
 Xuất dữ liệu các bảng ra file Excel
 """
 
-from django.http import HttpResponse
+import tempfile
+from datetime import datetime
+from itertools import chain, islice
+
+from django.core.exceptions import FieldDoesNotExist
+from django.http import FileResponse
 from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
 from openpyxl.utils import get_column_letter
-from datetime import datetime
+
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Số dòng đầu dùng để tính độ rộng cột
+WIDTH_SAMPLE_ROWS = 100
+
+
+def _cell_text(value):
+    """Giá trị ô: datetime → dd/mm/YYYY HH:MM, None → '', còn lại str()"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%d/%m/%Y %H:%M')
+    return str(value)
 
 
 class ExcelExporter:
     """Utility class to export Django QuerySets to Excel"""
     
     @staticmethod
-    def export_queryset(queryset, fields, headers, filename, title=None):
+    def stream_workbook(headers, rows, filename, title=None, header_size=12):
         """
-        Export Django QuerySet to Excel file
+        Ghi dữ liệu ra workbook write-only (openpyxl) - từng dòng được ghi thẳng
+        xuống file tạm thay vì giữ cả sheet với style riêng từng ô trong bộ nhớ.
+        Style dùng chung qua NamedStyle; độ rộng cột tính từ 100 dòng đầu.
         
         Args:
-            queryset: Django QuerySet to export
-            fields: List of field names to export (can use dot notation for related fields)
             headers: List of column headers
+            rows: Iterable các dòng (list giá trị), nên là generator/iterator
             filename: Name of the Excel file (without .xlsx extension)
             title: Optional title for the worksheet
+            header_size: Cỡ chữ dòng tiêu đề
         
         Returns:
-            HttpResponse with Excel file
+            FileResponse đọc dần từ file tạm (tự xóa khi đóng)
         """
-        # Create workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = title or "Data"
+        rows = ([_cell_text(value) for value in row] for row in rows)
+        sample = list(islice(rows, WIDTH_SAMPLE_ROWS))
+        
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(title or "Data")
         
-        # Styling
-        header_fill = PatternFill(start_color="0066CC", end_color="0066CC", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF", size=12)
         border = Border(
             left=Side(style='thin'),
             right=Side(style='thin'),
             top=Side(style='thin'),
             bottom=Side(style='thin')
         )
+        wb.add_named_style(NamedStyle(
+            name='export_header',
+            fill=PatternFill(start_color="0066CC", end_color="0066CC", fill_type="solid"),
+            font=Font(bold=True, color="FFFFFF", size=header_size),
+            alignment=Alignment(horizontal='center', vertical='center'),
+            border=border,
+        ))
+        wb.add_named_style(NamedStyle(
+            name='export_cell',
+            alignment=Alignment(vertical='center'),
+            border=border,
+        ))
         
-        # Write headers
+        # Write-only: độ rộng cột và freeze phải đặt trước khi ghi dòng
         for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            cell.border = border
+            max_length = max([len(header)] + [len(row[col_num - 1]) for row in sample])
+            ws.column_dimensions[get_column_letter(col_num)].width = min(max_length + 2, 50)
+        ws.freeze_panes = 'A2'
         
-        # Write data
-        for row_num, obj in enumerate(queryset, 2):
-            for col_num, field in enumerate(fields, 1):
-                # Handle nested fields (e.g., 'ma_khoa.ten_khoa')
-                value = obj
-                for field_part in field.split('.'):
-                    if hasattr(value, field_part):
-                        value = getattr(value, field_part)
-                    else:
-                        value = ''
-                        break
-                
-                # Handle callable fields (e.g., methods)
-                if callable(value):
-                    value = value()
-                
-                # Format datetime
-                if isinstance(value, datetime):
-                    value = value.strftime('%d/%m/%Y %H:%M')
-                
-                cell = ws.cell(row=row_num, column=col_num)
-                cell.value = str(value) if value is not None else ''
-                cell.border = border
-                cell.alignment = Alignment(vertical='center')
+        def styled(values, style):
+            cells = []
+            for value in values:
+                cell = WriteOnlyCell(ws, value=value)
+                cell.style = style
+                cells.append(cell)
+            return cells
         
-        # Auto-adjust column widths
-        for col_num in range(1, len(headers) + 1):
-            column_letter = get_column_letter(col_num)
-            max_length = 0
-            
-            # Check header length
-            max_length = len(headers[col_num - 1])
-            
-            # Check data length (sample first 100 rows)
-            for row_num in range(2, min(102, ws.max_row + 1)):
-                cell_value = ws[f'{column_letter}{row_num}'].value
-                if cell_value:
-                    max_length = max(max_length, len(str(cell_value)))
-            
-            # Set column width (add some padding)
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+        ws.append(styled(headers, 'export_header'))
+        for row in chain(sample, rows):
+            ws.append(styled(row, 'export_cell'))
         
-        # Freeze header row
-        ws.freeze_panes = 'A2'
+        output = tempfile.TemporaryFile()
+        wb.save(output)
+        output.seek(0)
+        return FileResponse(output, as_attachment=True, filename=f'{filename}.xlsx',
+                            content_type=XLSX_CONTENT_TYPE)
+    
+    @staticmethod
+    def _value_lookups(model, fields):
+        """
+        Đổi field dạng 'a.b' sang lookup 'a__b' cho values_list.
+        Field không tồn tại → None (ô trống). Trả về None nếu có field phải đọc
+        qua object (kết thúc ở quan hệ → __str__, property, method).
+        """
+        lookups = []
+        for field in fields:
+            current = model
+            parts = field.split('.')
+            for index, part in enumerate(parts):
+                try:
+                    model_field = current._meta.get_field(part)
+                except FieldDoesNotExist:
+                    if hasattr(current, part):
+                        return None
+                    lookups.append(None)
+                    break
+                if model_field.is_relation:
+                    if index == len(parts) - 1 or not (model_field.many_to_one or model_field.one_to_one):
+                        return None
+                    current = model_field.related_model
+            else:
+                lookups.append('__'.join(parts))
+        return lookups
+    
+    @staticmethod
+    def _object_value(obj, field):
+        """Đọc field dạng 'a.b' qua object (giá trị trống nếu thiếu)"""
+        value = obj
+        for field_part in field.split('.'):
+            if hasattr(value, field_part):
+                value = getattr(value, field_part)
+            else:
+                return ''
+        # Handle callable fields (e.g., methods)
+        return value() if callable(value) else value
+    
+    @staticmethod
+    def export_queryset(queryset, fields, headers, filename, title=None):
+        """
+        Export Django QuerySet to Excel file (streaming, xem stream_workbook)
         
-        # Create response
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename="{filename}.xlsx"'
+        Dữ liệu đọc bằng values_list().iterator() khi mọi field là cột thường;
+        nếu có field cần object (quan hệ, property, method) thì iterator() trên
+        object với select_related.
+        
+        Args:
+            queryset: Django QuerySet to export
+            fields: List of field names to export (can use dot notation for related fields)
+            headers: List of column headers
+            filename: Name of the Excel file (without .xlsx extension)
+            title: Optional title for the worksheet
+        
+        Returns:
+            FileResponse with Excel file
+        """
+        lookups = ExcelExporter._value_lookups(queryset.model, fields)
+        if lookups is not None:
+            columns = [lookup for lookup in lookups if lookup]
+            
+            def rows():
+                for values in queryset.values_list(*columns).iterator(chunk_size=2000):
+                    values = iter(values)
+                    yield [next(values) if lookup else '' for lookup in lookups]
+        else:
+            related = set()
+            for field in fields:
+                current, path = queryset.model, []
+                for part in field.split('.'):
+                    try:
+                        model_field = current._meta.get_field(part)
+                    except FieldDoesNotExist:
+                        break
+                    if not (model_field.many_to_one or model_field.one_to_one):
+                        break
+                    path.append(part)
+                    current = model_field.related_model
+                if path:
+                    related.add('__'.join(path))
+            if related and not queryset.query.is_sliced:
+                queryset = queryset.select_related(*related)
+            
+            def rows():
+                for obj in queryset.iterator(chunk_size=2000):
+                    yield [ExcelExporter._object_value(obj, field) for field in fields]
         
-        wb.save(response)
-        return response
+        return ExcelExporter.stream_workbook(headers, rows(), filename, title)
     
     @staticmethod
     def export_khoa(queryset):
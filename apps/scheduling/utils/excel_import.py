@@ -7,8 +7,15 @@ import pandas as pd
 from io import BytesIO
 import re
 import unicodedata
+from django.core.exceptions import ValidationError
+from django.db import DataError, IntegrityError, transaction
 from django.http import HttpResponse
 from django.contrib import messages
+from django.utils.html import format_html
+
+IMPORT_REPORT_SESSION_KEY = 'excel_import_report'
+# Giới hạn số lỗi giữ trong session
+MAX_REPORT_ERRORS = 5000
 
 
 class ExcelImporter:
@@ -124,164 +131,271 @@ class ExcelImporter:
         return response
     
     @staticmethod
-    def validate_and_import(file, model_class, request):
-        """Validate and import Excel data into database"""
+    def _normalize(name):
+        """Chuẩn hóa tên cột / verbose_name: bỏ dấu, strip, lower, gộp khoảng trắng"""
+        if not isinstance(name, str):
+            return name
+        name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+        name = name.strip().lower()
+        return re.sub(r'\s+', ' ', name)
+    
+    @staticmethod
+    def _cell_value(value):
+        """Giá trị ô từ pandas: numpy scalar → Python, 101.0 → 101 (cột số có ô trống bị đọc thành float)"""
+        if hasattr(value, 'item'):
+            value = value.item()
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return value
+    
+    @staticmethod
+    def import_dataframe(df, model_class, dry_run=False, batch_size=500):
+        """
+        Import DataFrame (cột đã chuẩn hóa) vào model theo lô
+        
+        - Kiểm tra từng dòng trong bộ nhớ: cột bắt buộc, kiểu dữ liệu (field.clean),
+          trùng mã trong file, khóa ngoại (mỗi model liên kết 1 query cho cả file)
+        - Bản ghi đã tồn tại (nạp 1 query theo mã) → bulk_update, còn lại → bulk_create
+        - Mã trống: cấp trước cả lô qua IdSequence; model sinh mã theo dữ liệu khác
+          (VD: BoMon theo khoa) thì save() từng bản ghi
+        - Lô lỗi ràng buộc DB được ghi lại từng dòng để biết dòng nào lỗi
+        - dry_run: chạy như thật trong transaction rồi rollback
+        
+        Returns:
+            {'created', 'updated', 'skipped', 'dry_run', 'errors': [{'row', 'column', 'value', 'message'}]}
+        """
+        from apps.scheduling.models import DotXep, IdSequence
+        from apps.scheduling.signals import DOT_SCHEDULE_MODELS, SHARED_SCHEDULE_MODELS
+        
+        norm = ExcelImporter._normalize
+        pk_field = model_class._meta.pk
+        report = {'created': 0, 'updated': 0, 'skipped': 0, 'dry_run': dry_run, 'errors': []}
+        
+        def error(row, column, value, message):
+            report['errors'].append({'row': row, 'column': column, 'value': '' if value is None else str(value),
+                                     'message': message})
+        
+        # Cột Excel (verbose_name chuẩn hóa) → field
+        columns = {}
+        if not pk_field.auto_created:
+            columns[norm(pk_field.verbose_name)] = pk_field
+        required = []
+        for field in model_class._meta.get_fields():
+            if field.name == pk_field.name or not getattr(field, 'concrete', False):
+                continue
+            if field.is_relation and not field.many_to_one:
+                continue
+            columns[norm(field.verbose_name)] = field
+            if not field.blank:
+                required.append(norm(field.verbose_name))
+        
+        missing_cols = [col for col in required if col not in df.columns]
+        if missing_cols:
+            error(None, ', '.join(columns[col].verbose_name for col in missing_cols), None, 'Thiếu các cột bắt buộc')
+            return report
+        present = [(col, field) for col, field in columns.items() if col in df.columns]
+        
+        # Khóa ngoại: mỗi model liên kết 1 query cho toàn bộ giá trị trong file
+        fk_existing = {}
+        for col, field in present:
+            if field.many_to_one:
+                target = field.target_field
+                values = set()
+                for value in df[col].dropna():
+                    try:
+                        values.add(target.to_python(ExcelImporter._cell_value(value)))
+                    except ValidationError:
+                        pass
+                fk_existing[field.name] = set(
+                    field.related_model._default_manager.filter(**{f'{target.name}__in': values})
+                    .values_list(target.name, flat=True)
+                )
+        
+        # Parse + validate từng dòng trong bộ nhớ
+        parsed = []  # (excel_row, {field: value})
+        seen_pks = {}
+        for idx, raw in enumerate(df.to_dict('records')):
+            excel_row = idx + 2
+            data = {}
+            row_ok = True
+            for col, field in present:
+                value = raw[col]
+                if pd.isna(value):
+                    if col in required:
+                        error(excel_row, field.verbose_name, None, 'Thiếu giá trị bắt buộc')
+                        row_ok = False
+                    continue
+                value = ExcelImporter._cell_value(value)
+                try:
+                    if field.many_to_one:
+                        value = field.target_field.to_python(value)
+                        if value not in fk_existing[field.name]:
+                            raise ValidationError(
+                                f"Không tìm thấy {field.related_model._meta.verbose_name} với mã '{value}'"
+                            )
+                    else:
+                        value = field.clean(value, None)
+                except ValidationError as e:
+                    error(excel_row, field.verbose_name, value, '; '.join(e.messages))
+                    row_ok = False
+                    continue
+                data[field] = value
+            
+            if not data:
+                report['skipped'] += 1
+                continue
+            if not row_ok:
+                continue
+            pk_value = data.get(pk_field)
+            if pk_value not in (None, ''):
+                if pk_value in seen_pks:
+                    error(excel_row, pk_field.verbose_name, pk_value,
+                          f'Trùng mã với dòng {seen_pks[pk_value]}')
+                    continue
+                seen_pks[pk_value] = excel_row
+            parsed.append((excel_row, data))
+        
+        existing = model_class._default_manager.in_bulk(list(seen_pks)) if seen_pks else {}
+        to_update = []  # (excel_row, obj, [field names])
+        to_create = []  # (excel_row, obj)
+        for excel_row, data in parsed:
+            pk_value = data.pop(pk_field, None)
+            obj = existing.get(pk_value) if pk_value not in (None, '') else None
+            if obj is None:
+                obj = model_class()
+                if pk_value not in (None, ''):
+                    setattr(obj, pk_field.attname, pk_value)
+            for field, value in data.items():
+                setattr(obj, field.attname, value)
+            if obj.pk is not None and pk_value in existing:
+                if data:
+                    to_update.append((excel_row, obj, sorted(field.name for field in data)))
+            else:
+                to_create.append((excel_row, obj))
+        
+        def write_rows(rows, write_batch, write_one):
+            """Ghi theo lô; lô lỗi DB thì ghi lại từng dòng để lấy lỗi theo dòng"""
+            done = 0
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                try:
+                    with transaction.atomic():
+                        write_batch(batch)
+                    done += len(batch)
+                except (IntegrityError, DataError, ValidationError):
+                    for row in batch:
+                        try:
+                            with transaction.atomic():
+                                write_one(row)
+                            done += 1
+                        except (IntegrityError, DataError, ValidationError) as e:
+                            error(row[0], '', None, str(e))
+            return done
+        
+        def update_batch(batch):
+            groups = {}
+            for _, obj, fields in batch:
+                groups.setdefault(tuple(fields), []).append(obj)
+            for fields, objs in groups.items():
+                model_class._default_manager.bulk_update(objs, list(fields))
+        
+        with transaction.atomic():
+            report['updated'] = write_rows(
+                to_update, update_batch,
+                lambda row: row[1].save(update_fields=row[2])
+            )
+            
+            # Mã tự sinh: giữ chỗ cả lô (IdSequence); model khác để save() tự sinh
+            blank = [obj for _, obj in to_create if obj.pk in (None, '')]
+            if blank and not pk_field.auto_created and hasattr(model_class, 'CODE_PREFIX'):
+                for obj, code in zip(blank, IdSequence.next_codes(model_class, len(blank))):
+                    setattr(obj, pk_field.attname, code)
+            
+            custom_pk, bulk_rows = [], []
+            for row in to_create:
+                needs_save = not pk_field.auto_created and row[1].pk in (None, '')
+                (custom_pk if needs_save else bulk_rows).append(row)
+            report['created'] = write_rows(
+                bulk_rows,
+                lambda batch: model_class._default_manager.bulk_create([obj for _, obj in batch]),
+                lambda row: row[1].save(force_insert=True)
+            ) + write_rows(
+                custom_pk,
+                lambda batch: [obj.save(force_insert=True) for _, obj in batch],
+                lambda row: row[1].save(force_insert=True)
+            )
+            if hasattr(model_class, 'CODE_PREFIX'):
+                for pk_value in seen_pks:
+                    if pk_value not in existing:
+                        IdSequence.observe(model_class, pk_value)
+            
+            # bulk_create / bulk_update không phát signal → tự tăng phiên bản TKB
+            if report['created'] or report['updated']:
+                concrete = model_class._meta.concrete_model
+                if concrete in DOT_SCHEDULE_MODELS:
+                    DotXep.bump_schedule_version(*{row[1].ma_dot_id for row in to_update + to_create})
+                elif concrete in SHARED_SCHEDULE_MODELS:
+                    DotXep.bump_schedule_version()
+            
+            if dry_run:
+                transaction.set_rollback(True)
+        
+        report['errors'].sort(key=lambda item: item['row'] or 0)
+        return report
+    
+    @staticmethod
+    def validate_and_import(file, model_class, request, dry_run=False):
+        """Validate and import Excel data into database (xem import_dataframe)
+        
+        Báo cáo lỗi đầy đủ lưu vào session để tải về (report_response)."""
         try:
             # Read Excel file
             df = pd.read_excel(file, sheet_name='Dữ liệu')
-
-            # Normalize column headers: strip, lower, remove accents
-            def normalize_header(h):
-                if not isinstance(h, str):
-                    return h
-                h = unicodedata.normalize('NFKD', h).encode('ascii', 'ignore').decode('ascii')
-                h = h.strip().lower()
-                h = re.sub(r'\s+', ' ', h)  # collapse multiple spaces
-                return h
-
-            normalized_cols = {col: normalize_header(col) for col in df.columns}
-            df.rename(columns=normalized_cols, inplace=True)
+            df.rename(columns={col: ExcelImporter._normalize(col) for col in df.columns}, inplace=True)
             
             if df.empty:
                 messages.error(request, "File Excel không có dữ liệu")
                 return False
             
-            # Helper: normalized verbose name
-            def norm_verbose(name):
-                if not isinstance(name, str):
-                    return name
-                name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
-                name = name.strip().lower()
-                name = re.sub(r'\s+', ' ', name)
-                return name
-
-            # Get model fields info
-            pk_field = model_class._meta.pk
-            field_mapping = {}  # normalized verbose_name -> field_name
-            required_fields = []
-            fk_fields = {}  # field_name -> related_model
-
-            # Add primary key if not auto-created
-            if not pk_field.auto_created:
-                verbose_name = pk_field.verbose_name if hasattr(pk_field, 'verbose_name') else pk_field.name
-                field_mapping[norm_verbose(verbose_name)] = pk_field.name
-            
-            for field in model_class._meta.get_fields():
-                if field.name == pk_field.name:
-                    continue
-                    
-                # Handle ForeignKey fields
-                if hasattr(field, 'related_model') and field.related_model and field.many_to_one:
-                    verbose_name = field.verbose_name if hasattr(field, 'verbose_name') else field.name
-                    field_mapping[norm_verbose(verbose_name)] = field.name
-                    fk_fields[field.name] = field.related_model
-                    
-                    if hasattr(field, 'blank') and not field.blank:
-                        required_fields.append(norm_verbose(verbose_name))
-                    continue
-                    
-                if hasattr(field, 'remote_field') and field.remote_field:
-                    continue
-                
-                verbose_name = field.verbose_name if hasattr(field, 'verbose_name') else field.name
-                field_mapping[norm_verbose(verbose_name)] = field.name
-                
-                if hasattr(field, 'blank') and not field.blank:
-                    required_fields.append(norm_verbose(verbose_name))
-            
-            # Validate required columns (normalized)
-            df_cols_norm = [col for col in df.columns]
-            missing_cols = [col for col in required_fields if col not in df_cols_norm]
-            if missing_cols:
-                messages.error(request, f"Thiếu các cột bắt buộc: {', '.join(missing_cols)}")
-                return False
-
-            # Check for empty required fields
-            for col in required_fields:
-                if col in df.columns:
-                    empty_rows = df[df[col].isna()].index.tolist()
-                    if empty_rows:
-                        messages.error(request, f"Cột '{col}' có giá trị trống ở dòng: {', '.join([str(r+2) for r in empty_rows[:5]])}")
-                        return False
-            
-            # Import data
-            created_count = 0
-            updated_count = 0
-            error_count = 0
-            errors = []
-            
-            for idx, row in df.iterrows():
-                try:
-                    # Convert row to dict with field names
-                    data = {}
-                    fk_data = {}  # Separate FK data for lookup
-                    
-                    for verbose_name, field_name in field_mapping.items():
-                        if verbose_name in df.columns and pd.notna(row[verbose_name]):
-                            value = row[verbose_name]
-                            
-                            # Handle ForeignKey - store for later validation
-                            if field_name in fk_fields:
-                                fk_data[field_name] = value
-                            else:
-                                data[field_name] = value
-                    
-                    if not data and not fk_data:
-                        continue
-                    
-                    # Get PK value from data
-                    pk_value = data.get(pk_field.name)
-                    
-                    # Validate and resolve ForeignKeys
-                    for fk_field, fk_value in fk_data.items():
-                        related_model = fk_fields[fk_field]
-                        related_pk = related_model._meta.pk.name
-                        try:
-                            related_obj = related_model.objects.get(**{related_pk: fk_value})
-                            data[fk_field] = related_obj
-                        except related_model.DoesNotExist:
-                            raise ValueError(f"Không tìm thấy {related_model._meta.verbose_name} với mã '{fk_value}'")
-                    
-                    if pk_value:
-                        # Check if exists
-                        exists = model_class.objects.filter(**{pk_field.name: pk_value}).exists()
-                        
-                        if exists:
-                            # Update existing record
-                            update_data = {k: v for k, v in data.items() if k != pk_field.name}
-                            if update_data:
-                                model_class.objects.filter(**{pk_field.name: pk_value}).update(**update_data)
-                                updated_count += 1
-                        else:
-                            # Create new with specified PK
-                            model_class.objects.create(**data)
-                            created_count += 1
-                    else:
-                        # PK is empty - let model's save() auto-generate it
-                        # Remove PK from data to allow auto-generation
-                        data.pop(pk_field.name, None)
-                        model_class.objects.create(**data)
-                        created_count += 1
-                        
-                except Exception as e:
-                    error_count += 1
-                    if len(errors) < 10:  # Only store first 10 errors
-                        errors.append(f"Dòng {idx+2}: {str(e)}")
+            report = ExcelImporter.import_dataframe(df, model_class, dry_run=dry_run)
+            errors = report['errors']
+            request.session[IMPORT_REPORT_SESSION_KEY] = {
+                'model': model_class._meta.label,
+                'errors': errors[:MAX_REPORT_ERRORS],
+            }
             
             # Show results
-            if created_count > 0:
-                messages.success(request, f"Đã tạo mới {created_count} bản ghi")
-            if updated_count > 0:
-                messages.info(request, f"Đã cập nhật {updated_count} bản ghi")
-            if error_count > 0:
-                messages.warning(request, f"Có {error_count} lỗi")
-                for error in errors:
-                    messages.error(request, error)
-            if created_count == 0 and updated_count == 0 and error_count == 0:
+            prefix = "[Chạy thử - không ghi dữ liệu] " if dry_run else ""
+            if report['created'] > 0:
+                messages.success(request, f"{prefix}{'Sẽ tạo' if dry_run else 'Đã tạo'} mới {report['created']} bản ghi")
+            if report['updated'] > 0:
+                messages.info(request, f"{prefix}{'Sẽ cập nhật' if dry_run else 'Đã cập nhật'} {report['updated']} bản ghi")
+            if errors:
+                messages.warning(request, format_html(
+                    '{}Có {} lỗi - <a href="import-report/">tải báo cáo lỗi theo dòng</a>', prefix, len(errors)
+                ))
+                for item in errors[:10]:
+                    where = f"Dòng {item['row']}" if item['row'] else "File"
+                    column = f" [{item['column']}]" if item['column'] else ""
+                    messages.error(request, f"{where}{column}: {item['message']}")
+            if report['created'] == 0 and report['updated'] == 0 and not errors:
                 messages.warning(request, "Không có bản ghi nào được import. Kiểm tra lại dữ liệu và tên cột.")
             
-            return created_count > 0 or updated_count > 0
+            return (report['created'] > 0 or report['updated'] > 0) and not dry_run
             
         except Exception as e:
             messages.error(request, f"Lỗi xử lý file: {str(e)}")
             return False
+    
+    @staticmethod
+    def report_response(request, model_class):
+        """Tải báo cáo lỗi (theo dòng) của lần import gần nhất"""
+        from .excel_export import ExcelExporter
+        
+        report = request.session.get(IMPORT_REPORT_SESSION_KEY) or {}
+        errors = report.get('errors', []) if report.get('model') == model_class._meta.label else []
+        rows = ([item['row'] or '', item['column'], item['value'], item['message']] for item in errors)
+        return ExcelExporter.stream_workbook(
+            ['Dòng', 'Cột', 'Giá trị', 'Lỗi'], rows,
+            f'import_errors_{model_class._meta.model_name}', title='Báo cáo lỗi'
+        )
@@ -0,0 +1,14 @@
+"""
+Tuần học của dòng TKB (ThoiKhoaBieu.tuan_hoc: chuỗi '1'/'0' theo tuần) dạng bitmask,
+dùng chung cho kiểm tra xung đột khi sửa TKB và xếp lịch nhiều đợt
+"""
+
+# Bitmask "học mọi tuần" (tuan_hoc trống): giao với mask nào cũng khác 0
+ALL_WEEKS = -1
+
+
+def week_mask(tuan_hoc):
+    """'1111000...' → bitmask các tuần học (bit 0 = tuần 1); trống = mọi tuần"""
+    if not tuan_hoc:
+        return ALL_WEEKS
+    return sum(1 << index for index, flag in enumerate(tuan_hoc) if flag == '1')
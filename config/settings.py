@@ -513,6 +513,51 @@ AI_MAX_OUTPUT_TOKENS = int(os.getenv('AI_MAX_OUTPUT_TOKENS', '8192'))
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 SCHEDULE_OUTPUT_DIR = os.getenv('SCHEDULE_OUTPUT_DIR', './schedules')
 
+# Solver result cache (algo scheduler): cùng instance + weights + thuật toán + seed + budget
+SOLVER_RESULT_CACHE_DIR = os.getenv('SOLVER_RESULT_CACHE_DIR', os.path.join(BASE_DIR, 'output', 'test_web_algo', 'result_cache'))
+SOLVER_RESULT_CACHE_MAX_ENTRIES = int(os.getenv('SOLVER_RESULT_CACHE_MAX_ENTRIES', '200'))
+SOLVER_RESULT_CACHE_MAX_MB = int(os.getenv('SOLVER_RESULT_CACHE_MAX_MB', '200'))
+SOLVER_RESULT_CACHE_MAX_AGE_DAYS = int(os.getenv('SOLVER_RESULT_CACHE_MAX_AGE_DAYS', '30'))
+
+# Cache trong process: lưới TKB đã dựng theo (đợt, bộ lọc, phiên bản TKB của đợt)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'schedule': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'schedule-grid',
+        'TIMEOUT': int(os.getenv('SCHEDULE_CACHE_TIMEOUT', '3600')),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('SCHEDULE_CACHE_MAX_ENTRIES', '2000'))},
+    },
+    # Danh sách chọn của bộ lọc data_table. LocMemCache là cache riêng từng process: signal xóa cache
+    # chỉ chạy ở worker nhận request ghi, worker khác giữ bản cũ tới hết FILTER_OPTIONS_TIMEOUT.
+    # Chạy nhiều worker thì trỏ sang backend dùng chung, vd.
+    # DATA_TABLE_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache, DATA_TABLE_CACHE_LOCATION=redis://...
+    'data_table': {
+        'BACKEND': os.getenv('DATA_TABLE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('DATA_TABLE_CACHE_LOCATION', 'data-table'),
+    },
+}
+
+# Phiên bản solver ghi vào lịch sử chạy (SolverRun) - đặt khi deploy (vd. git tag) để so sánh giữa các release
+SOLVER_RELEASE = os.getenv('SOLVER_RELEASE', '')
+
+# Job xếp lịch chạy nền (manage.py solver_worker): số job chạy đồng thời (0 = số CPU - 1)
+# và thời gian mất heartbeat trước khi job RUNNING bị coi là chết
+SOLVER_MAX_CONCURRENT_JOBS = int(os.getenv('SOLVER_MAX_CONCURRENT_JOBS', '0'))
+SOLVER_JOB_STALE_SECONDS = int(os.getenv('SOLVER_JOB_STALE_SECONDS', '600'))
+# Chu kỳ tối thiểu (giây) giữa 2 lần ghi / stream tiến trình solver (SSE)
+SOLVER_PROGRESS_INTERVAL = float(os.getenv('SOLVER_PROGRESS_INTERVAL', '1.0'))
+
+# Checkpoint định kỳ của SA/TS để resume sau khi worker restart: chu kỳ (giây, 0 = tắt) và thư mục.
+# File của đợt bị xóa sau khi lưu kết quả vào DB
+SOLVER_CHECKPOINT_INTERVAL = float(os.getenv('SOLVER_CHECKPOINT_INTERVAL', '0'))
+SOLVER_CHECKPOINT_DIR = os.getenv('SOLVER_CHECKPOINT_DIR', os.path.join(BASE_DIR, 'output', 'test_web_algo', 'checkpoints'))
+
+# Ghi instance của mỗi lần xếp lịch ra file .ctt (chỉ để debug - solver dựng instance trực tiếp từ DB)
+SOLVER_EXPORT_CTT = os.getenv('SOLVER_EXPORT_CTT', 'false').lower() == 'true'
+
 # Ensure output directory exists
 import os as _os
 if not _os.path.exists(SCHEDULE_OUTPUT_DIR):